@@ -7,10 +7,14 @@ from fastapi import APIRouter
 
 from .tasks import router as tasks_router
 from .matrix import router as matrix_router
+from .scheduler import router as scheduler_router
+from .events import router as events_router
 
 # 创建主路由
 router = APIRouter()
 
 # 包含子路由
 router.include_router(tasks_router, tags=["tasks"])
-router.include_router(matrix_router, tags=["matrix"])
\ No newline at end of file
+router.include_router(matrix_router, tags=["matrix"])
+router.include_router(scheduler_router, tags=["scheduler"])
+router.include_router(events_router, tags=["events"])
\ No newline at end of file
@@ -0,0 +1,87 @@
+"""
+任务事件路由模块
+
+通过SSE推送任务状态、进度和子任务结束事件，替代前端的定时轮询
+"""
+from typing import Dict, Any, List, Optional
+import traceback
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+
+from backend.api.schemas.common import APIResponse
+from backend.api.deps import get_current_user
+from backend.models.db.user import User
+from backend.core.config import settings
+from backend.services.task_events import get_task_event_hub
+
+# 配置日志
+import logging
+logger = logging.getLogger(__name__)
+
+# 创建路由
+router = APIRouter()
+
+
+@router.get("/events")
+async def stream_task_events(
+    task_id: Optional[List[str]] = Query(None, description="只接收这些任务的事件（可重复），为空时接收所有任务的事件")
+):
+    """
+    订阅任务事件（text/event-stream）
+
+    连接后先收到 ready 事件，之后收到 task_status、task_progress、subtasks 事件，
+    收到 resync 事件时需要重新加载数据。推送不查询数据库。
+
+    Args:
+        task_id: 任务ID过滤
+
+    Returns:
+        SSE事件流
+    """
+    if not settings.TASK_EVENTS_ENABLED:
+        raise HTTPException(
+            status_code=503,
+            detail={"message": "任务事件推送未启用"}
+        )
+
+    return StreamingResponse(
+        get_task_event_hub().stream(task_id),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # 禁止Nginx缓冲事件流
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+
+@router.get("/events/status", response_model=APIResponse[Dict[str, Any]])
+async def get_task_events_status(
+    current_user: User = Depends(get_current_user)
+):
+    """
+    获取本进程的推送连接数量和事件分发统计
+
+    Args:
+        current_user: 当前用户
+
+    Returns:
+        推送状态
+    """
+    try:
+        data = {"enabled": settings.TASK_EVENTS_ENABLED, **get_task_event_hub().get_status()}
+        return APIResponse[Dict[str, Any]](
+            code=200,
+            message="获取任务事件推送状态成功",
+            data=data
+        )
+    except Exception as e:
+        error_stack = traceback.format_exc()
+        logger.error(f"获取任务事件推送状态出错: {str(e)}\n错误栈: {error_stack}")
+        raise HTTPException(
+            status_code=500,
+            detail={
+                "message": f"获取任务事件推送状态出错: {str(e)}",
+                "error_stack": error_stack
+            }
+        )
@@ -0,0 +1,267 @@
+"""
+调度状态路由模块
+
+提供上游API并发控制等调度状态相关的API路由
+"""
+from typing import Dict, Any
+import traceback
+from fastapi import APIRouter, Depends, HTTPException, Query, Path
+
+from backend.api.schemas.common import APIResponse
+from backend.api.deps import get_current_user
+from backend.models.db.user import User
+from backend.core.config import settings
+from backend.utils.concurrency_controller import get_concurrency_controller
+from backend.services.fair_scheduler import get_fair_scheduler
+from backend.services.admission_controller import get_admission_controller
+from backend.services.poll_registry import get_poll_registry
+from backend.utils.polling_schedule import get_polling_schedule
+from backend.services.outbox import get_outbox_status
+
+# 配置日志
+import logging
+logger = logging.getLogger(__name__)
+
+# 创建路由
+router = APIRouter()
+
+
+@router.get("/scheduler/concurrency", response_model=APIResponse[Dict[str, Any]])
+async def get_concurrency_status(
+    history_limit: int = Query(50, ge=0, le=500, description="返回的调整记录条数"),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    获取自适应并发控制的当前上限、进行中的请求数量和最近的调整记录
+
+    Args:
+        history_limit: 返回的调整记录条数
+        current_user: 当前用户
+
+    Returns:
+        各个API桶的并发控制状态
+    """
+    try:
+        data = {
+            "enabled": settings.ADAPTIVE_CONCURRENCY_ENABLED,
+            "buckets": get_concurrency_controller().get_status(history_limit=history_limit),
+        }
+        return APIResponse[Dict[str, Any]](
+            code=200,
+            message="获取并发控制状态成功",
+            data=data
+        )
+    except Exception as e:
+        error_stack = traceback.format_exc()
+        logger.error(f"获取并发控制状态出错: {str(e)}\n错误栈: {error_stack}")
+        raise HTTPException(
+            status_code=500,
+            detail={
+                "message": f"获取并发控制状态出错: {str(e)}",
+                "error_stack": error_stack
+            }
+        )
+
+
+@router.get("/scheduler/fair", response_model=APIResponse[Dict[str, Any]])
+async def get_fair_scheduler_status(
+    current_user: User = Depends(get_current_user)
+):
+    """
+    获取公平调度器中各活跃任务的pass、权重、待发送和进行中的子任务数量
+
+    Args:
+        current_user: 当前用户
+
+    Returns:
+        公平调度器状态
+    """
+    try:
+        data = {
+            "enabled": settings.FAIR_SCHEDULING_ENABLED,
+            **get_fair_scheduler().get_status(),
+        }
+        return APIResponse[Dict[str, Any]](
+            code=200,
+            message="获取公平调度状态成功",
+            data=data
+        )
+    except Exception as e:
+        error_stack = traceback.format_exc()
+        logger.error(f"获取公平调度状态出错: {str(e)}\n错误栈: {error_stack}")
+        raise HTTPException(
+            status_code=500,
+            detail={
+                "message": f"获取公平调度状态出错: {str(e)}",
+                "error_stack": error_stack
+            }
+        )
+
+
+@router.get("/scheduler/admission", response_model=APIResponse[Dict[str, Any]])
+async def get_admission_status(
+    current_user: User = Depends(get_current_user)
+):
+    """
+    获取任务准入控制各准入池的容量、占用、已准入任务和等待队列
+
+    Args:
+        current_user: 当前用户
+
+    Returns:
+        准入控制状态
+    """
+    try:
+        data = {
+            "enabled": settings.ADMISSION_CONTROL_ENABLED,
+            **get_admission_controller().get_status(),
+        }
+        return APIResponse[Dict[str, Any]](
+            code=200,
+            message="获取准入控制状态成功",
+            data=data
+        )
+    except Exception as e:
+        error_stack = traceback.format_exc()
+        logger.error(f"获取准入控制状态出错: {str(e)}\n错误栈: {error_stack}")
+        raise HTTPException(
+            status_code=500,
+            detail={
+                "message": f"获取准入控制状态出错: {str(e)}",
+                "error_stack": error_stack
+            }
+        )
+
+
+@router.get("/scheduler/poller", response_model=APIResponse[Dict[str, Any]])
+async def get_poller_status(
+    current_user: User = Depends(get_current_user)
+):
+    """
+    获取两阶段模式下等待结果轮询服务轮询的上游任务数量
+
+    Args:
+        current_user: 当前用户
+
+    Returns:
+        轮询登记表状态
+    """
+    try:
+        data = {
+            "enabled": settings.TWO_PHASE_POLLING_ENABLED,
+            **get_poll_registry().get_status(),
+        }
+        return APIResponse[Dict[str, Any]](
+            code=200,
+            message="获取结果轮询状态成功",
+            data=data
+        )
+    except Exception as e:
+        error_stack = traceback.format_exc()
+        logger.error(f"获取结果轮询状态出错: {str(e)}\n错误栈: {error_stack}")
+        raise HTTPException(
+            status_code=500,
+            detail={
+                "message": f"获取结果轮询状态出错: {str(e)}",
+                "error_stack": error_stack
+            }
+        )
+
+
+@router.get("/scheduler/polling", response_model=APIResponse[Dict[str, Any]])
+async def get_polling_status(
+    current_user: User = Depends(get_current_user)
+):
+    """
+    获取自适应轮询各分组的完成耗时分位数和每个任务的平均轮询次数
+
+    Args:
+        current_user: 当前用户
+
+    Returns:
+        自适应轮询状态
+    """
+    try:
+        data = {
+            "enabled": settings.ADAPTIVE_POLLING_ENABLED,
+            **get_polling_schedule().get_status(),
+        }
+        return APIResponse[Dict[str, Any]](
+            code=200,
+            message="获取轮询计划状态成功",
+            data=data
+        )
+    except Exception as e:
+        error_stack = traceback.format_exc()
+        logger.error(f"获取轮询计划状态出错: {str(e)}\n错误栈: {error_stack}")
+        raise HTTPException(
+            status_code=500,
+            detail={
+                "message": f"获取轮询计划状态出错: {str(e)}",
+                "error_stack": error_stack
+            }
+        )
+
+
+@router.get("/scheduler/outbox", response_model=APIResponse[Dict[str, Any]])
+async def get_outbox_backlog(
+    current_user: User = Depends(get_current_user)
+):
+    """
+    获取事务发件箱的积压情况
+
+    Args:
+        current_user: 当前用户
+
+    Returns:
+        待处理事件数量、等待重试的事件数量和最早的待处理事件创建时间
+    """
+    try:
+        return APIResponse[Dict[str, Any]](
+            code=200,
+            message="获取发件箱状态成功",
+            data=get_outbox_status()
+        )
+    except Exception as e:
+        error_stack = traceback.format_exc()
+        logger.error(f"获取发件箱状态出错: {str(e)}\n错误栈: {error_stack}")
+        raise HTTPException(
+            status_code=500,
+            detail={
+                "message": f"获取发件箱状态出错: {str(e)}",
+                "error_stack": error_stack
+            }
+        )
+
+
+@router.get("/task/{task_id}/queue-position", response_model=APIResponse[Dict[str, Any]])
+async def get_task_queue_position(
+    task_id: str = Path(..., description="任务ID"),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    查询任务在准入队列中的位置
+
+    Args:
+        task_id: 任务ID
+        current_user: 当前用户
+
+    Returns:
+        任务的准入状态（waiting、admitted 或 none）、排队位置和同一准入池中排在前面的任务数
+    """
+    try:
+        return APIResponse[Dict[str, Any]](
+            code=200,
+            message="获取任务排队位置成功",
+            data=get_admission_controller().get_position(task_id)
+        )
+    except Exception as e:
+        error_stack = traceback.format_exc()
+        logger.error(f"获取任务排队位置出错: {str(e)}\n错误栈: {error_stack}")
+        raise HTTPException(
+            status_code=500,
+            detail={
+                "message": f"获取任务排队位置出错: {str(e)}",
+                "error_stack": error_stack
+            }
+        )
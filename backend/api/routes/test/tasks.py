@@ -4,6 +4,7 @@
 提供任务相关的API路由
 """
 from typing import Dict, Any, List, Optional
+import asyncio
 import time
 import uuid
 import json
@@ -17,8 +18,8 @@ from backend.api.schemas.test import (
     TaskListItem, SubtaskResponse, RunningTasksResponse, RunningTaskResponse
 )
 from backend.api.deps import get_current_user
-from backend.models.db.user import User
-from backend.models.db.tasks import Task, TaskStatus
+from backend.models.db.user import User, Permission
+from backend.models.db.tasks import Task, TaskStatus, TaskPriority
 from backend.models.db.subtasks import Subtask, SubtaskStatus
 from backend.api.responses import JSONResponse
 from backend.crud.task import task_crud
@@ -26,6 +27,9 @@ from backend.crud.subtask import subtask_crud
 from backend.services.task_service import cancel_task as service_cancel_task
 from backend.services.custom_background import get_background_service
 from backend.services.task_stats_service import update_task_subtask_stats, batch_update_all_task_stats
+from backend.services.task_status_stats import (
+    TaskStatsFilters, normalize_stats_filters, peek_task_status_stats, get_task_status_stats, invalidate_task_stats
+)
 from backend.services.old_task_reuse import is_old_format_user, generate_old_task_reuse_config
 
 # 配置日志
@@ -97,6 +101,15 @@ async def submit_task(
         # 添加用户ID到任务数据
         task_data["user_id"] = str(current_user.id)
 
+        # 规范化优先级：没有高优先级权限的用户最高只能创建普通优先级任务
+        try:
+            priority = int(task_data.get("priority", TaskPriority.NORMAL.value))
+        except (TypeError, ValueError):
+            priority = TaskPriority.NORMAL.value
+        max_priority = (TaskPriority.HIGH.value if current_user.has_permission(Permission.TEST_CREATE_HIGH_PRIORITY)
+                        else TaskPriority.NORMAL.value)
+        task_data["priority"] = min(max(priority, TaskPriority.LOW.value), max_priority)
+
         # 如果没有提供任务名称，使用时间点作为任务名
         if "name" not in task_data:
             task_data["name"] = "无标题任务" + datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -166,91 +179,39 @@ async def get_tasks_stats(
         各种状态的任务统计信息
     """
     try:
-        # 确保数据库连接是活跃的
-        from backend.db.database import test_db_proxy
-
-        # 重新初始化数据库连接以确保状态正确
-        try:
-            from backend.db.initialization import reconnect_test_db
-            reconnect_test_db()
-        except Exception as reconnect_error:
-            logger.warning(f"重新连接数据库失败，尝试直接连接: {str(reconnect_error)}")
-            if test_db_proxy.is_closed():
-                test_db_proxy.connect()
-
-        try:
-            # 构建基础查询
-            base_query = Task.select()
-
-            # 添加删除状态过滤
-            if deleted is not None:
-                base_query = base_query.where(Task.is_deleted == deleted)
-            else:
-                # 默认不显示已删除的任务
-                base_query = base_query.where(Task.is_deleted == False)
-
-            # 添加收藏状态过滤
-            if favorite is not None:
-                base_query = base_query.where(Task.is_favorite == favorite)
-
-            # 添加用户名过滤
-            if username:
-                base_query = base_query.join(User).where(User.username == username)
-
-            # 添加任务名搜索（部分匹配）
-            if task_name:
-                base_query = base_query.where(Task.name.contains(task_name))
-
-            # 添加子任务数量范围过滤
-            if min_subtasks is not None:
-                base_query = base_query.where(Task.total_images >= min_subtasks)
-
-            if max_subtasks is not None:
-                base_query = base_query.where(Task.total_images <= max_subtasks)
-
-            # 添加日期范围过滤
-            if start_date:
-                try:
-                    from datetime import datetime
-                    start_datetime = datetime.strptime(start_date, "%Y-%m-%d")
-                    base_query = base_query.where(Task.created_at >= start_datetime)
-                except ValueError:
-                    logger.warning(f"无效的开始日期格式: {start_date}")
-
-            if end_date:
-                try:
-                    from datetime import datetime, timedelta
-                    end_datetime = datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)
-                    base_query = base_query.where(Task.created_at < end_datetime)
-                except ValueError:
-                    logger.warning(f"无效的结束日期格式: {end_date}")
+        filters = normalize_stats_filters(
+            username=username,
+            task_name=task_name,
+            favorite=favorite,
+            deleted=deleted,
+            min_subtasks=min_subtasks,
+            max_subtasks=max_subtasks,
+            start_date=start_date,
+            end_date=end_date
+        )
 
-            # 计算各状态的数量
-            stats = {
-                'total': base_query.count(),
-                'completed': base_query.where(Task.status == 'completed').count(),
-                'failed': base_query.where(Task.status == 'failed').count(),
-                'cancelled': base_query.where(Task.status == 'cancelled').count(),
-                'processing': base_query.where(Task.status == 'processing').count(),
-                'pending': base_query.where(Task.status == 'pending').count()
-            }
+        # 先读缓存，命中时不访问数据库
+        stats = peek_task_status_stats(filters)
+        if stats is None:
+            # 一条按状态分组的查询（以及等待相同请求的查询结果）在线程中执行，不阻塞事件循环
+            stats = await asyncio.to_thread(_query_task_status_stats, filters)
 
-            return APIResponse[Dict[str, int]](
-                code=200,
-                message="success",
-                data=stats
-            )
-
-        except Exception as query_error:
-            logger.error(f"查询任务统计失败: {str(query_error)}")
-            return APIResponse[Dict[str, int]](
-                code=500,
-                message=f"查询任务统计失败: {str(query_error)}",
-                data={}
-            )
+        return APIResponse[Dict[str, int]](
+            code=200,
+            message="success",
+            data=stats
+        )
 
     except Exception as e:
         logger.error(f"获取任务统计失败: {str(e)}")
+
+        # 尝试重新初始化数据库连接
+        try:
+            from backend.db.initialization import reconnect_test_db
+            reconnect_test_db()
+        except Exception as db_error:
+            logger.error(f"重新初始化数据库连接失败: {str(db_error)}")
+
         return APIResponse[Dict[str, int]](
             code=500,
             message=f"获取任务统计失败: {str(e)}",
@@ -258,6 +219,15 @@ async def get_tasks_stats(
         )
 
 
+def _query_task_status_stats(filters: TaskStatsFilters) -> Dict[str, int]:
+    """在线程中获取任务统计，完成后把线程持有的连接归还连接池"""
+    from backend.db.pool import release_connection
+    try:
+        return get_task_status_stats(filters)
+    finally:
+        release_connection()
+
+
 @router.get("/tasks", response_model=APIResponse[TaskListResponse])
 async def get_tasks(
     page: int = Query(1, ge=1, description="页码"),
@@ -819,6 +789,7 @@ async def toggle_task_favorite(
             task.is_favorite = not getattr(task, 'is_favorite', False)
             task.updated_at = datetime.now()
             task.save()
+            invalidate_task_stats()
 
             return APIResponse[Dict[str, Any]](
                 code=200,
@@ -1001,6 +972,7 @@ async def toggle_task_delete(
             task.is_deleted = not getattr(task, 'is_deleted', False)
             task.updated_at = datetime.now()
             task.save()
+            invalidate_task_stats()
 
             return APIResponse[Dict[str, Any]](
                 code=200,
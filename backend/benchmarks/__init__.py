@@ -0,0 +1,8 @@
+"""
+后端热点路径的微基准测试
+
+用法:
+    python -m backend.benchmarks                          # 运行全部基准测试
+    python -m backend.benchmarks --save baseline.json     # 保存为基准线
+    python -m backend.benchmarks --baseline baseline.json # 与基准线对比，出现退化时退出码为1
+"""
@@ -0,0 +1,70 @@
+"""
+基准测试命令行入口
+
+Redis 替换为内存中的模拟Redis；需要数据库的基准测试使用本地Postgres（TEST_DB_* 配置），连接失败时跳过。
+"""
+import argparse
+import json
+import logging
+import sys
+
+from backend.benchmarks import fixtures
+from backend.benchmarks import cases  # noqa: F401  注册基准测试
+from backend.benchmarks.runner import (
+    compare, format_report, get_benchmarks, load_baseline, run_benchmarks, save_baseline
+)
+
+
+def main() -> int:
+    """主函数"""
+    logging.basicConfig(
+        level=logging.WARNING,
+        format="[%(asctime)s] [%(name)s] [%(levelname)s] %(message)s",
+        handlers=[logging.StreamHandler()],
+    )
+
+    parser = argparse.ArgumentParser(description="后端热点路径的微基准测试")
+    parser.add_argument("--filter", action="append", default=None, help="只运行名称包含该字符串的基准测试，可重复")
+    parser.add_argument("--repeat", type=int, default=5, help="每个基准测试的重复轮数")
+    parser.add_argument("--min-time", type=float, default=0.2, help="每轮的最短时间（秒）")
+    parser.add_argument("--baseline", default=None, help="基准线文件，指定时对比并在退化时返回1")
+    parser.add_argument("--save", default=None, help="把本次结果保存为基准线")
+    parser.add_argument("--threshold", type=float, default=0.2, help="退化阈值（比例），默认慢20%%以上视为退化")
+    parser.add_argument("--no-db", action="store_true", help="跳过需要数据库的基准测试")
+    parser.add_argument("--json", action="store_true", help="以JSON输出结果")
+    parser.add_argument("--list", action="store_true", help="只列出基准测试名称")
+    args = parser.parse_args()
+
+    selected = get_benchmarks(args.filter)
+    if args.list:
+        for case in selected:
+            print(case.name)
+        return 0
+
+    fixtures.install_fake_redis()
+    db_available = False
+    if not args.no_db and any(case.requires_db for case in selected):
+        db_available = fixtures.connect_local_db()
+
+    log = (lambda message: print(message, file=sys.stderr)) if args.json else print
+    results = run_benchmarks(selected, args.repeat, args.min_time, db_available, log=log)
+
+    baseline = load_baseline(args.baseline) if args.baseline else {}
+    rows, regressions = compare(results, baseline, args.threshold)
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+    else:
+        print()
+        print(format_report(rows))
+
+    if args.save:
+        save_baseline(args.save, results)
+
+    if regressions:
+        print(f"\n性能退化: {', '.join(regressions)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""
+后端热点路径的基准测试
+
+- subtask_generation: 按矩阵形状生成全部子任务（iter_subtasks_from_task）
+- pydantic_fields: Pydantic字段的 db_value / python_value 转换，以及写入/读取本地Postgres
+- task_matrix: 矩阵接口的数据组装（build_task_matrix）
+- normalize_variables: 矩阵变量的标准化（normalize_variables_for_frontend）
+- sanitize_for_json: 响应数据清洗
+- user_permissions: 角色继承的权限计算
+"""
+from backend.benchmarks import fixtures
+from backend.benchmarks.runner import benchmark
+from backend.dramatiq_app.actors.test_submit_master import iter_subtasks_from_task
+from backend.models.db.tasks import Task
+from backend.models.db.user import Permission
+from backend.services.subtask_plan import collect_active_variables
+from backend.services.task_matrix import build_matrix_variables, build_task_matrix, normalize_variables_for_frontend
+from backend.utils.json_utils import sanitize_for_json
+
+
+def _register_subtask_generation(shape: str) -> None:
+    prompt_dims, param_dims = fixtures.SUBTASK_SHAPES[shape]
+
+    @benchmark(f"subtask_generation[{shape}]")
+    def setup():
+        task = fixtures.build_task(prompt_dims, param_dims)
+        return lambda: list(iter_subtasks_from_task(task, collect_active_variables(task)))
+
+
+def _register_task_matrix(shape: str) -> None:
+    prompt_dims = fixtures.MATRIX_SHAPES[shape]
+
+    @benchmark(f"task_matrix[{shape}]")
+    def setup():
+        task = fixtures.build_task(prompt_dims)
+        subtasks = fixtures.build_subtasks(iter_subtasks_from_task(task, collect_active_variables(task)))
+        return lambda: build_task_matrix(task, subtasks)
+
+
+for _shape in fixtures.SUBTASK_SHAPES:
+    _register_subtask_generation(_shape)
+
+
+@benchmark("pydantic_fields[convert]")
+def _pydantic_fields_convert():
+    prompts_field = Task._meta.fields["prompts"]
+    ratio_field = Task._meta.fields["ratio"]
+    task = fixtures.build_task([10, 10], {"ratio": 10})
+    # 从数据库读出的是解码后的JSON
+    prompts_raw = [prompt.model_dump(mode="json") for prompt in task.prompts]
+    ratio_raw = task.ratio.model_dump(mode="json")
+
+    def run():
+        prompts_field.db_value(task.prompts)
+        ratio_field.db_value(task.ratio)
+        prompts_field.python_value(prompts_raw)
+        ratio_field.python_value(ratio_raw)
+    return run
+
+
+@benchmark("pydantic_fields[db_roundtrip]", requires_db=True, threshold=0.5)
+def _pydantic_fields_db_roundtrip():
+    # 数据库往返受本地Postgres负载影响较大，阈值放宽
+    task = fixtures.build_task([10, 10], {"ratio": 10})
+    rows = [{"prompts": task.prompts, "ratio": task.ratio} for _ in range(200)]
+    database = fixtures.BenchFieldRow._meta.database
+    fixtures.BenchFieldRow.create_table(safe=True)
+
+    def run():
+        with database.atomic():
+            fixtures.BenchFieldRow.insert_many(rows).execute()
+        list(fixtures.BenchFieldRow.select())
+        fixtures.BenchFieldRow.delete().execute()
+
+    def teardown():
+        fixtures.BenchFieldRow.drop_table(safe=True)
+    return run, teardown
+
+
+for _shape in fixtures.MATRIX_SHAPES:
+    _register_task_matrix(_shape)
+
+
+@benchmark("normalize_variables[6d]")
+def _normalize_variables():
+    task = fixtures.build_task([10, 5, 5], {"ratio": 4, "seed": 2, "lumina_step": 5})
+    variables_map = build_matrix_variables(task.variables_map, None)
+    return lambda: normalize_variables_for_frontend(variables_map)
+
+
+@benchmark("sanitize_for_json[1000]")
+def _sanitize_for_json():
+    payload = fixtures.build_json_payload(1000)
+    return lambda: sanitize_for_json(payload)
+
+
+@benchmark("user_permissions")
+def _user_permissions():
+    users = fixtures.build_users()
+
+    def run():
+        for user in users:
+            user.get_permissions()
+            user.has_permission(Permission.TEST_VIEW_RESULTS)
+    return run
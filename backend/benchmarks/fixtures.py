@@ -0,0 +1,242 @@
+"""
+基准测试数据
+
+构造不同矩阵形状的任务、子任务、variables_map 和用户，以及本地Postgres和模拟Redis的连接。
+数据都在内存中生成，同一形状每次生成的内容相同。
+"""
+import logging
+import typing
+import uuid
+from datetime import datetime, timedelta
+
+from peewee import Model
+
+from backend.core.config import settings  # noqa: F401  先加载配置，避免数据库模块的循环导入
+from backend.db.database import test_db_proxy
+from backend.models.db.extra_field import PydanticListField, PydanticModelField
+from backend.models.db.subtasks import Subtask, SubtaskStatus
+from backend.models.db.tasks import Task
+from backend.models.db.user import Role, User
+from backend.models.prompt import ConstantPrompt, Prompt
+from backend.models.task_parameter import TaskParameter
+from backend.services.subtask_plan import ActiveVariable, CONFIGURABLE_PARAMETER_NAMES, collect_active_variables
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 子任务生成的矩阵形状：名称 -> (提示词变量的取值数量, 参数变量 -> 取值数量)
+SUBTASK_SHAPES: typing.Dict[str, typing.Tuple[typing.List[int], typing.Dict[str, int]]] = {
+    "1d_100": ([100], {}),
+    "3d_1000": ([10, 10], {"ratio": 10}),
+    "6d_10000": ([10, 5, 5], {"ratio": 4, "seed": 2, "lumina_step": 5}),
+}
+
+# 矩阵接口的形状：名称 -> 提示词变量的取值数量
+MATRIX_SHAPES: typing.Dict[str, typing.List[int]] = {
+    "2d_400": [20, 20],
+    "4d_10000": [10, 10, 10, 10],
+}
+
+# 参数变量的取值
+_PARAM_VALUES: typing.Dict[str, typing.Callable[[int], typing.Any]] = {
+    "ratio": lambda i: ["1:1", "3:4", "4:3", "9:16", "16:9", "2:3", "3:2", "1:2", "2:1", "21:9"][i % 10],
+    "seed": lambda i: i + 1,
+    "use_polish": lambda i: bool(i % 2),
+    "lumina_step": lambda i: 10 * (i + 1),
+    "lumina_cfg": lambda i: 3.0 + i * 0.5,
+    "lumina_model_name": lambda i: f"model_{i}",
+}
+_PARAM_FORMATS = {"ratio": "string", "seed": "int", "use_polish": "bool", "is_lumina": "bool",
+                  "lumina_model_name": "string", "lumina_cfg": "float", "lumina_step": "int"}
+
+
+def build_task(prompt_dims: typing.List[int], param_dims: typing.Optional[typing.Dict[str, int]] = None) -> Task:
+    """
+    构造未保存的任务：每个提示词变量一个维度，参数变量排在提示词变量之后
+
+    Args:
+        prompt_dims: 各提示词变量的取值数量
+        param_dims: 参数名 -> 取值数量
+
+    Returns:
+        任务对象
+    """
+    param_dims = param_dims or {}
+    variable_counter = 0
+
+    prompts = [Prompt(type="freetext", value="1girl, solo, masterpiece", weight=1.0, is_variable=False)]
+    for dimension, size in enumerate(prompt_dims):
+        prompts.append(Prompt(
+            type="freetext", value="", weight=1.0, is_variable=True,
+            variable_id=str(variable_counter), variable_name=f"提示词{dimension}",
+            variable_values=[
+                ConstantPrompt(type="freetext", value=f"dim{dimension}_value{i}, best quality", weight=1.0)
+                for i in range(size)
+            ],
+        ))
+        variable_counter += 1
+    prompts.append(Prompt(type="freetext", value="looking at viewer", weight=0.8, is_variable=False))
+
+    params = {}
+    for param_name in CONFIGURABLE_PARAMETER_NAMES:
+        if param_name in param_dims:
+            params[param_name] = TaskParameter(
+                type=param_name, value="", is_variable=True, format=_PARAM_FORMATS.get(param_name),
+                variable_id=str(variable_counter), variable_name=param_name,
+                variable_values=[_PARAM_VALUES[param_name](i) for i in range(param_dims[param_name])],
+            )
+            variable_counter += 1
+
+    user = User(id=uuid.UUID(int=1), username="bench_user", roles=[Role.USER.value])
+    task = Task(id=uuid.UUID(int=len(prompt_dims) * 1000 + len(param_dims)), name="benchmark", user=user,
+                prompts=prompts, created_at=datetime(2024, 1, 1), **params)
+    task.variables_map = build_variables_map(task, collect_active_variables(task))
+    return task
+
+
+def build_variables_map(task: Task, active_variables: typing.List[ActiveVariable]) -> typing.Dict[str, typing.Any]:
+    """
+    构造与任务提交时相同结构的 variables_map（维度索引 -> 变量信息）
+
+    Args:
+        task: 任务对象
+        active_variables: 活动变量列表
+
+    Returns:
+        variables_map
+    """
+    variables_map = {}
+    prompt_variables = {prompt.variable_id: prompt for prompt in task.prompts if prompt.is_variable}
+    for dimension_index, active_variable in enumerate(active_variables):
+        prompt = prompt_variables.get(active_variable.variable_id)
+        if prompt is not None:
+            variables_map[str(dimension_index)] = {
+                "variable_id": prompt.variable_id,
+                "variable_name": prompt.variable_name,
+                "variable_type": "prompt",
+                "values": [value.model_dump() for value in prompt.variable_values],
+            }
+            continue
+        param_name = next(name for name in CONFIGURABLE_PARAMETER_NAMES
+                          if getattr(task, name).variable_id == active_variable.variable_id)
+        param = getattr(task, param_name)
+        variables_map[str(dimension_index)] = {
+            "variable_id": param.variable_id,
+            "variable_name": param.variable_name,
+            "variable_type": param_name,
+            "values": list(param.variable_values),
+        }
+    return variables_map
+
+
+def build_subtasks(subtasks: typing.Iterable[Subtask]) -> typing.List[Subtask]:
+    """
+    给子任务填上结果：80%成功、10%失败、10%未完成
+
+    Args:
+        subtasks: 未保存的子任务
+
+    Returns:
+        子任务列表
+    """
+    started_at = datetime(2024, 1, 1, 12, 0, 0)
+    result = []
+    for index, subtask in enumerate(subtasks):
+        subtask.id = uuid.UUID(int=index + 1)
+        subtask.created_at = started_at
+        bucket = index % 10
+        if bucket < 8:
+            subtask.status = SubtaskStatus.COMPLETED.value
+            subtask.result = f"https://oss.talesofai.cn/picture/{index}.webp"
+            subtask.completed_at = started_at + timedelta(seconds=index)
+        elif bucket == 8:
+            subtask.status = SubtaskStatus.FAILED.value
+            subtask.error = "图像生成API返回ILLEGAL_IMAGE状态，内容不合规"
+            subtask.completed_at = started_at + timedelta(seconds=index)
+        result.append(subtask)
+    return result
+
+
+def build_json_payload(rows: int) -> typing.Dict[str, typing.Any]:
+    """
+    构造需要清洗的响应数据（UUID、时间和嵌套的列表/字典），结构与任务详情接口类似
+
+    Args:
+        rows: 子任务数量
+
+    Returns:
+        响应数据
+    """
+    created_at = datetime(2024, 1, 1)
+    return {
+        "id": uuid.UUID(int=0),
+        "created_at": created_at,
+        "subtasks": [
+            {
+                "id": uuid.UUID(int=index + 1),
+                "status": "completed",
+                "variable_indices": [index % 10, index // 10 % 10, index // 100],
+                "prompts": [{"type": "freetext", "value": f"value {index}", "weight": 1.0}],
+                "created_at": created_at,
+                "completed_at": created_at + timedelta(seconds=index),
+                "evaluation": [],
+            }
+            for index in range(rows)
+        ],
+    }
+
+
+def build_users() -> typing.List[User]:
+    """
+    构造每种角色各一个的未保存用户
+
+    Returns:
+        用户列表
+    """
+    return [User(username=f"bench_{role.value}", roles=[role.value]) for role in Role]
+
+
+class BenchFieldRow(Model):
+    """
+    Pydantic字段写入/读取基准测试使用的表（测试结束后删除）
+    """
+    prompts = PydanticListField(Prompt)
+    ratio = PydanticModelField(TaskParameter)
+
+    class Meta:
+        database = test_db_proxy
+        table_name = "nietest_benchmark_field_rows"
+
+
+def install_fake_redis() -> bool:
+    """
+    把共享Redis客户端替换为内存中的模拟Redis，基准测试不访问真实的Redis
+
+    Returns:
+        是否已替换（未安装fakeredis时返回False）
+    """
+    try:
+        import fakeredis
+    except ImportError:
+        logger.warning("未安装fakeredis，基准测试将使用 BROKER_REDIS_URL 指向的Redis")
+        return False
+
+    from backend.utils import redis_client
+    redis_client._redis_client_instance = fakeredis.FakeRedis()
+    return True
+
+
+def connect_local_db() -> bool:
+    """
+    连接本地Postgres（TEST_DB_* 配置）
+
+    Returns:
+        是否连接成功
+    """
+    try:
+        from backend.db.initialization import initialize_test_db
+        initialize_test_db().execute_sql("SELECT 1")
+        return True
+    except Exception as e:
+        logger.warning(f"无法连接本地Postgres，跳过需要数据库的基准测试: {str(e)}")
+        return False
@@ -0,0 +1,242 @@
+"""
+基准测试运行和对比模块
+
+每个基准测试由准备函数注册（@benchmark），准备函数构造数据并返回被测函数（或 (被测函数, 清理函数)）。
+运行时先按 min_time 确定每轮调用次数，再重复 repeat 轮，取每次调用的最短耗时和中位数耗时。
+与基准线对比时按最短耗时计算变化，超过阈值视为性能退化。
+"""
+import gc
+import json
+import platform
+import statistics
+import time
+import typing
+from datetime import datetime
+
+
+class Benchmark(typing.NamedTuple):
+    """已注册的基准测试"""
+    name: str
+    setup: typing.Callable[[], typing.Any]
+    requires_db: bool
+    threshold: typing.Optional[float]  # 单独的退化阈值，为None时使用全局阈值
+
+
+# 名称 -> 基准测试，按注册顺序运行
+_REGISTRY: typing.Dict[str, Benchmark] = {}
+
+
+def benchmark(name: str, requires_db: bool = False, threshold: typing.Optional[float] = None):
+    """
+    注册基准测试（装饰器）
+
+    Args:
+        name: 名称，如 "subtask_generation[3d_1000]"
+        requires_db: 是否需要本地Postgres
+        threshold: 单独的退化阈值（比例），噪声较大的测试可以放宽
+
+    Returns:
+        装饰器
+    """
+    def decorator(setup):
+        if name in _REGISTRY:
+            raise ValueError(f"基准测试名称重复: {name}")
+        _REGISTRY[name] = Benchmark(name, setup, requires_db, threshold)
+        return setup
+    return decorator
+
+
+def get_benchmarks(patterns: typing.Optional[typing.List[str]] = None) -> typing.List[Benchmark]:
+    """
+    获取已注册的基准测试
+
+    Args:
+        patterns: 名称包含其中任意一个字符串的才返回，为空时返回全部
+
+    Returns:
+        基准测试列表
+    """
+    return [case for case in _REGISTRY.values()
+            if not patterns or any(pattern in case.name for pattern in patterns)]
+
+
+def measure(func: typing.Callable[[], typing.Any], repeat: int, min_time: float) -> typing.Dict[str, typing.Any]:
+    """
+    测量函数的单次调用耗时
+
+    Args:
+        func: 被测函数
+        repeat: 重复轮数
+        min_time: 每轮的最短时间（秒），据此确定每轮调用次数
+
+    Returns:
+        每轮调用次数、最短耗时和中位数耗时（微秒）
+    """
+    def timed(number: int) -> float:
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            for _ in range(number):
+                func()
+            return time.perf_counter() - start
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    # 预热一次，再按耗时放大调用次数直到一轮超过 min_time
+    func()
+    number = 1
+    while True:
+        elapsed = timed(number)
+        if elapsed >= min_time or number >= 1_000_000:
+            break
+        number = max(number * 2, int(number * min_time / max(elapsed, 1e-9) * 1.2))
+
+    samples = [timed(number) / number * 1e6 for _ in range(repeat)]
+    return {
+        "number": number,
+        "min_us": round(min(samples), 3),
+        "median_us": round(statistics.median(samples), 3),
+    }
+
+
+def run_benchmarks(cases: typing.List[Benchmark], repeat: int, min_time: float, db_available: bool,
+                   log: typing.Callable[[str], None] = print) -> typing.Dict[str, typing.Dict[str, typing.Any]]:
+    """
+    运行基准测试
+
+    Args:
+        cases: 基准测试列表
+        repeat: 重复轮数
+        min_time: 每轮的最短时间（秒）
+        db_available: 本地Postgres是否可用，不可用时跳过需要数据库的测试
+        log: 进度输出
+
+    Returns:
+        名称 -> 测量结果，跳过的测试记为 {"skipped": 原因}
+    """
+    results: typing.Dict[str, typing.Dict[str, typing.Any]] = {}
+    for case in cases:
+        if case.requires_db and not db_available:
+            results[case.name] = {"skipped": "需要本地Postgres"}
+            continue
+
+        prepared = case.setup()
+        func, teardown = prepared if isinstance(prepared, tuple) else (prepared, None)
+        try:
+            results[case.name] = measure(func, repeat, min_time)
+        finally:
+            if teardown is not None:
+                teardown()
+        log(f"{case.name}: {format_duration(results[case.name]['min_us'])}")
+    return results
+
+
+def format_duration(microseconds: float) -> str:
+    """按量级格式化耗时"""
+    if microseconds >= 1e6:
+        return f"{microseconds / 1e6:.3f} s"
+    if microseconds >= 1e3:
+        return f"{microseconds / 1e3:.3f} ms"
+    return f"{microseconds:.3f} us"
+
+
+def load_baseline(path: str) -> typing.Dict[str, typing.Dict[str, typing.Any]]:
+    """
+    读取基准线
+
+    Args:
+        path: 基准线文件路径
+
+    Returns:
+        名称 -> 测量结果
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["results"]
+
+
+def save_baseline(path: str, results: typing.Dict[str, typing.Dict[str, typing.Any]]) -> None:
+    """
+    保存基准线（附带Python版本和机器信息，不同机器的结果不可比较）
+
+    Args:
+        path: 基准线文件路径
+        results: 测量结果
+    """
+    data = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()} {platform.node()}",
+        "results": {name: result for name, result in results.items() if "skipped" not in result},
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def compare(results: typing.Dict[str, typing.Dict[str, typing.Any]],
+            baseline: typing.Dict[str, typing.Dict[str, typing.Any]],
+            threshold: float) -> typing.Tuple[typing.List[typing.Dict[str, typing.Any]], typing.List[str]]:
+    """
+    与基准线对比
+
+    Args:
+        results: 本次测量结果
+        baseline: 基准线
+        threshold: 全局退化阈值（比例），如0.2表示慢20%以上视为退化
+
+    Returns:
+        (报告行, 退化的基准测试名称)
+    """
+    rows = []
+    regressions = []
+    for name, result in results.items():
+        row: typing.Dict[str, typing.Any] = {"name": name, **result}
+        base = baseline.get(name)
+        if "skipped" in result:
+            row["status"] = "skipped"
+        elif not base:
+            row["status"] = "new"
+        else:
+            case = _REGISTRY.get(name)
+            limit = case.threshold if case is not None and case.threshold is not None else threshold
+            change = result["min_us"] / base["min_us"] - 1
+            row["baseline_us"] = base["min_us"]
+            row["change"] = change
+            if change > limit:
+                row["status"] = "REGRESSED"
+                regressions.append(name)
+            elif change < -limit:
+                row["status"] = "faster"
+            else:
+                row["status"] = "ok"
+        rows.append(row)
+    return rows, regressions
+
+
+def format_report(rows: typing.List[typing.Dict[str, typing.Any]]) -> str:
+    """
+    格式化对比报告
+
+    Args:
+        rows: compare 返回的报告行
+
+    Returns:
+        文本表格
+    """
+    header = ("benchmark", "min", "median", "baseline", "change", "status")
+    lines = [header]
+    for row in rows:
+        if "skipped" in row:
+            lines.append((row["name"], "-", "-", "-", "-", f"skipped ({row['skipped']})"))
+            continue
+        lines.append((
+            row["name"],
+            format_duration(row["min_us"]),
+            format_duration(row["median_us"]),
+            format_duration(row["baseline_us"]) if "baseline_us" in row else "-",
+            f"{row['change']:+.1%}" if "change" in row else "-",
+            row["status"],
+        ))
+    widths = [max(len(line[i]) for line in lines) for i in range(len(header))]
+    return "\n".join("  ".join(cell.ljust(width) for cell, width in zip(line, widths)).rstrip() for line in lines)
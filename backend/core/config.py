@@ -32,6 +32,44 @@ class Settings:
         # 数据库连接池配置
         self.TEST_DB_MAX_CONNECTIONS = int(os.getenv("TEST_DB_MAX_CONNECTIONS", "8"))
         self.TEST_DB_STALE_TIMEOUT = int(os.getenv("TEST_DB_STALE_TIMEOUT", "300"))
+        self.DB_POOL_STATS_LOG_INTERVAL = int(os.getenv("DB_POOL_STATS_LOG_INTERVAL", "500"))  # 工作进程每处理多少条消息记录一次连接池统计，0表示不记录
+
+        # 子任务状态延迟写入配置（状态变化在进程内合并，按间隔或行数批量写入）
+        # 进程被强制终止时最近一个写入间隔内的变化会丢失，见 backend.services.subtask_write_buffer
+        self.SUBTASK_WRITE_BUFFER_ENABLED = os.getenv("SUBTASK_WRITE_BUFFER_ENABLED", "false").lower() == "true"
+        self.SUBTASK_WRITE_BUFFER_INTERVAL_MS = int(os.getenv("SUBTASK_WRITE_BUFFER_INTERVAL_MS", "200"))  # 写入间隔（毫秒）
+        self.SUBTASK_WRITE_BUFFER_MAX_ROWS = int(os.getenv("SUBTASK_WRITE_BUFFER_MAX_ROWS", "500"))        # 积累到多少行时立即写入
+
+        # 事务发件箱配置（状态变化和后续事件在同一个事务中写入，由发件箱分发器处理通知、统计和完成检查）
+        self.OUTBOX_ENABLED = os.getenv("OUTBOX_ENABLED", "false").lower() == "true"
+        self.OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "200"))            # 每批领取的事件数量
+        self.OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "1.0"))    # 没有积压时的轮询间隔（秒）
+        self.OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))         # 事件最多处理次数，超过后放弃
+        self.OUTBOX_RETENTION_HOURS = int(os.getenv("OUTBOX_RETENTION_HOURS", "72"))   # 已处理事件保留时间（小时）
+
+        # 任务进度计数配置（子任务状态变化时在Redis中按任务计数，进度和完成检查不再读取子任务行）
+        self.TASK_PROGRESS_COUNTERS_ENABLED = os.getenv("TASK_PROGRESS_COUNTERS_ENABLED", "false").lower() == "true"
+        self.TASK_PROGRESS_KEY_PREFIX = os.getenv("TASK_PROGRESS_KEY_PREFIX", "nietest:progress")
+        self.TASK_PROGRESS_TTL = int(os.getenv("TASK_PROGRESS_TTL", str(7 * 24 * 3600)))          # 计数有效期（秒），每次变化时刷新
+        self.TASK_PROGRESS_RESYNC_INTERVAL = int(os.getenv("TASK_PROGRESS_RESYNC_INTERVAL", "300"))  # 未完成任务的计数超过该时间（秒）没有变化时按数据库校正
+
+        # 任务协调服务配置（全局一个选主的协调循环跟踪所有执行中任务的进度、完成和取消，替代每个任务的监控线程）
+        self.TASK_RECONCILER_ENABLED = os.getenv("TASK_RECONCILER_ENABLED", "false").lower() == "true"
+        self.TASK_RECONCILER_KEY_PREFIX = os.getenv("TASK_RECONCILER_KEY_PREFIX", "nietest:reconciler")
+        self.TASK_RECONCILER_INTERVAL = float(os.getenv("TASK_RECONCILER_INTERVAL", "10"))    # 两轮协调之间的间隔（秒）
+        self.TASK_RECONCILER_LEASE_TTL = float(os.getenv("TASK_RECONCILER_LEASE_TTL", "60"))  # 协调服务领导者租约有效期（秒），领导者退出后其他实例最多等待这么久接替
+
+        # 任务事件推送配置（子任务和任务状态变化时通过Redis发布订阅推送给前端的SSE连接，替代前端定时轮询）
+        self.TASK_EVENTS_ENABLED = os.getenv("TASK_EVENTS_ENABLED", "false").lower() == "true"
+        self.TASK_EVENTS_CHANNEL = os.getenv("TASK_EVENTS_CHANNEL", "nietest:task-events")
+        self.TASK_EVENTS_QUEUE_SIZE = int(os.getenv("TASK_EVENTS_QUEUE_SIZE", "1000"))    # 每个连接待发送事件的上限，超过后通知前端重新加载
+        self.TASK_EVENTS_HEARTBEAT = float(os.getenv("TASK_EVENTS_HEARTBEAT", "15"))     # 没有事件时发送心跳的间隔（秒），避免代理断开空闲连接
+
+        # 任务统计缓存配置（任务统计接口按筛选条件缓存结果，任务状态变化时失效，相同的并发请求只查询一次）
+        self.TASK_STATS_CACHE_ENABLED = os.getenv("TASK_STATS_CACHE_ENABLED", "false").lower() == "true"
+        self.TASK_STATS_CACHE_KEY_PREFIX = os.getenv("TASK_STATS_CACHE_KEY_PREFIX", "nietest:task-stats")
+        self.TASK_STATS_CACHE_TTL = float(os.getenv("TASK_STATS_CACHE_TTL", "5"))              # 缓存有效期（秒）
+        self.TASK_STATS_COALESCE_WAIT = float(os.getenv("TASK_STATS_COALESCE_WAIT", "2"))      # 等待其他请求查询结果的最长时间（秒），超过后自行查询
 
         # Redis配置
         self.BROKER_REDIS_URL = os.getenv("BROKER_REDIS_URL")
@@ -56,7 +94,99 @@ class Settings:
         # 任务配置
         self.MAX_RETRIES = int(os.getenv("MAX_RETRIES", "0"))
 
+        # 子任务生成流水线配置
+        self.SUBTASK_CHUNK_SIZE = int(os.getenv("SUBTASK_CHUNK_SIZE", "500"))          # 每个分块包含的子任务数量
+        self.SUBTASK_PIPELINE_DEPTH = int(os.getenv("SUBTASK_PIPELINE_DEPTH", "2"))    # 生成线程最多预先生成的分块数量
+        self.LAZY_DISPATCH_WINDOW = int(os.getenv("LAZY_DISPATCH_WINDOW", "200"))      # 惰性物化模式下每次分发的单元格数量
+        self.ENQUEUE_BATCH_SIZE = int(os.getenv("ENQUEUE_BATCH_SIZE", "500"))          # 批量发送消息时每个Redis pipeline包含的消息数量
+        self.BULK_LOAD_USE_COPY = os.getenv("BULK_LOAD_USE_COPY", "true").lower() == "true"  # 批量写入是否使用COPY（否则使用多行INSERT）
+
+        # 上游图像API全局限流配置（启用后子任务不再按提交顺序预先计算延迟）
+        self.RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "false").lower() == "true"
+        self.RATE_LIMIT_KEY_PREFIX = os.getenv("RATE_LIMIT_KEY_PREFIX", "nietest:rate_limit")
+        self.RATE_LIMIT_STANDARD_RATE = float(os.getenv("RATE_LIMIT_STANDARD_RATE", "5"))    # 标准API每秒请求数
+        self.RATE_LIMIT_STANDARD_BURST = float(os.getenv("RATE_LIMIT_STANDARD_BURST", "5"))  # 标准API突发容量
+        self.RATE_LIMIT_LUMINA_RATE = float(os.getenv("RATE_LIMIT_LUMINA_RATE", "2"))        # Lumina API每秒请求数
+        self.RATE_LIMIT_LUMINA_BURST = float(os.getenv("RATE_LIMIT_LUMINA_BURST", "1"))      # Lumina API突发容量
+        self.RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "240"))            # 获取令牌的最长等待时间（秒）
+        self.RATE_LIMIT_REQUEUE_DELAY = float(os.getenv("RATE_LIMIT_REQUEUE_DELAY", "30"))   # 等待令牌超时后重新发送消息的平均延迟（秒）
+
+        # 上游图像API自适应并发控制配置（AIMD：健康时加性增长，超时时乘性减少）
+        self.ADAPTIVE_CONCURRENCY_ENABLED = os.getenv("ADAPTIVE_CONCURRENCY_ENABLED", "false").lower() == "true"
+        self.ADAPTIVE_CONCURRENCY_KEY_PREFIX = os.getenv("ADAPTIVE_CONCURRENCY_KEY_PREFIX", "nietest:concurrency")
+        self.ADAPTIVE_STANDARD_INITIAL = float(os.getenv("ADAPTIVE_STANDARD_INITIAL", "5"))   # 标准API初始并发上限
+        self.ADAPTIVE_STANDARD_MIN = float(os.getenv("ADAPTIVE_STANDARD_MIN", "1"))           # 标准API最小并发上限
+        self.ADAPTIVE_STANDARD_MAX = float(os.getenv("ADAPTIVE_STANDARD_MAX", "50"))          # 标准API最大并发上限
+        self.ADAPTIVE_STANDARD_LATENCY_TARGET = float(os.getenv("ADAPTIVE_STANDARD_LATENCY_TARGET", "60"))  # 标准API完成耗时目标（秒）
+        self.ADAPTIVE_LUMINA_INITIAL = float(os.getenv("ADAPTIVE_LUMINA_INITIAL", "2"))       # Lumina API初始并发上限
+        self.ADAPTIVE_LUMINA_MIN = float(os.getenv("ADAPTIVE_LUMINA_MIN", "1"))               # Lumina API最小并发上限
+        self.ADAPTIVE_LUMINA_MAX = float(os.getenv("ADAPTIVE_LUMINA_MAX", "10"))              # Lumina API最大并发上限
+        self.ADAPTIVE_LUMINA_LATENCY_TARGET = float(os.getenv("ADAPTIVE_LUMINA_LATENCY_TARGET", "150"))  # Lumina API完成耗时目标（秒）
+        self.ADAPTIVE_DECREASE_FACTOR = float(os.getenv("ADAPTIVE_DECREASE_FACTOR", "0.5"))   # 乘性减少系数
+        self.ADAPTIVE_DECREASE_COOLDOWN = float(os.getenv("ADAPTIVE_DECREASE_COOLDOWN", "10"))  # 两次减少之间的最短间隔（秒）
+        self.ADAPTIVE_LEASE_TTL = float(os.getenv("ADAPTIVE_LEASE_TTL", "600"))               # 并发槽位租约有效期（秒），防止进程崩溃后槽位泄漏
+        self.ADAPTIVE_ACQUIRE_INTERVAL = float(os.getenv("ADAPTIVE_ACQUIRE_INTERVAL", "0.5"))  # 槽位已满时的重试间隔（秒）
+        self.ADAPTIVE_HISTORY_SIZE = int(os.getenv("ADAPTIVE_HISTORY_SIZE", "200"))           # 保留的调整记录条数
+
+        # 上游图像API共享HTTP客户端配置（每个工作线程的事件循环一个连接池）
+        self.HTTP_CLIENT_MAX_CONNECTIONS = int(os.getenv("HTTP_CLIENT_MAX_CONNECTIONS", "100"))    # 连接池最大连接数
+        self.HTTP_CLIENT_MAX_KEEPALIVE = int(os.getenv("HTTP_CLIENT_MAX_KEEPALIVE", "20"))         # 最多保持的空闲连接数
+        self.HTTP_CLIENT_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_CLIENT_KEEPALIVE_EXPIRY", "60"))  # 空闲连接保持时间（秒）
+        self.HTTP_CLIENT_TIMEOUT = float(os.getenv("HTTP_CLIENT_TIMEOUT", "30"))                   # 默认请求超时（秒）
+        self.HTTP_CLIENT_CONNECT_TIMEOUT = float(os.getenv("HTTP_CLIENT_CONNECT_TIMEOUT", "10"))   # 建立连接超时（秒）
+        self.HTTP_CLIENT_HTTP2 = os.getenv("HTTP_CLIENT_HTTP2", "false").lower() == "true"        # 是否启用HTTP/2（需要安装h2）
+        self.HTTP_CLIENT_STATS_LOG_INTERVAL = int(os.getenv("HTTP_CLIENT_STATS_LOG_INTERVAL", "500"))  # 每隔多少个请求记录一次连接复用统计，0表示不记录
+
+        # 异步子任务工作进程配置（单事件循环并发执行子任务）
+        self.ASYNC_WORKER_CONCURRENCY = int(os.getenv("ASYNC_WORKER_CONCURRENCY", "200"))  # 每个进程同时进行中的子任务数量上限
+
+        # 自适应轮询配置（按 端点/模型/步数/分辨率 统计完成耗时分布，推迟首次轮询，长尾任务逐步拉长间隔）
+        self.ADAPTIVE_POLLING_ENABLED = os.getenv("ADAPTIVE_POLLING_ENABLED", "false").lower() == "true"
+        self.POLLING_SCHEDULE_KEY_PREFIX = os.getenv("POLLING_SCHEDULE_KEY_PREFIX", "nietest:polling")
+        self.POLLING_FIRST_QUANTILE = float(os.getenv("POLLING_FIRST_QUANTILE", "0.1"))    # 首次轮询时间取完成耗时的分位数
+        self.POLLING_TAIL_QUANTILE = float(os.getenv("POLLING_TAIL_QUANTILE", "0.9"))      # 超过该分位数后开始拉长轮询间隔
+        self.POLLING_BACKOFF_FACTOR = float(os.getenv("POLLING_BACKOFF_FACTOR", "1.5"))    # 退避系数：间隔 = 基础间隔 + 超出时间 × (系数 - 1)
+        self.POLLING_MAX_INTERVAL = float(os.getenv("POLLING_MAX_INTERVAL", "10"))         # 最大轮询间隔（秒）
+        self.POLLING_MIN_SAMPLES = int(os.getenv("POLLING_MIN_SAMPLES", "20"))             # 样本数不足时按固定间隔轮询
+        self.POLLING_SAMPLE_SIZE = int(os.getenv("POLLING_SAMPLE_SIZE", "200"))            # 每个分组保留的最近样本数
+        self.POLLING_EXPLORATION_RATE = float(os.getenv("POLLING_EXPLORATION_RATE", "0.05"))  # 按固定间隔轮询的探测任务比例
+        self.POLLING_CACHE_TTL = float(os.getenv("POLLING_CACHE_TTL", "60"))               # 进程内分位数缓存时间（秒）
+
+        # 两阶段提交/轮询配置（子任务Actor只提交请求，由结果轮询服务统一轮询上游任务状态）
+        self.TWO_PHASE_POLLING_ENABLED = os.getenv("TWO_PHASE_POLLING_ENABLED", "false").lower() == "true"
+        self.RESULT_POLLER_KEY_PREFIX = os.getenv("RESULT_POLLER_KEY_PREFIX", "nietest:poller")
+        self.RESULT_POLLER_CONCURRENCY = int(os.getenv("RESULT_POLLER_CONCURRENCY", "200"))      # 每个轮询服务进程同时进行中的状态查询数量上限
+        self.RESULT_POLLER_BATCH_SIZE = int(os.getenv("RESULT_POLLER_BATCH_SIZE", "100"))        # 每次从登记表领取的最大数量
+        self.RESULT_POLLER_IDLE_INTERVAL = float(os.getenv("RESULT_POLLER_IDLE_INTERVAL", "0.2"))  # 没有到期任务时的等待时间（秒）
+        self.RESULT_POLLER_CLAIM_TTL = float(os.getenv("RESULT_POLLER_CLAIM_TTL", "60"))          # 领取租约（秒），轮询服务崩溃后到期的任务被重新领取
+
+        # 任务取消墓碑配置（工作进程跳过已取消任务的子任务消息）
+        self.TASK_TOMBSTONE_KEY_PREFIX = os.getenv("TASK_TOMBSTONE_KEY_PREFIX", "nietest:tombstone")
+        self.TASK_TOMBSTONE_TTL = int(os.getenv("TASK_TOMBSTONE_TTL", str(7 * 24 * 3600)))  # 墓碑有效期（秒），需长于子任务消息的最长延迟
+
+        # 任务准入控制配置（容量以进行中的子任务数量衡量，等待中的任务不占用工作线程）
+        # 启用时需要同时运行任务协调服务（TASK_RECONCILER_ENABLED），由其重新申请丢失准入记录的等待中任务
+        self.ADMISSION_CONTROL_ENABLED = os.getenv("ADMISSION_CONTROL_ENABLED", "false").lower() == "true"
+        self.ADMISSION_KEY_PREFIX = os.getenv("ADMISSION_KEY_PREFIX", "nietest:admission")
+        self.ADMISSION_STANDARD_CAPACITY = int(os.getenv("ADMISSION_STANDARD_CAPACITY", "2000"))  # 普通任务池容量（子任务数）
+        self.ADMISSION_LUMINA_CAPACITY = int(os.getenv("ADMISSION_LUMINA_CAPACITY", "1"))         # Lumina任务池容量（子任务数），默认同时只运行一个Lumina任务
+        self.ADMISSION_TASK_CHARGE_CAP = int(os.getenv("ADMISSION_TASK_CHARGE_CAP", "1000"))      # 单个任务最多占用的容量
+        self.ADMISSION_LEASE_TTL = float(os.getenv("ADMISSION_LEASE_TTL", "1800"))                # 已准入任务的心跳有效期（秒），超时后释放容量
+        self.ADMISSION_RECOVERY_GRACE = float(os.getenv("ADMISSION_RECOVERY_GRACE", "300"))       # 等待中的任务超过该时间（秒）未更新且不在准入队列中时，由任务协调服务重新申请准入
+
+        # 子任务公平调度配置（按任务优先级加权的步幅调度，按用户限制进行中的子任务数量）
+        self.FAIR_SCHEDULING_ENABLED = os.getenv("FAIR_SCHEDULING_ENABLED", "false").lower() == "true"
+        self.FAIR_SCHEDULER_KEY_PREFIX = os.getenv("FAIR_SCHEDULER_KEY_PREFIX", "nietest:fair")
+        self.FAIR_MAX_IN_FLIGHT = int(os.getenv("FAIR_MAX_IN_FLIGHT", "40"))            # 所有任务进行中的子任务总数上限
+        self.FAIR_USER_MAX_IN_FLIGHT = int(os.getenv("FAIR_USER_MAX_IN_FLIGHT", "20"))  # 单个用户进行中的子任务数量上限
+        self.FAIR_ROUND_SIZE = int(os.getenv("FAIR_ROUND_SIZE", "100"))                 # 每轮调度最多发送的子任务数量
+        self.FAIR_DISPATCH_INTERVAL = int(os.getenv("FAIR_DISPATCH_INTERVAL", "1000"))  # 调度间隔（毫秒）
+        self.FAIR_LEASE_TTL = float(os.getenv("FAIR_LEASE_TTL", "900"))                 # 进行中记录的有效期（秒），防止工作进程崩溃后额度泄漏
+        self.FAIR_PRIORITY_WEIGHT_BASE = float(os.getenv("FAIR_PRIORITY_WEIGHT_BASE", "2"))  # 优先级权重基数：权重 = 基数 ** 优先级
+
         # 图像生成服务配置
+        self.IMAGE_API_BASE_URL = os.getenv("IMAGE_API_BASE_URL", "https://api.talesofai.cn").rstrip("/")                # 标准API地址
+        self.LUMINA_IMAGE_API_BASE_URL = os.getenv("LUMINA_IMAGE_API_BASE_URL", "https://ops.api.talesofai.cn").rstrip("/")  # Lumina API地址
         self.TEST_IMAGE_MAX_POLLING_ATTEMPTS = int(os.getenv("TEST_IMAGE_MAX_POLLING_ATTEMPTS", "30"))
         self.TEST_IMAGE_POLLING_INTERVAL = float(os.getenv("TEST_IMAGE_POLLING_INTERVAL", "2.0"))
 
@@ -82,6 +212,14 @@ class Settings:
         if not self.FEISHU_DEBUG_WEBHOOK_URL:
             self.FEISHU_DEBUG_WEBHOOK_URL = self.FEISHU_WEBHOOK_URL
 
+        # 飞书通知发送配置（进程内有界队列 + 单个后台发送线程）
+        self.FEISHU_QUEUE_SIZE = int(os.getenv("FEISHU_QUEUE_SIZE", "1000"))                           # 发送队列长度
+        self.FEISHU_LOW_PRIORITY_WATERMARK = float(os.getenv("FEISHU_LOW_PRIORITY_WATERMARK", "0.5"))  # 队列使用率超过该比例时丢弃低优先级通知
+        self.FEISHU_RATE_PER_MINUTE = int(os.getenv("FEISHU_RATE_PER_MINUTE", "90"))                   # 每个机器人每分钟最多发送的通知数
+        self.FEISHU_MAX_RETRIES = int(os.getenv("FEISHU_MAX_RETRIES", "3"))                            # 限流或发送失败时的重试次数
+        self.FEISHU_MAX_BACKOFF = float(os.getenv("FEISHU_MAX_BACKOFF", "60"))                         # 最长退避时间（秒）
+        self.FEISHU_DIGEST_INTERVAL = float(os.getenv("FEISHU_DIGEST_INTERVAL", "60"))                 # 子任务结果汇总间隔（秒），0表示逐条发送
+
         # 前端地址配置
         self.FRONTEND_BASE_URL = os.getenv("FRONTEND_BASE_URL", "http://localhost:3000")
 
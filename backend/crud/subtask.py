@@ -6,6 +6,7 @@ from typing import List, Dict, Any, Union, Optional
 from uuid import UUID
 from datetime import datetime
 
+from backend.core.config import settings
 from backend.crud.base import CRUDBase
 from backend.models.db.subtasks import Subtask, SubtaskStatus
 
@@ -112,6 +113,44 @@ class SubtaskCRUD(CRUDBase[Subtask]):
             logger.error(f"更新子任务状态时出错: 子任务 ID: {id}, 错误: {str(e)}")
             return None
 
+    def cancel_by_task(self, task_id: Union[str, UUID], statuses: List[str], error: Optional[str] = None) -> int:
+        """
+        用一条UPDATE语句将任务中处于指定状态的子任务标记为已取消
+
+        启用进度计数时通过 RETURNING 取回被取消的子任务ID并更新计数
+
+        Args:
+            task_id: 任务 ID
+            statuses: 需要取消的子任务状态列表
+            error: 错误信息（可选）
+
+        Returns:
+            被取消的子任务数量
+        """
+        try:
+            now = datetime.now()
+            data = {
+                Subtask.status: SubtaskStatus.CANCELLED.value,
+                Subtask.completed_at: now,
+                Subtask.updated_at: now,
+            }
+            if error:
+                data[Subtask.error] = error
+            query = Subtask.update(data).where(
+                (Subtask.task == str(task_id)) &
+                (Subtask.status.in_(statuses))
+            )
+            if not settings.TASK_PROGRESS_COUNTERS_ENABLED:
+                return query.execute()
+
+            from backend.services.task_progress import record_subtask_statuses
+            cancelled_ids = [str(subtask_id) for subtask_id, in query.returning(Subtask.id).tuples().execute()]
+            record_subtask_statuses(str(task_id), dict.fromkeys(cancelled_ids, SubtaskStatus.CANCELLED.value))
+            return len(cancelled_ids)
+        except Exception as e:
+            logger.error(f"批量取消子任务时出错: 任务 ID: {task_id}, 错误: {str(e)}")
+            return 0
+
     def set_result(self, id: Union[str, UUID], result: Dict[str, Any]) -> Optional[Subtask]:
         """
         设置子任务结果
@@ -0,0 +1,334 @@
+"""
+批量导入模块
+
+通过 COPY ... FROM STDIN (CSV) 将大量行流式写入PostgreSQL，
+当连接不支持COPY时回退为多行INSERT。供子任务创建和数据迁移脚本共用。
+"""
+import io
+import json
+import logging
+import uuid
+from datetime import datetime, date
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Type
+
+from playhouse.postgres_ext import JSONField, ArrayField
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 列类型：需要特殊编码的列
+COLUMN_JSON = "json"
+COLUMN_ARRAY = "array"
+
+# 回退INSERT时每条语句包含的行数
+INSERT_BATCH_SIZE = 500
+
+
+class CopyNotSupportedError(Exception):
+    """连接不支持COPY FROM STDIN"""
+    pass
+
+
+def _quote_identifier(name: str) -> str:
+    """为表名或列名加双引号"""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _format_array_element(value: Any) -> str:
+    """
+    将数组元素编码为PostgreSQL数组字面量中的元素
+
+    Args:
+        value: 元素值
+
+    Returns:
+        编码后的元素
+    """
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, (list, tuple)):
+        return _format_array(value)
+    text = str(value).replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{text}"'
+
+
+def _format_array(values: Sequence[Any]) -> str:
+    """将列表编码为PostgreSQL数组字面量，如 {1,2,3}"""
+    return "{" + ",".join(_format_array_element(v) for v in values) + "}"
+
+
+def _format_csv_value(value: Any, column_type: Optional[str]) -> str:
+    """
+    将单个值编码为CSV字段
+
+    NULL 编码为不带引号的空字段，其他值一律加引号，因此空字符串与NULL可以区分。
+
+    Args:
+        value: 字段值
+        column_type: 列类型（COLUMN_JSON、COLUMN_ARRAY 或 None）
+
+    Returns:
+        CSV字段文本
+    """
+    if value is None:
+        return ""
+    if column_type == COLUMN_JSON:
+        text = json.dumps(value, ensure_ascii=False)
+    elif column_type == COLUMN_ARRAY:
+        text = _format_array(value)
+    elif isinstance(value, bool):
+        text = "t" if value else "f"
+    elif isinstance(value, (datetime, date)):
+        text = value.isoformat()
+    elif isinstance(value, uuid.UUID):
+        text = str(value)
+    elif isinstance(value, (dict, list)):
+        text = json.dumps(value, ensure_ascii=False)
+    else:
+        text = str(value)
+    return '"' + text.replace('"', '""') + '"'
+
+
+def iter_csv_lines(rows: Iterable[Sequence[Any]], column_types: Sequence[Optional[str]]) -> Iterator[str]:
+    """
+    将行编码为CSV文本行
+
+    Args:
+        rows: 行数据，每行的值顺序与列顺序一致
+        column_types: 每列的类型
+
+    Yields:
+        以换行结尾的CSV行
+    """
+    for row in rows:
+        yield ",".join(_format_csv_value(value, column_type)
+                       for value, column_type in zip(row, column_types)) + "\n"
+
+
+class _LineStream(io.TextIOBase):
+    """将文本行迭代器包装为只读文件对象，供COPY流式读取"""
+
+    def __init__(self, lines: Iterator[str]):
+        self._lines = lines
+        self._buffer = ""
+        self.rows = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._lines)
+                self.rows += 1
+            except StopIteration:
+                break
+        if size < 0:
+            size = len(self._buffer)
+        chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        return chunk
+
+    def readline(self, size: int = -1) -> str:
+        return self.read(size if size >= 0 else 8192)
+
+
+def copy_rows(connection: Any, table_name: str, columns: Sequence[str], rows: Iterable[Sequence[Any]],
+              column_types: Optional[Dict[str, str]] = None) -> int:
+    """
+    使用 COPY ... FROM STDIN (CSV) 将行流式写入表
+
+    支持 psycopg2（copy_expert）和 psycopg 3（cursor.copy）连接。事务由调用方控制。
+
+    Args:
+        connection: DB-API连接对象
+        table_name: 表名
+        columns: 列名列表
+        rows: 行数据迭代器
+        column_types: 列名到列类型的映射（COLUMN_JSON、COLUMN_ARRAY）
+
+    Returns:
+        写入的行数
+
+    Raises:
+        CopyNotSupportedError: 连接不支持COPY
+    """
+    column_types = column_types or {}
+    types = [column_types.get(column) for column in columns]
+    sql = (f"COPY {_quote_identifier(table_name)} ({', '.join(_quote_identifier(c) for c in columns)}) "
+           f"FROM STDIN WITH (FORMAT csv)")
+    stream = _LineStream(iter_csv_lines(rows, types))
+
+    cursor = connection.cursor()
+    try:
+        if hasattr(cursor, "copy_expert"):
+            cursor.copy_expert(sql, stream, size=65536)
+        elif hasattr(cursor, "copy"):
+            with cursor.copy(sql) as copy:
+                while True:
+                    chunk = stream.read(65536)
+                    if not chunk:
+                        break
+                    copy.write(chunk)
+        else:
+            raise CopyNotSupportedError(f"连接 {type(connection).__name__} 不支持COPY FROM STDIN")
+    finally:
+        cursor.close()
+    return stream.rows
+
+
+def insert_rows(connection: Any, table_name: str, columns: Sequence[str], rows: Iterable[Sequence[Any]],
+                column_types: Optional[Dict[str, str]] = None, batch_size: int = INSERT_BATCH_SIZE) -> int:
+    """
+    使用多行INSERT写入表（COPY不可用时的回退方式）
+
+    Args:
+        connection: DB-API连接对象
+        table_name: 表名
+        columns: 列名列表
+        rows: 行数据迭代器
+        column_types: 列名到列类型的映射，JSON列会被序列化为字符串
+        batch_size: 每条INSERT语句包含的行数
+
+    Returns:
+        写入的行数
+    """
+    column_types = column_types or {}
+    json_positions = [i for i, column in enumerate(columns) if column_types.get(column) == COLUMN_JSON]
+    column_sql = ", ".join(_quote_identifier(c) for c in columns)
+    row_placeholder = "(" + ", ".join(["%s"] * len(columns)) + ")"
+
+    total = 0
+    batch: List[Sequence[Any]] = []
+
+    def flush():
+        if not batch:
+            return
+        params: List[Any] = []
+        for row in batch:
+            row = list(row)
+            for position in json_positions:
+                if row[position] is not None:
+                    row[position] = json.dumps(row[position], ensure_ascii=False)
+            params.extend(row)
+        sql = (f"INSERT INTO {_quote_identifier(table_name)} ({column_sql}) VALUES "
+               + ", ".join([row_placeholder] * len(batch)))
+        cursor = connection.cursor()
+        try:
+            cursor.execute(sql, params)
+        finally:
+            cursor.close()
+
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            flush()
+            total += len(batch)
+            batch = []
+    flush()
+    total += len(batch)
+    return total
+
+
+def bulk_load_rows(connection: Any, table_name: str, columns: Sequence[str], rows: Sequence[Sequence[Any]],
+                   column_types: Optional[Dict[str, str]] = None, use_copy: bool = True) -> int:
+    """
+    批量写入行：优先使用COPY，不支持时回退为多行INSERT
+
+    Args:
+        connection: DB-API连接对象
+        table_name: 表名
+        columns: 列名列表
+        rows: 行数据（回退时需要重新遍历，因此为序列）
+        column_types: 列名到列类型的映射（COLUMN_JSON、COLUMN_ARRAY）
+        use_copy: 是否尝试使用COPY
+
+    Returns:
+        写入的行数
+    """
+    if use_copy:
+        try:
+            return copy_rows(connection, table_name, columns, rows, column_types)
+        except CopyNotSupportedError as e:
+            logger.warning(f"{e}，回退为多行INSERT")
+    return insert_rows(connection, table_name, columns, rows, column_types)
+
+
+def model_columns(model_class: Type[Any]) -> List[Any]:
+    """返回模型的字段列表（按表中列的顺序）"""
+    return list(model_class._meta.sorted_fields)
+
+
+def model_column_types(model_class: Type[Any]) -> Dict[str, str]:
+    """
+    根据模型字段类型生成列类型映射
+
+    Args:
+        model_class: Peewee模型类
+
+    Returns:
+        列名到列类型的映射
+    """
+    column_types = {}
+    for field in model_columns(model_class):
+        if isinstance(field, JSONField):
+            column_types[field.column_name] = COLUMN_JSON
+        elif isinstance(field, ArrayField):
+            column_types[field.column_name] = COLUMN_ARRAY
+    return column_types
+
+
+def model_to_row(instance: Any, fields: Sequence[Any], column_types: Dict[str, str]) -> List[Any]:
+    """
+    将模型实例转换为行数据
+
+    JSON和数组列直接使用Python值（由编码函数处理），其余列使用字段的 db_value。
+
+    Args:
+        instance: 模型实例
+        fields: 字段列表
+        column_types: 列类型映射
+
+    Returns:
+        行数据
+    """
+    row = []
+    data = instance.__data__
+    for field in fields:
+        value = data.get(field.name)
+        if field.column_name not in column_types:
+            value = field.db_value(value)
+        row.append(value)
+    return row
+
+
+def bulk_load_models(model_class: Type[Any], instances: Sequence[Any], use_copy: bool = True) -> int:
+    """
+    将未保存的模型实例批量写入对应的表
+
+    使用模型所属数据库的当前连接，并在一个事务中完成写入。
+    实例的默认值（如主键UUID、created_at）在实例化时已生成，写入后实例ID保持不变。
+
+    Args:
+        model_class: Peewee模型类
+        instances: 模型实例列表
+        use_copy: 是否尝试使用COPY
+
+    Returns:
+        写入的行数
+    """
+    if not instances:
+        return 0
+
+    fields = model_columns(model_class)
+    columns = [field.column_name for field in fields]
+    column_types = model_column_types(model_class)
+    rows = [model_to_row(instance, fields, column_types) for instance in instances]
+
+    database = model_class._meta.database
+    with database.atomic():
+        return bulk_load_rows(database.connection(), model_class._meta.table_name, columns, rows,
+                              column_types, use_copy=use_copy)
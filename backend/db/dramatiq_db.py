@@ -5,10 +5,8 @@ Dramatiq数据库连接模块
 避免循环导入问题
 """
 import logging
-import os
 from peewee import DatabaseProxy
-from playhouse.pool import PooledPostgresqlDatabase
-from backend.core.config import settings
+from backend.db.pool import get_database
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -20,35 +18,13 @@ def initialize_dramatiq_db():
     """
     为Dramatiq工作进程初始化数据库连接
 
-    使用settings中的配置，确保配置一致性
+    与测试数据库代理共用当前进程的连接池，重复调用时直接返回已有的连接池
     """
-    # 从settings获取数据库配置
-    db_host = settings.TEST_DB_HOST
-    db_port = settings.TEST_DB_PORT
-    db_name = settings.TEST_DB_NAME
-    db_user = settings.TEST_DB_USER
-    db_password = settings.TEST_DB_PASSWORD
-    db_max_connections = max(settings.TEST_DB_MAX_CONNECTIONS, 20)  # 增加最大连接数
-    db_stale_timeout = max(settings.TEST_DB_STALE_TIMEOUT, 600)     # 增加超时时间
-
-    # 创建数据库连接
-    logger.info(f"正在初始化Dramatiq数据库连接: {db_host}:{db_port}/{db_name}")
-    test_db = PooledPostgresqlDatabase(
-        db_name,
-        user=db_user,
-        password=db_password,
-        host=db_host,
-        port=db_port,
-        max_connections=db_max_connections,
-        stale_timeout=db_stale_timeout,
-        timeout=30,                                                 # 连接超时30秒
-        autorollback=True,
-        autoconnect=True
-    )
-
-    # 初始化代理
-    dramatiq_db_proxy.initialize(test_db)
-    logger.info(f"Dramatiq数据库连接池已初始化: 最大连接数={db_max_connections}, 超时时间={db_stale_timeout}秒")
+    db = get_database()
+    if dramatiq_db_proxy.obj is not db:
+        dramatiq_db_proxy.initialize(db)
+        logger.info("Dramatiq数据库代理已绑定到进程连接池")
+    return db
 
 def close_dramatiq_db():
     """
@@ -68,7 +44,8 @@ def reconnect_dramatiq_db():
     try:
         logger.info("正在重新连接Dramatiq数据库...")
         close_dramatiq_db()
-        initialize_dramatiq_db()
+        # 丢弃空闲连接，数据库重启后池中的连接已失效
+        initialize_dramatiq_db().close_idle()
         logger.info("Dramatiq数据库重新连接成功")
     except Exception as e:
         logger.error(f"重新连接Dramatiq数据库失败: {str(e)}")
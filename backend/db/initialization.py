@@ -4,9 +4,8 @@
 提供数据库连接的初始化和关闭功能
 """
 import logging
-from playhouse.pool import PooledPostgresqlDatabase
-from backend.core.config import settings
 from backend.db.database import test_db_proxy
+from backend.db.pool import get_database
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -15,22 +14,12 @@ def initialize_test_db():
     """
     初始化测试数据库连接
 
-    使用配置中的测试数据库设置初始化数据库代理对象
+    把数据库代理绑定到当前进程的连接池，重复调用时直接返回已有的连接池
     """
-    test_db = PooledPostgresqlDatabase(
-        settings.TEST_DB_NAME,
-        user=settings.TEST_DB_USER,
-        password=settings.TEST_DB_PASSWORD,
-        host=settings.TEST_DB_HOST,
-        port=settings.TEST_DB_PORT,
-        max_connections=max(settings.TEST_DB_MAX_CONNECTIONS, 20),  # 增加最大连接数
-        stale_timeout=max(settings.TEST_DB_STALE_TIMEOUT, 600),     # 增加超时时间到10分钟
-        timeout=30,                                                 # 连接超时30秒
-        autorollback=True,
-        autoconnect=True
-    )
-    test_db_proxy.initialize(test_db)
-    logger.info(f"数据库连接池已初始化: 最大连接数={max(settings.TEST_DB_MAX_CONNECTIONS, 20)}, 超时时间={max(settings.TEST_DB_STALE_TIMEOUT, 600)}秒")
+    test_db = get_database()
+    if test_db_proxy.obj is not test_db:
+        test_db_proxy.initialize(test_db)
+        logger.info("测试数据库代理已绑定到进程连接池")
     return test_db
 
 def close_test_db():
@@ -51,7 +40,8 @@ def reconnect_test_db():
     try:
         logger.info("正在重新连接数据库...")
         close_test_db()
-        initialize_test_db()
+        # 丢弃空闲连接，数据库重启后池中的连接已失效
+        initialize_test_db().close_idle()
         logger.info("数据库重新连接成功")
     except Exception as e:
         logger.error(f"重新连接数据库失败: {str(e)}")
@@ -0,0 +1,157 @@
+"""
+数据库连接池模块
+
+每个进程只创建一个PostgreSQL连接池，test_db_proxy 和 dramatiq_db_proxy 共用这个连接池，
+重复初始化时直接返回已有的连接池。连接池记录新建连接数、使用中的连接数和获取连接的等待时间。
+"""
+import logging
+import os
+import threading
+import time
+import typing
+
+from playhouse.pool import MaxConnectionsExceeded, PooledPostgresqlDatabase
+
+from backend.core.config import settings
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+class InstrumentedPooledPostgresqlDatabase(PooledPostgresqlDatabase):
+    """
+    记录连接池指标的PostgreSQL连接池
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        """初始化连接池和统计"""
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "checkouts": 0,           # 获取连接次数
+            "connections_opened": 0,  # 新建的数据库连接数
+            "connections_closed": 0,  # 关闭的数据库连接数（过期、失效或手动关闭）
+            "wait_timeouts": 0,       # 等待空闲连接超时次数
+            "wait_total": 0.0,        # 获取连接的累计等待时间（秒）
+            "wait_max": 0.0,          # 获取连接的最长等待时间（秒）
+        }
+        super().__init__(*args, **kwargs)
+
+    def _incr(self, field: str, amount: float = 1) -> None:
+        with self._stats_lock:
+            self._stats[field] += amount
+
+    def connect(self, reuse_if_open=False):
+        """获取连接，记录等待时间"""
+        start_time = time.monotonic()
+        try:
+            return super().connect(reuse_if_open)
+        except MaxConnectionsExceeded:
+            self._incr("wait_timeouts")
+            raise
+        finally:
+            waited = time.monotonic() - start_time
+            with self._stats_lock:
+                self._stats["checkouts"] += 1
+                self._stats["wait_total"] += waited
+                self._stats["wait_max"] = max(self._stats["wait_max"], waited)
+
+    def _connect(self):
+        """从连接池取出连接，池中没有可用连接时新建"""
+        with self._pool_lock:
+            idle = {self.conn_key(conn) for _, _, conn in self._connections}
+            conn = super()._connect()
+            if self.conn_key(conn) not in idle:
+                self._incr("connections_opened")
+            return conn
+
+    def _close_raw(self, conn):
+        """关闭底层数据库连接"""
+        self._incr("connections_closed")
+        super()._close_raw(conn)
+
+    def get_stats(self) -> typing.Dict[str, typing.Any]:
+        """
+        获取连接池统计
+
+        Returns:
+            新建/关闭的连接数、使用中和空闲的连接数、获取连接的次数和等待时间
+        """
+        with self._pool_lock:
+            in_use = len(self._in_use)
+            idle = len(self._connections)
+        with self._stats_lock:
+            stats = dict(self._stats)
+        checkouts = stats["checkouts"]
+        return {
+            "pid": os.getpid(),
+            "max_connections": self._max_connections,
+            "in_use": in_use,
+            "idle": idle,
+            "connections_opened": stats["connections_opened"],
+            "connections_closed": stats["connections_closed"],
+            "checkouts": checkouts,
+            "wait_timeouts": stats["wait_timeouts"],
+            "wait_avg_ms": round(stats["wait_total"] / checkouts * 1000, 3) if checkouts else 0.0,
+            "wait_max_ms": round(stats["wait_max"] * 1000, 3),
+        }
+
+
+# 单例模式（按进程，fork出的子进程重新创建连接池）
+_database_instance: typing.Optional[InstrumentedPooledPostgresqlDatabase] = None
+_database_pid: typing.Optional[int] = None
+_database_lock = threading.Lock()
+
+
+def get_database() -> InstrumentedPooledPostgresqlDatabase:
+    """
+    获取当前进程的数据库连接池（单例模式）
+
+    Returns:
+        数据库连接池
+    """
+    global _database_instance, _database_pid
+    if _database_instance is not None and _database_pid == os.getpid():
+        return _database_instance
+
+    with _database_lock:
+        if _database_instance is None or _database_pid != os.getpid():
+            max_connections = max(settings.TEST_DB_MAX_CONNECTIONS, 20)  # 增加最大连接数
+            stale_timeout = max(settings.TEST_DB_STALE_TIMEOUT, 600)     # 增加超时时间到10分钟
+            _database_instance = InstrumentedPooledPostgresqlDatabase(
+                settings.TEST_DB_NAME,
+                user=settings.TEST_DB_USER,
+                password=settings.TEST_DB_PASSWORD,
+                host=settings.TEST_DB_HOST,
+                port=settings.TEST_DB_PORT,
+                max_connections=max_connections,
+                stale_timeout=stale_timeout,
+                timeout=30,                                              # 连接超时30秒
+                autorollback=True,
+                autoconnect=True
+            )
+            _database_pid = os.getpid()
+            logger.info(f"数据库连接池已创建: {settings.TEST_DB_HOST}:{settings.TEST_DB_PORT}/{settings.TEST_DB_NAME}, "
+                        f"最大连接数={max_connections}, 超时时间={stale_timeout}秒, PID={_database_pid}")
+    return _database_instance
+
+
+def release_connection() -> None:
+    """
+    把当前线程持有的连接归还连接池（事务中不归还）
+    """
+    if _database_instance is None or _database_pid != os.getpid():
+        return
+    if not _database_instance.is_closed() and not _database_instance.in_transaction():
+        _database_instance.close()
+
+
+def get_pool_stats() -> typing.Optional[typing.Dict[str, typing.Any]]:
+    """
+    获取当前进程的连接池统计
+
+    Returns:
+        连接池统计，尚未创建连接池时返回None
+    """
+    if _database_instance is None or _database_pid != os.getpid():
+        return None
+    return _database_instance.get_stats()
@@ -16,12 +16,30 @@ import random
 import asyncio
 import math
 import os
+import contextlib
+import uuid
 import httpx
 
 from backend.core.config import settings
-from backend.utils.feishu import feishu_notify
+from backend.utils.feishu import feishu_subtask_notify
+from backend.utils.rate_limiter import get_rate_limiter, RateLimitTimeoutError, BUCKET_LUMINA, BUCKET_STANDARD
+from backend.utils.concurrency_controller import (
+    get_concurrency_controller, ConcurrencySlot, OUTCOME_TIMEOUT, OUTCOME_FAILURE, OUTCOME_CENSORED
+)
 from backend.models.db.dramatiq_base import DramatiqBaseModel
 from backend.models.db.subtasks import Subtask, SubtaskStatus
+from backend.models.db.tasks import Task, TaskStatus
+from backend.services.subtask_plan import get_task_plan, build_cell_subtask
+from backend.services.fair_scheduler import get_fair_scheduler
+from backend.services.task_tombstones import is_task_cancelled
+from backend.services.poll_registry import get_poll_registry
+from backend.services.subtask_write_buffer import get_subtask_write_buffer
+from backend.services.outbox import build_event, record_events, EVENT_SUBTASK_FINISHED
+from backend.services.task_progress import record_subtask_statuses
+from backend.services.task_events import publish_subtask_updates
+from backend.utils.http_client import get_http_client
+from backend.db.pool import release_connection
+from backend.utils.polling_schedule import get_polling_schedule
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -39,6 +57,14 @@ class RetryableException(Exception):
     """可重试的异常"""
     pass
 
+class UpstreamTimeoutException(RetryableException):
+    """上游任务返回TIMEOUT状态，可重试，并发控制视为超时"""
+    pass
+
+class TaskCancelledException(Exception):
+    """父任务已取消，放弃当前子任务"""
+    pass
+
 class ImageClient:
     """
     图像生成客户端
@@ -53,13 +79,13 @@ class ImageClient:
             logger.warning("环境变量中未设置NIETA_XTOKEN，请确保设置正确的API令牌")
             raise ValueError("环境变量中未设置NIETA_XTOKEN")
 
-        # API端点
-        self.api_url = "https://api.talesofai.cn/v3/make_image"
-        self.task_status_url = "https://api.talesofai.cn/v1/artifact/task/{task_uuid}"
+        # API端点（IMAGE_API_BASE_URL 可指向本地模拟服务，见 backend.loadtest.fake_upstream）
+        self.api_url = f"{settings.IMAGE_API_BASE_URL}/v3/make_image"
+        self.task_status_url = f"{settings.IMAGE_API_BASE_URL}/v1/artifact/task/{{task_uuid}}"
 
         # Lumina API端点
-        self.lumina_api_url = "https://ops.api.talesofai.cn/v3/make_image"
-        self.lumina_task_status_url = "https://ops.api.talesofai.cn/v1/artifact/task/{task_uuid}"
+        self.lumina_api_url = f"{settings.LUMINA_IMAGE_API_BASE_URL}/v3/make_image"
+        self.lumina_task_status_url = f"{settings.LUMINA_IMAGE_API_BASE_URL}/v1/artifact/task/{{task_uuid}}"
 
         # 轮询配置
         self.max_polling_attempts = int(os.getenv("IMAGE_MAX_POLLING_ATTEMPTS", "30"))  # 最大轮询次数
@@ -85,7 +111,8 @@ class ImageClient:
                             is_lumina: bool = False,
                             lumina_model_name: str = None,
                             lumina_cfg: float = None,
-                            lumina_step: int = None) -> Dict[str, Any]:
+                            lumina_step: int = None,
+                            task_id: Optional[str] = None) -> Dict[str, Any]:
         """
         生成图像
 
@@ -98,11 +125,242 @@ class ImageClient:
             lumina_model_name: Lumina模型名称
             lumina_cfg: Lumina配置参数
             lumina_step: Lumina步数
+            task_id: 所属任务ID，提交前和每次轮询前检查任务是否已取消
 
         Returns:
             生成结果
+
+        Raises:
+            TaskCancelledException: 所属任务已取消
+        """
+
+        api_url, task_status_url, payload, seed = self._build_request(
+            prompts, width, height, seed, use_polish, is_lumina, lumina_model_name, lumina_cfg, lumina_step
+        )
+
+        try:
+            await asyncio.to_thread(self._check_cancelled, task_id)
+
+            # 先获取限流令牌再占用槽位，等待令牌的时间不占用槽位
+            await self._acquire_rate_limit_token(is_lumina, payload)
+
+            # 占用自适应并发槽位（未启用时不做限制），结束后把提交耗时、完成耗时和结果反馈给控制器
+            async with self._concurrency_slot(is_lumina) as slot:
+                # 等待槽位期间任务可能已被取消
+                await asyncio.to_thread(self._check_cancelled, task_id)
+
+                # 发送API请求，直接获取任务UUID字符串
+                submit_start = time.time()
+                task_uuid = await self._call_api(api_url, payload)
+                if slot:
+                    slot.record_submit(time.time() - submit_start)
+
+                # 验证任务UUID
+                if not task_uuid:
+                    raise Exception("API返回的任务UUID为空")
+
+                logger.info(f"获取到任务UUID: {task_uuid}")
+
+                # 轮询任务状态
+                max_attempts = self.lumina_max_polling_attempts if is_lumina else self.max_polling_attempts
+                polling_interval = self.lumina_polling_interval if is_lumina else self.polling_interval
+
+                profile = get_polling_schedule().profile_key(is_lumina, lumina_model_name, lumina_step, width, height)
+                result = await self._poll_task_status(task_uuid, task_status_url, max_attempts, polling_interval,
+                                                      task_id=task_id, profile=profile, slot=slot)
+
+            # 检查任务状态
+            task_status = result.get("status")
+            task_status = result.get("task_status")
+
+            # 检查task_status
+            if task_status:
+                if task_status == "SUCCESS":
+                    # 提取图像URL
+                    image_url = await self.extract_image_url(result)
+                    if not image_url:
+                        raise Exception("无法从结果中提取图像URL")
+
+                    return {
+                        "success": True,
+                        "data": {
+                            "image_url": image_url,
+                            "seed": seed,
+                            "is_lumina": is_lumina,
+                            "width": width,
+                            "height": height
+                        }
+                    }
+                elif task_status == "FAILURE":
+                    error_msg = result.get("error", "未知错误")
+                    logger.error(f"任务失败(task_status=FAILURE): {task_uuid}, 错误: {error_msg}")
+                    raise Exception(f"任务失败: {error_msg}")
+                elif task_status == "ILLEGAL_IMAGE":
+                    logger.error(f"任务失败(task_status=ILLEGAL_IMAGE): {task_uuid}, 内容不合规")
+                    raise ContentCensoredException("图像生成API返回ILLEGAL_IMAGE状态，内容不合规")
+                elif task_status == "TIMEOUT":
+                    logger.warning(f"任务超时(task_status=TIMEOUT): {task_uuid}, 将进行重试")
+                    raise UpstreamTimeoutException("图像生成API返回TIMEOUT状态，任务超时")
+                elif task_status == "PENDING":
+                    pass
+                    # 继续轮询，不做其他处理
+                else:
+                    # 其他未知状态视为失败
+                    logger.error(f"任务失败(task_status={task_status}): {task_uuid}, 将结束重试")
+                    error_msg = result.get("error", f"任务状态为{task_status}")
+                    raise Exception(f"任务失败: {error_msg}")
+
+            # 提取图像URL
+            image_url = await self.extract_image_url(result)
+            if not image_url:
+                raise Exception("无法从结果中提取图像URL")
+
+            return {
+                "success": True,
+                "data": {
+                    "image_url": image_url,
+                    "seed": seed,
+                    "is_lumina": is_lumina,
+                    "width": width,
+                    "height": height
+                }
+            }
+
+        except (TaskCancelledException, RateLimitTimeoutError):
+            # 任务取消和限流等待超时不是生成失败，交给调用方处理
+            raise
+        except Exception as e:
+            logger.error(f"图像生成失败: {str(e)}")
+            logger.error(traceback.format_exc())
+            return {
+                "success": False,
+                "error": str(e)
+            }
+
+    async def submit_image(self,
+                           prompts: List[Dict[str, Any]],
+                           width: int,
+                           height: int,
+                           seed: int = None,
+                           use_polish: bool = False,
+                           is_lumina: bool = False,
+                           lumina_model_name: str = None,
+                           lumina_cfg: float = None,
+                           lumina_step: int = None,
+                           task_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        两阶段模式的提交阶段：只提交生成请求并返回上游任务UUID，轮询交给结果轮询服务
+
+        启用自适应并发控制时，提交前获取的并发槽位不在这里释放，
+        而是随提交记录交给结果轮询服务，在得到最终结果时释放。
+
+        Args:
+            prompts: 提示词列表
+            width: 图像宽度
+            height: 图像高度
+            seed: 随机种子
+            use_polish: 是否使用润色
+            is_lumina: 是否使用Lumina模型
+            lumina_model_name: Lumina模型名称
+            lumina_cfg: Lumina配置参数
+            lumina_step: Lumina步数
+            task_id: 所属任务ID，提交前检查任务是否已取消
+
+        Returns:
+            提交记录：task_uuid、status_url、seed、轮询参数和并发槽位租约
+
+        Raises:
+            TaskCancelledException: 所属任务已取消
         """
+        api_url, task_status_url, payload, seed = self._build_request(
+            prompts, width, height, seed, use_polish, is_lumina, lumina_model_name, lumina_cfg, lumina_step
+        )
+        await asyncio.to_thread(self._check_cancelled, task_id)
+        await self._acquire_rate_limit_token(is_lumina, payload)
+
+        bucket = "lumina" if is_lumina else "standard"
+        lease_id = None
+        if settings.ADAPTIVE_CONCURRENCY_ENABLED:
+            lease_id = uuid.uuid4().hex
+            await get_concurrency_controller().acquire(bucket, lease_id)
+
+        acquired_at = time.time()
+        submit_start = time.time()
+        try:
+            # 等待槽位期间任务可能已被取消
+            await asyncio.to_thread(self._check_cancelled, task_id)
+
+            task_uuid = await self._call_api(api_url, payload)
+            if not task_uuid:
+                raise Exception("API返回的任务UUID为空")
+        except BaseException as e:
+            if lease_id:
+                outcome = OUTCOME_CENSORED if isinstance(e, TaskCancelledException) else (
+                    OUTCOME_TIMEOUT if isinstance(e, httpx.TimeoutException) else OUTCOME_FAILURE)
+                try:
+                    elapsed_ms = (time.time() - acquired_at) * 1000
+                    await asyncio.to_thread(get_concurrency_controller().release, bucket, lease_id, outcome,
+                                            elapsed_ms, elapsed_ms)
+                except Exception as release_error:
+                    logger.warning(f"释放并发槽位失败: {str(release_error)}")
+            raise
+
+        logger.info(f"获取到任务UUID: {task_uuid}，交给结果轮询服务")
+        max_attempts = self.lumina_max_polling_attempts if is_lumina else self.max_polling_attempts
+        interval = self.lumina_polling_interval if is_lumina else self.polling_interval
+        submission = {
+            "task_uuid": task_uuid,
+            "status_url": task_status_url.format(task_uuid=task_uuid),
+            "seed": seed,
+            "is_lumina": is_lumina,
+            "max_attempts": max_attempts,
+            "interval": interval,
+            "first_delay": interval,
+            "submitted_at": time.time(),
+            "concurrency_bucket": bucket,
+            "concurrency_lease": lease_id,
+            "acquired_at": acquired_at,
+            "submit_ms": (time.time() - submit_start) * 1000,
+        }
 
+        # 启用自适应轮询时，轮询计划随上游任务登记，由结果轮询服务按计划安排轮询时间
+        if settings.ADAPTIVE_POLLING_ENABLED:
+            schedule = get_polling_schedule()
+            plan = await asyncio.to_thread(
+                schedule.plan, schedule.profile_key(is_lumina, lumina_model_name, lumina_step, width, height),
+                interval, max_attempts
+            )
+            submission["poll_plan"] = plan.to_dict()
+            submission["first_delay"] = plan.first_delay()
+        return submission
+
+    def _build_request(self,
+                       prompts: List[Dict[str, Any]],
+                       width: int,
+                       height: int,
+                       seed: int = None,
+                       use_polish: bool = False,
+                       is_lumina: bool = False,
+                       lumina_model_name: str = None,
+                       lumina_cfg: float = None,
+                       lumina_step: int = None) -> Tuple[str, str, Dict[str, Any], int]:
+        """
+        构建图像生成请求
+
+        Args:
+            prompts: 提示词列表
+            width: 图像宽度
+            height: 图像高度
+            seed: 随机种子，为空或0时随机生成
+            use_polish: 是否使用润色
+            is_lumina: 是否使用Lumina模型
+            lumina_model_name: Lumina模型名称
+            lumina_cfg: Lumina配置参数
+            lumina_step: Lumina步数
+
+        Returns:
+            (API端点, 任务状态URL模板, 请求载荷, 实际使用的种子)
+        """
         # 生成随机种子（如果未提供）
         if seed is None or seed == 0:
             seed = random.randint(1, 2147483647)
@@ -187,86 +445,64 @@ class ImageClient:
                 payload["client_args"] = client_args
                 logger.info(f"添加Lumina参数: {client_args}")
 
-        try:
-            # 发送API请求，直接获取任务UUID字符串
-            task_uuid = await self._call_api(api_url, payload)
-
-            # 验证任务UUID
-            if not task_uuid:
-                raise Exception("API返回的任务UUID为空")
+        return api_url, task_status_url, payload, seed
 
-            logger.info(f"获取到任务UUID: {task_uuid}")
+    def _check_cancelled(self, task_id: Optional[str]) -> None:
+        """
+        检查所属任务是否已取消（读取任务墓碑，带进程内缓存）
 
-            # 轮询任务状态
-            max_attempts = self.lumina_max_polling_attempts if is_lumina else self.max_polling_attempts
-            polling_interval = self.lumina_polling_interval if is_lumina else self.polling_interval
+        Args:
+            task_id: 任务ID，为空时不检查
 
-            result = await self._poll_task_status(task_uuid, task_status_url, max_attempts, polling_interval)
+        Raises:
+            TaskCancelledException: 任务已取消
+        """
+        if not task_id:
+            return
+        try:
+            cancelled = is_task_cancelled(task_id)
+        except Exception as e:
+            logger.warning(f"检查任务 {task_id} 是否取消失败: {str(e)}")
+            return
+        if cancelled:
+            raise TaskCancelledException(f"任务 {task_id} 已取消")
 
-            # 检查任务状态
-            task_status = result.get("status")
-            task_status = result.get("task_status")
+    def _concurrency_slot(self, is_lumina: bool):
+        """
+        获取自适应并发槽位上下文
 
-            # 检查task_status
-            if task_status:
-                if task_status == "SUCCESS":
-                    # 提取图像URL
-                    image_url = await self._extract_image_url(result)
-                    if not image_url:
-                        raise Exception("无法从结果中提取图像URL")
+        Args:
+            is_lumina: 是否为Lumina请求
 
-                    return {
-                        "success": True,
-                        "data": {
-                            "image_url": image_url,
-                            "seed": seed,
-                            "is_lumina": is_lumina,
-                            "width": width,
-                            "height": height
-                        }
-                    }
-                elif task_status == "FAILURE":
-                    error_msg = result.get("error", "未知错误")
-                    logger.error(f"任务失败(task_status=FAILURE): {task_uuid}, 错误: {error_msg}")
-                    raise Exception(f"任务失败: {error_msg}")
-                elif task_status == "ILLEGAL_IMAGE":
-                    logger.error(f"任务失败(task_status=ILLEGAL_IMAGE): {task_uuid}, 内容不合规")
-                    raise ContentCensoredException("图像生成API返回ILLEGAL_IMAGE状态，内容不合规")
-                elif task_status == "TIMEOUT":
-                    logger.warning(f"任务超时(task_status=TIMEOUT): {task_uuid}, 将进行重试")
-                    raise RetryableException("图像生成API返回TIMEOUT状态，任务超时")
-                elif task_status == "PENDING":
-                    pass
-                    # 继续轮询，不做其他处理
-                else:
-                    # 其他未知状态视为失败
-                    logger.error(f"任务失败(task_status={task_status}): {task_uuid}, 将结束重试")
-                    error_msg = result.get("error", f"任务状态为{task_status}")
-                    raise Exception(f"任务失败: {error_msg}")
+        Returns:
+            并发槽位上下文；未启用自适应并发控制时返回空上下文（进入后得到None）
+        """
+        if not settings.ADAPTIVE_CONCURRENCY_ENABLED:
+            return contextlib.nullcontext()
+        return get_concurrency_controller().slot(
+            "lumina" if is_lumina else "standard",
+            timeout_exceptions=(MaxRetriesException, UpstreamTimeoutException, httpx.TimeoutException),
+            neutral_exceptions=(ContentCensoredException, TaskCancelledException),
+        )
 
-            # 提取图像URL
-            image_url = await self._extract_image_url(result)
-            if not image_url:
-                raise Exception("无法从结果中提取图像URL")
+    async def _acquire_rate_limit_token(self, is_lumina: bool, payload: Dict[str, Any]) -> None:
+        """
+        获取全局限流令牌（未启用时不做限制），标准API和Lumina API各自独立计算
 
-            return {
-                "success": True,
-                "data": {
-                    "image_url": image_url,
-                    "seed": seed,
-                    "is_lumina": is_lumina,
-                    "width": width,
-                    "height": height
-                }
-            }
+        Args:
+            is_lumina: 是否使用Lumina API
+            payload: 请求载荷（仅用于日志）
 
-        except Exception as e:
-            logger.error(f"图像生成失败: {str(e)}")
-            logger.error(traceback.format_exc())
-            return {
-                "success": False,
-                "error": str(e)
-            }
+        Raises:
+            RateLimitTimeoutError: 等待令牌超过最长等待时间
+        """
+        if not settings.RATE_LIMIT_ENABLED:
+            return
+        bucket = BUCKET_LUMINA if is_lumina else BUCKET_STANDARD
+        waited = await get_rate_limiter().acquire_async(bucket)
+        if waited >= 0.1:
+            task_info = f"宽度={payload.get('width')}, 高度={payload.get('height')}, 种子={payload.get('seed')}"
+            logger.info(f"获取{bucket}限流令牌等待 {waited:.2f}秒 {task_info}")
 
     async def _call_api(self, api_url: str, payload: Dict[str, Any]) -> str:
         """
@@ -286,30 +522,33 @@ class ImageClient:
         logger.info(f"开始调用图像生成API {task_info}")
 
         try:
-            # 发送API请求
-            async with httpx.AsyncClient(timeout=300.0) as client:  # 5分钟超时
-                response = await client.post(
-                    api_url,
-                    json=payload,
-                    headers=self.default_headers
-                )
-
-                # 检查响应状态
-                response.raise_for_status()
-
-                # 获取响应内容
-                content = response.text.strip()
-                elapsed_time = time.time() - start_time
-                logger.info(f"图像生成API请求成功 {task_info}, 耗时: {elapsed_time:.2f}秒")
-
-                # 返回任务UUID字符串
-                return content.replace('"', '')
+            # 发送API请求（复用共享连接池）
+            response = await get_http_client().post(
+                api_url,
+                json=payload,
+                headers=self.default_headers,
+                timeout=300.0  # 5分钟超时
+            )
+
+            # 检查响应状态
+            response.raise_for_status()
+
+            # 获取响应内容
+            content = response.text.strip()
+            elapsed_time = time.time() - start_time
+            logger.info(f"图像生成API请求成功 {task_info}, 耗时: {elapsed_time:.2f}秒")
+
+            # 返回任务UUID字符串
+            return content.replace('"', '')
         except Exception as e:
             logger.error(f"发送API请求失败: {str(e)}")
             raise
 
     async def _poll_task_status(self, task_uuid: str, task_status_url_template: str,
-                               max_attempts: int, polling_interval: float) -> Dict[str, Any]:
+                               max_attempts: int, polling_interval: float,
+                               task_id: Optional[str] = None,
+                               profile: Optional[str] = None,
+                               slot: Optional[ConcurrencySlot] = None) -> Dict[str, Any]:
         """
         轮询任务状态
 
@@ -318,55 +557,39 @@ class ImageClient:
             task_status_url_template: 任务状态URL模板
             max_attempts: 最大轮询次数
             polling_interval: 轮询间隔（秒）
+            task_id: 所属任务ID，每次轮询前检查任务是否已取消
+            profile: 耗时分布分组，启用自适应轮询时按该分组的耗时分布安排轮询时间
+            slot: 自适应并发槽位，成功时记录估计的上游完成耗时
 
         Returns:
             任务结果
+
+        Raises:
+            TaskCancelledException: 所属任务已取消，放弃轮询
         """
         task_status_url = task_status_url_template.format(task_uuid=task_uuid)
 
+        if settings.ADAPTIVE_POLLING_ENABLED and profile:
+            return await self._poll_task_status_adaptive(task_uuid, task_status_url, max_attempts,
+                                                         polling_interval, task_id, profile, slot)
+
+        start_time = time.monotonic()
+        last_poll_elapsed = 0.0
         for attempt in range(1, max_attempts + 1):
+            await asyncio.to_thread(self._check_cancelled, task_id)
             try:
-                async with httpx.AsyncClient(timeout=30.0) as client:
-                    response = await client.get(
-                        task_status_url,
-                        headers=self.default_headers
-                    )
-
-                    response.raise_for_status()
-                    result = response.json()
-
-                    # 检查任务状态
-                    status = result.get("status")
-                    task_status = result.get("task_status")
-
-                    # 检查task_status
-                    if task_status:
-                        if task_status == "SUCCESS":
-                            return result
-                        elif task_status == "FAILURE":
-                            error_msg = result.get("error", "未知错误")
-                            logger.error(f"任务失败(task_status=FAILURE): {task_uuid}, 错误: {error_msg}")
-                            raise Exception(f"任务失败: {error_msg}")
-                        elif task_status == "ILLEGAL_IMAGE":
-                            logger.error(f"任务失败(task_status=ILLEGAL_IMAGE): {task_uuid}, 内容不合规")
-                            raise ContentCensoredException("图像生成API返回ILLEGAL_IMAGE状态，内容不合规")
-                        elif task_status == "TIMEOUT":
-                            logger.warning(f"任务超时(task_status=TIMEOUT): {task_uuid}, 将进行重试")
-                            raise RetryableException("图像生成API返回TIMEOUT状态，任务超时")
-                        elif task_status == "PENDING":
-                            logger.info(f"任务进行中(task_status=PENDING): {task_uuid}, 轮询次数: {attempt}/{max_attempts}")
-                            # 继续轮询，不做其他处理
-                        else:
-                            # 其他未知状态视为失败
-                            logger.error(f"任务失败(task_status={task_status}): {task_uuid}, 将结束重试")
-                            error_msg = result.get("error", f"任务状态为{task_status}")
-                            raise Exception(f"任务失败: {error_msg}")
-                    else:
-                        logger.warning(f"API响应中没有task_status字段: {result}, 轮询次数: {attempt}/{max_attempts}")
-
-                    # 如果不是最后一次尝试，则等待下一次轮询
-                    if attempt < max_attempts:
-                        await asyncio.sleep(polling_interval)
+                elapsed = time.monotonic() - start_time
+                result = await self.fetch_task_status(task_status_url)
+                if self.check_task_result(task_uuid, result, attempt, max_attempts):
+                    if slot:
+                        # 上游在上一次未完成的轮询和本次轮询之间完成，取中点
+                        slot.record_completion((last_poll_elapsed + elapsed) / 2)
+                    return result
+                last_poll_elapsed = elapsed
+
+                # 如果不是最后一次尝试，则等待下一次轮询
+                if attempt < max_attempts:
+                    await asyncio.sleep(polling_interval)
             except Exception as e:
                 # 如果是最后一次尝试，则直接抛出异常
                 if attempt == max_attempts:
@@ -381,7 +604,125 @@ class ImageClient:
         # 如果循环正常结束但仍未返回结果（这种情况理论上不会发生）
         raise MaxRetriesException(f"达到最大轮询次数 {max_attempts}")
 
-    async def _extract_image_url(self, result: Dict[str, Any]) -> Optional[str]:
+    async def _poll_task_status_adaptive(self, task_uuid: str, task_status_url: str,
+                                         max_attempts: int, polling_interval: float,
+                                         task_id: Optional[str], profile: str,
+                                         slot: Optional[ConcurrencySlot] = None) -> Dict[str, Any]:
+        """
+        按耗时分布安排轮询时间：推迟首次轮询，超过高分位数后逐步拉长间隔，总等待时间与固定间隔轮询相同
+
+        Args:
+            task_uuid: 任务UUID
+            task_status_url: 任务状态URL
+            max_attempts: 固定间隔轮询时的最大轮询次数
+            polling_interval: 固定轮询间隔（秒）
+            task_id: 所属任务ID，每次轮询前检查任务是否已取消
+            profile: 耗时分布分组
+            slot: 自适应并发槽位，成功时记录估计的上游完成耗时
+
+        Returns:
+            任务结果
+
+        Raises:
+            TaskCancelledException: 所属任务已取消，放弃轮询
+        """
+        schedule = get_polling_schedule()
+        plan = await asyncio.to_thread(schedule.plan, profile, polling_interval, max_attempts)
+        start_time = time.monotonic()
+        await asyncio.sleep(plan.first_delay())
+
+        attempt = 0
+        while True:
+            attempt += 1
+            await asyncio.to_thread(self._check_cancelled, task_id)
+            elapsed = time.monotonic() - start_time
+            exhausted = elapsed >= plan.budget
+            try:
+                result = await self.fetch_task_status(task_status_url)
+                if self.check_task_result(task_uuid, result, attempt, max_attempts):
+                    await asyncio.to_thread(schedule.record, plan, elapsed, attempt)
+                    if slot:
+                        # 上游在上一次未完成的轮询和本次轮询之间完成，取中点
+                        slot.record_completion(((plan.last_poll_elapsed or 0.0) + elapsed) / 2)
+                    return result
+                if exhausted:
+                    logger.error(f"轮询任务状态超时，已等待 {elapsed:.1f}秒，轮询 {attempt} 次")
+                    raise MaxRetriesException(f"达到最大轮询时间 {plan.budget:.0f}秒")
+            except Exception as e:
+                if exhausted or isinstance(e, (ContentCensoredException, RetryableException)):
+                    if isinstance(e, (MaxRetriesException, ContentCensoredException, RetryableException)):
+                        raise e
+                    raise MaxRetriesException(f"达到最大轮询时间 {plan.budget:.0f}秒") from e
+                logger.warning(f"轮询任务状态失败: {str(e)}")
+
+            await asyncio.sleep(plan.next_delay(elapsed))
+
+    async def fetch_task_status(self, task_status_url: str) -> Dict[str, Any]:
+        """
+        查询一次上游任务状态
+
+        Args:
+            task_status_url: 任务状态URL
+
+        Returns:
+            上游返回的任务状态
+        """
+        response = await get_http_client().get(
+            task_status_url,
+            headers=self.default_headers,
+            timeout=30.0
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def check_task_result(self, task_uuid: str, result: Dict[str, Any], attempt: int, max_attempts: int) -> bool:
+        """
+        检查一次轮询得到的任务状态
+
+        Args:
+            task_uuid: 任务UUID
+            result: 上游返回的任务状态
+            attempt: 当前轮询次数
+            max_attempts: 最大轮询次数
+
+        Returns:
+            任务是否已成功完成；仍在进行中时返回False
+
+        Raises:
+            ContentCensoredException: 内容不合规
+            UpstreamTimeoutException: 上游任务超时
+            Exception: 上游任务失败
+        """
+        task_status = result.get("task_status")
+
+        # 检查task_status
+        if task_status:
+            if task_status == "SUCCESS":
+                return True
+            elif task_status == "FAILURE":
+                error_msg = result.get("error", "未知错误")
+                logger.error(f"任务失败(task_status=FAILURE): {task_uuid}, 错误: {error_msg}")
+                raise Exception(f"任务失败: {error_msg}")
+            elif task_status == "ILLEGAL_IMAGE":
+                logger.error(f"任务失败(task_status=ILLEGAL_IMAGE): {task_uuid}, 内容不合规")
+                raise ContentCensoredException("图像生成API返回ILLEGAL_IMAGE状态，内容不合规")
+            elif task_status == "TIMEOUT":
+                logger.warning(f"任务超时(task_status=TIMEOUT): {task_uuid}, 将进行重试")
+                raise UpstreamTimeoutException("图像生成API返回TIMEOUT状态，任务超时")
+            elif task_status == "PENDING":
+                logger.info(f"任务进行中(task_status=PENDING): {task_uuid}, 轮询次数: {attempt}/{max_attempts}")
+                # 继续轮询，不做其他处理
+            else:
+                # 其他未知状态视为失败
+                logger.error(f"任务失败(task_status={task_status}): {task_uuid}, 将结束重试")
+                error_msg = result.get("error", f"任务状态为{task_status}")
+                raise Exception(f"任务失败: {error_msg}")
+        else:
+            logger.warning(f"API响应中没有task_status字段: {result}, 轮询次数: {attempt}/{max_attempts}")
+
+        return False
+
+    async def extract_image_url(self, result: Dict[str, Any]) -> Optional[str]:
         """
         从结果中提取图像URL
 
@@ -431,15 +772,72 @@ class ImageClient:
 
         return 1024, 1024
 
-def update_subtask_status(subtask_id: str, status: str, error: str = None, result: str = None) -> bool:
+# 单例模式
+_image_client_instance: Optional[ImageClient] = None
+
+
+def get_image_client() -> ImageClient:
+    """
+    获取图像生成客户端实例（单例模式）
+
+    客户端本身不持有连接，HTTP连接由共享HTTP客户端按事件循环复用
+
+    Returns:
+        图像生成客户端实例
+    """
+    global _image_client_instance
+    if _image_client_instance is None:
+        _image_client_instance = ImageClient()
+    return _image_client_instance
+
+
+def _call_and_release_connection(func, *args, **kwargs):
+    """执行同步调用，完成后把当前线程持有的数据库连接归还连接池"""
+    try:
+        return func(*args, **kwargs)
+    finally:
+        release_connection()
+
+
+async def run_in_thread(func, *args, **kwargs):
+    """
+    在线程中执行同步的数据库或Redis调用，不阻塞事件循环（异步工作进程中同一事件循环上有大量子任务）
+
+    线程池中的线程不经过工作进程的中间件，调用结束后在该线程中归还数据库连接
+
+    Args:
+        func: 同步函数
+        *args: 位置参数
+        **kwargs: 关键字参数
+
+    Returns:
+        函数的返回值
+    """
+    return await asyncio.to_thread(_call_and_release_connection, func, *args, **kwargs)
+
+
+def initialize_databases() -> None:
+    """
+    初始化Dramatiq和BaseModel的数据库连接（Subtask、Task等模型继承自BaseModel）
+    """
+    DramatiqBaseModel.initialize_database()
+    from backend.core.app import initialize_app
+    initialize_app()
+
+def update_subtask_status(subtask_id: str, status: str, error: str = None, result: str = None,
+                          task_id: str = None) -> bool:
     """
     更新子任务状态
 
+    启用发件箱时，子任务结束事件与状态在同一个事务中写入（延迟写入时在同一次批量写入中）；
+    启用进度计数时，状态写入数据库后更新所属任务的计数；启用事件推送时发布结束的子任务
+
     Args:
         subtask_id: 子任务ID
         status: 状态
         error: 错误信息
         result: 结果URL
+        task_id: 所属任务ID，用于写入子任务结束事件和更新进度计数
 
     Returns:
         是否更新成功
@@ -456,37 +854,306 @@ def update_subtask_status(subtask_id: str, status: str, error: str = None, resul
             logger.error(f"更新子任务状态时初始化BaseModel数据库连接失败: {str(base_init_error)}")
             raise
 
-        # 获取子任务
-        subtask = Subtask.get_or_none(Subtask.id == subtask_id)
-        if not subtask:
-            logger.error(f"子任务不存在: {subtask_id}")
-            return False
-
         # 更新状态
-        subtask.status = status
-        subtask.updated_at = datetime.now()
+        now = datetime.now()
+        fields = {"status": status, "updated_at": now}
 
         # 如果是开始处理，更新开始时间
         if status == SubtaskStatus.PROCESSING.value:
-            subtask.started_at = datetime.now()
+            fields["started_at"] = now
 
         # 如果是完成或失败，更新完成时间和其他信息
-        if status in [SubtaskStatus.COMPLETED.value, SubtaskStatus.FAILED.value]:
-            subtask.completed_at = datetime.now()
+        event = None
+        if status in [SubtaskStatus.COMPLETED.value, SubtaskStatus.FAILED.value, SubtaskStatus.CANCELLED.value]:
+            fields["completed_at"] = now
 
             if error:
-                subtask.error = error
+                fields["error"] = error
 
             if result:
-                subtask.result = result
-
-        # 保存更新
-        subtask.save()
+                fields["result"] = result
+
+            if settings.OUTBOX_ENABLED and task_id:
+                event = build_event(EVENT_SUBTASK_FINISHED, task_id, {"subtask_id": str(subtask_id), "status": status})
+
+        # 延迟写入：由缓冲区和其他子任务的变化合并成一条语句批量写入
+        if settings.SUBTASK_WRITE_BUFFER_ENABLED:
+            get_subtask_write_buffer().enqueue(subtask_id, fields, event=event, task_id=task_id)
+            return True
+
+        # 只更新变化的列，不重写提示词等其他列
+        with Subtask._meta.database.atomic():
+            if not Subtask.update(**fields).where(Subtask.id == subtask_id).execute():
+                logger.error(f"子任务不存在: {subtask_id}")
+                return False
+            if event:
+                record_events([event])
+        if task_id:
+            record_subtask_statuses(task_id, {str(subtask_id): status})
+            publish_subtask_updates(task_id, {str(subtask_id): fields})
         return True
     except Exception as e:
         logger.error(f"更新子任务状态失败: {str(e)}")
         return False
 
+async def generate_subtask_image(subtask: Subtask) -> Tuple[str, Any]:
+    """
+    根据子任务参数调用图像生成服务
+
+    Args:
+        subtask: 子任务对象（可以是尚未保存到数据库的子任务）
+
+    Returns:
+        (图像URL, 实际使用的种子)
+
+    Raises:
+        Exception: 图像生成失败或无法获取图像URL
+    """
+    subtask_id = str(subtask.id)
+
+    # 提取任务参数
+    prompts = subtask.prompts
+    ratio = subtask.ratio
+    seed = subtask.seed
+    use_polish = subtask.use_polish
+    is_lumina = subtask.is_lumina
+    lumina_model_name = subtask.lumina_model_name
+    lumina_cfg = subtask.lumina_cfg
+    lumina_step = subtask.lumina_step
+
+    # 记录任务参数
+    logger.info(f"子任务参数: ratio={ratio}, seed={seed}, use_polish={use_polish}, is_lumina={is_lumina}")
+    if is_lumina:
+        logger.info(f"Lumina参数: model={lumina_model_name}, cfg={lumina_cfg}, step={lumina_step}")
+
+    # 获取图像客户端（进程内共享）
+    image_client = get_image_client()
+
+    # 计算宽高
+    width, height = await image_client.calculate_dimensions(ratio)
+
+    logger.info(f"开始生成图像: 子任务ID={subtask_id}, 宽度={width}, 高度={height}, 种子={seed}")
+
+    # 生成图像
+    result = await image_client.generate_image(
+        prompts=prompts,
+        width=width,
+        height=height,
+        seed=seed,
+        use_polish=use_polish,
+        is_lumina=is_lumina,
+        lumina_model_name=lumina_model_name,
+        lumina_cfg=lumina_cfg,
+        lumina_step=lumina_step,
+        task_id=str(subtask.task_id)
+    )
+
+    if not result.get("success"):
+        raise Exception(f"图像生成失败: {result.get('error', '未知错误')}, {result}")
+
+    # 提取图像URL
+    image_url = result.get("data", {}).get("image_url")
+    if not image_url:
+        raise Exception("无法从结果中获取图像URL")
+
+    # 获取实际使用的种子（可能是随机生成的）
+    actual_seed = result.get("data", {}).get("seed", seed)
+
+    return image_url, actual_seed
+
+
+async def submit_subtask_image(subtask: Subtask, job: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    两阶段模式：根据子任务参数提交图像生成请求，并把上游任务登记给结果轮询服务
+
+    Args:
+        subtask: 子任务对象（可以是尚未保存到数据库的子任务）
+        job: 结果轮询服务完成子任务所需的信息（kind、actor、task_id、subtask_id 或 ordinal 等）
+
+    Returns:
+        登记的上游任务信息
+
+    Raises:
+        TaskCancelledException: 所属任务已取消
+        Exception: 提交失败
+    """
+    image_client = get_image_client()
+    width, height = await image_client.calculate_dimensions(subtask.ratio)
+
+    submission = await image_client.submit_image(
+        prompts=subtask.prompts,
+        width=width,
+        height=height,
+        seed=subtask.seed,
+        use_polish=subtask.use_polish,
+        is_lumina=subtask.is_lumina,
+        lumina_model_name=subtask.lumina_model_name,
+        lumina_cfg=subtask.lumina_cfg,
+        lumina_step=subtask.lumina_step,
+        task_id=str(subtask.task_id)
+    )
+
+    job = {
+        **job,
+        **submission,
+        "task_id": str(subtask.task_id),
+        "retry_count": subtask.error_retry_count or 0,
+        "attempts": 0,
+    }
+    await asyncio.to_thread(get_poll_registry().register, job, delay=job["first_delay"])
+    return job
+
+
+def is_censored_error(error: Exception) -> bool:
+    """
+    判断错误是否由内容审核或内容不合规引起（此类错误不应重试）
+
+    Args:
+        error: 异常对象
+
+    Returns:
+        是否为内容审核错误
+    """
+    message = str(error)
+    return ("451" in message or "审核" in message or "敏感" in message or "违规" in message
+            or "ILLEGAL_IMAGE" in message or "内容不合规" in message)
+
+
+def requeue_rate_limited(actor_name: str, kwargs: Dict[str, Any], retry_count: int, task_id: str) -> bool:
+    """
+    限流等待超时后延迟重新发送子任务消息
+
+    本地限流积压不是上游失败，保持原重试次数，不计入失败和重试
+
+    Args:
+        actor_name: Actor名称
+        kwargs: 消息参数
+        retry_count: 当前重试次数
+        task_id: 任务ID
+
+    Returns:
+        是否发送成功
+    """
+    try:
+        delay = int(settings.RATE_LIMIT_REQUEUE_DELAY * 1000 * random.uniform(0.5, 1.5))
+        actor = dramatiq.get_broker().get_actor(actor_name)
+        actor.send_with_options(kwargs=kwargs, delay=delay, retries=retry_count, task_id=task_id)
+        logger.info(f"任务 {task_id} 等待限流令牌超时，{delay}毫秒后重新执行 {kwargs}")
+        return True
+    except Exception as e:
+        logger.error(f"任务 {task_id} 重新发送限流超时的消息失败: {str(e)}")
+        return False
+
+
+def release_fair_slot(task_id: str, member: str) -> None:
+    """
+    子任务本次执行结束后释放公平调度器中的进行中记录（未启用公平调度时不做处理）
+
+    Args:
+        task_id: 任务ID
+        member: 子任务在调度器中的标识（子任务ID或单元格序号）
+    """
+    if not settings.FAIR_SCHEDULING_ENABLED:
+        return
+    try:
+        get_fair_scheduler().complete(task_id, member)
+    except Exception as e:
+        # 释放失败时进行中记录会自然过期，不影响子任务结果
+        logger.warning(f"释放公平调度额度失败: {str(e)}")
+
+
+def complete_subtask(subtask: Subtask, image_url: str, actual_seed: Any) -> None:
+    """
+    子任务图像生成成功：更新子任务状态为已完成并发送通知
+
+    Args:
+        subtask: 子任务对象
+        image_url: 图像URL
+        actual_seed: 实际使用的种子
+    """
+    subtask_id = str(subtask.id)
+
+    # 更新子任务状态为已完成
+    update_subtask_status(
+        subtask_id=subtask_id,
+        status=SubtaskStatus.COMPLETED.value,
+        result=image_url,
+        task_id=str(subtask.task_id)
+    )
+
+    # 尝试发送飞书通知（计入所属任务的汇总通知）
+    try:
+        feishu_subtask_notify(
+            event_type="task_completed",
+            task_id=str(subtask.task.id),
+            task_name=subtask.task.name,
+            submitter=subtask.task.user.username if subtask.task.user else None,
+            details={
+                "子任务ID": str(subtask_id),
+                "图像URL": image_url,
+                "随机种子": actual_seed,
+                "变量索引": subtask.variable_indices,
+                "是否Lumina": "是" if subtask.is_lumina else "否"
+            },
+            message="子任务已完成"
+        )
+    except Exception as notify_error:
+        # 飞书通知失败不影响主流程
+        logger.warning(f"发送飞书通知失败: {str(notify_error)}")
+
+
+def fail_subtask(subtask: Subtask, error_msg: str, error: Exception) -> bool:
+    """
+    子任务图像生成失败：更新子任务状态为失败并发送通知
+
+    Args:
+        subtask: 子任务对象
+        error_msg: 错误信息
+        error: 异常对象
+
+    Returns:
+        是否为内容审核错误（不应重试）
+    """
+    subtask_id = str(subtask.id)
+
+    # 检查是否是审核问题或内容不合规
+    is_censored = is_censored_error(error)
+    if is_censored:
+        logger.warning(f"子任务 {subtask_id} 可能触发内容审核或内容不合规，不进行重试")
+
+    # 更新子任务状态为失败
+    update_subtask_status(
+        subtask_id=subtask_id,
+        status=SubtaskStatus.FAILED.value,
+        error=error_msg,
+        task_id=str(subtask.task_id)
+    )
+
+    # 尝试发送飞书通知（计入所属任务的汇总通知）
+    try:
+        feishu_subtask_notify(
+            event_type="task_failed",
+            task_id=str(subtask.task.id),
+            task_name=subtask.task.name,
+            submitter=subtask.task.user.username if subtask.task.user else None,
+            details={
+                "子任务ID": str(subtask_id),
+                "错误信息": error_msg,
+                "变量索引": subtask.variable_indices,
+                "是否内容不合规": "是" if is_censored else "否",
+                "错误类型": "内容不合规" if is_censored else "其他错误"
+            },
+            message="子任务失败",
+            error=error_msg,
+            censored=is_censored
+        )
+    except Exception as notify_error:
+        # 飞书通知失败不影响主流程
+        logger.warning(f"发送飞书通知失败: {str(notify_error)}")
+
+    return is_censored
+
+
 async def process_subtask(subtask_id: str) -> Dict[str, Any]:
     """
     处理子任务
@@ -498,18 +1165,14 @@ async def process_subtask(subtask_id: str) -> Dict[str, Any]:
         处理结果
     """
     # 初始化数据库连接
-    DramatiqBaseModel.initialize_database()
-
-    # 同时初始化BaseModel的数据库连接，因为Subtask、Task等模型继承自BaseModel
     try:
-        from backend.core.app import initialize_app
-        initialize_app()
+        await run_in_thread(initialize_databases)
     except Exception as base_init_error:
         logger.error(f"[{subtask_id}] 初始化BaseModel数据库连接失败: {str(base_init_error)}")
         raise
 
     # 获取子任务数据
-    subtask = Subtask.get_or_none(Subtask.id == subtask_id)
+    subtask = await run_in_thread(Subtask.get_or_none, Subtask.id == subtask_id)
     if not subtask:
         logger.error(f"子任务不存在: {subtask_id}")
         return {
@@ -517,85 +1180,35 @@ async def process_subtask(subtask_id: str) -> Dict[str, Any]:
             "error": f"子任务不存在: {subtask_id}"
         }
 
+    # 子任务已随父任务取消（墓碑检查之前发送的消息或检查失败时），不再执行
+    if subtask.status == SubtaskStatus.CANCELLED.value:
+        logger.info(f"子任务 {subtask_id} 已取消，跳过执行")
+        await run_in_thread(release_fair_slot, str(subtask.task_id), subtask_id)
+        return {"status": "cancelled"}
+
     # 更新子任务状态为处理中
-    update_subtask_status(subtask_id, SubtaskStatus.PROCESSING.value)
+    await run_in_thread(update_subtask_status, subtask_id, SubtaskStatus.PROCESSING.value,
+                        task_id=str(subtask.task_id))
 
+    actor_name = "test_run_lumina_subtask" if subtask.is_lumina else "test_run_subtask"
+    handed_off = False
     try:
-        # 提取任务参数
-        prompts = subtask.prompts
-        ratio = subtask.ratio
-        seed = subtask.seed
-        use_polish = subtask.use_polish
-        is_lumina = subtask.is_lumina
-        lumina_model_name = subtask.lumina_model_name
-        lumina_cfg = subtask.lumina_cfg
-        lumina_step = subtask.lumina_step
-
-        # 记录任务参数
-        logger.info(f"子任务参数: ratio={ratio}, seed={seed}, use_polish={use_polish}, is_lumina={is_lumina}")
-        if is_lumina:
-            logger.info(f"Lumina参数: model={lumina_model_name}, cfg={lumina_cfg}, step={lumina_step}")
-
-        # 创建图像客户端
-        image_client = ImageClient()
-
-        # 计算宽高
-        width, height = await image_client.calculate_dimensions(ratio)
-
-        logger.info(f"开始生成图像: 子任务ID={subtask_id}, 宽度={width}, 高度={height}, 种子={seed}")
+        if settings.TWO_PHASE_POLLING_ENABLED:
+            # 两阶段模式：只提交生成请求，轮询和子任务状态更新由结果轮询服务完成
+            job = await submit_subtask_image(subtask, {
+                "kind": "subtask",
+                "actor": actor_name,
+                "subtask_id": subtask_id,
+            })
+            handed_off = True
+            return {"status": "submitted", "task_uuid": job["task_uuid"]}
 
         # 生成图像
-        result = await image_client.generate_image(
-            prompts=prompts,
-            width=width,
-            height=height,
-            seed=seed,
-            use_polish=use_polish,
-            is_lumina=is_lumina,
-            lumina_model_name=lumina_model_name,
-            lumina_cfg=lumina_cfg,
-            lumina_step=lumina_step
-        )
-
-        if not result.get("success"):
-            raise Exception(f"图像生成失败: {result.get('error', '未知错误')}, {result}")
-
-        # 提取图像URL
-        image_url = result.get("data", {}).get("image_url")
-        if not image_url:
-            raise Exception("无法从结果中获取图像URL")
-
-        # 获取实际使用的种子（可能是随机生成的）
-        actual_seed = result.get("data", {}).get("seed", seed)
+        image_url, actual_seed = await generate_subtask_image(subtask)
 
         logger.info(f"图像生成成功: 子任务ID={subtask_id}, 图像URL={image_url}, 种子={actual_seed}")
 
-        # 更新子任务状态为已完成
-        update_subtask_status(
-            subtask_id=subtask_id,
-            status=SubtaskStatus.COMPLETED.value,
-            result=image_url
-        )
-
-        # 尝试发送飞书通知
-        try:
-            feishu_notify(
-                event_type="task_completed",
-                task_id=str(subtask.task.id),
-                task_name=subtask.task.name,
-                submitter=subtask.task.user.username if subtask.task.user else None,
-                details={
-                    "子任务ID": str(subtask_id),
-                    "图像URL": image_url,
-                    "随机种子": actual_seed,
-                    "变量索引": subtask.variable_indices,
-                    "是否Lumina": "是" if is_lumina else "否"
-                },
-                message="子任务已完成"
-            )
-        except Exception as notify_error:
-            # 飞书通知失败不影响主流程
-            logger.warning(f"发送飞书通知失败: {str(notify_error)}")
+        await run_in_thread(complete_subtask, subtask, image_url, actual_seed)
 
         # 返回结果
         return {
@@ -604,44 +1217,37 @@ async def process_subtask(subtask_id: str) -> Dict[str, Any]:
             "seed": actual_seed
         }
 
+    except TaskCancelledException:
+        # 父任务已取消：放弃轮询，不重试
+        logger.info(f"子任务 {subtask_id} 所属任务已取消，停止执行")
+        await run_in_thread(
+            update_subtask_status,
+            subtask_id=subtask_id,
+            status=SubtaskStatus.CANCELLED.value,
+            error="父任务已取消",
+            task_id=str(subtask.task_id)
+        )
+        return {"status": "cancelled"}
+
+    except RateLimitTimeoutError as e:
+        # 本地限流积压而不是上游失败：恢复为待处理并延迟重新发送，发送失败时才按失败处理
+        logger.warning(f"子任务 {subtask_id} {str(e)}")
+        await run_in_thread(update_subtask_status, subtask_id, SubtaskStatus.PENDING.value,
+                            task_id=str(subtask.task_id))
+        if await run_in_thread(requeue_rate_limited, actor_name, {"subtask_id": subtask_id},
+                               subtask.error_retry_count or 0, str(subtask.task_id)):
+            return {"status": "requeued"}
+        error_msg = f"图像生成失败: {str(e)}"
+        await run_in_thread(fail_subtask, subtask, error_msg, e)
+        raise RetryableException(error_msg)
+
     except Exception as e:
         # 处理异常
         error_msg = f"图像生成失败: {str(e)}"
         error_details = traceback.format_exc()
         logger.error(f"子任务 {subtask_id} {error_msg}\n{error_details}")
 
-        # 检查是否是审核问题或内容不合规
-        is_censored = False
-        if "451" in str(e) or "审核" in str(e) or "敏感" in str(e) or "违规" in str(e) or "ILLEGAL_IMAGE" in str(e) or "内容不合规" in str(e):
-            is_censored = True
-            logger.warning(f"子任务 {subtask_id} 可能触发内容审核或内容不合规，不进行重试")
-
-        # 更新子任务状态为失败
-        update_subtask_status(
-            subtask_id=subtask_id,
-            status=SubtaskStatus.FAILED.value,
-            error=error_msg
-        )
-
-        # 尝试发送飞书通知
-        try:
-            feishu_notify(
-                event_type="task_failed",
-                task_id=str(subtask.task.id),
-                task_name=subtask.task.name,
-                submitter=subtask.task.user.username if subtask.task.user else None,
-                details={
-                    "子任务ID": str(subtask_id),
-                    "错误信息": error_msg,
-                    "变量索引": subtask.variable_indices,
-                    "是否内容不合规": "是" if is_censored else "否",
-                    "错误类型": "内容不合规" if is_censored else "其他错误"
-                },
-                message="子任务失败"
-            )
-        except Exception as notify_error:
-            # 飞书通知失败不影响主流程
-            logger.warning(f"发送飞书通知失败: {str(notify_error)}")
+        is_censored = await run_in_thread(fail_subtask, subtask, error_msg, e)
 
         # 根据错误类型抛出不同的异常
         if is_censored:
@@ -650,47 +1256,225 @@ async def process_subtask(subtask_id: str) -> Dict[str, Any]:
         else:
             # 其他错误，可以重试
             raise RetryableException(error_msg)
+    finally:
+        # 本次执行结束，释放公平调度额度（重试由Dramatiq重新投递，不再占用调度额度）
+        # 两阶段模式下上游任务仍在进行，由结果轮询服务在得到结果后释放
+        if not handed_off:
+            await run_in_thread(release_fair_slot, str(subtask.task_id), subtask_id)
 
-@dramatiq.actor(
-    queue_name=settings.SUBTASK_QUEUE,  # 使用子任务队列
-    max_retries=settings.MAX_RETRIES,  # 最多重试3次
-    time_limit=300000,  # 300秒，考虑到图像生成可能需要较长时间
-    # retry_when=RetryableException,  # 只有RetryableException才会触发重试
-)
-def test_run_subtask(subtask_id: str):
+
+def record_cell_subtask(subtask: Subtask, status: str, error: str = None, result: str = None) -> bool:
     """
-    处理单个子任务
+    写入惰性物化单元格的子任务记录（按确定性ID插入或覆盖）
 
     Args:
-        subtask_id: 子任务ID
+        subtask: 在领取时物化的子任务对象
+        status: 状态（已完成或失败）
+        error: 错误信息
+        result: 结果URL
+
+    Returns:
+        是否写入成功
     """
-    # 获取当前重试次数
-    message = CurrentMessage.get_current_message()
-    retry_count = message.options.get("retries", 0) if message else 0
+    try:
+        now = datetime.now()
+        subtask.status = status
+        subtask.error = error
+        subtask.result = result
+        subtask.updated_at = now
+        subtask.completed_at = now
+
+        data = {field.name: subtask.__data__.get(field.name) for field in Subtask._meta.sorted_fields}
+        with Subtask._meta.database.atomic():
+            Subtask.insert(**data).on_conflict(
+                conflict_target=[Subtask.id],
+                update={
+                    Subtask.status: status,
+                    Subtask.error: error,
+                    Subtask.result: result,
+                    Subtask.error_retry_count: subtask.error_retry_count,
+                    Subtask.updated_at: now,
+                    Subtask.completed_at: now,
+                }
+            ).execute()
+            if settings.OUTBOX_ENABLED:
+                record_events([build_event(EVENT_SUBTASK_FINISHED, str(subtask.task_id),
+                                           {"subtask_id": str(subtask.id), "status": status})])
+        record_subtask_statuses(str(subtask.task_id), {str(subtask.id): status})
+        publish_subtask_updates(str(subtask.task_id), {str(subtask.id): {"status": status, "result": result, "error": error}})
+        return True
+    except Exception as e:
+        logger.error(f"写入单元格子任务记录失败: {str(e)}")
+        return False
+
+
+async def process_subtask_cell(task_id: str, ordinal: int, retry_count: int = 0) -> Dict[str, Any]:
+    """
+    处理惰性物化模式下的单元格
+
+    从任务的槽位计划解码单元格序号并物化子任务，生成图像后才写入子任务记录
+
+    Args:
+        task_id: 任务ID
+        ordinal: 单元格序号
+        retry_count: 当前重试次数
+
+    Returns:
+        处理结果
+    """
+    task_obj = await run_in_thread(Task.get_or_none, Task.id == task_id)
+    if not task_obj:
+        logger.error(f"任务不存在: {task_id}")
+        return {
+            "status": "failed",
+            "error": f"任务不存在: {task_id}"
+        }
+
+    if task_obj.status == TaskStatus.CANCELLED.value:
+        logger.info(f"[{task_id}#{ordinal}] 任务已取消，跳过单元格")
+        await run_in_thread(release_fair_slot, task_id, str(ordinal))
+        return {"status": "cancelled"}
+
+    subtask = build_cell_subtask(task_obj, await asyncio.to_thread(get_task_plan, task_obj), ordinal)
+    subtask.error_retry_count = retry_count
+
+    actor_name = "test_run_lumina_subtask_cell" if subtask.is_lumina else "test_run_subtask_cell"
+    handed_off = False
+    try:
+        if settings.TWO_PHASE_POLLING_ENABLED:
+            # 两阶段模式：只提交生成请求，由结果轮询服务在得到结果后写入子任务记录
+            job = await submit_subtask_image(subtask, {
+                "kind": "cell",
+                "actor": actor_name,
+                "ordinal": ordinal,
+            })
+            handed_off = True
+            return {"status": "submitted", "task_uuid": job["task_uuid"]}
+
+        image_url, actual_seed = await generate_subtask_image(subtask)
+        logger.info(f"图像生成成功: 任务ID={task_id}, 单元格={ordinal}, 图像URL={image_url}, 种子={actual_seed}")
 
+        await run_in_thread(record_cell_subtask, subtask, SubtaskStatus.COMPLETED.value, result=image_url)
+
+        return {
+            "status": "completed",
+            "result": image_url,
+            "seed": actual_seed
+        }
+
+    except TaskCancelledException:
+        # 惰性物化模式下取消的单元格不写入记录
+        logger.info(f"[{task_id}#{ordinal}] 任务已取消，停止执行单元格")
+        return {"status": "cancelled"}
+
+    except RateLimitTimeoutError as e:
+        # 本地限流积压而不是上游失败：单元格尚未写入记录，直接延迟重新发送
+        logger.warning(f"任务 {task_id} 单元格 {ordinal} {str(e)}")
+        if await run_in_thread(requeue_rate_limited, actor_name, {"task_id": task_id, "ordinal": ordinal},
+                               retry_count, task_id):
+            return {"status": "requeued"}
+        error_msg = f"图像生成失败: {str(e)}"
+        await run_in_thread(record_cell_subtask, subtask, SubtaskStatus.FAILED.value, error=error_msg)
+        raise RetryableException(error_msg)
+
+    except Exception as e:
+        error_msg = f"图像生成失败: {str(e)}"
+        logger.error(f"任务 {task_id} 单元格 {ordinal} {error_msg}\n{traceback.format_exc()}")
+
+        await run_in_thread(record_cell_subtask, subtask, SubtaskStatus.FAILED.value, error=error_msg)
+
+        if is_censored_error(e):
+            raise ContentCensoredException(error_msg)
+        raise RetryableException(error_msg)
+    finally:
+        if not handed_off:
+            await run_in_thread(release_fair_slot, task_id, str(ordinal))
+
+async def run_subtask_async(subtask_id: str, retry_count: int = 0) -> Dict[str, Any]:
+    """
+    子任务消息的异步入口，供同步Actor和异步工作进程共用
+
+    Args:
+        subtask_id: 子任务ID
+        retry_count: 当前重试次数
+
+    Returns:
+        处理结果
+    """
     logger.info(f"[{subtask_id}] 子任务开始执行 (重试次数: {retry_count})")
 
     # 初始化数据库
-    DramatiqBaseModel.initialize_database()
-
-    # 同时初始化BaseModel的数据库连接，因为Subtask、Task等模型继承自BaseModel
     try:
-        from backend.core.app import initialize_app
-        initialize_app()
+        await run_in_thread(initialize_databases)
     except Exception as base_init_error:
         logger.error(f"[{subtask_id}] 初始化BaseModel数据库连接失败: {str(base_init_error)}")
         raise
 
     if retry_count > 0:
         try:
-            subtask = Subtask.get_or_none(Subtask.id == subtask_id)
-            if subtask:
-                subtask.error_retry_count = retry_count
-                subtask.save()
+            # 重试计数在本次执行中会被读取，直接写入而不经过延迟写入缓冲区
+            query = Subtask.update(error_retry_count=retry_count).where(Subtask.id == subtask_id)
+            if await run_in_thread(query.execute):
                 logger.info(f"[{subtask_id}] 更新子任务重试计数: {retry_count}")
         except Exception as e:
             logger.error(f"[{subtask_id}] 更新重试计数失败: {str(e)}")
 
+    result = await process_subtask(subtask_id)
+
+    logger.info(f"[{subtask_id}] 子任务执行完成: {result.get('status')}")
+
+    return result
+
+
+async def run_subtask_cell_async(task_id: str, ordinal: int, retry_count: int = 0) -> Dict[str, Any]:
+    """
+    惰性物化单元格消息的异步入口，供同步Actor和异步工作进程共用
+
+    Args:
+        task_id: 任务ID
+        ordinal: 单元格序号
+        retry_count: 当前重试次数
+
+    Returns:
+        处理结果
+    """
+    logger.info(f"[{task_id}#{ordinal}] 单元格开始执行 (重试次数: {retry_count})")
+
+    # 初始化数据库
+    await run_in_thread(initialize_databases)
+
+    result = await process_subtask_cell(task_id, ordinal, retry_count)
+
+    logger.info(f"[{task_id}#{ordinal}] 单元格执行完成: {result.get('status')}")
+
+    return result
+
+
+# 可由异步工作进程直接在事件循环中执行的Actor及其异步入口
+ASYNC_ACTOR_HANDLERS = {
+    "test_run_subtask": run_subtask_async,
+    "test_run_lumina_subtask": run_subtask_async,
+    "test_run_subtask_cell": run_subtask_cell_async,
+    "test_run_lumina_subtask_cell": run_subtask_cell_async,
+}
+
+@dramatiq.actor(
+    queue_name=settings.SUBTASK_QUEUE,  # 使用子任务队列
+    max_retries=settings.MAX_RETRIES,  # 最多重试3次
+    time_limit=300000,  # 300秒，考虑到图像生成可能需要较长时间
+    # retry_when=RetryableException,  # 只有RetryableException才会触发重试
+)
+def test_run_subtask(subtask_id: str):
+    """
+    处理单个子任务
+
+    Args:
+        subtask_id: 子任务ID
+    """
+    # 获取当前重试次数
+    message = CurrentMessage.get_current_message()
+    retry_count = message.options.get("retries", 0) if message else 0
+
     # 使用事件循环运行异步处理函数
     try:
         loop = asyncio.get_event_loop()
@@ -700,11 +1484,7 @@ def test_run_subtask(subtask_id: str):
         asyncio.set_event_loop(loop)
 
     # 运行异步处理函数
-    result = loop.run_until_complete(process_subtask(subtask_id))
-
-    logger.info(f"[{subtask_id}] 子任务执行完成: {result.get('status')}")
-
-    return result
+    return loop.run_until_complete(run_subtask_async(subtask_id, retry_count))
 
 @dramatiq.actor(
     queue_name=settings.SUBTASK_OPS_QUEUE,  # 使用Lumina子任务队列
@@ -723,3 +1503,43 @@ def test_run_lumina_subtask(subtask_id: str):
     return test_run_subtask(subtask_id)
 
 
+@dramatiq.actor(
+    queue_name=settings.SUBTASK_QUEUE,  # 使用子任务队列
+    max_retries=settings.MAX_RETRIES,
+    time_limit=300000,  # 300秒，与普通子任务相同
+)
+def test_run_subtask_cell(task_id: str, ordinal: int):
+    """
+    处理惰性物化模式下的单个单元格
+
+    Args:
+        task_id: 任务ID
+        ordinal: 单元格序号
+    """
+    message = CurrentMessage.get_current_message()
+    retry_count = message.options.get("retries", 0) if message else 0
+
+    try:
+        loop = asyncio.get_event_loop()
+    except RuntimeError:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+
+    return loop.run_until_complete(run_subtask_cell_async(task_id, ordinal, retry_count))
+
+@dramatiq.actor(
+    queue_name=settings.SUBTASK_OPS_QUEUE,  # 使用Lumina子任务队列
+    max_retries=0,
+    time_limit=600000,  # 600秒，与Lumina子任务相同
+    retry_when=RetryableException,
+)
+def test_run_lumina_subtask_cell(task_id: str, ordinal: int):
+    """
+    处理惰性物化模式下的Lumina单元格（与普通单元格相同，但使用不同的队列和超时设置）
+
+    Args:
+        task_id: 任务ID
+        ordinal: 单元格序号
+    """
+    logger.info(f"[{task_id}#{ordinal}] Lumina单元格开始执行")
+    return test_run_subtask_cell(task_id, ordinal)
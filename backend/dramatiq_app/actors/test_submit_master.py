@@ -7,16 +7,20 @@ import logging
 import dramatiq
 import time
 import threading
-from typing import List, Dict, Any, cast, Tuple, NamedTuple, Optional
+from typing import List, Dict, Any, cast, Tuple, Optional, Iterable, Iterator
 from datetime import datetime, timedelta
 import uuid
 import itertools
-from copy import deepcopy
+import queue
 
 from backend.core.config import settings
 
 from backend.utils.feishu import feishu_notify, feishu_task_notify
 from backend.utils.task_scheduler import TaskScheduler
+from backend.db.bulk_load import bulk_load_models
+from backend.services.subtask_plan import (
+    ActiveVariable, CONFIGURABLE_PARAMETER_NAMES, compile_subtask_plan, get_task_plan, collect_active_variables
+)
 from backend.models.db.dramatiq_base import DramatiqBaseModel
 from backend.models.db.user import User
 from backend.models.db.subtasks import Subtask, SubtaskStatus
@@ -26,12 +30,25 @@ from backend.models.task_parameter import TaskParameter
 from backend.models.variable_dimension import VariableDimension
 # 不再直接导入test_run_subtask和test_run_lumina_subtask，使用custom_background服务代替
 from backend.services.custom_background import get_background_service
+from backend.services.fair_scheduler import get_fair_scheduler
+from backend.services.admission_controller import get_admission_controller
+from backend.services.task_tombstones import mark_task_cancelled
+from backend.services.active_tasks import track_task
+from backend.services.task_events import publish_task_progress, publish_task_status
+from backend.services.task_status_stats import invalidate_task_stats
+from backend.services.task_progress import TaskProgress, get_task_progress, refresh_stale_progress
 from backend.services.task_service import check_and_update_task_completion
+from backend.services.outbox import record_events, build_task_status_events
 from backend.crud.task import task_crud
+from backend.crud.subtask import subtask_crud
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
+# 惰性物化模式下相邻两个分发窗口的最小间隔（毫秒）
+LAZY_DISPATCH_MIN_STEP_MS = 1000
+
+
 def initialize_data(task_id: str, task_data: Dict[str, Any]):
     """初始化数据"""
     # 获取基本信息
@@ -175,7 +192,8 @@ def initialize_data(task_id: str, task_data: Dict[str, Any]):
         "prompts": prompts,
         "total_images": total_images,
         "is_favorite": False,  # 新创建的任务默认不收藏
-        "variables_map": {},   # 变量映射初始为空字典，后续在create_subtasks_from_task中填充
+        "lazy_materialization": bool(task_data.get("lazy_materialization", False)),  # 是否惰性物化子任务
+        "variables_map": {},   # 变量映射初始为空字典，后续在build_task_variables中填充
         **tmp_parameters,
     }
 
@@ -212,11 +230,15 @@ def insert_master_task_to_db(task_obj: Task):
     from backend.db.database import test_db_proxy
     with test_db_proxy.atomic():
         task_obj.save()
+    invalidate_task_stats()
 
 
 def insert_subtasks_to_db(subtasks: List[Subtask]):
     """
-    批量插入子任务到数据库
+    批量插入一个分块的子任务到数据库
+
+    每个分块使用独立的事务，分块之间不会长时间持有同一个事务。
+    子任务ID在实例化时已生成，写入后发送消息时可直接使用。
 
     Args:
         subtasks: 子任务列表
@@ -225,35 +247,87 @@ def insert_subtasks_to_db(subtasks: List[Subtask]):
         logger.warning("没有子任务需要插入数据库")
         return
 
-    logger.info(f"开始批量插入 {len(subtasks)} 个子任务到数据库")
+    logger.debug(f"开始批量插入 {len(subtasks)} 个子任务到数据库")
 
-    from backend.db.database import test_db_proxy
+    # 使用COPY流式写入（不支持时回退为多行INSERT），整个分块在一个事务中完成
+    bulk_load_models(Subtask, subtasks, use_copy=settings.BULK_LOAD_USE_COPY)
 
-    # 使用事务批量插入子任务
-    with test_db_proxy.atomic():
-        # 使用批量插入以提高性能
-        # 每批次插入100个子任务
-        batch_size = 100
-        for i in range(0, len(subtasks), batch_size):
-            batch = subtasks[i:i+batch_size]
-            Subtask.bulk_create(batch, batch_size=batch_size)
+    logger.debug(f"成功批量插入 {len(subtasks)} 个子任务到数据库")
 
-    logger.info(f"成功批量插入 {len(subtasks)} 个子任务到数据库")
 
+class DispatchCursor:
+    """
+    子任务发送进度游标
 
-def send_subtasks_to_dramatiq(subtasks: List[Subtask]):
+    分块发送时记录Lumina任务和普通任务各自的序号与累积延迟，
+    保证分块发送得到的延迟曲线与一次性发送全部子任务时一致
+    """
+
+    def __init__(self):
+        self.lumina_index = 0        # 已发送的Lumina子任务数量
+        self.lumina_delay_ms = 0     # Lumina子任务的累积延迟（毫秒）
+        self.normal_index = 0        # 已发送的普通子任务数量
+        self.normal_delay_ms = 0     # 普通子任务的累积延迟（毫秒）
+
+    def advance(self, is_lumina: bool) -> int:
+        """
+        为下一个子任务计算累积延迟并推进游标
+
+        Args:
+            is_lumina: 是否为Lumina子任务
+
+        Returns:
+            该子任务相对于发送开始时刻的累积延迟（毫秒）；
+            启用全局限流或公平调度时为0，分别由工作进程按令牌桶、由公平调度器按并发额度控制速率
+        """
+        if settings.RATE_LIMIT_ENABLED or settings.FAIR_SCHEDULING_ENABLED:
+            return 0
+
+        if is_lumina:
+            delay_seconds = TaskScheduler.calculate_lumina_delay(self.lumina_index)
+            self.lumina_index += 1
+            self.lumina_delay_ms += int(delay_seconds * 1000)
+            return self.lumina_delay_ms
+
+        delay_seconds = TaskScheduler.calculate_normal_delay(self.normal_index)
+        self.normal_index += 1
+        self.normal_delay_ms += int(delay_seconds * 1000)
+        return self.normal_delay_ms
+
+    def to_dict(self) -> Dict[str, int]:
+        """转换为可放入消息参数的字典"""
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, int]]) -> "DispatchCursor":
+        """从消息参数中的字典恢复游标"""
+        cursor = cls()
+        for key, value in (data or {}).items():
+            if hasattr(cursor, key):
+                setattr(cursor, key, int(value))
+        return cursor
+
+
+def send_subtasks_to_dramatiq(subtasks: List[Subtask], cursor: Optional[DispatchCursor] = None,
+                              task_obj: Optional[Task] = None):
     """
     将子任务发送到Dramatiq队列进行处理，并根据任务类型添加延迟
-    使用dramatiq的延迟任务能力，一次性发送所有任务
+    使用dramatiq的延迟任务能力，通过Redis pipeline分批一次性发送所有任务；
+    启用公平调度时改为加入公平调度器的待发送列表，由调度Actor按优先级和用户额度发送
 
     Args:
         subtasks: 子任务列表
+        cursor: 发送进度游标，分块发送时在多次调用之间传递同一个游标
+        task_obj: 子任务所属的任务对象，启用公平调度时用于获取用户和优先级
     """
     if not subtasks:
         logger.warning("没有子任务需要发送到Dramatiq")
         return
 
-    logger.info(f"开始将 {len(subtasks)} 个子任务发送到Dramatiq队列")
+    if cursor is None:
+        cursor = DispatchCursor()
+
+    logger.debug(f"开始将 {len(subtasks)} 个子任务发送到Dramatiq队列")
 
     # 记录发送开始时间
     start_time = datetime.now()
@@ -261,57 +335,48 @@ def send_subtasks_to_dramatiq(subtasks: List[Subtask]):
     # 获取后台任务服务实例
     background_service = get_background_service()
 
-    # 将子任务分为Lumina任务和普通任务
+    # 将子任务分为Lumina任务和普通任务，各自按照延迟规则计算累积延迟
     lumina_subtasks = [subtask for subtask in subtasks if subtask.is_lumina]
     normal_subtasks = [subtask for subtask in subtasks if not subtask.is_lumina]
 
-    # 处理Lumina任务
-    if lumina_subtasks:
-        logger.info(f"开始处理 {len(lumina_subtasks)} 个Lumina子任务")
-
-        # 计算累积延迟时间（毫秒）
-        accumulated_delay_ms = 0
-
-        # 按照延迟规则发送Lumina任务
-        for i, subtask in enumerate(lumina_subtasks):
-            # 计算当前任务的延迟时间（秒）
-            delay_seconds = TaskScheduler.calculate_lumina_delay(i)
-
-            # 累加延迟时间（转换为毫秒）
-            accumulated_delay_ms += int(delay_seconds * 1000)
-
-            background_service.enqueue(
-                actor_name="test_run_lumina_subtask",
-                kwargs={"subtask_id": str(subtask.id)},
-                queue_name=settings.SUBTASK_OPS_QUEUE,
-                delay=accumulated_delay_ms
-            )
-
-    # 处理普通任务
-    if normal_subtasks:
-        logger.info(f"开始处理 {len(normal_subtasks)} 个普通子任务")
-
-        # 计算累积延迟时间（毫秒）
-        accumulated_delay_ms = 0
-
-        # 按照延迟规则发送普通任务
-        for i, subtask in enumerate(normal_subtasks):
-            # 计算当前任务的延迟时间（秒）
-            delay_seconds = TaskScheduler.calculate_normal_delay(i)
-
-            # 累加延迟时间（转换为毫秒）
-            accumulated_delay_ms += int(delay_seconds * 1000)
+    # 消息带上任务ID，任务取消后工作进程据此跳过消息
+    task_id = str(task_obj.id) if task_obj is not None else str(subtasks[0].task_id)
+
+    messages = []
+    for subtask in lumina_subtasks:
+        messages.append({
+            "actor_name": "test_run_lumina_subtask",
+            "kwargs": {"subtask_id": str(subtask.id)},
+            "queue_name": settings.SUBTASK_OPS_QUEUE,
+            "delay": cursor.advance(is_lumina=True),
+            "task_id": task_id,
+        })
+    for subtask in normal_subtasks:
+        messages.append({
+            "actor_name": "test_run_subtask",
+            "kwargs": {"subtask_id": str(subtask.id)},
+            "queue_name": settings.SUBTASK_QUEUE,
+            "delay": cursor.advance(is_lumina=False),
+            "task_id": task_id,
+        })
+
+    if settings.FAIR_SCHEDULING_ENABLED:
+        # 公平调度：子任务ID作为进行中记录的标识，执行结束时释放
+        if task_obj is None:
+            task_obj = subtasks[0].task
+        for message in messages:
+            message["member"] = message["kwargs"]["subtask_id"]
+        pending = get_fair_scheduler().submit(task_id, str(task_obj.user_id), task_obj.priority, messages)
+        logger.debug(f"已将 {len(subtasks)} 个子任务加入公平调度器，任务 {task_id} 待发送: {pending}")
+        return
 
-            background_service.enqueue(
-                actor_name="test_run_subtask",
-                kwargs={"subtask_id": str(subtask.id)},
-                queue_name=settings.SUBTASK_QUEUE,
-                delay=accumulated_delay_ms
-            )
+    # 批量发送，每个批次一次Redis往返
+    batch_stats = background_service.enqueue_many(messages)
 
     # 计算发送耗时
     elapsed_time = (datetime.now() - start_time).total_seconds()
-    logger.info(f"成功将 {len(subtasks)} 个子任务发送到Dramatiq队列，耗时: {elapsed_time:.2f}秒")
+    logger.debug(f"成功将 {len(subtasks)} 个子任务发送到Dramatiq队列（Lumina: {len(lumina_subtasks)}，普通: {len(normal_subtasks)}），"
+                 f"共 {len(batch_stats)} 批，耗时: {elapsed_time:.2f}秒")
 
 
 def check_recent_running_tasks(current_task: Task = None) -> int:
@@ -388,6 +453,11 @@ def wait_for_execution_slot(task_obj: Task) -> bool:
     Returns:
         是否成功获取执行槽位
     """
+    if settings.FAIR_SCHEDULING_ENABLED:
+        # 启用公平调度时任务之间按优先级交替执行，不再等待其他任务
+        logger.info(f"任务 {task_obj.id} 使用公平调度，无需等待执行槽位")
+        return True
+
     check_interval = 30  # 每30秒检查一次
     max_wait_time = 3600  # 最长等待时间（秒）
     total_wait_time = 0
@@ -420,13 +490,33 @@ def wait_for_execution_slot(task_obj: Task) -> bool:
     return False
 
 
-def update_task_status(task_obj: Task, status: str):
+def release_admission(task_id: str):
+    """
+    任务结束后释放准入容量并唤醒等待中的任务（未启用准入控制时不做处理）
+
+    Args:
+        task_id: 任务ID
+    """
+    if not settings.ADMISSION_CONTROL_ENABLED:
+        return
+    try:
+        get_admission_controller().release(str(task_id))
+    except Exception as e:
+        # 释放失败时准入记录会在心跳过期后自动清理
+        logger.warning(f"释放任务 {task_id} 的准入容量失败: {str(e)}")
+
+
+def update_task_status(task_obj: Task, status: str, notification: Optional[Dict[str, Any]] = None):
     """
     更新任务状态
 
+    启用发件箱时，状态变化事件（包括附带的通知）与状态在同一个事务中写入，由发件箱分发器发送通知；
+    否则在状态更新后直接发送通知
+
     Args:
         task_obj: 任务对象
         status: 新状态
+        notification: 状态变化后发送的飞书通知（feishu_task_notify 的参数）
     """
     logger.info(f"更新任务 {task_obj.id} 状态为 {status}")
 
@@ -445,12 +535,62 @@ def update_task_status(task_obj: Task, status: str):
 
         task_obj.save()
 
+        if settings.OUTBOX_ENABLED:
+            record_events(build_task_status_events(str(task_obj.id), status, notification))
+
     logger.info(f"任务 {task_obj.id} 状态已更新为 {status}")
+    publish_task_status(str(task_obj.id), status)
+    invalidate_task_stats()
+
+    if notification and not settings.OUTBOX_ENABLED:
+        try:
+            feishu_task_notify(**notification)
+        except Exception as notify_error:
+            # 飞书通知失败不影响主流程
+            logger.warning(f"发送飞书通知失败: {str(notify_error)}")
+
+
+def apply_task_progress(task: Task, progress: TaskProgress) -> bool:
+    """
+    把子任务状态计数写入任务的进度列，并上报准入进度
+
+    Args:
+        task: 任务对象（至少包含ID、总数和进度相关的列）
+        progress: 子任务状态计数
+
+    Returns:
+        是否所有子任务都已处理完成
+    """
+    task_id = str(task.id)
+    total_subtasks = task.total_images
+    processed_subtasks = progress.processed
+
+    # 只更新进度相关的列，不重写提示词等其他列
+    fields = {
+        "processed_images": processed_subtasks,
+        "progress": int((processed_subtasks / total_subtasks) * 100),
+        "completed_subtasks": progress.completed,
+        "failed_subtasks": progress.failed,
+    }
+    if any(getattr(task, name) != value for name, value in fields.items()):
+        Task.update(updated_at=datetime.now(), **fields).where(Task.id == task_id).execute()
+        publish_task_progress(task_id, progress, total_subtasks)
+
+    logger.info(f"任务 {task_id} 进度已更新: {fields['progress']}%, 已处理: {processed_subtasks}/{total_subtasks}")
+
+    # 上报进度，释放已处理子任务占用的准入容量
+    if settings.ADMISSION_CONTROL_ENABLED:
+        try:
+            get_admission_controller().report_progress(task_id, processed_subtasks)
+        except Exception as admission_error:
+            logger.warning(f"上报任务 {task_id} 准入进度失败: {str(admission_error)}")
+
+    return processed_subtasks >= total_subtasks
 
 
 def update_task_progress(task_id: str) -> bool:
     """
-    更新任务进度，计算已处理的子任务数量并更新进度
+    更新任务进度，按子任务状态计数更新已处理数量、进度和子任务统计
 
     Args:
         task_id: 任务ID
@@ -465,41 +605,14 @@ def update_task_progress(task_id: str) -> bool:
             logger.warning(f"任务不存在: {task_id}")
             return False
 
-        # 获取任务的所有子任务
-        subtasks = list(Subtask.select().where(Subtask.task == task_id))
-
-        if not subtasks:
+        # 惰性物化模式下只有产生结果或错误的单元格才有记录，两种模式的总数都以单元格总数为准
+        if task.total_images <= 0:
             logger.warning(f"任务 {task_id} 没有子任务")
             return False
 
-        # 计算子任务状态
-        total_subtasks = len(subtasks)
-        completed_subtasks = sum(1 for s in subtasks if s.status == SubtaskStatus.COMPLETED.value)
-        failed_subtasks = sum(1 for s in subtasks if s.status == SubtaskStatus.FAILED.value)
-        cancelled_subtasks = sum(1 for s in subtasks if s.status == SubtaskStatus.CANCELLED.value)
-
-        # 计算已处理的子任务数量
-        processed_subtasks = completed_subtasks + failed_subtasks + cancelled_subtasks
-
-        # 更新任务的processed_images字段
-        task.processed_images = processed_subtasks
-
-        # 计算进度百分比
-        if task.total_images > 0:
-            task.progress = int((processed_subtasks / task.total_images) * 100)
-        else:
-            task.progress = 0
-
-        # 保存更新
-        from backend.db.database import test_db_proxy
-        with test_db_proxy.atomic():
-            task.updated_at = datetime.now()
-            task.save()
-
-        logger.info(f"任务 {task_id} 进度已更新: {task.progress}%, 已处理: {processed_subtasks}/{total_subtasks}")
-
-        # 返回是否所有子任务都已完成
-        return processed_subtasks == total_subtasks
+        # 读取子任务状态计数（不读取子任务行），计数长时间没有变化时按数据库校正
+        progress = refresh_stale_progress(task_id, get_task_progress(task_id), task.total_images)
+        return apply_task_progress(task, progress)
     except Exception as e:
         logger.error(f"更新任务进度时出错: {task_id}, 错误: {str(e)}")
         return False
@@ -508,8 +621,9 @@ def update_task_progress(task_id: str) -> bool:
 def cleanup_cancelled_task(task_id: str):
     """
     清理被取消的任务，包括：
-    1. 移除Redis中等待的子任务
-    2. 更新数据库中等待的子任务状态为CANCELLED
+    1. 写入任务墓碑，工作进程取出该任务的子任务消息时直接跳过（不扫描Redis队列）
+    2. 移除公平调度器中尚未发送的子任务消息
+    3. 批量更新数据库中等待的子任务状态为CANCELLED
 
     Args:
         task_id: 任务ID
@@ -517,99 +631,27 @@ def cleanup_cancelled_task(task_id: str):
     logger.info(f"开始清理被取消的任务 {task_id}")
 
     try:
-        # 获取后台任务服务实例来访问Redis broker
-        background_service = get_background_service()
-        broker = background_service.broker
-
-        # 获取任务的所有子任务
-        subtasks = list(Subtask.select().where(Subtask.task == task_id))
-
-        if not subtasks:
-            logger.warning(f"任务 {task_id} 没有子任务需要清理")
-            return
+        # 1. 写入任务墓碑
+        mark_task_cancelled(task_id)
 
-        # 统计需要清理的子任务
-        pending_subtasks = []
-        processing_subtasks = []
-
-        for subtask in subtasks:
-            if subtask.status == SubtaskStatus.PENDING.value:
-                pending_subtasks.append(subtask)
-            elif subtask.status == SubtaskStatus.PROCESSING.value:
-                processing_subtasks.append(subtask)
-
-        logger.info(f"任务 {task_id} 清理统计: 等待中={len(pending_subtasks)}, 处理中={len(processing_subtasks)}")
+        # 2. 移除公平调度器中尚未发送的子任务消息
+        scheduler_dropped = 0
+        if settings.FAIR_SCHEDULING_ENABLED:
+            try:
+                scheduler_dropped = get_fair_scheduler().remove_task(str(task_id))
+            except Exception as scheduler_error:
+                logger.warning(f"从公平调度器移除任务 {task_id} 时出错: {str(scheduler_error)}")
 
-        # 1. 清理Redis中等待的子任务
-        redis_cleaned_count = 0
+        # 3. 批量更新数据库中等待的子任务状态为CANCELLED
+        db_updated_count = subtask_crud.cancel_by_task(task_id, [SubtaskStatus.PENDING.value], error="父任务已取消")
 
-        # 获取Redis客户端
-        redis_client = broker.client
+        processing_count = Subtask.select().where(
+            (Subtask.task == task_id) &
+            (Subtask.status == SubtaskStatus.PROCESSING.value)
+        ).count()
 
-        # 需要检查的队列列表
-        queues_to_check = [
-            (settings.SUBTASK_QUEUE, "test_run_subtask"),
-            (settings.SUBTASK_OPS_QUEUE, "test_run_lumina_subtask")
-        ]
-
-        for queue_name, actor_name in queues_to_check:
-            try:
-                # 检查普通队列和延迟队列
-                queue_names_to_clean = [
-                    f"dramatiq:{queue_name}",  # 普通队列
-                    f"dramatiq:{queue_name}.DQ"  # 延迟队列
-                ]
-
-                for redis_queue_name in queue_names_to_clean:
-                    try:
-                        # 获取队列中的所有消息
-                        messages = redis_client.lrange(redis_queue_name, 0, -1)
-
-                        for message in messages:
-                            try:
-                                # 解码消息内容
-                                message_str = message.decode('utf-8') if isinstance(message, bytes) else str(message)
-
-                                # 检查消息是否包含该任务的子任务ID
-                                task_related = False
-                                for subtask in pending_subtasks:
-                                    subtask_id_str = str(subtask.id)
-                                    if subtask_id_str in message_str:
-                                        task_related = True
-                                        break
-
-                                if task_related:
-                                    # 从队列中移除该消息
-                                    removed = redis_client.lrem(redis_queue_name, 1, message)
-                                    if removed > 0:
-                                        redis_cleaned_count += removed
-                                        logger.debug(f"从Redis队列 {redis_queue_name} 移除了与任务 {task_id} 相关的消息")
-
-                            except Exception as msg_error:
-                                logger.warning(f"处理Redis消息时出错: {str(msg_error)}")
-
-                    except Exception as queue_error:
-                        logger.warning(f"清理Redis队列 {redis_queue_name} 时出错: {str(queue_error)}")
-
-            except Exception as redis_error:
-                logger.warning(f"清理队列 {queue_name} 时出错: {str(redis_error)}")
-
-        # 2. 更新数据库中等待的子任务状态为CANCELLED
-        db_updated_count = 0
-        from backend.db.database import test_db_proxy
-
-        with test_db_proxy.atomic():
-            for subtask in pending_subtasks:
-                try:
-                    subtask.status = SubtaskStatus.CANCELLED.value
-                    subtask.error = "父任务已取消"
-                    subtask.updated_at = datetime.now()
-                    subtask.save()
-                    db_updated_count += 1
-                except Exception as db_error:
-                    logger.error(f"更新子任务 {subtask.id} 状态时出错: {str(db_error)}")
-
-        logger.info(f"任务 {task_id} 清理完成: Redis清理={redis_cleaned_count}, 数据库更新={db_updated_count}")
+        logger.info(f"任务 {task_id} 清理完成: 数据库更新={db_updated_count}, 处理中={processing_count}, "
+                    f"调度器丢弃={scheduler_dropped}")
 
         # 发送任务取消通知
         try:
@@ -624,10 +666,9 @@ def cleanup_cancelled_task(task_id: str):
                     task_name=task.name,
                     submitter=task.user.username if task.user else "未知用户",
                     details={
-                        "清理的等待任务数": len(pending_subtasks),
-                        "处理中任务数": len(processing_subtasks),
-                        "Redis清理数": redis_cleaned_count,
-                        "数据库更新数": db_updated_count
+                        "取消的等待任务数": db_updated_count,
+                        "处理中任务数": processing_count,
+                        "调度器丢弃数": scheduler_dropped
                     },
                     message="任务已取消，相关子任务已清理",
                     frontend_url=frontend_url
@@ -645,6 +686,7 @@ def monitor_subtasks_completion(task_id: str):
     """
     监控子任务完成情况，每10秒检查一次，直到所有子任务都完成或失败
     如果检测到任务被取消，会停止轮询并进行清理工作
+    （启用 TASK_RECONCILER_ENABLED 时改由任务协调服务处理，不启动本监控）
 
     Args:
         task_id: 任务ID
@@ -707,34 +749,24 @@ def monitor_subtasks_completion(task_id: str):
         logger.error(f"监控任务 {task_id} 子任务完成情况时出错: {str(e)}")
         import traceback
         logger.error(traceback.format_exc())
+    finally:
+        # 监控结束（任务完成、失败、取消或监控出错）时释放准入容量
+        release_admission(task_id)
 
 
-class ActiveVariable(NamedTuple):
+def build_task_variables(task_obj: Task) -> List[ActiveVariable]:
     """
-    代表一个活动变量，仅包含其 ID 和可能的取值。
-    在 `active_variables_list` 中的索引即为其"维度索引"或"增序数字"。
-    """
-    variable_id: str | None     # 此变量在原始Task中的ID
-    possible_values: List[Any]  # 此变量所有可能的取值
-    # 注意：这里不包含如何应用此变量的指令。应用逻辑会在填充时动态查找。
+    收集任务的活动变量，并将变量维度映射和variables_map保存到任务对象。
 
+    `active_variables_list` 中每个元素定义一个变量（通过 `variable_id` 识别）
+    及其可能的取值。列表的索引（0, 1, 2...）就是"维度索引"。
 
-def create_subtasks_from_task(task_obj: Task) -> List[Subtask]:
-    """
-    根据给定的 Task 对象生成所有可能的 Subtask 对象。
+    Args:
+        task_obj: 任务对象
 
-    核心逻辑：
-    1. 创建 `active_variables_list`：每个元素定义一个变量（通过 `variable_id` 识别）
-       及其可能的取值。列表的索引（0, 1, 2...）就是"维度索引"。
-    2. 创建子任务的"基础模板"（包含所有固定配置）。
-    3. 使用 `itertools.product` 生成所有可能的"空间坐标" (即 `subtask.variable_indices`)。
-       该坐标的每个元素是对应"维度索引"的变量所选值的索引。
-    4. 对于每个空间坐标，从基础模板开始。对坐标中的每个维度：
-       a. 获取该维度对应的 `variable_id` 和选定的值。
-       b. 在模板中查找与此 `variable_id` 关联的"挖空"位置，并填充值。
+    Returns:
+        活动变量列表
     """
-    subtasks_to_create: List[Subtask] = []
-
     # 1. 创建 `active_variables_list`
     #    此列表的顺序定义了"维度索引"与 `variable_id` 的映射关系。
     active_variables_list: List[ActiveVariable] = []
@@ -783,16 +815,7 @@ def create_subtasks_from_task(task_obj: Task) -> List[Subtask]:
             logger.info(f"任务 {task_obj.id}: 添加提示词变量到variables_map - dimension_index: {dimension_index}, variable_id: {prompt_in_task.variable_id}")
 
     # 1b. 从任务的可配置参数中收集活动变量
-    configurable_parameters_names: List[str] = [
-        SettingField.RATIO.value,
-        SettingField.SEED.value,
-        SettingField.USER_POLISH.value,
-        SettingField.IS_LUMINA.value,
-        SettingField.LUMINA_MODEL_NAME.value,
-        SettingField.LUMINA_CFG.value,
-        SettingField.LUMINA_STEP.value,
-    ]
-    for param_name in configurable_parameters_names:
+    for param_name in CONFIGURABLE_PARAMETER_NAMES:
         param_task_model: TaskParameter = getattr(task_obj, param_name)
         if param_task_model.is_variable:
             # 添加到活动变量列表
@@ -833,142 +856,259 @@ def create_subtasks_from_task(task_obj: Task) -> List[Subtask]:
     except Exception as save_error:
         raise
 
-    # 2. 创建子任务的"基础模板"
-    # 基础提示词列表 (对于 Subtask 的 JSONField，最终需要是字典列表)
-    # 先用固定提示词的 Pydantic 模型填充，变量提示词位置留空或用标记
-    base_prompts_for_subtask_template: List[Dict[str, Any] | None] = [None] * len(task_obj.prompts)
-    for i, prompt_in_task in enumerate(task_obj.prompts):
-        if not prompt_in_task.is_variable: # 如果是固定提示词
-            base_prompts_for_subtask_template[i] = prompt_in_task.model_dump()
-        # else: 变量提示词的位置会在填充时被覆盖，所以这里是 None
-
-    # 基础参数字典
-    base_params_for_subtask_template: Dict[str, Any] = {}
-    for param_name in configurable_parameters_names:
-        param_task_model: TaskParameter = getattr(task_obj, param_name)
-        if not param_task_model.is_variable: # 如果是固定参数
-            base_params_for_subtask_template[param_name] = param_task_model.value
-        # else: 变量参数的值会在填充时被覆盖
-
-    base_params_for_subtask_template[SettingField.BATCH_SIZE.value] = task_obj.batch_size.value
-
-    # 3. 遍历所有"空间坐标"组合
-    index_ranges = [range(len(active_var.possible_values)) for active_var in active_variables_list]
-
-    # 如果没有变量，仍然需要创建一个子任务
-    if not active_variables_list:
-        # 为没有变量的任务创建一个子任务
-        final_prompts_for_subtask = []
-        for prompt_dict in base_prompts_for_subtask_template:
-            if prompt_dict is not None and prompt_dict.get('value'):
-                final_prompts_for_subtask.append(prompt_dict)
-
-        subtask_payload = {
-            "task": task_obj,
-            "variable_indices": [],  # 没有变量时为空列表
-            "prompts": final_prompts_for_subtask,
-            **base_params_for_subtask_template
-        }
+    return active_variables_list
+
+
+def iter_subtasks_from_task(task_obj: Task, active_variables_list: List[ActiveVariable]) -> Iterator[Subtask]:
+    """
+    根据给定的 Task 对象按空间坐标顺序逐个生成 Subtask 对象（惰性生成）。
+
+    核心逻辑：
+    1. 编译子任务槽位计划（维度 -> 槽位，预先转换所有取值），每个任务只编译一次。
+    2. 使用 `itertools.product` 生成所有可能的"空间坐标" (即 `subtask.variable_indices`)。
+       该坐标的每个元素是对应"维度索引"的变量所选值的索引。
+    3. 对于每个空间坐标，通过槽位计划在 O(维度数) 内组装提示词和参数。
+
+    Args:
+        task_obj: 任务对象
+        active_variables_list: `build_task_variables` 返回的活动变量列表
+
+    Yields:
+        未保存的子任务对象
+    """
+    plan = compile_subtask_plan(task_obj, active_variables_list)
+
+    # 如果没有变量，仍然需要创建一个子任务（product() 对空序列恰好产生一个空坐标）
+    index_ranges = [range(size) for size in plan.shape]
+
+    for spatial_coordinates_tuple in itertools.product(*index_ranges):
+        prompts, params = plan.build(spatial_coordinates_tuple)
+
+        yield Subtask(
+            task=task_obj,
+            variable_indices=list(spatial_coordinates_tuple),
+            prompts=prompts,
+            **params
+        )
+
+
+def iter_subtask_chunks(subtasks: Iterable[Subtask], chunk_size: int) -> Iterator[List[Subtask]]:
+    """
+    将子任务迭代器切分为固定大小的分块
+
+    Args:
+        subtasks: 子任务迭代器
+        chunk_size: 每个分块的子任务数量
+
+    Yields:
+        子任务分块
+    """
+    iterator = iter(subtasks)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# 生成线程结束标记
+_PIPELINE_DONE = object()
+
+
+def dispatch_subtasks_pipeline(task_obj: Task, active_variables_list: List[ActiveVariable]) -> Dict[str, int]:
+    """
+    以流水线方式生成、插入并发送子任务
+
+    生成线程按分块生成子任务并放入有界队列，当前线程依次将每个分块插入数据库并发送到Dramatiq队列，
+    因此生成与插入/发送相互重叠，内存中最多只保留 SUBTASK_PIPELINE_DEPTH + 1 个分块，
+    第一批子任务在第一个分块生成后即可开始执行。每个分块发送前会检查任务是否已被取消。
+
+    Args:
+        task_obj: 任务对象
+        active_variables_list: 活动变量列表
+
+    Returns:
+        发送统计信息: total、normal、lumina、chunks，以及是否因取消而提前停止的cancelled标记
+    """
+    chunk_size = max(settings.SUBTASK_CHUNK_SIZE, 1)
+    chunk_queue: "queue.Queue[Any]" = queue.Queue(maxsize=max(settings.SUBTASK_PIPELINE_DEPTH, 1))
+    stop_event = threading.Event()
 
-        subtask = Subtask(**subtask_payload)
-        subtasks_to_create.append(subtask)
+    def put_until_stopped(item: Any) -> bool:
+        """在消费者停止前持续尝试放入队列，返回是否放入成功"""
+        while not stop_event.is_set():
+            try:
+                chunk_queue.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        """生成线程：按分块生成子任务"""
+        try:
+            subtasks_iter = iter_subtasks_from_task(task_obj, active_variables_list)
+            for chunk in iter_subtask_chunks(subtasks_iter, chunk_size):
+                if not put_until_stopped(chunk):
+                    return
+            put_until_stopped(_PIPELINE_DONE)
+        except Exception as produce_error:
+            put_until_stopped(produce_error)
+
+    producer = threading.Thread(target=produce, name=f"subtask-producer-{task_obj.id}", daemon=True)
+    producer.start()
+
+    cursor = DispatchCursor()
+    stats = {"total": 0, "normal": 0, "lumina": 0, "chunks": 0, "cancelled": 0}
+    start_time = time.time()
+
+    try:
+        while True:
+            item = chunk_queue.get()
+            if item is _PIPELINE_DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
+
+            # 每个分块发送前检查任务是否已被取消
+            current_task = Task.get_or_none(Task.id == task_obj.id)
+            if current_task and current_task.status == TaskStatus.CANCELLED.value:
+                logger.info(f"任务 {task_obj.id} 在发送子任务过程中被取消，停止生成，已发送 {stats['total']} 个子任务")
+                stats["cancelled"] = 1
+                break
+
+            insert_subtasks_to_db(item)
+            send_subtasks_to_dramatiq(item, cursor, task_obj)
+
+            stats["chunks"] += 1
+            stats["total"] += len(item)
+            stats["lumina"] += sum(1 for subtask in item if subtask.is_lumina)
+            stats["normal"] = stats["total"] - stats["lumina"]
+
+            if stats["chunks"] == 1:
+                logger.info(f"任务 {task_obj.id} 第一个分块已发送，耗时: {time.time() - start_time:.2f}秒")
+    finally:
+        stop_event.set()
+        producer.join(timeout=5)
+
+    logger.info(f"任务 {task_obj.id} 子任务流水线完成: 共 {stats['total']} 个子任务, {stats['chunks']} 个分块, "
+                f"耗时: {time.time() - start_time:.2f}秒")
+    return stats
+
+
+def start_lazy_dispatch(task_obj: Task) -> Dict[str, int]:
+    """
+    惰性物化模式：不创建子任务记录，只发送第一个单元格分发消息
+
+    任务只保存变量空间（variables_map 和提示词/参数模板），
+    单元格序号由 `test_dispatch_lazy_cells` 按窗口逐批发送，工作进程在领取时解码序号并物化子任务，
+    只有产生结果或错误时才写入子任务记录。
+
+    Args:
+        task_obj: 任务对象
+
+    Returns:
+        发送统计信息，格式与 `dispatch_subtasks_pipeline` 一致
+    """
+    # 提前编译计划，变量定义有误时在提交阶段即失败
+    plan = get_task_plan(task_obj)
+    total = plan.total_cells
+    lumina = plan.count_cells(SettingField.IS_LUMINA.value, bool)
+
+    get_background_service().enqueue(
+        actor_name="test_dispatch_lazy_cells",
+        kwargs={"task_id": str(task_obj.id), "start_ordinal": 0, "cursor_state": {}, "offset_ms": 0},
+        queue_name="test_master"
+    )
+
+    logger.info(f"任务 {task_obj.id} 使用惰性物化模式，共 {total} 个单元格，已启动分发")
+    return {"total": total, "normal": total - lumina, "lumina": lumina, "chunks": 0, "cancelled": 0}
+
+
+def start_task_execution(task_obj: Task, active_variables_list: List[ActiveVariable]) -> Dict[str, Any]:
+    """
+    任务获得执行槽位（准入）后开始执行：更新状态为processing，发送子任务，发送通知，
+    然后交由任务协调服务跟踪（TASK_RECONCILER_ENABLED）或启动监控线程
+
+    Args:
+        task_obj: 任务对象
+        active_variables_list: 活动变量列表
+
+    Returns:
+        执行结果
+    """
+    task_id = str(task_obj.id)
+
+    # 更新任务状态为处理中
+    update_task_status(task_obj, TaskStatus.PROCESSING.value)
+
+    if task_obj.lazy_materialization:
+        # 惰性物化：只发送单元格序号，子任务在工作进程领取时物化
+        dispatch_stats = start_lazy_dispatch(task_obj)
     else:
-        # 有变量时的正常流程
-        for spatial_coordinates_tuple in itertools.product(*index_ranges):
-            # 为当前子任务深拷贝基础模板
-            current_subtask_prompts_list = deepcopy(base_prompts_for_subtask_template)
-            current_subtask_params_dict = deepcopy(base_params_for_subtask_template)
-
-            # 3a. 根据当前空间坐标点 (`spatial_coordinates_tuple`) 填充变量值
-            #     `dimension_idx` 即为"维度索引" (0, 1, 2, ...)，
-            #     它对应 `active_variables_list` 中的索引。
-            for dimension_idx, chosen_value_index_for_this_dim in enumerate(spatial_coordinates_tuple):
-                active_var_info = active_variables_list[dimension_idx]
-                current_variable_id = active_var_info.variable_id
-                chosen_value = active_var_info.possible_values[chosen_value_index_for_this_dim]
-
-                # 在子任务模板中查找此 variable_id 并应用/替换值
-
-                variable_applied = False
-                # 尝试在提示词中应用
-                for i, original_task_prompt in enumerate(task_obj.prompts):
-                    if original_task_prompt.is_variable and original_task_prompt.variable_id == current_variable_id:
-                        # `chosen_value` 此时应该是一个 ConstantPrompt 对象
-                        if not isinstance(chosen_value, ConstantPrompt):
-                            logger.error(f"Mismatched type for prompt variable {current_variable_id}. Expected ConstantPrompt, got {type(chosen_value)}")
-                            # Potentially raise error or skip
-                            continue
-                        current_subtask_prompts_list[i] = chosen_value.model_dump()
-                        variable_applied = True
-                        break # variable_id 在 prompts 中是唯一的
-
-                if variable_applied:
-                    continue
+        # 流水线生成子任务：按分块插入数据库并发送到Dramatiq队列
+        dispatch_stats = dispatch_subtasks_pipeline(task_obj, active_variables_list)
 
-                # 尝试在参数中应用
-                for param_name_candidate in configurable_parameters_names:
-                    original_task_param: TaskParameter = getattr(task_obj, param_name_candidate)
-                    if original_task_param.is_variable and original_task_param.variable_id == current_variable_id:
-                        current_subtask_params_dict[param_name_candidate] = chosen_value
-                        variable_applied = True
-                        break # variable_id 在 parameters 中是唯一的 (且与prompts中的不同)
-
-                if not variable_applied:
-                    logger.warning(f"Task {task_obj.id}: Variable ID '{current_variable_id}' from active_variables_list "
-                                   f"was not found or applied to any part of the subtask template.")
-
-            final_prompts_for_subtask: List[Dict[str, Any]]
-            if not task_obj.prompts:
-                final_prompts_for_subtask = []
-            else:
-                # 确保所有 None (代表变量提示词的原始位置) 都被填充了
-                if any(p_dict is None for i, p_dict in enumerate(current_subtask_prompts_list) if task_obj.prompts[i].is_variable):
-                    # 找到未填充的变量提示词
-                    missing_vars = []
-                    for i, p_dict in enumerate(current_subtask_prompts_list):
-                        if task_obj.prompts[i].is_variable and p_dict is None:
-                            missing_vars.append(task_obj.prompts[i].variable_id)
-                    logger.error(
-                        f"任务 {task_obj.id}, 子任务 (空间坐标: {spatial_coordinates_tuple}): "
-                        f"部分变量提示词未被填充: {missing_vars}. 当前提示词列表: {current_subtask_prompts_list}"
-                    )
-                    # 这通常指示逻辑错误，比如 active_variables_list 和 task_obj 的变量定义不匹配
-                    # 或者 variable_id 在填充时没有正确匹配
-                    raise ValueError("逻辑错误：并非所有变量提示词槽都为子任务填充完毕。")
-
-                # 过滤掉None值和value为空的提示词
-                def is_valid_prompt(p_dict):
-                    if p_dict is None:
-                        return False
-                    # 检查value字段是否为空
-                    value = p_dict.get('value')
-                    if value is None or value == "":
-                        return False
-                    return True
-
-                # 记录过滤前后的提示词数量
-                original_count = len([p for p in current_subtask_prompts_list if p is not None])
-                final_prompts_for_subtask = [p for p in current_subtask_prompts_list if is_valid_prompt(p)]
-                filtered_count = len(final_prompts_for_subtask)
-
-                if original_count != filtered_count:
-                    logger.info(f"任务 {task_obj.id}, 子任务 (空间坐标: {spatial_coordinates_tuple}): "
-                               f"过滤掉 {original_count - filtered_count} 个空值提示词，"
-                               f"最终保留 {filtered_count} 个有效提示词")
-                # 如果允许某些提示词在某些子任务中完全不存在（而不是仅值不同），则上面的None检查需要调整
-
-            # 4. 准备 Subtask 数据并创建对象
-            subtask_payload = {
-                "task": task_obj,
-                "variable_indices": list(spatial_coordinates_tuple),
-                "prompts": final_prompts_for_subtask, # 确保这里的prompts是List[Dict]
-                **current_subtask_params_dict
-            }
+    if dispatch_stats["cancelled"]:
+        logger.info(f"[{task_id}] 任务在发送子任务过程中被取消，已发送 {dispatch_stats['total']} 个子任务")
+        release_admission(task_id)
+        return {
+            "status": "cancelled",
+            "task_id": str(task_obj.id),
+            "message": "任务已被取消"
+        }
+
+    # 记录任务提交完成
+    logger.info(f"[{task_id}] 测试任务提交完成，已创建并发送 {dispatch_stats['total']} 个子任务")
+
+    # 发送飞书通知 - 任务开始处理
+    try:
+        # 生成前端详细页面URL
+        frontend_url = f"{settings.FRONTEND_BASE_URL}/model-testing/history/{task_obj.id}"
+
+        feishu_task_notify(
+            event_type="task_processing",
+            task_id=str(task_obj.id),
+            task_name=task_obj.name,
+            submitter=task_obj.user.username if task_obj.user else None,
+            details={
+                "子任务数量": dispatch_stats["total"],
+                "普通子任务数": dispatch_stats["normal"],
+                "Lumina子任务数": dispatch_stats["lumina"],
+            },
+            message="任务已开始处理",
+            frontend_url=frontend_url
+        )
+    except Exception as e:
+        # 飞书通知失败不影响主流程
+        logger.warning(f"发送飞书通知失败: {str(e)}")
+
+    if settings.TASK_RECONCILER_ENABLED:
+        # 由全局任务协调服务跟踪进度、完成和取消，当前Actor发送完子任务后直接返回
+        # 登记失败时协调服务仍会从数据库中找到执行中的任务
+        try:
+            track_task(task_id)
+        except Exception as e:
+            logger.warning(f"[{task_id}] 登记任务失败: {str(e)}")
+        logger.info(f"[{task_id}] 任务已交由任务协调服务跟踪")
+    else:
+        # 启动子任务监控线程
+        logger.info(f"[{task_id}] 启动子任务监控线程")
+        # 使用线程而不是直接调用，避免阻塞当前任务
+        monitor_thread = threading.Thread(
+            target=monitor_subtasks_completion,
+            args=(str(task_obj.id),),
+            daemon=True  # 设置为守护线程，主线程结束时自动结束
+        )
+        monitor_thread.start()
+        logger.info(f"[{task_id}] 子任务监控线程已启动")
 
-            subtask = Subtask(**subtask_payload)
-            subtasks_to_create.append(subtask)
+    return {
+        "status": "success",
+        "task_id": str(task_obj.id),
+        "subtask_count": dispatch_stats["total"]
+    }
 
-    return subtasks_to_create
 
 @dramatiq.actor(
     queue_name="test_master",  # 使用标准队列
@@ -981,9 +1121,11 @@ def test_submit_master(task_id: str, task_data: Dict[str, Any]):
 
     流程：
     1. 初始化任务数据并以pending状态保存到数据库
-    2. 创建子任务并保存到数据库
-    3. 等待执行槽位（10分钟内没有其他正在执行的任务）
-    4. 获取到执行槽位后，更新任务状态为processing并发送子任务到队列
+    2. 构建任务变量（variables_map）
+    3. 申请准入（ADMISSION_CONTROL_ENABLED），容量不足时进入准入队列并结束当前Actor，
+       容量释放后由 test_start_admitted_task 继续；未启用时等待执行槽位（10分钟内没有其他正在执行的任务）
+    4. 获取到执行槽位后，更新任务状态为processing，
+       以流水线方式分块生成子任务，逐块插入数据库并发送到队列
 
     Args:
         task_id: 任务ID（可能会被替换为数据库生成的ID）
@@ -1037,21 +1179,27 @@ def test_submit_master(task_id: str, task_data: Dict[str, Any]):
             # 飞书通知失败不影响主流程
             logger.warning(f"发送飞书通知失败: {str(e)}")
 
-        # 创建子任务
-        subtasks_to_create = create_subtasks_from_task(task_obj)
+        # 构建任务变量（生成variables_map并保存到数据库）
+        active_variables_list = build_task_variables(task_obj)
 
         # 刷新任务对象以确保variables_map已更新
         # 重新查询数据库获取最新数据
         updated_task = Task.get_or_none(Task.id == task_obj.id)
         if updated_task:
             task_obj = updated_task
-        logger.info(f"[{task_id}] 子任务创建完成，variables_map已更新: {len(task_obj.variables_map)} 个变量")
+        logger.info(f"[{task_id}] 任务变量构建完成，variables_map已更新: {len(task_obj.variables_map)} 个变量")
 
-        # 批量插入子任务到数据库
-        insert_subtasks_to_db(subtasks_to_create)
+        if settings.ADMISSION_CONTROL_ENABLED:
+            # 申请准入：容量不足时任务留在准入队列中，释放当前工作线程，容量释放后由 test_start_admitted_task 继续执行
+            if not get_admission_controller().request(task_obj):
+                return {
+                    "status": "queued",
+                    "task_id": str(task_obj.id),
+                    "message": "任务已进入准入等待队列"
+                }
 
         # 等待执行槽位（10分钟内没有其他正在执行的任务）
-        if not wait_for_execution_slot(task_obj):
+        elif not wait_for_execution_slot(task_obj):
             # 如果无法获取执行槽位（超时或任务被取消）
             # 重新查询数据库获取最新状态
             current_task = Task.get_or_none(Task.id == task_obj.id)
@@ -1065,83 +1213,29 @@ def test_submit_master(task_id: str, task_data: Dict[str, Any]):
                     "message": "任务已被取消"
                 }
 
-            # 如果是因为超时无法获取执行槽位，将任务标记为失败
-            update_task_status(task_obj, TaskStatus.FAILED.value)
+            # 如果是因为超时无法获取执行槽位，将任务标记为失败并发送飞书通知
             error_msg = "等待执行槽位超时，无法执行任务"
             logger.error(f"[{task_id}] {error_msg}")
-
-            # 发送飞书通知
-            try:
-                # 生成前端详细页面URL
-                frontend_url = f"{settings.FRONTEND_BASE_URL}/model-testing/history/{task_obj.id}"
-
-                feishu_task_notify(
-                    event_type="task_failed",
-                    task_id=str(task_obj.id),
-                    task_name=task_obj.name,
-                    submitter=task_obj.user.username if task_obj.user else None,
-                    details={
-                        "错误信息": error_msg,
-                    },
-                    message="任务等待执行槽位超时",
-                    frontend_url=frontend_url
-                )
-            except Exception as notify_error:
-                logger.warning(f"发送飞书通知失败: {str(notify_error)}")
-
-            return {
-                "status": "failed",
-                "task_id": str(task_obj.id),
-                "message": error_msg
-            }
-
-        # 获取到执行槽位，更新任务状态为处理中
-        update_task_status(task_obj, TaskStatus.PROCESSING.value)
-
-        # 将子任务发送到Dramatiq队列
-        send_subtasks_to_dramatiq(subtasks_to_create)
-
-        # 记录任务提交完成
-        logger.info(f"[{task_id}] 测试任务提交完成，已创建并发送 {len(subtasks_to_create)} 个子任务")
-
-        # 发送飞书通知 - 任务开始处理
-        try:
-            # 生成前端详细页面URL
-            frontend_url = f"{settings.FRONTEND_BASE_URL}/model-testing/history/{task_obj.id}"
-
-            feishu_task_notify(
-                event_type="task_processing",
+            update_task_status(task_obj, TaskStatus.FAILED.value, notification=dict(
+                event_type="task_failed",
                 task_id=str(task_obj.id),
                 task_name=task_obj.name,
                 submitter=task_obj.user.username if task_obj.user else None,
                 details={
-                    "子任务数量": len(subtasks_to_create),
-                    "普通子任务数": sum(1 for s in subtasks_to_create if not s.is_lumina),
-                    "Lumina子任务数": sum(1 for s in subtasks_to_create if s.is_lumina),
+                    "错误信息": error_msg,
                 },
-                message="任务已开始处理",
-                frontend_url=frontend_url
-            )
-        except Exception as e:
-            # 飞书通知失败不影响主流程
-            logger.warning(f"发送飞书通知失败: {str(e)}")
+                message="任务等待执行槽位超时",
+                frontend_url=f"{settings.FRONTEND_BASE_URL}/model-testing/history/{task_obj.id}"
+            ))
 
-        # 启动子任务监控线程
-        logger.info(f"[{task_id}] 启动子任务监控线程")
-        # 使用线程而不是直接调用，避免阻塞当前任务
-        monitor_thread = threading.Thread(
-            target=monitor_subtasks_completion,
-            args=(str(task_obj.id),),
-            daemon=True  # 设置为守护线程，主线程结束时自动结束
-        )
-        monitor_thread.start()
-        logger.info(f"[{task_id}] 子任务监控线程已启动")
+            return {
+                "status": "failed",
+                "task_id": str(task_obj.id),
+                "message": error_msg
+            }
 
-        return {
-            "status": "success",
-            "task_id": str(task_obj.id),
-            "subtask_count": len(subtasks_to_create)
-        }
+        # 获取到执行槽位，开始执行
+        return start_task_execution(task_obj, active_variables_list)
 
     except Exception as e:
         # 记录错误
@@ -1157,6 +1251,9 @@ def test_submit_master(task_id: str, task_data: Dict[str, Any]):
         except Exception as update_error:
             logger.error(f"更新任务状态失败: {str(update_error)}")
 
+        if 'task_obj' in locals():
+            release_admission(task_obj.id)
+
         # 尝试发送飞书通知
         try:
             if 'task_obj' in locals():
@@ -1181,3 +1278,214 @@ def test_submit_master(task_id: str, task_data: Dict[str, Any]):
         # 重新抛出异常，让dramatiq处理重试逻辑
         raise
 
+
+@dramatiq.actor(
+    queue_name="test_master",
+    max_retries=settings.MAX_RETRIES,
+    time_limit=600000,  # 600秒
+)
+def test_dispatch_lazy_cells(task_id: str, start_ordinal: int = 0,
+                             cursor_state: Optional[Dict[str, int]] = None, offset_ms: int = 0):
+    """
+    惰性物化模式的单元格分发Actor
+
+    每次发送一个窗口（LAZY_DISPATCH_WINDOW 个）的单元格序号，延迟规则与普通子任务相同；
+    窗口发送完后，在本窗口最早一路消息到期时再次调度自身发送下一个窗口，
+    因此Redis中同时存在的消息数量与窗口大小成正比，而不是与单元格总数成正比。
+
+    Args:
+        task_id: 任务ID
+        start_ordinal: 本窗口的起始单元格序号
+        cursor_state: 延迟游标状态（累积延迟相对于首次分发时刻）
+        offset_ms: 本次执行时刻相对于首次分发时刻的延迟（毫秒）
+    """
+    DramatiqBaseModel.initialize_database()
+    from backend.core.app import initialize_app
+    initialize_app()
+
+    task_obj = Task.get_or_none(Task.id == task_id)
+    if not task_obj:
+        logger.warning(f"[{task_id}] 任务不存在，停止分发单元格")
+        return
+    if task_obj.status != TaskStatus.PROCESSING.value:
+        logger.info(f"[{task_id}] 任务状态为 {task_obj.status}，停止分发单元格（已分发 {start_ordinal} 个）")
+        return
+
+    plan = get_task_plan(task_obj)
+    total = plan.total_cells
+    window = max(settings.LAZY_DISPATCH_WINDOW, 1)
+    end_ordinal = min(start_ordinal + window, total)
+
+    cursor = DispatchCursor.from_dict(cursor_state)
+    background_service = get_background_service()
+
+    if settings.FAIR_SCHEDULING_ENABLED and get_fair_scheduler().pending_count(task_id) >= window:
+        # 公平调度器中本任务待发送的单元格仍多于一个窗口，稍后再补充
+        background_service.enqueue(
+            actor_name="test_dispatch_lazy_cells",
+            kwargs={"task_id": task_id, "start_ordinal": start_ordinal, "cursor_state": cursor.to_dict(),
+                    "offset_ms": offset_ms},
+            queue_name="test_master",
+            delay=settings.FAIR_DISPATCH_INTERVAL * 5
+        )
+        return
+
+    # 本窗口开始前各路的序号，用于判断本窗口推进了哪一路
+    lumina_index_before, normal_index_before = cursor.lumina_index, cursor.normal_index
+
+    messages = []
+    for ordinal in range(start_ordinal, end_ordinal):
+        is_lumina = bool(plan.param_value(plan.decode(ordinal), SettingField.IS_LUMINA.value))
+        messages.append({
+            "actor_name": "test_run_lumina_subtask_cell" if is_lumina else "test_run_subtask_cell",
+            "kwargs": {"task_id": task_id, "ordinal": ordinal},
+            "queue_name": settings.SUBTASK_OPS_QUEUE if is_lumina else settings.SUBTASK_QUEUE,
+            "delay": max(cursor.advance(is_lumina) - offset_ms, 0),
+            "task_id": task_id,
+        })
+
+    if settings.FAIR_SCHEDULING_ENABLED:
+        for message in messages:
+            message["member"] = str(message["kwargs"]["ordinal"])
+        get_fair_scheduler().submit(task_id, str(task_obj.user_id), task_obj.priority, messages)
+    else:
+        background_service.enqueue_many(messages)
+
+    logger.info(f"[{task_id}] 已分发单元格 {start_ordinal}-{end_ordinal - 1}，共 {total} 个")
+
+    if end_ordinal >= total:
+        logger.info(f"[{task_id}] 所有单元格已分发完成")
+        return
+
+    if settings.FAIR_SCHEDULING_ENABLED:
+        # 公平调度器按额度发送，定期检查待发送数量并补充下一个窗口
+        next_offset_ms = offset_ms + settings.FAIR_DISPATCH_INTERVAL * 5
+    elif settings.RATE_LIMIT_ENABLED:
+        # 启用全局限流时消息没有延迟，按限流速率估算本窗口被消费完的时间
+        lumina_count = sum(1 for message in messages if message["actor_name"] == "test_run_lumina_subtask_cell")
+        normal_count = len(messages) - lumina_count
+        window_ms = max(lumina_count / settings.RATE_LIMIT_LUMINA_RATE,
+                        normal_count / settings.RATE_LIMIT_STANDARD_RATE) * 1000
+        next_offset_ms = offset_ms + int(window_ms)
+    else:
+        # 在本窗口推进过的各路中最早一路消息到期时发送下一个窗口；
+        # 本窗口没有推进的一路（is_lumina不是最后一个维度时窗口中只有一种单元格）的延迟已经过期，不参与计算
+        due_delays = [delay for index, before, delay in (
+            (cursor.lumina_index, lumina_index_before, cursor.lumina_delay_ms),
+            (cursor.normal_index, normal_index_before, cursor.normal_delay_ms),
+        ) if index > before]
+        next_offset_ms = min(due_delays) if due_delays else offset_ms
+        # 至少间隔一个最小步长，避免下一个窗口立即发送，使全部单元格提前进入Redis延迟队列
+        next_offset_ms = max(next_offset_ms, offset_ms + LAZY_DISPATCH_MIN_STEP_MS)
+
+    background_service.enqueue(
+        actor_name="test_dispatch_lazy_cells",
+        kwargs={
+            "task_id": task_id,
+            "start_ordinal": end_ordinal,
+            "cursor_state": cursor.to_dict(),
+            "offset_ms": next_offset_ms,
+        },
+        queue_name="test_master",
+        delay=next_offset_ms - offset_ms
+    )
+
+
+@dramatiq.actor(
+    queue_name="test_master",
+    max_retries=0,
+    time_limit=60000,  # 60秒
+)
+def test_fair_dispatch(token: str):
+    """
+    公平调度Actor
+
+    每次执行一轮调度，将各任务待发送的子任务按优先级加权的步幅顺序发送到子任务队列，
+    然后在 FAIR_DISPATCH_INTERVAL 毫秒后再次调度自身；没有活跃任务时停止。
+    同一时刻只有持有调度权令牌的一条调度链在运行。
+
+    Args:
+        token: 调度链令牌
+    """
+    scheduler = get_fair_scheduler()
+    if not scheduler.claim_ticker(token):
+        logger.info("已有其他公平调度Actor在运行，当前调度链退出")
+        return
+
+    try:
+        dispatched = scheduler.dispatch()
+        if dispatched:
+            logger.info(f"公平调度本轮发送 {dispatched} 个子任务")
+    finally:
+        if scheduler.stop_ticker(token):
+            logger.info("没有待调度的任务，公平调度Actor停止")
+        else:
+            get_background_service().enqueue(
+                actor_name="test_fair_dispatch",
+                kwargs={"token": token},
+                queue_name="test_master",
+                delay=settings.FAIR_DISPATCH_INTERVAL
+            )
+
+
+@dramatiq.actor(
+    queue_name="test_master",
+    max_retries=5,  # 重试时任务已不是等待中（已开始执行或已标记失败）则跳过，不会重复发送子任务
+    time_limit=3600000,  # 3600秒，与任务提交Actor相同
+)
+def test_start_admitted_task(task_id: str):
+    """
+    准入等待的任务被唤醒后继续执行的Actor
+
+    Args:
+        task_id: 任务ID
+    """
+    logger.info(f"[{task_id}] 任务获得准入，开始执行")
+
+    task_obj = None
+    try:
+        DramatiqBaseModel.initialize_database()
+        from backend.core.app import initialize_app
+        initialize_app()
+
+        task_obj = Task.get_or_none(Task.id == task_id)
+        if not task_obj or task_obj.status != TaskStatus.PENDING.value:
+            logger.info(f"[{task_id}] 任务不存在或状态不是等待中（{task_obj.status if task_obj else None}），释放准入容量")
+            release_admission(task_id)
+            return {
+                "status": "skipped",
+                "task_id": task_id,
+            }
+
+        return start_task_execution(task_obj, collect_active_variables(task_obj))
+    except Exception as e:
+        import traceback
+        error_msg = f"任务执行失败: {str(e)}"
+        logger.error(f"[{task_id}] {error_msg}\n{traceback.format_exc()}")
+
+        if task_obj is None:
+            # 读取任务之前失败（数据库不可用等）：保留准入，由Dramatiq重试
+            raise
+
+        try:
+            update_task_status(task_obj, TaskStatus.FAILED.value, notification=dict(
+                event_type="task_failed",
+                task_id=task_id,
+                task_name=task_obj.name,
+                submitter=task_obj.user.username if task_obj.user else None,
+                details={
+                    "错误信息": error_msg,
+                },
+                message="任务执行失败",
+                frontend_url=f"{settings.FRONTEND_BASE_URL}/model-testing/history/{task_id}"
+            ))
+        except Exception as update_error:
+            logger.error(f"更新任务状态失败: {str(update_error)}")
+            # 状态没有更新：保留准入，由Dramatiq重试（重试时任务已开始执行则跳过）
+            raise
+        release_admission(task_id)
+        return {
+            "status": "failed",
+            "task_id": task_id,
+            "message": error_msg
+        }
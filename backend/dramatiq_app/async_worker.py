@@ -0,0 +1,287 @@
+"""
+异步子任务工作进程
+
+普通Dramatiq工作进程中每个子任务会占用一个工作线程直到图像生成结束，而大部分时间都花在轮询间隔的等待上，
+因此单机并发受限于 进程数 × 线程数。异步工作进程在每个进程中只运行一个事件循环，
+把子任务消息交给 `ASYNC_ACTOR_HANDLERS` 中的协程并发执行，同时进行中的消息数量由 --concurrency 限制。
+
+消息的接收、延迟消息的处理和确认仍由Dramatiq的ConsumerThread完成，并沿用broker上的中间件
+（墓碑跳过、重试、任务跟踪等）；TimeLimit中间件按线程中断执行，不适用于协程，改为按Actor的time_limit
+使用 asyncio.wait_for 限制执行时间。没有异步入口的Actor会放到线程池中执行。
+
+子任务中的数据库读写和Redis调用仍是同步调用，通过 asyncio.to_thread 在线程池中执行，不阻塞事件循环，
+数据库连接在线程中用完后立即归还连接池。
+
+用法:
+    python -m backend.dramatiq_app.async_worker subtask subtask_ops --concurrency 300
+"""
+import argparse
+import asyncio
+import logging
+import queue
+import signal
+import typing
+
+from dramatiq.common import dq_name
+from dramatiq.middleware import MiddlewareError, SkipMessage, TimeLimit, TimeLimitExceeded
+from dramatiq.worker import ConsumerThread
+
+from backend.core.config import settings
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 命令行中的队列别名
+QUEUE_ALIASES = {
+    "subtask": settings.SUBTASK_QUEUE,
+    "subtask_ops": settings.SUBTASK_OPS_QUEUE,
+}
+
+# 消费者从Redis取消息和工作队列空闲时的等待时间（毫秒）
+WORKER_TIMEOUT = 1000
+
+
+class AsyncWorker:
+    """
+    单事件循环的Dramatiq工作进程
+
+    参照 dramatiq.Worker 的结构：每个队列及其延迟队列各一个ConsumerThread，把消息放入共享的工作队列，
+    事件循环从工作队列取出消息并为每条消息创建一个协程。
+    """
+
+    def __init__(self, broker, queues: typing.List[str], concurrency: int) -> None:
+        """
+        初始化异步工作进程
+
+        Args:
+            broker: Dramatiq消息代理
+            queues: 监听的队列名称列表
+            concurrency: 同时进行中的消息数量上限
+        """
+        self.broker = broker
+        self.queues = queues
+        self.concurrency = concurrency
+        self.work_queue: "queue.PriorityQueue" = queue.PriorityQueue()
+        self.consumers: typing.Dict[str, ConsumerThread] = {}
+        self.running = False
+        self.in_flight: typing.Set[asyncio.Task] = set()
+        # TimeLimit中间件通过向线程注入异常来中断执行，在事件循环线程中会中断所有协程，需要跳过
+        self.middleware = [m for m in broker.middleware if not isinstance(m, TimeLimit)]
+
+    def _emit_before(self, signal_name: str, *args, **kwargs) -> None:
+        """按顺序调用中间件的 before_ 回调（与 Broker.emit_before 相同，但跳过TimeLimit）"""
+        for middleware in self.middleware:
+            try:
+                getattr(middleware, "before_" + signal_name)(self.broker, *args, **kwargs)
+            except MiddlewareError:
+                raise
+            except Exception:
+                logger.critical(f"中间件 {middleware!r} 的 before_{signal_name} 执行失败", exc_info=True)
+
+    def _emit_after(self, signal_name: str, *args, **kwargs) -> None:
+        """逆序调用中间件的 after_ 回调（与 Broker.emit_after 相同，但跳过TimeLimit）"""
+        for middleware in reversed(self.middleware):
+            try:
+                getattr(middleware, "after_" + signal_name)(self.broker, *args, **kwargs)
+            except Exception:
+                logger.critical(f"中间件 {middleware!r} 的 after_{signal_name} 执行失败", exc_info=True)
+
+    def _add_consumer(self, queue_name: str, prefetch: int) -> None:
+        """为队列启动消费者线程"""
+        consumer = self.consumers[queue_name] = ConsumerThread(
+            broker=self.broker,
+            queue_name=queue_name,
+            prefetch=prefetch,
+            work_queue=self.work_queue,
+            worker_timeout=WORKER_TIMEOUT,
+        )
+        consumer.start()
+
+    def start(self) -> None:
+        """启动消费者线程"""
+        self.broker.emit_before("worker_boot", self)
+        for queue_name in self.queues:
+            self._add_consumer(queue_name, prefetch=self.concurrency)
+            self._add_consumer(dq_name(queue_name), prefetch=min(self.concurrency * 1000, 65535))
+        self.running = True
+        self.broker.emit_after("worker_boot", self)
+        logger.info(f"异步工作进程已启动，监听队列: {self.queues}，并发上限: {self.concurrency}")
+
+    async def run(self) -> None:
+        """从工作队列取出消息并发执行，直到停止"""
+        slots = asyncio.Semaphore(self.concurrency)
+        while self.running:
+            await slots.acquire()
+            try:
+                item = await asyncio.to_thread(self.work_queue.get, timeout=WORKER_TIMEOUT / 1000)
+            except queue.Empty:
+                slots.release()
+                continue
+
+            task = asyncio.create_task(self._process_message(item.message))
+            self.in_flight.add(task)
+            task.add_done_callback(self.in_flight.discard)
+            task.add_done_callback(lambda _: slots.release())
+
+    async def _call_actor(self, message) -> typing.Any:
+        """
+        执行消息对应的Actor：有异步入口的直接在事件循环中执行，否则放到线程池中执行
+
+        Args:
+            message: 消息
+
+        Returns:
+            Actor的返回值
+        """
+        from backend.dramatiq_app.actors.test_run_subtask import ASYNC_ACTOR_HANDLERS
+
+        actor = self.broker.get_actor(message.actor_name)
+        handler = ASYNC_ACTOR_HANDLERS.get(message.actor_name)
+        if handler is not None:
+            coro = handler(*message.args, retry_count=message.options.get("retries", 0), **message.kwargs)
+        else:
+            coro = asyncio.to_thread(actor, *message.args, **message.kwargs)
+
+        time_limit = message.options.get("time_limit") or actor.options.get("time_limit")
+        if not time_limit:
+            return await coro
+        try:
+            return await asyncio.wait_for(coro, time_limit / 1000)
+        except asyncio.TimeoutError:
+            raise TimeLimitExceeded(f"消息执行超过时间限制 {time_limit}ms")
+
+    async def _process_message(self, message) -> None:
+        """
+        处理单条消息，流程与 dramatiq.worker.WorkerThread.process_message 相同
+
+        Args:
+            message: 消息
+        """
+        try:
+            self._emit_before("process_message", message)
+
+            result = None
+            if not message.failed:
+                result = await self._call_actor(message)
+
+            self._emit_after("process_message", message, result=result)
+
+        except SkipMessage as e:
+            if message.failed:
+                message.stuff_exception(e)
+            logger.warning(f"消息 {message} 已跳过")
+            self._emit_after("skip_message", message)
+
+        except BaseException as e:
+            message.stuff_exception(e)
+            logger.error(f"处理消息 {message} 失败", exc_info=True)
+            self._emit_after("process_message", message, exception=e)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+
+        finally:
+            await asyncio.to_thread(self.consumers[message.queue_name].post_process_message, message)
+            self.work_queue.task_done()
+            message.clear_exception()
+
+    async def stop(self, timeout: float = 600) -> None:
+        """
+        停止接收新消息，等待进行中的消息完成后关闭消费者
+
+        Args:
+            timeout: 等待进行中消息的最长时间（秒）
+        """
+        self.broker.emit_before("worker_shutdown", self)
+        self.running = False
+
+        if self.in_flight:
+            logger.info(f"等待 {len(self.in_flight)} 条进行中的消息完成...")
+            done, pending = await asyncio.wait(set(self.in_flight), timeout=timeout)
+            for task in pending:
+                task.cancel()
+
+        for consumer in self.consumers.values():
+            consumer.stop()
+        for consumer in self.consumers.values():
+            await asyncio.to_thread(consumer.join, timeout)
+
+        # 工作队列中尚未开始的消息放回各自的队列
+        messages_by_queue: typing.Dict[str, list] = {}
+        while True:
+            try:
+                item = self.work_queue.get_nowait()
+            except queue.Empty:
+                break
+            messages_by_queue.setdefault(item.message.queue_name, []).append(item.message)
+        for queue_name, messages in messages_by_queue.items():
+            try:
+                self.consumers[queue_name].requeue_messages(messages)
+            except Exception as e:
+                logger.warning(f"将消息放回队列 {queue_name} 失败: {str(e)}")
+
+        for consumer in self.consumers.values():
+            consumer.close()
+
+        from backend.utils.http_client import aclose_http_client
+        await aclose_http_client()
+
+        self.broker.emit_after("worker_shutdown", self)
+        logger.info("异步工作进程已停止")
+
+
+async def serve(queues: typing.List[str], concurrency: int) -> None:
+    """
+    启动异步工作进程并运行到收到退出信号
+
+    Args:
+        queues: 监听的队列名称列表
+        concurrency: 同时进行中的消息数量上限
+    """
+    # 导入broker和actor（broker_setup会在导入时初始化数据库连接）
+    from backend.dramatiq_app.workers.broker_setup import broker
+    from backend.dramatiq_app.actors import test_run_subtask  # noqa: F401
+
+    worker = AsyncWorker(broker, queues, concurrency)
+    worker.start()
+
+    loop = asyncio.get_running_loop()
+    stop_event = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    run_task = asyncio.create_task(worker.run())
+    await stop_event.wait()
+    logger.info("收到退出信号，正在停止异步工作进程...")
+    await worker.stop()
+    await run_task
+
+
+def main():
+    """主函数"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format="[%(asctime)s] [PID %(process)d] [%(threadName)s] [%(name)s] [%(levelname)s] %(message)s",
+        handlers=[logging.StreamHandler()],
+    )
+
+    parser = argparse.ArgumentParser(description="启动异步子任务工作进程")
+    parser.add_argument(
+        "queues",
+        nargs="*",
+        default=["subtask", "subtask_ops"],
+        help=f"要处理的队列: subtask({settings.SUBTASK_QUEUE})、subtask_ops({settings.SUBTASK_OPS_QUEUE})或队列全名",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=settings.ASYNC_WORKER_CONCURRENCY,
+        help="同时进行中的子任务数量上限",
+    )
+    args = parser.parse_args()
+
+    queues = [QUEUE_ALIASES.get(name, name) for name in args.queues]
+    asyncio.run(serve(queues, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+数据库连接池生命周期中间件
+
+工作进程启动时初始化进程内唯一的数据库连接池，每条消息处理完后把工作线程持有的连接归还连接池，
+并定期记录连接池统计；工作进程退出前写入子任务状态缓冲区中剩余的变化
+"""
+import logging
+import threading
+from dramatiq import Middleware
+
+from backend.core.config import settings
+from backend.db.pool import get_pool_stats, release_connection
+from backend.services.subtask_write_buffer import flush_subtask_write_buffer
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+class DatabaseLifecycle(Middleware):
+    """
+    数据库连接池生命周期中间件
+    """
+
+    def __init__(self):
+        """初始化中间件"""
+        self._lock = threading.Lock()
+        self._processed = 0
+
+    def before_worker_boot(self, broker, worker):
+        """
+        工作进程启动前的回调函数：初始化连接池并绑定数据库代理
+
+        Args:
+            broker: 消息代理
+            worker: 工作进程
+        """
+        from backend.db.dramatiq_db import initialize_dramatiq_db
+        from backend.db.initialization import initialize_test_db
+
+        initialize_dramatiq_db()
+        initialize_test_db()
+
+    def _release(self):
+        """归还连接并按间隔记录连接池统计"""
+        try:
+            release_connection()
+        except Exception as e:
+            logger.warning(f"归还数据库连接失败: {str(e)}")
+
+        interval = settings.DB_POOL_STATS_LOG_INTERVAL
+        if interval <= 0:
+            return
+        with self._lock:
+            self._processed += 1
+            should_log = self._processed % interval == 0
+        if should_log:
+            logger.info(f"数据库连接池统计: {get_pool_stats()}")
+
+    def after_process_message(self, broker, message, *, result=None, exception=None):
+        """
+        消息处理后的回调函数
+
+        Args:
+            broker: 消息代理
+            message: 消息
+            result: 处理结果
+            exception: 异常
+        """
+        self._release()
+
+    def after_skip_message(self, broker, message):
+        """
+        跳过消息后的回调函数
+
+        Args:
+            broker: 消息代理
+            message: 消息
+        """
+        self._release()
+
+    def before_worker_thread_shutdown(self, broker, thread):
+        """
+        工作线程退出前的回调函数（在该工作线程中执行）
+
+        Args:
+            broker: 消息代理
+            thread: 工作线程
+        """
+        release_connection()
+
+    def before_worker_shutdown(self, broker, worker):
+        """
+        工作进程退出前的回调函数
+
+        Args:
+            broker: 消息代理
+            worker: 工作进程
+        """
+        flush_subtask_write_buffer()
+        logger.info(f"数据库连接池统计: {get_pool_stats()}")
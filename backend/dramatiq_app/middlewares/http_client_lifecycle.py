@@ -0,0 +1,43 @@
+"""
+共享HTTP客户端生命周期中间件
+
+工作线程退出时关闭该线程事件循环上的共享HTTP客户端，并记录连接复用统计
+"""
+import asyncio
+import logging
+from dramatiq import Middleware
+
+from backend.utils.http_client import close_http_client_for_loop, get_http_client_stats
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+class HttpClientLifecycle(Middleware):
+    """
+    共享HTTP客户端生命周期中间件
+    """
+
+    def before_worker_thread_shutdown(self, broker, thread):
+        """
+        工作线程退出前的回调函数（在该工作线程中执行）
+
+        Args:
+            broker: 消息代理
+            thread: 工作线程
+        """
+        try:
+            loop = asyncio.get_event_loop()
+        except RuntimeError:
+            return
+        close_http_client_for_loop(loop)
+
+    def before_worker_shutdown(self, broker, worker):
+        """
+        工作进程退出前的回调函数
+
+        Args:
+            broker: 消息代理
+            worker: 工作进程
+        """
+        logger.info(f"共享HTTP客户端连接复用统计: {get_http_client_stats()}")
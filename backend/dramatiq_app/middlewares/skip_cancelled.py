@@ -0,0 +1,58 @@
+"""
+跳过已取消任务中间件
+
+在工作进程处理消息前检查消息所属任务的墓碑标记，已取消任务的子任务消息直接跳过（确认但不执行）
+"""
+import logging
+from dramatiq import Middleware
+from dramatiq.middleware import SkipMessage
+
+from backend.services.task_tombstones import is_task_cancelled
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 需要检查墓碑的子任务Actor
+SUBTASK_ACTORS = {
+    "test_run_subtask",
+    "test_run_lumina_subtask",
+    "test_run_subtask_cell",
+    "test_run_lumina_subtask_cell",
+}
+
+
+class SkipCancelledTasks(Middleware):
+    """
+    跳过已取消任务中间件
+
+    任务ID取自消息选项 task_id（发送子任务时写入），惰性物化单元格消息则取自参数 task_id
+    """
+
+    def before_process_message(self, broker, message):
+        """
+        消息处理前的回调函数
+
+        Args:
+            broker: 消息代理
+            message: 消息对象
+
+        Raises:
+            SkipMessage: 消息所属任务已取消
+        """
+        if message.actor_name not in SUBTASK_ACTORS:
+            return
+
+        task_id = message.options.get("task_id") or message.kwargs.get("task_id")
+        if not task_id:
+            return
+
+        try:
+            cancelled = is_task_cancelled(task_id)
+        except Exception as e:
+            # 检查失败时照常执行，由子任务自身的状态检查兜底
+            logger.warning(f"[{task_id}] 检查任务墓碑失败: {str(e)}")
+            return
+
+        if cancelled:
+            logger.info(f"[{task_id}] 任务已取消，跳过消息: {message.actor_name} {message.kwargs}")
+            raise SkipMessage(f"任务 {task_id} 已取消")
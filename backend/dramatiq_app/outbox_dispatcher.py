@@ -0,0 +1,75 @@
+"""
+发件箱分发服务
+
+启用事务发件箱（OUTBOX_ENABLED）后，任务状态变化和子任务结束事件与状态更新在同一个事务中
+写入 nietest_outbox_events。本服务批量领取这些事件，发送飞书通知、重算子任务统计并检查任务是否完成
+（backend.services.outbox）。
+
+可以同时运行多个实例：事件用 FOR UPDATE SKIP LOCKED 领取，同一事件不会被两个实例同时处理。
+
+用法:
+    python -m backend.dramatiq_app.outbox_dispatcher --batch-size 200
+"""
+import argparse
+import logging
+import signal
+
+from backend.core.config import settings
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+def serve(batch_size: int) -> None:
+    """
+    启动发件箱分发服务并运行到收到退出信号
+
+    Args:
+        batch_size: 每批领取的事件数量
+    """
+    # 导入broker（broker_setup会在导入时初始化数据库连接）
+    from backend.dramatiq_app.workers import broker_setup  # noqa: F401
+    from backend.services.outbox import OutboxDispatcher
+    from backend.utils.feishu import get_feishu_dispatcher
+
+    stopping = {"value": False}
+
+    def handle_signal(signum, frame):
+        logger.info("收到退出信号，正在停止发件箱分发服务...")
+        stopping["value"] = True
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, handle_signal)
+
+    if not settings.OUTBOX_ENABLED:
+        logger.warning("OUTBOX_ENABLED 未启用，本服务只处理已写入的事件")
+
+    try:
+        OutboxDispatcher(batch_size).run(lambda: stopping["value"])
+    finally:
+        # 发送队列中剩余的飞书通知
+        get_feishu_dispatcher().close()
+
+
+def main():
+    """主函数"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format="[%(asctime)s] [PID %(process)d] [%(threadName)s] [%(name)s] [%(levelname)s] %(message)s",
+        handlers=[logging.StreamHandler()],
+    )
+
+    parser = argparse.ArgumentParser(description="启动发件箱分发服务")
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=settings.OUTBOX_BATCH_SIZE,
+        help="每批领取的事件数量",
+    )
+    args = parser.parse_args()
+
+    serve(args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+"""
+结果轮询服务
+
+两阶段模式（TWO_PHASE_POLLING_ENABLED）下，子任务Actor提交图像生成请求后立即返回，
+上游任务登记在轮询登记表中（backend.services.poll_registry）。本服务在单个事件循环中
+按各上游任务的轮询间隔并发查询状态，得到结果后完成子任务：更新状态、发送通知、
+释放公平调度额度和自适应并发槽位，需要重试时重新发送子任务消息。
+
+可以同时运行多个实例：到期的上游任务由Redis原子领取，领取后的一段时间内其他实例不会重复轮询。
+
+用法:
+    python -m backend.dramatiq_app.result_poller --concurrency 200
+"""
+import argparse
+import asyncio
+import logging
+import signal
+import time
+import typing
+
+from backend.core.config import settings
+from backend.utils.concurrency_controller import (
+    get_concurrency_controller, OUTCOME_SUCCESS, OUTCOME_TIMEOUT, OUTCOME_FAILURE, OUTCOME_CENSORED
+)
+from backend.services.poll_registry import get_poll_registry
+from backend.services.task_tombstones import is_task_cancelled
+from backend.utils.polling_schedule import get_polling_schedule
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+class ResultPoller:
+    """
+    上游任务结果轮询服务
+    """
+
+    def __init__(self, concurrency: int, batch_size: int) -> None:
+        """
+        初始化轮询服务
+
+        Args:
+            concurrency: 同时进行中的状态查询数量上限
+            batch_size: 每次从登记表领取的最大数量
+        """
+        from backend.dramatiq_app.actors import test_run_subtask
+
+        self.subtasks = test_run_subtask
+        self.client = test_run_subtask.get_image_client()
+        self.registry = get_poll_registry()
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.running = False
+        self.in_flight: typing.Set[asyncio.Task] = set()
+        self.stats = {"polls": 0, "completed": 0, "failed": 0, "cancelled": 0, "retried": 0}
+
+    async def run(self) -> None:
+        """领取到期的上游任务并发查询，直到停止"""
+        self.running = True
+        logger.info(f"结果轮询服务已启动，并发上限: {self.concurrency}，每批领取: {self.batch_size}")
+        last_report = time.monotonic()
+        while self.running:
+            free = self.concurrency - len(self.in_flight)
+            jobs = []
+            if free > 0:
+                try:
+                    jobs = await asyncio.to_thread(self.registry.claim_due, min(free, self.batch_size))
+                except Exception as e:
+                    logger.error(f"领取待轮询的上游任务失败: {str(e)}")
+
+            for job in jobs:
+                task = asyncio.create_task(self._poll_job(job))
+                self.in_flight.add(task)
+                task.add_done_callback(self.in_flight.discard)
+
+            if time.monotonic() - last_report >= 60:
+                logger.info(f"结果轮询统计: 进行中={len(self.in_flight)}, {self.stats}")
+                last_report = time.monotonic()
+
+            if len(jobs) < self.batch_size or free <= 0:
+                await asyncio.sleep(settings.RESULT_POLLER_IDLE_INTERVAL)
+
+    async def stop(self, timeout: float = 60) -> None:
+        """
+        停止领取新任务并等待进行中的查询完成（未完成的上游任务会在领取租约到期后被重新领取）
+
+        Args:
+            timeout: 等待时间（秒）
+        """
+        self.running = False
+        if self.in_flight:
+            await asyncio.wait(set(self.in_flight), timeout=timeout)
+
+        from backend.utils.http_client import aclose_http_client
+        from backend.services.subtask_write_buffer import flush_subtask_write_buffer
+        await aclose_http_client()
+        await asyncio.to_thread(flush_subtask_write_buffer)
+        logger.info(f"结果轮询服务已停止: {self.stats}")
+
+    async def _poll_job(self, job: typing.Dict[str, typing.Any]) -> None:
+        """
+        查询一次上游任务状态并处理结果
+
+        Args:
+            job: 上游任务信息
+        """
+        task_uuid = job["task_uuid"]
+        try:
+            if await asyncio.to_thread(is_task_cancelled, job["task_id"]):
+                await self.subtasks.run_in_thread(self._finish_cancelled, job)
+                return
+
+            job["attempts"] += 1
+            self.stats["polls"] += 1
+
+            # 登记了轮询计划的上游任务按总等待时间判断是否超时，否则按轮询次数
+            plan = None
+            elapsed = time.time() - job["submitted_at"]
+            if job.get("poll_plan"):
+                plan = get_polling_schedule().restore(job["poll_plan"])
+                exhausted = elapsed >= plan.budget
+            else:
+                exhausted = job["attempts"] >= job["max_attempts"]
+
+            try:
+                result = await self.client.fetch_task_status(job["status_url"])
+            except Exception as e:
+                if exhausted:
+                    logger.error(f"轮询任务状态失败，已达到最大轮询次数: {job['max_attempts']}")
+                    error = self.subtasks.MaxRetriesException(f"达到最大轮询次数 {job['max_attempts']}")
+                    await self.subtasks.run_in_thread(self._finish_failed, job, error, OUTCOME_TIMEOUT)
+                else:
+                    logger.warning(f"轮询任务状态失败: {str(e)}, 将稍后重试")
+                    await asyncio.to_thread(self._reschedule, job, plan, elapsed)
+                return
+
+            try:
+                done = self.client.check_task_result(task_uuid, result, job["attempts"], job["max_attempts"])
+            except self.subtasks.ContentCensoredException as e:
+                await self.subtasks.run_in_thread(self._finish_failed, job, e, OUTCOME_CENSORED)
+                return
+            except self.subtasks.RetryableException as e:
+                await self.subtasks.run_in_thread(self._finish_failed, job, e, OUTCOME_TIMEOUT)
+                return
+            except Exception as e:
+                await self.subtasks.run_in_thread(self._finish_failed, job, e, OUTCOME_FAILURE)
+                return
+
+            if done:
+                # 上游在上一次未完成的轮询和本次轮询之间完成，取中点作为并发控制的完成耗时
+                job["completed_elapsed"] = (job.get("last_poll_elapsed", 0.0) + elapsed) / 2
+                if plan is not None:
+                    await asyncio.to_thread(get_polling_schedule().record, plan, elapsed, job["attempts"])
+                image_url = await self.client.extract_image_url(result)
+                if image_url:
+                    await self.subtasks.run_in_thread(self._finish_completed, job, image_url)
+                else:
+                    await self.subtasks.run_in_thread(self._finish_failed, job,
+                                                      Exception("无法从结果中提取图像URL"), OUTCOME_FAILURE)
+            elif exhausted:
+                error = self.subtasks.MaxRetriesException(f"达到最大轮询次数 {job['max_attempts']}")
+                await self.subtasks.run_in_thread(self._finish_failed, job, error, OUTCOME_TIMEOUT)
+            else:
+                job["last_poll_elapsed"] = elapsed
+                await asyncio.to_thread(self._reschedule, job, plan, elapsed)
+        except Exception as e:
+            # 处理失败时不移出登记表，领取租约到期后会被重新领取
+            logger.error(f"处理上游任务 {task_uuid} 失败: {str(e)}", exc_info=True)
+
+    def _reschedule(self, job: typing.Dict[str, typing.Any], plan, elapsed: float) -> None:
+        """
+        安排上游任务的下次轮询：有轮询计划时按计划，否则按固定间隔
+
+        Args:
+            job: 上游任务信息
+            plan: 轮询计划，没有时为None
+            elapsed: 从提交到本次轮询的时间（秒）
+        """
+        delay = job["interval"]
+        if plan is not None:
+            delay = plan.next_delay(elapsed)
+            job["poll_plan"] = plan.to_dict()
+        self.registry.reschedule(job, delay)
+
+    def _load_subtask(self, job: typing.Dict[str, typing.Any]):
+        """
+        加载上游任务对应的子任务（惰性物化单元格重新物化）
+
+        Args:
+            job: 上游任务信息
+
+        Returns:
+            子任务对象，不存在时返回None
+        """
+        from backend.core.app import initialize_app
+        from backend.models.db.subtasks import Subtask
+        from backend.models.db.tasks import Task
+        from backend.services.subtask_plan import get_task_plan, build_cell_subtask
+
+        initialize_app()
+        if job["kind"] == "cell":
+            task_obj = Task.get_or_none(Task.id == job["task_id"])
+            if not task_obj:
+                return None
+            subtask = build_cell_subtask(task_obj, get_task_plan(task_obj), job["ordinal"])
+            subtask.error_retry_count = job["retry_count"]
+            return subtask
+        return Subtask.get_or_none(Subtask.id == job["subtask_id"])
+
+    def _release(self, job: typing.Dict[str, typing.Any], outcome: str) -> None:
+        """
+        上游任务结束：移出登记表，释放公平调度额度和自适应并发槽位
+
+        Args:
+            job: 上游任务信息
+            outcome: 并发控制结果类型
+        """
+        self.registry.finish(job["task_uuid"])
+
+        member = job["subtask_id"] if job["kind"] == "subtask" else str(job["ordinal"])
+        self.subtasks.release_fair_slot(job["task_id"], member)
+
+        if job.get("concurrency_lease"):
+            # 成功时只反馈提交耗时和上游完成耗时，不包含轮询间隔和登记表调度造成的等待
+            if job.get("completed_elapsed") is not None:
+                total_ms = job["submit_ms"] + job["completed_elapsed"] * 1000
+            else:
+                total_ms = (time.time() - job["acquired_at"]) * 1000
+            try:
+                get_concurrency_controller().release(job["concurrency_bucket"], job["concurrency_lease"],
+                                                     outcome, job["submit_ms"], total_ms)
+            except Exception as e:
+                logger.warning(f"释放并发槽位失败: {str(e)}")
+
+    def _finish_completed(self, job: typing.Dict[str, typing.Any], image_url: str) -> None:
+        """
+        上游任务成功：完成子任务
+
+        Args:
+            job: 上游任务信息
+            image_url: 图像URL
+        """
+        subtask = self._load_subtask(job)
+        if subtask is not None:
+            logger.info(f"图像生成成功: 任务ID={job['task_id']}, 上游任务={job['task_uuid']}, 图像URL={image_url}")
+            if job["kind"] == "cell":
+                self.subtasks.record_cell_subtask(subtask, self.subtasks.SubtaskStatus.COMPLETED.value,
+                                                  result=image_url)
+            else:
+                self.subtasks.complete_subtask(subtask, image_url, job["seed"])
+        self._release(job, OUTCOME_SUCCESS)
+        self.stats["completed"] += 1
+
+    def _finish_failed(self, job: typing.Dict[str, typing.Any], error: Exception, outcome: str) -> None:
+        """
+        上游任务失败：标记子任务失败，非内容审核错误在重试次数内重新发送子任务消息
+
+        Args:
+            job: 上游任务信息
+            error: 失败原因
+            outcome: 并发控制结果类型
+        """
+        error_msg = f"图像生成失败: {str(error)}"
+        logger.error(f"任务 {job['task_id']} 上游任务 {job['task_uuid']} {error_msg}")
+
+        is_censored = self.subtasks.is_censored_error(error)
+        subtask = self._load_subtask(job)
+        if subtask is not None:
+            if job["kind"] == "cell":
+                self.subtasks.record_cell_subtask(subtask, self.subtasks.SubtaskStatus.FAILED.value,
+                                                  error=error_msg)
+            else:
+                is_censored = self.subtasks.fail_subtask(subtask, error_msg, error)
+        self._release(job, outcome)
+        self.stats["failed"] += 1
+
+        if subtask is not None and not is_censored:
+            self._retry(job)
+
+    def _finish_cancelled(self, job: typing.Dict[str, typing.Any]) -> None:
+        """
+        所属任务已取消：放弃轮询（惰性物化单元格不写入记录）
+
+        Args:
+            job: 上游任务信息
+        """
+        logger.info(f"任务 {job['task_id']} 已取消，停止轮询上游任务 {job['task_uuid']}")
+        if job["kind"] == "subtask":
+            self.subtasks.update_subtask_status(
+                subtask_id=job["subtask_id"],
+                status=self.subtasks.SubtaskStatus.CANCELLED.value,
+                error="父任务已取消",
+                task_id=job["task_id"]
+            )
+        self._release(job, OUTCOME_CENSORED)
+        self.stats["cancelled"] += 1
+
+    def _retry(self, job: typing.Dict[str, typing.Any]) -> None:
+        """
+        按Actor的重试次数上限重新发送子任务消息（与Dramatiq Retries中间件相同的指数退避）
+
+        Args:
+            job: 上游任务信息
+        """
+        import dramatiq
+
+        actor = dramatiq.get_broker().get_actor(job["actor"])
+        retries = job["retry_count"]
+        if retries >= (actor.options.get("max_retries") or 0):
+            return
+
+        if job["kind"] == "cell":
+            kwargs = {"task_id": job["task_id"], "ordinal": job["ordinal"]}
+        else:
+            kwargs = {"subtask_id": job["subtask_id"]}
+        delay = min(1000 * 2 ** retries, 900000)
+        actor.send_with_options(kwargs=kwargs, delay=delay, retries=retries + 1, task_id=job["task_id"])
+        logger.info(f"任务 {job['task_id']} 上游任务 {job['task_uuid']} 失败，{delay}毫秒后重试第{retries + 1}次")
+        self.stats["retried"] += 1
+
+
+async def serve(concurrency: int, batch_size: int) -> None:
+    """
+    启动结果轮询服务并运行到收到退出信号
+
+    Args:
+        concurrency: 同时进行中的状态查询数量上限
+        batch_size: 每次从登记表领取的最大数量
+    """
+    # 导入broker（重试时发送子任务消息，broker_setup会在导入时初始化数据库连接）
+    from backend.dramatiq_app.workers import broker_setup  # noqa: F401
+
+    poller = ResultPoller(concurrency, batch_size)
+
+    loop = asyncio.get_running_loop()
+    stop_event = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    run_task = asyncio.create_task(poller.run())
+    await stop_event.wait()
+    logger.info("收到退出信号，正在停止结果轮询服务...")
+    await poller.stop()
+    await run_task
+
+
+def main():
+    """主函数"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format="[%(asctime)s] [PID %(process)d] [%(threadName)s] [%(name)s] [%(levelname)s] %(message)s",
+        handlers=[logging.StreamHandler()],
+    )
+
+    parser = argparse.ArgumentParser(description="启动上游任务结果轮询服务")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=settings.RESULT_POLLER_CONCURRENCY,
+        help="同时进行中的状态查询数量上限",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=settings.RESULT_POLLER_BATCH_SIZE,
+        help="每次从登记表领取的最大数量",
+    )
+    args = parser.parse_args()
+
+    asyncio.run(serve(args.concurrency, args.batch_size))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+任务协调服务
+
+原来每个任务开始执行后都由一个监控线程每10秒检查一次进度，直到任务结束，可能持续数小时；
+工作进程重启后监控随之丢失。启用 TASK_RECONCILER_ENABLED 后，主任务Actor发送完子任务就返回，
+由本服务统一处理所有执行中的任务，每轮：
+1. 读取数据库中所有执行中的任务和登记跟踪的任务（backend.services.active_tasks）
+2. 批量获取这些任务的子任务状态计数（启用进度计数时一次读取Redis，否则一条按任务和状态分组的查询）
+3. 更新任务进度和子任务统计，全部处理完成的任务更新为完成或失败并发送通知
+4. 清理已取消的任务，释放已结束任务的准入容量并移出跟踪
+5. 启用准入控制时，为丢失准入记录的等待中任务重新申请准入
+
+可以同时运行多个实例，通过Redis租约选出一个领导者执行协调，领导者退出或崩溃后由其他实例接替。
+
+用法:
+    python -m backend.dramatiq_app.task_reconciler --interval 10
+"""
+import argparse
+import logging
+import signal
+import time
+import typing
+
+from backend.core.config import settings
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+def leader_lease_key() -> str:
+    """返回协调服务领导者租约的Redis键"""
+    return f"{settings.TASK_RECONCILER_KEY_PREFIX}:leader"
+
+
+class TaskReconciler:
+    """
+    全局任务协调循环
+    """
+
+    def __init__(self, interval: float) -> None:
+        """
+        初始化协调服务
+
+        Args:
+            interval: 两轮协调之间的间隔（秒）
+        """
+        from backend.dramatiq_app.actors import test_submit_master
+        from backend.utils.leader_election import LeaderLease
+
+        self.master = test_submit_master
+        self.interval = interval
+        self.lease = LeaderLease(leader_lease_key(), settings.TASK_RECONCILER_LEASE_TTL)
+        self.stats = {"cycles": 0, "completed": 0, "cancelled": 0, "finished": 0, "recovered": 0, "errors": 0}
+
+    def reconcile(self) -> int:
+        """
+        执行一轮协调
+
+        Returns:
+            本轮检查的执行中任务数量
+        """
+        from backend.models.db.tasks import Task, TaskStatus
+        from backend.services.active_tasks import get_tracked_tasks, track_task, untrack_task
+        from backend.services.task_progress import get_tasks_progress, refresh_stale_progress
+        from backend.services.task_service import check_and_update_task_completion
+
+        tracked = get_tracked_tasks()
+        condition = Task.status == TaskStatus.PROCESSING.value
+        if tracked:
+            condition = condition | Task.id.in_(list(tracked))
+
+        # 只读取进度相关的列，不读取提示词和变量等大字段
+        tasks = list(Task.select(
+            Task.id, Task.status, Task.total_images, Task.processed_images, Task.progress,
+            Task.completed_subtasks, Task.failed_subtasks,
+        ).where(condition))
+
+        processing = []
+        seen = set()
+        for task in tasks:
+            task_id = str(task.id)
+            seen.add(task_id)
+            if task.status == TaskStatus.PROCESSING.value:
+                if task_id not in tracked:
+                    # 启用前开始或登记失败的任务：登记后才能在取消时被清理
+                    track_task(task_id)
+                if task.total_images > 0:
+                    processing.append(task)
+            elif task.status == TaskStatus.CANCELLED.value:
+                logger.info(f"任务 {task_id} 已被取消，开始清理")
+                self.master.cleanup_cancelled_task(task_id)
+                self._finish(task_id)
+                self.stats["cancelled"] += 1
+            elif task.status in (TaskStatus.COMPLETED.value, TaskStatus.FAILED.value):
+                # 已由发件箱分发服务或其他途径结束
+                self._finish(task_id)
+
+        # 已删除的任务
+        for task_id in tracked - seen:
+            untrack_task(task_id)
+
+        progress_by_task = get_tasks_progress([str(task.id) for task in processing])
+        for task in processing:
+            task_id = str(task.id)
+            try:
+                progress = refresh_stale_progress(task_id, progress_by_task[task_id], task.total_images)
+                if not self.master.apply_task_progress(task, progress):
+                    continue
+                logger.info(f"任务 {task_id} 的所有子任务都已处理完成，检查最终状态")
+                if check_and_update_task_completion(task_id):
+                    self._finish(task_id)
+                    self.stats["completed"] += 1
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"协调任务 {task_id} 时出错: {str(e)}")
+
+        if settings.ADMISSION_CONTROL_ENABLED:
+            try:
+                self.stats["recovered"] += self.recover_admission()
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"恢复等待中任务的准入记录时出错: {str(e)}")
+        return len(processing)
+
+    def recover_admission(self) -> int:
+        """
+        为丢失准入记录的等待中任务重新申请准入
+
+        准入后发送继续执行的消息失败，或继续执行的Actor在开始执行前失败时，
+        任务的准入心跳过期后被移出准入控制，没有其他途径再开始执行
+
+        Returns:
+            重新申请准入的任务数量
+        """
+        from datetime import datetime, timedelta
+        from backend.models.db.tasks import Task, TaskStatus
+        from backend.services.admission_controller import get_admission_controller
+
+        # 主任务Actor在保存任务之后才申请准入，刚提交的任务留出宽限时间
+        cutoff = datetime.now() - timedelta(seconds=settings.ADMISSION_RECOVERY_GRACE)
+        pending_ids = [str(task.id) for task in Task.select(Task.id).where(
+            (Task.status == TaskStatus.PENDING.value) & (Task.updated_at < cutoff)
+        )]
+
+        controller = get_admission_controller()
+        recovered = 0
+        for task_id in controller.find_untracked(pending_ids):
+            task_obj = Task.get_or_none(Task.id == task_id)
+            if not task_obj or task_obj.status != TaskStatus.PENDING.value:
+                continue
+            logger.warning(f"等待中的任务 {task_id} 不在准入队列中，重新申请准入")
+            controller.recover(task_obj)
+            recovered += 1
+        return recovered
+
+    def _finish(self, task_id: str) -> None:
+        """任务结束：释放准入容量并移出跟踪"""
+        from backend.services.active_tasks import untrack_task
+
+        self.master.release_admission(task_id)
+        untrack_task(task_id)
+        self.stats["finished"] += 1
+
+    def run(self, should_stop: typing.Callable[[], bool]) -> None:
+        """
+        持有租约时按间隔执行协调，直到 should_stop 返回True
+
+        Args:
+            should_stop: 是否停止
+        """
+        logger.info(f"任务协调服务已启动，间隔: {self.interval}秒，实例: {self.lease.identity}")
+        last_report = time.monotonic()
+        try:
+            while not should_stop():
+                started = time.monotonic()
+                if self.lease.acquire():
+                    try:
+                        count = self.reconcile()
+                        self.stats["cycles"] += 1
+                        logger.debug(f"协调完成，执行中任务: {count}，耗时: {time.monotonic() - started:.3f}秒")
+                    except Exception as e:
+                        self.stats["errors"] += 1
+                        logger.error(f"任务协调出错: {str(e)}")
+
+                if started - last_report >= 600:
+                    logger.info(f"任务协调统计: 领导者={self.lease.is_leader}, {self.stats}")
+                    last_report = started
+
+                # 分段等待，以便及时响应退出信号
+                while not should_stop() and time.monotonic() - started < self.interval:
+                    time.sleep(min(0.5, self.interval))
+        finally:
+            self.lease.release()
+            logger.info(f"任务协调服务已停止: {self.stats}")
+
+
+def serve(interval: float) -> None:
+    """
+    启动任务协调服务并运行到收到退出信号
+
+    Args:
+        interval: 两轮协调之间的间隔（秒）
+    """
+    # 未启用时执行中的任务由各自的监控线程结束，本服务同时处理会与监控线程重复结束任务
+    if not settings.TASK_RECONCILER_ENABLED:
+        logger.error("TASK_RECONCILER_ENABLED 未启用，任务由监控线程跟踪，任务协调服务不启动")
+        return
+
+    # 导入broker（broker_setup会在导入时初始化数据库连接）
+    from backend.dramatiq_app.workers import broker_setup  # noqa: F401
+    from backend.utils.feishu import get_feishu_dispatcher
+
+    stopping = {"value": False}
+
+    def handle_signal(signum, frame):
+        logger.info("收到退出信号，正在停止任务协调服务...")
+        stopping["value"] = True
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, handle_signal)
+
+    try:
+        TaskReconciler(interval).run(lambda: stopping["value"])
+    finally:
+        # 发送队列中剩余的飞书通知
+        get_feishu_dispatcher().close()
+
+
+def main():
+    """主函数"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format="[%(asctime)s] [PID %(process)d] [%(threadName)s] [%(name)s] [%(levelname)s] %(message)s",
+        handlers=[logging.StreamHandler()],
+    )
+
+    parser = argparse.ArgumentParser(description="启动任务协调服务")
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=settings.TASK_RECONCILER_INTERVAL,
+        help="两轮协调之间的间隔（秒）",
+    )
+    args = parser.parse_args()
+
+    serve(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,9 @@ from dramatiq.middleware import CurrentMessage, Retries, TimeLimit
 from backend.core.config import settings
 from backend.dramatiq_app.middlewares.task_tracker import TaskTracker
 from backend.dramatiq_app.middlewares.catch_exceptions import CatchExceptions
+from backend.dramatiq_app.middlewares.skip_cancelled import SkipCancelledTasks
+from backend.dramatiq_app.middlewares.http_client_lifecycle import HttpClientLifecycle
+from backend.dramatiq_app.middlewares.database_lifecycle import DatabaseLifecycle
 from backend.models.db.dramatiq_base import DramatiqBaseModel
 
 # 配置日志
@@ -20,7 +23,10 @@ middlewares = [
     CurrentMessage(),
     Retries(min_backoff=1000, max_backoff=900000, max_retries=5),
     TimeLimit(time_limit=3600000),  # 默认时间限制为1小时
+    SkipCancelledTasks(),  # 跳过已取消任务的子任务消息
     TaskTracker(),
+    HttpClientLifecycle(),  # 工作线程退出时关闭共享HTTP客户端
+    DatabaseLifecycle(),  # 进程内共用一个数据库连接池，消息处理完后归还连接
     CatchExceptions()
 ]
 
@@ -0,0 +1,5 @@
+"""
+本地压测工具
+
+fake_upstream 模拟上游图像生成API，driver 通过 POST /task 提交任务并统计端到端吞吐和延迟
+"""
@@ -0,0 +1,340 @@
+"""
+端到端压测脚本
+
+通过 POST /api/v1/test/task 提交一批任务，轮询任务进度直到全部结束，然后读取子任务完成时间，输出：
+- 端到端吞吐（完成的单元格数 / 从第一次提交到最后一个单元格完成的时间）
+- 单元格延迟P50/P90/P99（从提交任务到单元格完成，压测脚本与服务在同一台机器上运行时才准确）
+- 上游请求计数（来自 backend.loadtest.fake_upstream 的 /_stats，开始前会清空统计）
+
+运行前启动模拟上游、API服务和工作进程，工作进程的 IMAGE_API_BASE_URL / LUMINA_IMAGE_API_BASE_URL 指向模拟上游。
+
+用法:
+    python -m backend.loadtest.driver --username admin --password admin --tasks 20 --cells 100 --concurrency 5
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+import typing
+from datetime import datetime
+
+import httpx
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 任务结束状态
+FINAL_STATUSES = {"completed", "failed", "cancelled"}
+
+
+def build_task_payload(name: str, cells: int, is_lumina: bool, priority: int, lazy: bool) -> typing.Dict[str, typing.Any]:
+    """
+    构建压测任务：一个包含 cells 个取值的提示词变量
+
+    Args:
+        name: 任务名称
+        cells: 单元格数量
+        is_lumina: 是否使用Lumina端点
+        priority: 任务优先级
+        lazy: 是否惰性物化子任务
+
+    Returns:
+        POST /task 的请求体
+    """
+    def constant(param_type: str, value: typing.Any, value_format: str) -> typing.Dict[str, typing.Any]:
+        return {"type": param_type, "value": value, "is_variable": False, "format": value_format}
+
+    return {
+        "name": name,
+        "priority": priority,
+        "lazy_materialization": lazy,
+        "prompts": [
+            {"type": "freetext", "value": "1girl, loadtest", "weight": 1.0, "is_variable": False},
+            {
+                "type": "freetext",
+                "is_variable": True,
+                "variable_id": "loadtest",
+                "variable_name": "压测变量",
+                "variable_values": [
+                    {"type": "freetext", "value": f"loadtest variant {index}", "weight": 1.0}
+                    for index in range(cells)
+                ],
+            },
+        ],
+        "ratio": constant("ratio", "1:1", "string"),
+        "seed": constant("seed", 1, "int"),
+        "use_polish": constant("use_polish", False, "bool"),
+        "is_lumina": constant("is_lumina", is_lumina, "bool"),
+        "lumina_model_name": constant("lumina_model_name", None, "string"),
+        "lumina_cfg": constant("lumina_cfg", 5.5, "float"),
+        "lumina_step": constant("lumina_step", 30, "int"),
+    }
+
+
+def percentile(values: typing.List[float], q: float) -> typing.Optional[float]:
+    """
+    计算分位数（最近秩）
+
+    Args:
+        values: 数值列表
+        q: 分位数，0到1之间
+
+    Returns:
+        分位数，列表为空时返回None
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))
+    return ordered[index]
+
+
+class LoadTestDriver:
+    """
+    压测驱动：提交任务、等待完成并汇总结果
+    """
+
+    def __init__(self, api_url: str, upstream_url: typing.Optional[str], concurrency: int,
+                 poll_interval: float, task_timeout: float) -> None:
+        """
+        初始化压测驱动
+
+        Args:
+            api_url: API地址，如 http://127.0.0.1:8000/api/v1
+            upstream_url: 模拟上游地址，为空时不统计上游请求
+            concurrency: 同时进行中的任务数量
+            poll_interval: 任务进度轮询间隔（秒）
+            task_timeout: 单个任务的最长等待时间（秒）
+        """
+        self.api_url = api_url.rstrip("/")
+        self.upstream_url = upstream_url.rstrip("/") if upstream_url else None
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.task_timeout = task_timeout
+        self.client = httpx.AsyncClient(timeout=60.0)
+        self.headers: typing.Dict[str, str] = {}
+
+    async def login(self, username: str, password: str) -> None:
+        """
+        登录并保存访问令牌
+
+        Args:
+            username: 用户名
+            password: 密码
+        """
+        response = await self.client.post(f"{self.api_url}/auth/token",
+                                          data={"username": username, "password": password})
+        response.raise_for_status()
+        token = response.json()["data"]["access_token"]
+        self.headers = {"Authorization": f"Bearer {token}"}
+
+    async def upstream_stats(self, reset: bool = False) -> typing.Optional[typing.Dict[str, typing.Any]]:
+        """
+        读取（或清空）模拟上游的统计
+
+        Args:
+            reset: 是否清空统计
+
+        Returns:
+            模拟上游统计，未配置或读取失败时返回None
+        """
+        if not self.upstream_url:
+            return None
+        try:
+            if reset:
+                response = await self.client.post(f"{self.upstream_url}/_stats/reset")
+            else:
+                response = await self.client.get(f"{self.upstream_url}/_stats")
+            response.raise_for_status()
+            return response.json()
+        except Exception as e:
+            logger.warning(f"读取模拟上游统计失败: {str(e)}")
+            return None
+
+    async def run_task(self, payload: typing.Dict[str, typing.Any]) -> typing.Dict[str, typing.Any]:
+        """
+        提交一个任务并等待结束
+
+        Args:
+            payload: 任务请求体
+
+        Returns:
+            任务ID、提交时间、结束状态和各单元格的延迟
+        """
+        submitted_at = time.time()
+        response = await self.client.post(f"{self.api_url}/test/task", json=payload, headers=self.headers)
+        response.raise_for_status()
+        task_id = response.json()["data"]["task_id"]
+
+        status = "unknown"
+        deadline = submitted_at + self.task_timeout
+        while time.time() < deadline:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                progress = await self.client.get(f"{self.api_url}/test/task/{task_id}/progress")
+            except httpx.HTTPError as e:
+                logger.warning(f"查询任务进度失败: {task_id}, {str(e)}")
+                continue
+            # 主任务Actor创建任务之前查询会返回404
+            if progress.status_code != 200:
+                continue
+            status = progress.json()["data"]["status"]
+            if status in FINAL_STATUSES:
+                break
+        else:
+            logger.warning(f"任务 {task_id} 在 {self.task_timeout} 秒内没有结束，最后状态: {status}")
+
+        detail = await self.client.get(f"{self.api_url}/test/task/{task_id}", params={"include_subtasks": "true"})
+        subtasks = []
+        if detail.status_code == 200:
+            subtasks = detail.json()["data"].get("subtasks") or []
+
+        latencies = []
+        outcomes: typing.Dict[str, int] = {}
+        for subtask in subtasks:
+            outcomes[subtask["status"]] = outcomes.get(subtask["status"], 0) + 1
+            if subtask["status"] == "completed" and subtask.get("completed_at"):
+                completed_at = datetime.fromisoformat(subtask["completed_at"]).timestamp()
+                latencies.append(completed_at - submitted_at)
+
+        return {
+            "task_id": task_id,
+            "status": status,
+            "submitted_at": submitted_at,
+            "finished_at": time.time(),
+            "latencies": latencies,
+            "outcomes": outcomes,
+        }
+
+    async def run(self, payloads: typing.List[typing.Dict[str, typing.Any]],
+                  submit_interval: float) -> typing.Dict[str, typing.Any]:
+        """
+        按并发数提交全部任务并汇总
+
+        Args:
+            payloads: 任务请求体列表
+            submit_interval: 两次提交之间的最短间隔（秒）
+
+        Returns:
+            压测报告
+        """
+        await self.upstream_stats(reset=True)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def limited(index: int, payload: typing.Dict[str, typing.Any]):
+            await asyncio.sleep(index * submit_interval)
+            async with semaphore:
+                try:
+                    return await self.run_task(payload)
+                except Exception as e:
+                    logger.error(f"任务 {payload['name']} 执行失败: {str(e)}")
+                    return None
+
+        started_at = time.time()
+        results = [result for result in await asyncio.gather(
+            *(limited(index, payload) for index, payload in enumerate(payloads))
+        ) if result]
+        elapsed = time.time() - started_at
+        upstream = await self.upstream_stats()
+        await self.client.aclose()
+        return build_report(results, elapsed, upstream)
+
+
+def build_report(results: typing.List[typing.Dict[str, typing.Any]], elapsed: float,
+                 upstream: typing.Optional[typing.Dict[str, typing.Any]]) -> typing.Dict[str, typing.Any]:
+    """
+    汇总压测结果
+
+    Args:
+        results: 各任务的结果
+        elapsed: 压测总耗时（秒）
+        upstream: 模拟上游统计
+
+    Returns:
+        压测报告
+    """
+    latencies = [latency for result in results for latency in result["latencies"]]
+    outcomes: typing.Dict[str, int] = {}
+    task_statuses: typing.Dict[str, int] = {}
+    for result in results:
+        task_statuses[result["status"]] = task_statuses.get(result["status"], 0) + 1
+        for status, count in result["outcomes"].items():
+            outcomes[status] = outcomes.get(status, 0) + count
+
+    # 吞吐按第一次提交到最后一个单元格完成计算，不包含结束后等待轮询的时间
+    if latencies:
+        first_submit = min(result["submitted_at"] for result in results)
+        last_done = max(result["submitted_at"] + max(result["latencies"]) for result in results if result["latencies"])
+        window = max(last_done - first_submit, 1e-6)
+    else:
+        window = elapsed
+
+    def rounded(value: typing.Optional[float]) -> typing.Optional[float]:
+        return round(value, 3) if value is not None else None
+
+    report: typing.Dict[str, typing.Any] = {
+        "tasks": len(results),
+        "task_statuses": task_statuses,
+        "cells": outcomes,
+        "elapsed": round(elapsed, 3),
+        "throughput_cells_per_sec": round(len(latencies) / window, 3),
+        "cell_latency": {
+            "p50": rounded(percentile(latencies, 0.5)),
+            "p90": rounded(percentile(latencies, 0.9)),
+            "p99": rounded(percentile(latencies, 0.99)),
+            "max": rounded(max(latencies) if latencies else None),
+        },
+    }
+    if upstream:
+        report["upstream"] = upstream
+    return report
+
+
+def main():
+    """主函数"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format="[%(asctime)s] [%(name)s] [%(levelname)s] %(message)s",
+        handlers=[logging.StreamHandler()],
+    )
+
+    parser = argparse.ArgumentParser(description="端到端压测：通过API提交任务并统计吞吐和单元格延迟")
+    parser.add_argument("--api", default="http://127.0.0.1:8000/api/v1", help="API地址")
+    parser.add_argument("--upstream", default="http://127.0.0.1:9000", help="模拟上游地址，传空字符串表示不统计")
+    parser.add_argument("--username", required=True, help="用户名")
+    parser.add_argument("--password", required=True, help="密码")
+    parser.add_argument("--tasks", type=int, default=10, help="提交的任务数量")
+    parser.add_argument("--cells", type=int, default=50, help="每个任务的单元格数量")
+    parser.add_argument("--concurrency", type=int, default=5, help="同时进行中的任务数量")
+    parser.add_argument("--submit-interval", type=float, default=0.0, help="两次提交之间的最短间隔（秒）")
+    parser.add_argument("--lumina", action="store_true", help="使用Lumina端点")
+    parser.add_argument("--lazy", action="store_true", help="惰性物化子任务")
+    parser.add_argument("--priority", type=int, default=1, help="任务优先级")
+    parser.add_argument("--poll-interval", type=float, default=2.0, help="任务进度轮询间隔（秒）")
+    parser.add_argument("--task-timeout", type=float, default=3600, help="单个任务的最长等待时间（秒）")
+    parser.add_argument("--output", default=None, help="把报告写入JSON文件")
+    args = parser.parse_args()
+
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    payloads = [
+        build_task_payload(f"压测_{stamp}_{index}", args.cells, args.lumina, args.priority, args.lazy)
+        for index in range(args.tasks)
+    ]
+
+    async def run() -> typing.Dict[str, typing.Any]:
+        driver = LoadTestDriver(args.api, args.upstream or None, args.concurrency,
+                                args.poll_interval, args.task_timeout)
+        await driver.login(args.username, args.password)
+        return await driver.run(payloads, args.submit_interval)
+
+    report = asyncio.run(run())
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
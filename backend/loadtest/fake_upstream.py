@@ -0,0 +1,342 @@
+"""
+上游图像生成API模拟服务
+
+实现 /v3/make_image 和 /v1/artifact/task/{uuid} 两个接口，用于在本地对 ImageClient、调度器和工作进程做压测。
+同样的接口也挂在 /ops 前缀下作为Lumina端点，两个端点的生成耗时分别配置：
+
+    IMAGE_API_BASE_URL=http://127.0.0.1:9000
+    LUMINA_IMAGE_API_BASE_URL=http://127.0.0.1:9000/ops
+
+生成耗时服从对数正态分布，由P50和P99确定。--capacity 限制同时生成的任务数，超出的任务排队，
+排队时间计入完成耗时；未完成的任务超过 --max-pending 时提交请求返回429。
+任务的最终状态按 --failure-rate、--timeout-rate 和 --illegal-rate 随机决定，
+到达完成时间之前状态查询返回 PENDING。
+
+GET /_stats 返回各端点的请求计数和任务结果统计，POST /_stats/reset 清空统计。
+
+用法:
+    python -m backend.loadtest.fake_upstream --port 9000 --latency-p50 8 --latency-p99 30 --capacity 64
+"""
+import argparse
+import asyncio
+import heapq
+import logging
+import math
+import random
+import time
+import typing
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 标准正态分布的P99分位点
+_Z99 = 2.3263
+
+ENDPOINT_STANDARD = "standard"
+ENDPOINT_LUMINA = "lumina"
+
+
+class EndpointProfile:
+    """
+    一个模拟端点的生成耗时、容量和结果分布
+    """
+
+    def __init__(self, latency_p50: float, latency_p99: float, capacity: int, max_pending: int,
+                 failure_rate: float, timeout_rate: float, illegal_rate: float) -> None:
+        """
+        初始化端点配置
+
+        Args:
+            latency_p50: 生成耗时P50（秒）
+            latency_p99: 生成耗时P99（秒）
+            capacity: 同时生成的任务数，0表示不限制
+            max_pending: 未完成任务数上限，超出时提交返回429，0表示不限制
+            failure_rate: 任务结果为 FAILURE 的比例
+            timeout_rate: 任务结果为 TIMEOUT 的比例
+            illegal_rate: 任务结果为 ILLEGAL_IMAGE 的比例
+        """
+        self.mu = math.log(max(latency_p50, 0.001))
+        self.sigma = max(math.log(max(latency_p99, latency_p50) / max(latency_p50, 0.001)) / _Z99, 0.0)
+        self.capacity = capacity
+        self.max_pending = max_pending
+        self.failure_rate = failure_rate
+        self.timeout_rate = timeout_rate
+        self.illegal_rate = illegal_rate
+        # 各生成槽位的空闲时间（小顶堆）
+        self._slots: typing.List[float] = [0.0] * capacity
+
+    def sample_duration(self) -> float:
+        """抽取一次生成耗时（秒）"""
+        return random.lognormvariate(self.mu, self.sigma)
+
+    def schedule(self, now: float) -> typing.Tuple[float, float]:
+        """
+        为新任务分配生成槽位
+
+        Args:
+            now: 当前时间
+
+        Returns:
+            (开始生成时间, 完成时间)
+        """
+        duration = self.sample_duration()
+        if not self.capacity:
+            return now, now + duration
+        start = max(now, heapq.heappop(self._slots))
+        heapq.heappush(self._slots, start + duration)
+        return start, start + duration
+
+    def sample_outcome(self) -> str:
+        """抽取任务的最终状态"""
+        roll = random.random()
+        for status, rate in (("FAILURE", self.failure_rate), ("TIMEOUT", self.timeout_rate),
+                             ("ILLEGAL_IMAGE", self.illegal_rate)):
+            if roll < rate:
+                return status
+            roll -= rate
+        return "SUCCESS"
+
+
+class FakeUpstream:
+    """
+    模拟上游服务的状态：任务表、请求计数和结果统计
+    """
+
+    def __init__(self, profiles: typing.Dict[str, EndpointProfile], submit_latency: float,
+                 error_rate: float, retention: float) -> None:
+        """
+        初始化模拟服务
+
+        Args:
+            profiles: 端点名称 -> 端点配置
+            submit_latency: 提交接口的平均响应耗时（秒）
+            error_rate: 提交接口返回500的比例
+            retention: 任务完成后保留多久（秒），之后查询返回404
+        """
+        self.profiles = profiles
+        self.submit_latency = submit_latency
+        self.error_rate = error_rate
+        self.retention = retention
+        # 任务UUID -> 任务信息
+        self.jobs: typing.Dict[str, typing.Dict[str, typing.Any]] = {}
+        # 端点名称 -> 未完成任务的完成时间（小顶堆）
+        self._pending: typing.Dict[str, typing.List[float]] = {name: [] for name in profiles}
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        """清空统计"""
+        self.started_at = time.time()
+        self.stats = {
+            name: {
+                "make_image": 0,     # 提交请求数
+                "accepted": 0,       # 接受的提交数
+                "rejected": 0,       # 返回429的提交数
+                "errors": 0,         # 返回500的提交数
+                "status": 0,         # 状态查询请求数
+                "status_pending": 0, # 返回PENDING的状态查询数
+                "not_found": 0,      # 查询不存在的任务
+                "outcomes": {"SUCCESS": 0, "FAILURE": 0, "TIMEOUT": 0, "ILLEGAL_IMAGE": 0},
+                "queue_wait_total": 0.0,  # 任务等待生成槽位的累计时间（秒）
+            }
+            for name in self.profiles
+        }
+
+    def _pending_count(self, endpoint: str, now: float) -> int:
+        pending = self._pending[endpoint]
+        while pending and pending[0] <= now:
+            heapq.heappop(pending)
+        return len(pending)
+
+    def _purge(self, now: float) -> None:
+        expired = [job_id for job_id, job in self.jobs.items() if now - job["done_at"] > self.retention]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    async def make_image(self, endpoint: str, payload: typing.Dict[str, typing.Any]):
+        """
+        提交生成任务
+
+        Args:
+            endpoint: 端点名称
+            payload: 请求载荷
+
+        Returns:
+            任务UUID（带引号的字符串，与上游一致）或错误响应
+        """
+        stats = self.stats[endpoint]
+        profile = self.profiles[endpoint]
+        stats["make_image"] += 1
+
+        if self.submit_latency > 0:
+            await asyncio.sleep(random.expovariate(1 / self.submit_latency))
+
+        if random.random() < self.error_rate:
+            stats["errors"] += 1
+            return JSONResponse(status_code=500, content={"detail": "fake upstream error"})
+
+        now = time.time()
+        if stats["make_image"] % 1000 == 0:
+            self._purge(now)
+        if profile.max_pending and self._pending_count(endpoint, now) >= profile.max_pending:
+            stats["rejected"] += 1
+            return JSONResponse(status_code=429, content={"detail": "too many pending tasks"},
+                                headers={"Retry-After": "1"})
+
+        start, done_at = profile.schedule(now)
+        heapq.heappush(self._pending[endpoint], done_at)
+        job_id = str(uuid.uuid4())
+        self.jobs[job_id] = {
+            "endpoint": endpoint,
+            "created_at": now,
+            "done_at": done_at,
+            "status": profile.sample_outcome(),
+            "seed": payload.get("seed"),
+        }
+        stats["accepted"] += 1
+        stats["queue_wait_total"] += start - now
+        return PlainTextResponse(f'"{job_id}"')
+
+    def task_status(self, endpoint: str, job_id: str):
+        """
+        查询任务状态
+
+        Args:
+            endpoint: 端点名称
+            job_id: 任务UUID
+
+        Returns:
+            与上游格式一致的任务状态
+        """
+        stats = self.stats[endpoint]
+        stats["status"] += 1
+        job = self.jobs.get(job_id)
+        if job is None:
+            stats["not_found"] += 1
+            return JSONResponse(status_code=404, content={"detail": "task not found"})
+
+        if time.time() < job["done_at"]:
+            stats["status_pending"] += 1
+            return {"task_uuid": job_id, "task_status": "PENDING"}
+
+        status = job["status"]
+        if not job.get("reported"):
+            job["reported"] = True
+            stats["outcomes"][status] += 1
+
+        result: typing.Dict[str, typing.Any] = {"task_uuid": job_id, "task_status": status}
+        if status == "SUCCESS":
+            result["artifacts"] = [{"url": f"https://fake-upstream.local/artifacts/{job_id}.webp", "seed": job["seed"]}]
+        elif status == "FAILURE":
+            result["error"] = "fake upstream failure"
+        return result
+
+    def get_stats(self) -> typing.Dict[str, typing.Any]:
+        """
+        获取统计
+
+        Returns:
+            各端点的请求计数、结果统计、未完成任务数和平均排队时间
+        """
+        now = time.time()
+        endpoints = {}
+        for name, stats in self.stats.items():
+            accepted = stats["accepted"]
+            endpoints[name] = {
+                **stats,
+                "pending": self._pending_count(name, now),
+                "status_per_task": round(stats["status"] / accepted, 2) if accepted else 0.0,
+                "queue_wait_avg": round(stats["queue_wait_total"] / accepted, 3) if accepted else 0.0,
+            }
+        return {"elapsed": round(now - self.started_at, 3), "endpoints": endpoints}
+
+
+def create_app(upstream: FakeUpstream) -> FastAPI:
+    """
+    创建模拟服务的FastAPI应用
+
+    Args:
+        upstream: 模拟服务状态
+
+    Returns:
+        FastAPI应用
+    """
+    app = FastAPI(title="fake upstream")
+
+    for prefix, endpoint in (("", ENDPOINT_STANDARD), ("/ops", ENDPOINT_LUMINA)):
+        def register(endpoint: str = endpoint, prefix: str = prefix) -> None:
+            @app.post(f"{prefix}/v3/make_image")
+            async def make_image(request: Request):
+                return await upstream.make_image(endpoint, await request.json())
+
+            @app.get(f"{prefix}/v1/artifact/task/{{job_id}}")
+            async def task_status(job_id: str):
+                return upstream.task_status(endpoint, job_id)
+
+        register()
+
+    @app.get("/_stats")
+    async def get_stats():
+        return upstream.get_stats()
+
+    @app.post("/_stats/reset")
+    async def reset_stats():
+        upstream.reset_stats()
+        return upstream.get_stats()
+
+    return app
+
+
+def main():
+    """主函数"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format="[%(asctime)s] [PID %(process)d] [%(name)s] [%(levelname)s] %(message)s",
+        handlers=[logging.StreamHandler()],
+    )
+
+    parser = argparse.ArgumentParser(description="启动上游图像生成API模拟服务")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=9000, help="监听端口")
+    parser.add_argument("--latency-p50", type=float, default=8.0, help="标准端点生成耗时P50（秒）")
+    parser.add_argument("--latency-p99", type=float, default=30.0, help="标准端点生成耗时P99（秒）")
+    parser.add_argument("--capacity", type=int, default=0, help="标准端点同时生成的任务数，0表示不限制")
+    parser.add_argument("--max-pending", type=int, default=0, help="标准端点未完成任务数上限，超出时返回429，0表示不限制")
+    parser.add_argument("--lumina-latency-p50", type=float, default=20.0, help="Lumina端点生成耗时P50（秒）")
+    parser.add_argument("--lumina-latency-p99", type=float, default=90.0, help="Lumina端点生成耗时P99（秒）")
+    parser.add_argument("--lumina-capacity", type=int, default=0, help="Lumina端点同时生成的任务数，0表示不限制")
+    parser.add_argument("--lumina-max-pending", type=int, default=0, help="Lumina端点未完成任务数上限，0表示不限制")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="任务结果为FAILURE的比例")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="任务结果为TIMEOUT的比例")
+    parser.add_argument("--illegal-rate", type=float, default=0.0, help="任务结果为ILLEGAL_IMAGE的比例")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="提交接口返回500的比例")
+    parser.add_argument("--submit-latency", type=float, default=0.05, help="提交接口的平均响应耗时（秒）")
+    parser.add_argument("--retention", type=float, default=3600, help="任务完成后保留多久（秒）")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子，用于复现同一组耗时和结果")
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    outcome_rates = dict(failure_rate=args.failure_rate, timeout_rate=args.timeout_rate, illegal_rate=args.illegal_rate)
+    upstream = FakeUpstream(
+        profiles={
+            ENDPOINT_STANDARD: EndpointProfile(args.latency_p50, args.latency_p99, args.capacity,
+                                               args.max_pending, **outcome_rates),
+            ENDPOINT_LUMINA: EndpointProfile(args.lumina_latency_p50, args.lumina_latency_p99, args.lumina_capacity,
+                                             args.lumina_max_pending, **outcome_rates),
+        },
+        submit_latency=args.submit_latency,
+        error_rate=args.error_rate,
+        retention=args.retention,
+    )
+
+    import uvicorn
+    uvicorn.run(create_app(upstream), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
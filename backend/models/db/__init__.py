@@ -8,11 +8,13 @@ from backend.models.db.base import BaseModel
 from backend.models.db.user import User, Permission, ROLE_ADDITIONAL_PERMISSIONS, ROLE_HIERARCHY
 from backend.models.db.tasks import Task, TaskStatus, SettingField, MakeApiQueue
 from backend.models.db.subtasks import Subtask, SubtaskStatus
+from backend.models.db.outbox import OutboxEvent
 
 
 __all__ = [
     'BaseModel',
     'User', 'Permission', 'ROLE_ADDITIONAL_PERMISSIONS', 'ROLE_HIERARCHY',
     'Task', 'TaskStatus', 'SettingField', 'MakeApiQueue',
-    'Subtask', 'SubtaskStatus'
+    'Subtask', 'SubtaskStatus',
+    'OutboxEvent'
 ]
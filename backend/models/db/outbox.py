@@ -0,0 +1,31 @@
+"""
+事务发件箱模型模块
+
+任务和子任务状态变化时，在同一个事务中写入待处理的事件，由发件箱分发器异步处理通知和统计等后续工作
+"""
+from datetime import datetime
+from peewee import BigAutoField, CharField, DateTimeField, SmallIntegerField, TextField
+from playhouse.postgres_ext import JSONField
+
+from backend.models.db.base import BaseModel
+
+
+class OutboxEvent(BaseModel):
+    """发件箱事件模型"""
+    id = BigAutoField()
+    event_type = CharField(max_length=64)               # 事件类型
+    task_id = CharField(max_length=64)                  # 所属任务ID
+    payload = JSONField(default=dict)                   # 事件内容
+
+    created_at = DateTimeField(default=datetime.now)
+    available_at = DateTimeField(default=datetime.now)  # 最早处理时间（处理失败后推迟）
+    dispatched_at = DateTimeField(null=True)            # 处理完成时间
+    attempts = SmallIntegerField(default=0)             # 处理次数
+    last_error = TextField(null=True)                   # 最后一次处理错误
+
+    class Meta:
+        table_name = 'nietest_outbox_events'
+        indexes = (
+            (('dispatched_at', 'available_at'), False),
+            (('created_at',), False),
+        )
@@ -35,6 +35,13 @@ class TaskStatus(str, Enum):
     CANCELLED = "cancelled"   # 已取消
 
 
+class TaskPriority(int, Enum):
+    """任务优先级枚举（普通用户最高只能创建NORMAL，HIGH需要高优先级权限）"""
+    LOW = 0      # 低优先级
+    NORMAL = 1   # 普通优先级（默认）
+    HIGH = 2     # 高优先级
+
+
 class SettingField(str, Enum):
     """设置字段枚举"""
     RATIO = "ratio"
@@ -53,7 +60,7 @@ class Task(BaseModel):
     name = CharField(max_length=255)
     user = ForeignKeyField(User, backref='tasks')
     status = CharField(max_length=20, default=TaskStatus.PENDING.value)
-    priority = SmallIntegerField(default=1)
+    priority = SmallIntegerField(default=TaskPriority.NORMAL.value)
     total_images = IntegerField(default=0)
 
     processed_images = IntegerField(default=0)
@@ -65,6 +72,7 @@ class Task(BaseModel):
 
     is_deleted = BooleanField(default=False)
     is_favorite = BooleanField(default=False)
+    lazy_materialization = BooleanField(default=False)  # 惰性物化：子任务在执行时才生成，仅保存有结果或错误的记录
     created_at = DateTimeField(default=datetime.now)
     updated_at = DateTimeField(default=datetime.now)
     completed_at = DateTimeField(null=True)
@@ -0,0 +1,170 @@
+"""
+基准测试脚本：对比子任务槽位计划与旧的逐单元格深拷贝组装方式
+
+构造一个6维、50000个单元格的任务（3个提示词变量 + 3个参数变量），
+分别用旧的组装方式（深拷贝模板 + 线性查找变量槽位 + 重复 model_dump）和槽位计划组装全部单元格，
+校验两者结果一致并输出耗时与加速比。只测试组装本身，不涉及数据库。
+
+运行方式：
+python -m backend.scripts.benchmark_subtask_plan
+或者
+cd backend && python scripts/benchmark_subtask_plan.py
+"""
+
+import sys
+import os
+import time
+import itertools
+from copy import deepcopy
+from types import SimpleNamespace
+
+# 添加项目根目录到Python路径
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from backend.models.db.tasks import SettingField
+from backend.models.prompt import Prompt, ConstantPrompt
+from backend.models.task_parameter import TaskParameter
+from backend.services.subtask_plan import CONFIGURABLE_PARAMETER_NAMES, compile_subtask_plan
+
+
+def build_benchmark_task():
+    """
+    构造基准测试用的任务对象：维度形状为 10 x 10 x 5 x 5 x 4 x 5 = 50000
+
+    Returns:
+        (任务对象, 活动变量列表)
+    """
+    def prompt_values(prefix, count):
+        return [
+            ConstantPrompt(type="freetext", value=f"{prefix}_{i}, masterpiece, best quality", weight=1.0)
+            for i in range(count)
+        ]
+
+    prompts = [
+        Prompt(type="freetext", value="1girl, solo", weight=1.0, is_variable=False),
+        Prompt(type="freetext", is_variable=True, variable_id="v0", variable_name="角色",
+               variable_values=prompt_values("character", 10)),
+        Prompt(type="freetext", is_variable=True, variable_id="v1", variable_name="服装",
+               variable_values=prompt_values("outfit", 10)),
+        Prompt(type="freetext", value="looking at viewer", weight=0.8, is_variable=False),
+        Prompt(type="freetext", is_variable=True, variable_id="v2", variable_name="背景",
+               variable_values=prompt_values("background", 5)),
+    ]
+
+    variable_params = {
+        SettingField.RATIO.value: TaskParameter(type="ratio", is_variable=True, variable_id="v3", variable_name="比例",
+                                                variable_values=["1:1", "3:4", "4:3", "9:16", "16:9"]),
+        SettingField.SEED.value: TaskParameter(type="seed", is_variable=True, variable_id="v4", variable_name="种子",
+                                               variable_values=[1, 2, 3, 4]),
+        SettingField.LUMINA_STEP.value: TaskParameter(type="lumina_step", is_variable=True, variable_id="v5",
+                                                      variable_name="步数", variable_values=[10, 20, 30, 40, 50]),
+    }
+    fixed_params = {
+        SettingField.USER_POLISH.value: TaskParameter(type="use_polish", value=False),
+        SettingField.IS_LUMINA.value: TaskParameter(type="is_lumina", value=False),
+        SettingField.LUMINA_MODEL_NAME.value: TaskParameter(type="lumina_model_name", value=None),
+        SettingField.LUMINA_CFG.value: TaskParameter(type="lumina_cfg", value=None),
+        SettingField.BATCH_SIZE.value: TaskParameter(type="batch_size", value=1),
+    }
+
+    task_obj = SimpleNamespace(id="benchmark", prompts=prompts, **variable_params, **fixed_params)
+
+    active_variables_list = [
+        SimpleNamespace(variable_id=p.variable_id, possible_values=p.variable_values)
+        for p in prompts if p.is_variable
+    ]
+    for param_name in CONFIGURABLE_PARAMETER_NAMES:
+        param = getattr(task_obj, param_name)
+        if param.is_variable:
+            active_variables_list.append(SimpleNamespace(variable_id=param.variable_id,
+                                                         possible_values=param.variable_values))
+    return task_obj, active_variables_list
+
+
+def legacy_build_all(task_obj, active_variables_list):
+    """
+    旧的组装方式：每个单元格深拷贝模板，并线性查找变量所属的槽位
+
+    Returns:
+        [(提示词列表, 参数字典), ...]
+    """
+    base_prompts = [None] * len(task_obj.prompts)
+    for i, prompt_in_task in enumerate(task_obj.prompts):
+        if not prompt_in_task.is_variable:
+            base_prompts[i] = prompt_in_task.model_dump()
+
+    base_params = {}
+    for param_name in CONFIGURABLE_PARAMETER_NAMES:
+        param_task_model = getattr(task_obj, param_name)
+        if not param_task_model.is_variable:
+            base_params[param_name] = param_task_model.value
+    base_params[SettingField.BATCH_SIZE.value] = task_obj.batch_size.value
+
+    index_ranges = [range(len(v.possible_values)) for v in active_variables_list]
+    results = []
+    for coordinates in itertools.product(*index_ranges):
+        prompts = deepcopy(base_prompts)
+        params = deepcopy(base_params)
+        for dimension_idx, value_index in enumerate(coordinates):
+            active_var = active_variables_list[dimension_idx]
+            chosen_value = active_var.possible_values[value_index]
+            applied = False
+            for i, original_prompt in enumerate(task_obj.prompts):
+                if original_prompt.is_variable and original_prompt.variable_id == active_var.variable_id:
+                    prompts[i] = chosen_value.model_dump()
+                    applied = True
+                    break
+            if applied:
+                continue
+            for param_name in CONFIGURABLE_PARAMETER_NAMES:
+                original_param = getattr(task_obj, param_name)
+                if original_param.is_variable and original_param.variable_id == active_var.variable_id:
+                    params[param_name] = chosen_value
+                    break
+        prompts = [p for p in prompts if p is not None and p.get('value') not in (None, "")]
+        results.append((prompts, params))
+    return results
+
+
+def plan_build_all(task_obj, active_variables_list):
+    """
+    槽位计划组装方式：编译一次计划，每个单元格 O(维度数) 组装
+
+    Returns:
+        [(提示词列表, 参数字典), ...]
+    """
+    plan = compile_subtask_plan(task_obj, active_variables_list)
+    index_ranges = [range(size) for size in plan.shape]
+    return [plan.build(coordinates) for coordinates in itertools.product(*index_ranges)]
+
+
+def run_benchmark(repeat: int = 3):
+    """运行基准测试并打印结果"""
+    task_obj, active_variables_list = build_benchmark_task()
+    shape = [len(v.possible_values) for v in active_variables_list]
+    total_cells = 1
+    for size in shape:
+        total_cells *= size
+    print(f"维度形状: {shape}，单元格数量: {total_cells}")
+
+    timings = {}
+    outputs = {}
+    for name, builder in (("legacy", legacy_build_all), ("plan", plan_build_all)):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            outputs[name] = builder(task_obj, active_variables_list)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings[name] = best
+        print(f"{name:>6}: {best:.3f}秒 (最优/{repeat}次), {total_cells / best:,.0f} 单元格/秒")
+
+    if outputs["legacy"] != outputs["plan"]:
+        raise SystemExit("错误：两种组装方式的结果不一致")
+    print(f"结果一致，加速比: {timings['legacy'] / timings['plan']:.1f}x")
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -6,7 +6,7 @@
 import logging
 import sys
 from backend.core import initialize_app, shutdown_app
-from backend.models.db import User, Task, Subtask
+from backend.models.db import User, Task, Subtask, OutboxEvent
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -19,7 +19,7 @@ def create_tables():
     logger.info("正在创建数据库表...")
 
     # 创建表
-    tables = [User, Task, Subtask]
+    tables = [User, Task, Subtask, OutboxEvent]
     for table in tables:
         logger.info(f"正在创建表: {table._meta.table_name}")
         table.create_table(safe=True)
@@ -0,0 +1,71 @@
+"""
+数据库迁移脚本：为任务表添加lazy_materialization字段
+
+运行方式：
+python -m backend.scripts.migrate_lazy_materialization
+或者
+cd backend && python scripts/migrate_lazy_materialization.py
+"""
+
+import sys
+import os
+
+# 添加项目根目录到Python路径
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from peewee import BooleanField
+from playhouse.postgres_ext import PostgresqlExtDatabase
+from playhouse.migrate import migrate, PostgresqlMigrator
+from dotenv import load_dotenv
+from pathlib import Path
+
+# 加载环境变量
+env_path = Path(__file__).resolve().parent.parent.parent / ".env"
+load_dotenv(env_path)
+
+
+def add_fields():
+    """添加lazy_materialization字段"""
+    print("开始数据库迁移...")
+
+    # 直接创建数据库连接
+    db = PostgresqlExtDatabase(
+        os.getenv("TEST_DB_NAME", "database"),
+        user=os.getenv("TEST_DB_USER", "postgres"),
+        password=os.getenv("TEST_DB_PASSWORD", ""),
+        host=os.getenv("TEST_DB_HOST", "localhost"),
+        port=int(os.getenv("TEST_DB_PORT", "5432")),
+        autoconnect=True
+    )
+
+    # 创建迁移器
+    migrator = PostgresqlMigrator(db)
+
+    try:
+        # 检查字段是否已存在
+        table_info = db.get_columns('nietest_tasks')
+        existing_columns = [col.name for col in table_info]
+
+        if 'lazy_materialization' not in existing_columns:
+            print("添加lazy_materialization字段...")
+            migrate(
+                migrator.add_column('nietest_tasks', 'lazy_materialization', BooleanField(default=False))
+            )
+            print("成功添加lazy_materialization字段")
+        else:
+            print("lazy_materialization字段已存在，无需迁移")
+
+        print("数据库迁移完成！")
+
+    except Exception as e:
+        print(f"迁移过程中出错: {e}")
+        import traceback
+        traceback.print_exc()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    add_fields()
@@ -0,0 +1,51 @@
+"""
+跟踪中任务登记模块
+
+启用任务协调服务（TASK_RECONCILER_ENABLED）后，主任务Actor发送完子任务就把任务登记在这里，不再为每个任务启动监控线程。
+任务协调服务（backend.dramatiq_app.task_reconciler）每轮处理登记的任务和数据库中所有执行中的任务，
+任务结束（完成、失败或取消并清理）后移出登记。登记保存在Redis集合中，工作进程重启不会丢失。
+"""
+import logging
+import typing
+
+from backend.core.config import settings
+from backend.utils.redis_client import get_redis_client
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+def _active_tasks_key() -> str:
+    """返回跟踪中任务集合的Redis键"""
+    return f"{settings.TASK_RECONCILER_KEY_PREFIX}:tasks"
+
+
+def track_task(task_id: str) -> None:
+    """
+    登记任务，由任务协调服务跟踪
+
+    Args:
+        task_id: 任务ID
+    """
+    get_redis_client().sadd(_active_tasks_key(), str(task_id))
+
+
+def untrack_task(task_id: str) -> None:
+    """
+    任务结束后移出登记
+
+    Args:
+        task_id: 任务ID
+    """
+    get_redis_client().srem(_active_tasks_key(), str(task_id))
+
+
+def get_tracked_tasks() -> typing.Set[str]:
+    """
+    获取所有跟踪中的任务
+
+    Returns:
+        任务ID集合
+    """
+    return {member.decode() if isinstance(member, bytes) else member
+            for member in get_redis_client().smembers(_active_tasks_key())}
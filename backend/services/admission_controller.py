@@ -0,0 +1,361 @@
+"""
+任务准入控制服务模块
+
+用Redis实现的任务准入队列，替代主任务Actor中轮询等待执行槽位的方式：
+容量以进行中的子任务数量衡量，等待中的任务不占用工作线程，
+当已准入任务的进度推进、完成或取消使容量释放时，立即唤醒排在前面的等待任务。
+"""
+import logging
+import time
+import typing
+
+from backend.core.config import settings
+from backend.models.db.tasks import TaskPriority
+from backend.services.custom_background import get_background_service
+from backend.utils.redis_client import get_redis_client
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 准入池：普通任务和Lumina任务分别计算容量
+POOL_STANDARD = "standard"
+POOL_LUMINA = "lumina"
+
+# 任务准入后由该Actor继续执行
+START_ACTOR = "test_start_admitted_task"
+START_QUEUE = "test_master"
+
+# 等待队列排序：优先级高的在前，同优先级按加入时间先后
+_PRIORITY_SCORE_SPAN = 10 ** 13
+
+# 唤醒：清理心跳过期的已准入任务，统计各池占用，按顺序准入能放下的等待任务（每个池队首放不下时该池停止准入）
+_WAKE_SCRIPT = """
+local prefix = ARGV[1]
+local standard_capacity = tonumber(ARGV[2])
+local lumina_capacity = tonumber(ARGV[3])
+local charge_cap = tonumber(ARGV[4])
+local lease_ttl_ms = tonumber(ARGV[5])
+
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+local waiting_key = prefix .. ':waiting'
+local admitted_key = prefix .. ':admitted'
+
+for _, task_id in ipairs(redis.call('ZRANGEBYSCORE', admitted_key, '-inf', now)) do
+    redis.call('ZREM', admitted_key, task_id)
+    redis.call('DEL', prefix .. ':task:' .. task_id)
+end
+
+local capacity = {standard = standard_capacity, lumina = lumina_capacity}
+local load = {standard = 0, lumina = 0}
+local count = {standard = 0, lumina = 0}
+for _, task_id in ipairs(redis.call('ZRANGE', admitted_key, 0, -1)) do
+    local info = redis.call('HMGET', prefix .. ':task:' .. task_id, 'pool', 'remaining')
+    local pool = info[1] or 'standard'
+    load[pool] = (load[pool] or 0) + math.min(tonumber(info[2]) or 0, charge_cap)
+    count[pool] = (count[pool] or 0) + 1
+end
+
+local blocked = {}
+local admitted = {}
+for _, task_id in ipairs(redis.call('ZRANGE', waiting_key, 0, -1)) do
+    local task_key = prefix .. ':task:' .. task_id
+    local info = redis.call('HMGET', task_key, 'pool', 'cost')
+    local pool = info[1] or 'standard'
+    if not blocked[pool] then
+        local cost = tonumber(info[2]) or 0
+        local charge = math.min(cost, charge_cap)
+        if (count[pool] or 0) == 0 or (load[pool] or 0) + charge <= (capacity[pool] or 0) then
+            redis.call('ZREM', waiting_key, task_id)
+            redis.call('ZADD', admitted_key, now + lease_ttl_ms, task_id)
+            redis.call('HSET', task_key, 'state', 'admitted', 'remaining', cost, 'admitted_at', now)
+            load[pool] = (load[pool] or 0) + charge
+            count[pool] = (count[pool] or 0) + 1
+            table.insert(admitted, task_id)
+        else
+            blocked[pool] = true
+        end
+    end
+end
+return admitted
+"""
+
+
+def task_pool(task_obj: typing.Any) -> str:
+    """
+    判断任务所属的准入池：包含Lumina子任务的任务进入Lumina池
+
+    Args:
+        task_obj: 任务对象
+
+    Returns:
+        准入池名称
+    """
+    is_lumina_param = task_obj.is_lumina
+    if is_lumina_param and (is_lumina_param.is_variable or is_lumina_param.value):
+        return POOL_LUMINA
+    return POOL_STANDARD
+
+
+class AdmissionController:
+    """基于Redis的任务准入控制器"""
+
+    def __init__(self) -> None:
+        """初始化准入控制器"""
+        self.client = get_redis_client()
+        self.key_prefix = settings.ADMISSION_KEY_PREFIX
+        self.wake_script = self.client.register_script(_WAKE_SCRIPT)
+
+    @property
+    def waiting_key(self) -> str:
+        return f"{self.key_prefix}:waiting"
+
+    @property
+    def admitted_key(self) -> str:
+        return f"{self.key_prefix}:admitted"
+
+    def _task_key(self, task_id: str) -> str:
+        return f"{self.key_prefix}:task:{task_id}"
+
+    def _lease_expiry_ms(self) -> int:
+        return int((time.time() + settings.ADMISSION_LEASE_TTL) * 1000)
+
+    def request(self, task_obj: typing.Any) -> bool:
+        """
+        任务申请准入：加入等待队列并尝试唤醒
+
+        Args:
+            task_obj: 任务对象
+
+        Returns:
+            是否立即准入；否则任务留在等待队列中，容量释放时由 `test_start_admitted_task` 继续执行
+        """
+        task_id = str(task_obj.id)
+
+        # 主任务消息在准入后重试时不再重新申请，否则状态被改回waiting，任务会被再次准入
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hget(self._task_key(task_id), "state")
+        pipe.zscore(self.admitted_key, task_id)
+        state, admitted_score = pipe.execute()
+        if state == b"admitted" and admitted_score is not None:
+            self.client.zadd(self.admitted_key, {task_id: self._lease_expiry_ms()}, xx=True)
+            logger.info(f"任务 {task_id} 已获得准入，继续执行")
+            return True
+
+        priority = task_obj.priority if task_obj.priority is not None else TaskPriority.NORMAL.value
+        score = (TaskPriority.HIGH.value - priority) * _PRIORITY_SCORE_SPAN + int(time.time() * 1000)
+
+        pipe = self.client.pipeline(transaction=True)
+        pipe.hset(self._task_key(task_id), mapping={
+            "pool": task_pool(task_obj),
+            "cost": task_obj.total_images,
+            "state": "waiting",
+        })
+        pipe.zadd(self.waiting_key, {task_id: score}, nx=True)
+        pipe.execute()
+
+        admitted = self.wake(exclude=task_id)
+        if task_id in admitted:
+            logger.info(f"任务 {task_id} 立即获得准入")
+            return True
+
+        position = self.get_position(task_id)
+        logger.info(f"任务 {task_id} 进入准入等待队列，排在第 {position.get('position')} 位")
+        return False
+
+    def wake(self, exclude: typing.Optional[str] = None) -> typing.List[str]:
+        """
+        按容量准入等待中的任务，并为每个准入的任务发送继续执行的消息
+
+        Args:
+            exclude: 不需要发送消息的任务ID（由调用方在当前线程中继续执行）
+
+        Returns:
+            本次准入的任务ID列表
+        """
+        admitted = [task_id.decode() if isinstance(task_id, bytes) else task_id
+                    for task_id in self.wake_script(args=[
+                        self.key_prefix,
+                        settings.ADMISSION_STANDARD_CAPACITY,
+                        settings.ADMISSION_LUMINA_CAPACITY,
+                        settings.ADMISSION_TASK_CHARGE_CAP,
+                        int(settings.ADMISSION_LEASE_TTL * 1000),
+                    ])]
+        for task_id in admitted:
+            if task_id == exclude:
+                continue
+            logger.info(f"唤醒准入等待中的任务 {task_id}")
+            self._enqueue_start(task_id)
+        return admitted
+
+    def _enqueue_start(self, task_id: str) -> None:
+        """
+        发送已准入任务继续执行的消息
+
+        发送失败时任务的准入心跳过期后被移出准入控制，由任务协调服务重新申请准入
+
+        Args:
+            task_id: 任务ID
+        """
+        try:
+            get_background_service().enqueue(
+                actor_name=START_ACTOR,
+                kwargs={"task_id": task_id},
+                queue_name=START_QUEUE,
+            )
+        except Exception as e:
+            logger.error(f"发送任务 {task_id} 继续执行的消息失败: {str(e)}")
+
+    def find_untracked(self, task_ids: typing.List[str]) -> typing.List[str]:
+        """
+        找出既不在等待队列也不在已准入集合中的任务
+
+        Args:
+            task_ids: 任务ID列表
+
+        Returns:
+            不在准入控制中的任务ID列表
+        """
+        if not task_ids:
+            return []
+        pipe = self.client.pipeline(transaction=False)
+        for task_id in task_ids:
+            pipe.zscore(self.waiting_key, task_id)
+            pipe.zscore(self.admitted_key, task_id)
+        scores = pipe.execute()
+        return [task_id for index, task_id in enumerate(task_ids)
+                if scores[2 * index] is None and scores[2 * index + 1] is None]
+
+    def recover(self, task_obj: typing.Any) -> bool:
+        """
+        为丢失准入记录的等待中任务重新申请准入，立即准入时发送继续执行的消息
+
+        Args:
+            task_obj: 任务对象
+
+        Returns:
+            是否立即准入
+        """
+        admitted = self.request(task_obj)
+        if admitted:
+            self._enqueue_start(str(task_obj.id))
+        return admitted
+
+    def report_progress(self, task_id: str, processed: int) -> None:
+        """
+        上报已准入任务的进度（同时作为心跳），释放已处理子任务占用的容量
+
+        Args:
+            task_id: 任务ID
+            processed: 已处理（完成、失败或取消）的子任务数量
+        """
+        task_key = self._task_key(task_id)
+        cost = self.client.hget(task_key, "cost")
+        if cost is None:
+            return
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hset(task_key, "remaining", max(int(cost) - processed, 0))
+        pipe.zadd(self.admitted_key, {task_id: self._lease_expiry_ms()}, xx=True)
+        pipe.execute()
+        self.wake()
+
+    def release(self, task_id: str) -> None:
+        """
+        任务结束（完成、失败或取消）时移出准入控制，并唤醒等待中的任务
+
+        Args:
+            task_id: 任务ID
+        """
+        pipe = self.client.pipeline(transaction=True)
+        pipe.zrem(self.waiting_key, task_id)
+        pipe.zrem(self.admitted_key, task_id)
+        pipe.delete(self._task_key(task_id))
+        pipe.execute()
+        logger.info(f"任务 {task_id} 已释放准入容量")
+        self.wake()
+
+    def get_position(self, task_id: str) -> typing.Dict[str, typing.Any]:
+        """
+        查询任务在准入队列中的位置
+
+        Args:
+            task_id: 任务ID
+
+        Returns:
+            state（waiting、admitted 或 none）、position（从1开始，仅等待中）、
+            ahead_in_pool（同一准入池中排在前面的任务数）和 waiting_total
+        """
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hgetall(self._task_key(task_id))
+        pipe.zrank(self.waiting_key, task_id)
+        pipe.zrange(self.waiting_key, 0, -1)
+        info, rank, waiting = pipe.execute()
+        info = {k.decode(): v.decode() for k, v in info.items()}
+
+        result: typing.Dict[str, typing.Any] = {
+            "task_id": task_id,
+            "state": info.get("state", "none"),
+            "pool": info.get("pool"),
+            "position": None,
+            "ahead_in_pool": None,
+            "waiting_total": len(waiting),
+        }
+        if rank is not None:
+            ahead = [t.decode() for t in waiting[:rank]]
+            pipe = self.client.pipeline(transaction=False)
+            for other_id in ahead:
+                pipe.hget(self._task_key(other_id), "pool")
+            pools = pipe.execute() if ahead else []
+            result["position"] = rank + 1
+            result["ahead_in_pool"] = sum(1 for pool in pools if pool and pool.decode() == info.get("pool"))
+        return result
+
+    def get_status(self) -> typing.Dict[str, typing.Any]:
+        """
+        获取各准入池的容量、占用和等待队列
+
+        Returns:
+            准入控制状态
+        """
+        admitted_ids = [t.decode() for t in self.client.zrange(self.admitted_key, 0, -1)]
+        waiting_ids = [t.decode() for t in self.client.zrange(self.waiting_key, 0, -1)]
+        pipe = self.client.pipeline(transaction=False)
+        for task_id in admitted_ids + waiting_ids:
+            pipe.hgetall(self._task_key(task_id))
+        infos = [{k.decode(): v.decode() for k, v in info.items()} for info in pipe.execute()]
+
+        pools = {
+            POOL_STANDARD: {"capacity": settings.ADMISSION_STANDARD_CAPACITY, "in_flight": 0,
+                            "admitted": [], "waiting": []},
+            POOL_LUMINA: {"capacity": settings.ADMISSION_LUMINA_CAPACITY, "in_flight": 0,
+                          "admitted": [], "waiting": []},
+        }
+        for index, task_id in enumerate(admitted_ids + waiting_ids):
+            info = infos[index]
+            pool = pools.setdefault(info.get("pool", POOL_STANDARD),
+                                    {"capacity": 0, "in_flight": 0, "admitted": [], "waiting": []})
+            if index < len(admitted_ids):
+                remaining = int(info.get("remaining", 0))
+                pool["in_flight"] += min(remaining, settings.ADMISSION_TASK_CHARGE_CAP)
+                pool["admitted"].append({"task_id": task_id, "remaining": remaining})
+            else:
+                pool["waiting"].append({"task_id": task_id, "cost": int(info.get("cost", 0))})
+        return {"pools": pools, "task_charge_cap": settings.ADMISSION_TASK_CHARGE_CAP}
+
+
+# 单例模式
+_admission_controller_instance: typing.Optional[AdmissionController] = None
+
+
+def get_admission_controller() -> AdmissionController:
+    """
+    获取任务准入控制器实例（单例模式）
+
+    Returns:
+        任务准入控制器实例
+    """
+    global _admission_controller_instance
+    if _admission_controller_instance is None:
+        _admission_controller_instance = AdmissionController()
+    return _admission_controller_instance
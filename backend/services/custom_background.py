@@ -4,9 +4,12 @@
 提供一个简单的接口，用于将任务发送到Dramatiq队列，
 替代直接调用dramatiq.send()方法
 """
+import time
 import typing
 import logging
+from uuid import uuid4
 from dramatiq.brokers.redis import RedisBroker
+from dramatiq.common import current_millis, dq_name
 from dramatiq import Message
 
 from backend.core.config import settings
@@ -37,26 +40,122 @@ class CustomBackgroundService:
             queue_name: 队列名称，默认为default
             delay: 延迟执行时间（毫秒），默认为None（立即执行）
         """
-        # 创建消息选项
-        options = {}
-        if delay is not None:
-            options["delay"] = delay
-            logger.debug(f"设置任务延迟执行: {delay}毫秒")
-
         # 创建消息
         msg = Message(
             queue_name=queue_name,
             actor_name=actor_name,
             args=(),
             kwargs=kwargs,
-            options=options,
+            options={},
         )
 
-        # 发送消息到队列
+        # 发送消息到队列（有延迟的消息进入对应的延迟队列 .DQ）
         logger.debug(f"发送任务到队列: {queue_name}, Actor: {actor_name}, 参数: {kwargs}, 延迟: {delay}毫秒")
-        self.broker.enqueue(msg)
+        self.broker.enqueue(msg, delay=delay or None)
         logger.debug(f"任务已发送到队列: {queue_name}")
 
+    def _prepare_message(self, actor_name: str, kwargs: dict, queue_name: str,
+                         delay: typing.Optional[int], task_id: typing.Optional[str] = None) -> Message:
+        """
+        构造与 RedisBroker.enqueue 相同格式的消息
+
+        每条消息带有唯一的 redis_message_id；延迟大于0的消息改投到延迟队列，并设置 eta。
+
+        Args:
+            actor_name: Actor名称
+            kwargs: 任务参数
+            queue_name: 队列名称
+            delay: 延迟执行时间（毫秒）
+            task_id: 消息所属的任务ID，写入消息选项，供工作进程检查任务是否已取消
+
+        Returns:
+            待写入Redis的消息
+        """
+        options: typing.Dict[str, typing.Any] = {"redis_message_id": str(uuid4())}
+        if task_id:
+            options["task_id"] = task_id
+        if delay:
+            queue_name = dq_name(queue_name)
+            options["eta"] = current_millis() + delay
+
+        return Message(
+            queue_name=queue_name,
+            actor_name=actor_name,
+            args=(),
+            kwargs=kwargs,
+            options=options,
+        )
+
+    def enqueue_many(self, items: typing.Iterable[typing.Dict[str, typing.Any]],
+                     batch_size: typing.Optional[int] = None) -> typing.List[typing.Dict[str, typing.Any]]:
+        """
+        批量将任务发送到Dramatiq队列
+
+        使用Redis pipeline执行broker的dispatch脚本，每个批次只有一次网络往返。
+        消息格式（包括进入 .DQ 延迟队列的消息）与逐条调用 enqueue 时完全一致。
+
+        Args:
+            items: 任务列表，每项包含 actor_name、kwargs，可选 queue_name（默认default）、delay（毫秒）和 task_id
+            batch_size: 每个批次的消息数量，默认使用 ENQUEUE_BATCH_SIZE 配置
+
+        Returns:
+            每个批次的统计信息列表，包含 batch、size、elapsed_ms
+        """
+        batch_size = max(batch_size or settings.ENQUEUE_BATCH_SIZE, 1)
+        broker = self.broker
+        dispatch = broker.scripts["dispatch"]
+        keys = [broker.namespace]
+        max_unpack_size = broker._max_unpack_size()
+
+        batch_stats: typing.List[typing.Dict[str, typing.Any]] = []
+        batch: typing.List[Message] = []
+
+        def flush():
+            start_time = time.perf_counter()
+            pipe = broker.client.pipeline(transaction=False)
+            timestamp = current_millis()
+            for message in batch:
+                dispatch(
+                    keys=keys,
+                    args=[
+                        "enqueue",
+                        timestamp,
+                        message.queue_name,
+                        broker.broker_id,
+                        broker.heartbeat_timeout,
+                        broker.dead_message_ttl,
+                        0,  # 批量发送时不触发维护
+                        max_unpack_size,
+                        message.options["redis_message_id"],
+                        message.encode(),
+                    ],
+                    client=pipe,
+                )
+            pipe.execute()
+            elapsed_ms = (time.perf_counter() - start_time) * 1000
+            batch_stats.append({"batch": len(batch_stats), "size": len(batch), "elapsed_ms": round(elapsed_ms, 2)})
+            logger.debug(f"批量发送第 {len(batch_stats)} 批 {len(batch)} 个任务，耗时: {elapsed_ms:.2f}毫秒")
+
+        for item in items:
+            batch.append(self._prepare_message(
+                actor_name=item["actor_name"],
+                kwargs=item["kwargs"],
+                queue_name=item.get("queue_name", "default"),
+                delay=item.get("delay"),
+                task_id=item.get("task_id"),
+            ))
+            if len(batch) >= batch_size:
+                flush()
+                batch = []
+        if batch:
+            flush()
+
+        if batch_stats:
+            total = sum(stat["size"] for stat in batch_stats)
+            total_ms = sum(stat["elapsed_ms"] for stat in batch_stats)
+            logger.info(f"批量发送 {total} 个任务，共 {len(batch_stats)} 批，耗时: {total_ms:.2f}毫秒")
+        return batch_stats
+
 
 # 单例模式
 _custom_background_service_instance: typing.Optional[CustomBackgroundService] = None
@@ -0,0 +1,374 @@
+"""
+公平调度服务模块
+
+按任务优先级加权、按用户限制并发的子任务调度器（步幅调度）：
+子任务消息先进入各任务自己的待发送列表，由调度Actor定期按步幅（pass）最小的任务依次取出，
+发送到Dramatiq子任务队列，使大任务与小任务交替执行，小任务不会被大任务阻塞。
+调度状态保存在Redis中，所有进程共享。
+"""
+import json
+import logging
+import typing
+import uuid
+
+from backend.core.config import settings
+from backend.models.db.tasks import TaskPriority
+from backend.services.custom_background import get_background_service
+from backend.utils.redis_client import get_redis_client
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 步幅基数：任务每发送一条消息，pass 增加 STRIDE_BASE / 权重
+STRIDE_BASE = 1000.0
+
+# 调度Actor名称和所在队列
+DISPATCH_ACTOR = "test_fair_dispatch"
+DISPATCH_QUEUE = "test_master"
+
+# 注册任务并追加待发送消息；新加入或重新活跃的任务从当前最小pass开始，避免积累过多额度
+_SUBMIT_SCRIPT = """
+local active_key = KEYS[1]
+local meta_key = KEYS[2]
+local pending_key = KEYS[3]
+local task_id = ARGV[1]
+local user_id = ARGV[2]
+local stride = ARGV[3]
+
+redis.call('HSET', meta_key, 'user', user_id, 'stride', stride)
+
+local min_pass = 0
+local first = redis.call('ZRANGE', active_key, 0, 0, 'WITHSCORES')
+if #first > 0 then
+    min_pass = tonumber(first[2])
+end
+local current = tonumber(redis.call('ZSCORE', active_key, task_id))
+if current == nil or current < min_pass then
+    redis.call('ZADD', active_key, min_pass, task_id)
+end
+
+for i = 4, #ARGV do
+    redis.call('RPUSH', pending_key, ARGV[i])
+end
+return redis.call('LLEN', pending_key)
+"""
+
+# 一轮调度：统计各任务和各用户进行中的消息数量，在总并发和用户并发上限内按最小pass取出消息
+_DISPATCH_SCRIPT = """
+local prefix = ARGV[1]
+local round_size = tonumber(ARGV[2])
+local max_in_flight = tonumber(ARGV[3])
+local user_cap = tonumber(ARGV[4])
+local lease_ttl_ms = tonumber(ARGV[5])
+
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+local active_key = prefix .. ':active'
+local entries = redis.call('ZRANGE', active_key, 0, -1, 'WITHSCORES')
+local tasks = {}
+local user_load = {}
+local total = 0
+
+for i = 1, #entries, 2 do
+    local task_id = entries[i]
+    local inflight_key = prefix .. ':inflight:' .. task_id
+    redis.call('ZREMRANGEBYSCORE', inflight_key, '-inf', now)
+    local inflight = redis.call('ZCARD', inflight_key)
+    local pending = redis.call('LLEN', prefix .. ':pending:' .. task_id)
+    if pending == 0 and inflight == 0 then
+        redis.call('ZREM', active_key, task_id)
+        redis.call('DEL', prefix .. ':meta:' .. task_id)
+    else
+        local meta = redis.call('HMGET', prefix .. ':meta:' .. task_id, 'user', 'stride')
+        local user = meta[1] or ''
+        table.insert(tasks, {
+            id = task_id, pass = tonumber(entries[i + 1]), stride = tonumber(meta[2]) or 1000,
+            user = user, pending = pending
+        })
+        user_load[user] = (user_load[user] or 0) + inflight
+        total = total + inflight
+    end
+end
+
+local budget = math.min(round_size, max_in_flight - total)
+local dispatched = {}
+while budget > 0 do
+    local best = nil
+    for _, task in ipairs(tasks) do
+        if task.pending > 0 and user_load[task.user] < user_cap and (best == nil or task.pass < best.pass) then
+            best = task
+        end
+    end
+    if best == nil then
+        break
+    end
+    local item = redis.call('LPOP', prefix .. ':pending:' .. best.id)
+    best.pending = best.pending - 1
+    if item then
+        local member = cjson.decode(item)['member']
+        redis.call('ZADD', prefix .. ':inflight:' .. best.id, now + lease_ttl_ms, member)
+        table.insert(dispatched, item)
+        best.pass = best.pass + best.stride
+        user_load[best.user] = user_load[best.user] + 1
+        budget = budget - 1
+    end
+end
+
+for _, task in ipairs(tasks) do
+    redis.call('ZADD', active_key, task.pass, task.id)
+end
+return dispatched
+"""
+
+# 调度Actor认领调度权：令牌一致或调度权已过期时续期
+_CLAIM_TICKER_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if current == false or current == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+    return 1
+end
+return 0
+"""
+
+# 没有活跃任务时停止调度：释放调度权
+_STOP_TICKER_SCRIPT = """
+if redis.call('ZCARD', KEYS[2]) == 0 and redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('DEL', KEYS[1])
+    return 1
+end
+return 0
+"""
+
+
+def priority_weight(priority: typing.Optional[int]) -> float:
+    """
+    计算任务优先级对应的调度权重
+
+    权重为 FAIR_PRIORITY_WEIGHT_BASE 的 priority 次方：低优先级(0)为1，普通(1)为2，高优先级(2)为4（默认基数为2时）
+
+    Args:
+        priority: 任务优先级
+
+    Returns:
+        调度权重
+    """
+    if priority is None:
+        priority = TaskPriority.NORMAL.value
+    priority = min(max(int(priority), TaskPriority.LOW.value), TaskPriority.HIGH.value)
+    return settings.FAIR_PRIORITY_WEIGHT_BASE ** priority
+
+
+class FairScheduler:
+    """按优先级加权、按用户限制并发的子任务公平调度器"""
+
+    def __init__(self) -> None:
+        """初始化公平调度器"""
+        self.client = get_redis_client()
+        self.key_prefix = settings.FAIR_SCHEDULER_KEY_PREFIX
+        self.submit_script = self.client.register_script(_SUBMIT_SCRIPT)
+        self.dispatch_script = self.client.register_script(_DISPATCH_SCRIPT)
+        self.claim_ticker_script = self.client.register_script(_CLAIM_TICKER_SCRIPT)
+        self.stop_ticker_script = self.client.register_script(_STOP_TICKER_SCRIPT)
+
+    @property
+    def active_key(self) -> str:
+        return f"{self.key_prefix}:active"
+
+    @property
+    def ticker_key(self) -> str:
+        return f"{self.key_prefix}:ticker"
+
+    def _task_key(self, kind: str, task_id: str) -> str:
+        """返回任务的 meta / pending / inflight 键"""
+        return f"{self.key_prefix}:{kind}:{task_id}"
+
+    def submit(self, task_id: str, user_id: str, priority: typing.Optional[int],
+               items: typing.Iterable[typing.Dict[str, typing.Any]]) -> int:
+        """
+        将任务的子任务消息加入待发送列表，并确保调度Actor在运行
+
+        Args:
+            task_id: 任务ID
+            user_id: 任务所属用户ID
+            priority: 任务优先级
+            items: 消息列表，格式与 enqueue_many 相同，另需包含 task_id 和任务内唯一的 member（用于统计进行中的消息）
+
+        Returns:
+            该任务当前待发送的消息数量
+        """
+        stride = STRIDE_BASE / priority_weight(priority)
+        encoded = [json.dumps(item, ensure_ascii=False) for item in items]
+        if not encoded:
+            return self.pending_count(task_id)
+
+        batch_size = max(settings.ENQUEUE_BATCH_SIZE, 1)
+        pending = 0
+        for start in range(0, len(encoded), batch_size):
+            pending = int(self.submit_script(
+                keys=[self.active_key, self._task_key("meta", task_id), self._task_key("pending", task_id)],
+                args=[task_id, user_id, stride, *encoded[start:start + batch_size]],
+            ))
+        logger.debug(f"任务 {task_id} 加入 {len(encoded)} 条待调度消息，当前待发送: {pending}")
+        self.ensure_ticker()
+        return pending
+
+    def dispatch(self) -> int:
+        """
+        执行一轮调度，将选出的消息发送到Dramatiq队列
+
+        Returns:
+            本轮发送的消息数量
+        """
+        raw_items = self.dispatch_script(args=[
+            self.key_prefix,
+            settings.FAIR_ROUND_SIZE,
+            settings.FAIR_MAX_IN_FLIGHT,
+            settings.FAIR_USER_MAX_IN_FLIGHT,
+            int(settings.FAIR_LEASE_TTL * 1000),
+        ])
+        if not raw_items:
+            return 0
+
+        items = [json.loads(raw) for raw in raw_items]
+        try:
+            get_background_service().enqueue_many(items)
+        except Exception as e:
+            # 发送失败时放回待发送列表头部，并释放对应的进行中记录
+            logger.error(f"发送调度消息失败，放回待发送列表: {str(e)}")
+            pipe = self.client.pipeline(transaction=False)
+            for raw, item in zip(reversed(raw_items), reversed(items)):
+                pipe.lpush(self._task_key("pending", item["task_id"]), raw)
+                pipe.zrem(self._task_key("inflight", item["task_id"]), item["member"])
+            pipe.execute()
+            raise
+        logger.debug(f"公平调度本轮发送 {len(items)} 条消息")
+        return len(items)
+
+    def complete(self, task_id: str, member: str) -> None:
+        """
+        标记一条消息执行结束（无论成功或失败），释放其占用的并发额度
+
+        Args:
+            task_id: 任务ID
+            member: 消息的唯一标识
+        """
+        self.client.zrem(self._task_key("inflight", task_id), member)
+        self.ensure_ticker()
+
+    def remove_task(self, task_id: str) -> int:
+        """
+        移除任务的所有待发送消息（用于取消任务）
+
+        Args:
+            task_id: 任务ID
+
+        Returns:
+            被丢弃的待发送消息数量
+        """
+        pending_key = self._task_key("pending", task_id)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.llen(pending_key)
+        pipe.delete(pending_key, self._task_key("inflight", task_id), self._task_key("meta", task_id))
+        pipe.zrem(self.active_key, task_id)
+        dropped = pipe.execute()[0]
+        logger.info(f"任务 {task_id} 已从公平调度器移除，丢弃 {dropped} 条待发送消息")
+        return dropped
+
+    def pending_count(self, task_id: str) -> int:
+        """返回任务待发送的消息数量"""
+        return int(self.client.llen(self._task_key("pending", task_id)))
+
+    def ensure_ticker(self) -> None:
+        """调度权空闲时启动一个新的调度Actor链"""
+        token = uuid.uuid4().hex
+        if self.client.set(self.ticker_key, token, nx=True, px=self._ticker_ttl_ms()):
+            get_background_service().enqueue(
+                actor_name=DISPATCH_ACTOR,
+                kwargs={"token": token},
+                queue_name=DISPATCH_QUEUE,
+            )
+            logger.info("公平调度Actor已启动")
+
+    def claim_ticker(self, token: str) -> bool:
+        """
+        调度Actor认领或续期调度权
+
+        Args:
+            token: 调度Actor链的令牌
+
+        Returns:
+            是否持有调度权；否则说明已有其他调度Actor链在运行
+        """
+        return bool(self.claim_ticker_script(keys=[self.ticker_key], args=[token, self._ticker_ttl_ms()]))
+
+    def stop_ticker(self, token: str) -> bool:
+        """
+        没有活跃任务时释放调度权
+
+        Args:
+            token: 调度Actor链的令牌
+
+        Returns:
+            是否已停止；仍有活跃任务时返回False，调度Actor应继续调度
+        """
+        return bool(self.stop_ticker_script(keys=[self.ticker_key, self.active_key], args=[token]))
+
+    def _ticker_ttl_ms(self) -> int:
+        """调度权有效期：若干个调度间隔，调度Actor链中断后由下一次提交或完成重新启动"""
+        return max(settings.FAIR_DISPATCH_INTERVAL * 10, 10000)
+
+    def get_status(self) -> typing.Dict[str, typing.Any]:
+        """
+        获取各活跃任务的pass、权重、待发送和进行中的消息数量
+
+        Returns:
+            调度器状态
+        """
+        entries = self.client.zrange(self.active_key, 0, -1, withscores=True)
+        pipe = self.client.pipeline(transaction=False)
+        for task_id, _ in entries:
+            task_id = task_id.decode()
+            pipe.hgetall(self._task_key("meta", task_id))
+            pipe.llen(self._task_key("pending", task_id))
+            pipe.zcard(self._task_key("inflight", task_id))
+        results = pipe.execute()
+
+        tasks = []
+        users: typing.Dict[str, int] = {}
+        for index, (task_id, task_pass) in enumerate(entries):
+            meta, pending, in_flight = results[index * 3:index * 3 + 3]
+            meta = {k.decode(): v.decode() for k, v in meta.items()}
+            user_id = meta.get("user", "")
+            users[user_id] = users.get(user_id, 0) + in_flight
+            tasks.append({
+                "task_id": task_id.decode(),
+                "user_id": user_id,
+                "pass": task_pass,
+                "weight": STRIDE_BASE / float(meta.get("stride", STRIDE_BASE)),
+                "pending": pending,
+                "in_flight": in_flight,
+            })
+        return {
+            "tasks": tasks,
+            "user_in_flight": users,
+            "max_in_flight": settings.FAIR_MAX_IN_FLIGHT,
+            "user_max_in_flight": settings.FAIR_USER_MAX_IN_FLIGHT,
+        }
+
+
+# 单例模式
+_fair_scheduler_instance: typing.Optional[FairScheduler] = None
+
+
+def get_fair_scheduler() -> FairScheduler:
+    """
+    获取公平调度器实例（单例模式）
+
+    Returns:
+        公平调度器实例
+    """
+    global _fair_scheduler_instance
+    if _fair_scheduler_instance is None:
+        _fair_scheduler_instance = FairScheduler()
+    return _fair_scheduler_instance
@@ -0,0 +1,318 @@
+"""
+事务发件箱模块
+
+启用 OUTBOX_ENABLED 后，任务状态变化（update_task_status）和子任务结束（update_subtask_status）
+在同一个事务中向 nietest_outbox_events 写入事件，通知、统计重算和任务完成检查等后续工作
+不再在Actor和API处理流程中同步执行，而是由发件箱分发器（backend.dramatiq_app.outbox_dispatcher）批量处理。
+
+分发器用 FOR UPDATE SKIP LOCKED 领取事件，可以同时运行多个实例。每个处理函数按任务分别在单独的保存点中执行，
+失败只影响该任务的事件；处理失败的事件按指数退避重试，已成功的处理函数记录在事件内容中，重试时不再执行，
+超过 OUTBOX_MAX_ATTEMPTS 次后放弃。同一批事件可能被重复处理，处理函数需要保证幂等。
+"""
+import logging
+import time
+import typing
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from backend.core.config import settings
+from backend.models.db.outbox import OutboxEvent
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 事件类型
+EVENT_TASK_STATUS_CHANGED = "task.status_changed"
+EVENT_TASK_NOTIFICATION = "task.notification"
+EVENT_SUBTASK_FINISHED = "subtask.finished"
+
+# 事件内容中记录已成功的处理函数的键
+_HANDLED_KEY = "_handled"
+
+# 事件类型 -> 处理函数列表，处理函数接收同一类型的一批事件
+_HANDLERS: typing.Dict[str, typing.List[typing.Callable[[typing.List[OutboxEvent]], None]]] = {}
+
+
+def register_handler(event_type: str):
+    """
+    注册事件处理函数（装饰器）
+
+    Args:
+        event_type: 事件类型
+
+    Returns:
+        装饰器
+    """
+    def decorator(func):
+        _HANDLERS.setdefault(event_type, []).append(func)
+        return func
+    return decorator
+
+
+def build_event(event_type: str, task_id: str, payload: typing.Optional[typing.Dict[str, typing.Any]] = None
+                ) -> typing.Dict[str, typing.Any]:
+    """
+    构建待写入的事件行
+
+    Args:
+        event_type: 事件类型
+        task_id: 所属任务ID
+        payload: 事件内容
+
+    Returns:
+        事件行
+    """
+    now = datetime.now()
+    return {
+        "event_type": event_type,
+        "task_id": str(task_id),
+        "payload": payload or {},
+        "created_at": now,
+        "available_at": now,
+    }
+
+
+def record_events(events: typing.List[typing.Dict[str, typing.Any]]) -> None:
+    """
+    写入事件（调用方负责与状态变化放在同一个事务中）
+
+    Args:
+        events: build_event 构建的事件行
+    """
+    if events:
+        OutboxEvent.insert_many(events).execute()
+
+
+def build_task_status_events(task_id: str, status: str,
+                             notification: typing.Optional[typing.Dict[str, typing.Any]] = None
+                             ) -> typing.List[typing.Dict[str, typing.Any]]:
+    """
+    构建任务状态变化的事件行：状态变化事件和单独的通知事件（有通知时），
+    统计重算失败重试时不会重复发送通知
+
+    Args:
+        task_id: 任务ID
+        status: 新状态
+        notification: 飞书通知参数
+
+    Returns:
+        事件行
+    """
+    events = [build_event(EVENT_TASK_STATUS_CHANGED, task_id, {"status": status})]
+    if notification:
+        events.append(build_event(EVENT_TASK_NOTIFICATION, task_id, {"notification": notification}))
+    return events
+
+
+def record_event(event_type: str, task_id: str, payload: typing.Optional[typing.Dict[str, typing.Any]] = None) -> None:
+    """
+    写入一个事件（调用方负责与状态变化放在同一个事务中）
+
+    Args:
+        event_type: 事件类型
+        task_id: 所属任务ID
+        payload: 事件内容
+    """
+    record_events([build_event(event_type, task_id, payload)])
+
+
+class OutboxDispatcher:
+    """
+    发件箱分发器
+    """
+
+    def __init__(self, batch_size: int) -> None:
+        """
+        初始化分发器
+
+        Args:
+            batch_size: 每批领取的事件数量
+        """
+        self.batch_size = batch_size
+        self.stats = {"dispatched": 0, "failed": 0, "abandoned": 0}
+
+    def dispatch_batch(self) -> int:
+        """
+        领取并处理一批事件
+
+        Returns:
+            领取的事件数量
+        """
+        db = OutboxEvent._meta.database
+        with db.atomic():
+            now = datetime.now()
+            events = list(
+                OutboxEvent.select()
+                .where(OutboxEvent.dispatched_at.is_null() & (OutboxEvent.available_at <= now))
+                .order_by(OutboxEvent.id)
+                .limit(self.batch_size)
+                .for_update(skip_locked=True)
+            )
+            if not events:
+                return 0
+
+            # 按事件类型和任务分组
+            groups: typing.Dict[typing.Tuple[str, str], typing.List[OutboxEvent]] = OrderedDict()
+            for event in events:
+                groups.setdefault((event.event_type, event.task_id), []).append(event)
+
+            errors: typing.Dict[int, str] = {}
+            # 事件ID -> 已成功的处理函数（包括之前的处理中已成功的）
+            handled: typing.Dict[int, typing.Set[str]] = {
+                event.id: set(event.payload.get(_HANDLED_KEY, [])) for event in events
+            }
+            for (event_type, task_id), group in groups.items():
+                for handler in _HANDLERS.get(event_type, []):
+                    pending = [event for event in group if handler.__name__ not in handled[event.id]]
+                    if not pending:
+                        continue
+                    try:
+                        # 每个处理函数按任务在单独的保存点中执行，失败时不影响其他任务和其他处理函数
+                        with db.atomic():
+                            handler(pending)
+                    except Exception as e:
+                        logger.error(f"处理发件箱事件失败: {event_type}, 任务 {task_id}, {handler.__name__}: {str(e)}")
+                        for event in pending:
+                            errors[event.id] = f"{handler.__name__}: {str(e)}"
+                    else:
+                        for event in pending:
+                            handled[event.id].add(handler.__name__)
+
+            done_ids = [event.id for event in events if event.id not in errors]
+            if done_ids:
+                OutboxEvent.update(
+                    dispatched_at=now, attempts=OutboxEvent.attempts + 1
+                ).where(OutboxEvent.id.in_(done_ids)).execute()
+                self.stats["dispatched"] += len(done_ids)
+
+            for event in events:
+                if event.id in errors:
+                    self._mark_failed(event, errors[event.id], now, handled[event.id])
+        return len(events)
+
+    def _mark_failed(self, event: OutboxEvent, error: str, now: datetime, handled: typing.Set[str]) -> None:
+        """
+        记录处理失败的事件：记录已成功的处理函数，按指数退避推迟，超过最大次数后放弃
+
+        Args:
+            event: 事件
+            error: 错误信息
+            now: 当前时间
+            handled: 已成功的处理函数名称，重试时不再执行
+        """
+        attempts = event.attempts + 1
+        update = {"attempts": attempts, "last_error": error,
+                  "payload": {**event.payload, _HANDLED_KEY: sorted(handled)}}
+        if attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+            update["dispatched_at"] = now
+            self.stats["abandoned"] += 1
+            logger.error(f"发件箱事件 {event.id} ({event.event_type}) 处理失败 {attempts} 次，放弃处理: {error}")
+        else:
+            update["available_at"] = now + timedelta(seconds=min(2 ** attempts, 300))
+            self.stats["failed"] += 1
+        OutboxEvent.update(**update).where(OutboxEvent.id == event.id).execute()
+
+    def purge(self) -> int:
+        """
+        删除超过保留时间的已处理事件
+
+        Returns:
+            删除的事件数量
+        """
+        cutoff = datetime.now() - timedelta(hours=settings.OUTBOX_RETENTION_HOURS)
+        return OutboxEvent.delete().where(
+            OutboxEvent.dispatched_at.is_null(False) & (OutboxEvent.dispatched_at < cutoff)
+        ).execute()
+
+    def run(self, should_stop: typing.Callable[[], bool]) -> None:
+        """
+        循环处理事件，直到 should_stop 返回True
+
+        Args:
+            should_stop: 是否停止
+        """
+        logger.info(f"发件箱分发器已启动，每批: {self.batch_size}")
+        last_purge = 0.0
+        last_report = time.monotonic()
+        while not should_stop():
+            try:
+                count = self.dispatch_batch()
+            except Exception as e:
+                logger.error(f"领取发件箱事件失败: {str(e)}")
+                count = 0
+
+            now = time.monotonic()
+            if now - last_purge >= 600:
+                try:
+                    purged = self.purge()
+                    if purged:
+                        logger.info(f"已删除 {purged} 个过期的发件箱事件")
+                except Exception as e:
+                    logger.warning(f"删除过期的发件箱事件失败: {str(e)}")
+                last_purge = now
+            if now - last_report >= 60:
+                logger.info(f"发件箱分发统计: {self.stats}")
+                last_report = now
+
+            if count < self.batch_size:
+                time.sleep(settings.OUTBOX_POLL_INTERVAL)
+        logger.info(f"发件箱分发器已停止: {self.stats}")
+
+
+def get_outbox_status() -> typing.Dict[str, typing.Any]:
+    """
+    获取发件箱积压情况
+
+    Returns:
+        待处理事件数量、最早的待处理事件创建时间和处理失败等待重试的数量
+    """
+    pending = OutboxEvent.select().where(OutboxEvent.dispatched_at.is_null())
+    oldest = pending.order_by(OutboxEvent.id).first()
+    return {
+        "enabled": settings.OUTBOX_ENABLED,
+        "pending": pending.count(),
+        "retrying": pending.where(OutboxEvent.attempts > 0).count(),
+        "oldest_pending_at": oldest.created_at.isoformat() if oldest else None,
+    }
+
+
+@register_handler(EVENT_TASK_NOTIFICATION)
+def _send_task_notifications(events: typing.List[OutboxEvent]) -> None:
+    """发送任务状态变化时的飞书通知"""
+    from backend.utils.feishu import feishu_task_notify
+
+    for event in events:
+        notification = event.payload.get("notification")
+        if notification:
+            feishu_task_notify(**notification)
+
+
+@register_handler(EVENT_TASK_STATUS_CHANGED)
+def _update_task_stats(events: typing.List[OutboxEvent]) -> None:
+    """任务完成或失败后重算子任务统计"""
+    from backend.models.db.tasks import TaskStatus
+    from backend.services.task_stats_service import update_task_subtask_stats
+
+    finished = [TaskStatus.COMPLETED.value, TaskStatus.FAILED.value]
+    task_ids = OrderedDict((event.task_id, None) for event in events if event.payload.get("status") in finished)
+    for task_id in task_ids:
+        success, message = update_task_subtask_stats(task_id)
+        if not success:
+            raise Exception(message)
+
+
+@register_handler(EVENT_SUBTASK_FINISHED)
+def _check_task_completion(events: typing.List[OutboxEvent]) -> None:
+    """子任务结束后检查所属任务是否已全部处理完成（同一任务的事件只检查一次）"""
+    from backend.models.db.tasks import Task, TaskStatus
+    from backend.services.task_progress import get_task_progress
+    from backend.services.task_service import check_and_update_task_completion
+
+    for task_id in OrderedDict((event.task_id, None) for event in events):
+        task = Task.get_or_none(Task.id == task_id)
+        if not task or task.status != TaskStatus.PROCESSING.value:
+            continue
+
+        # 先用子任务状态计数判断，全部处理完成时才执行完整的完成检查
+        if task.total_images and get_task_progress(task_id).processed >= task.total_images:
+            check_and_update_task_completion(task_id)
@@ -0,0 +1,147 @@
+"""
+上游任务轮询登记模块
+
+两阶段模式下，子任务Actor只提交图像生成请求，把上游任务UUID及完成子任务所需的信息登记在这里，
+由结果轮询服务（backend.dramatiq_app.result_poller）统一按计划轮询所有未完成的上游任务。
+登记信息保存在Redis中：一个按下次轮询时间排序的有序集合，和一个保存任务信息的哈希表。
+"""
+import json
+import logging
+import time
+import typing
+
+from backend.core.config import settings
+from backend.utils.redis_client import get_redis_client
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 领取到期的上游任务：把下次轮询时间推迟到领取租约到期时，轮询服务崩溃后任务会在租约到期后被重新领取
+_CLAIM_SCRIPT = """
+local due_key = KEYS[1]
+local jobs_key = KEYS[2]
+local limit = tonumber(ARGV[1])
+local claim_ttl_ms = tonumber(ARGV[2])
+
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+local result = {}
+for _, task_uuid in ipairs(redis.call('ZRANGEBYSCORE', due_key, '-inf', now, 'LIMIT', 0, limit)) do
+    local job = redis.call('HGET', jobs_key, task_uuid)
+    if job then
+        redis.call('ZADD', due_key, now + claim_ttl_ms, task_uuid)
+        table.insert(result, job)
+    else
+        redis.call('ZREM', due_key, task_uuid)
+    end
+end
+return result
+"""
+
+
+class PollRegistry:
+    """基于Redis的上游任务轮询登记表"""
+
+    def __init__(self) -> None:
+        """初始化登记表"""
+        self.client = get_redis_client()
+        self.key_prefix = settings.RESULT_POLLER_KEY_PREFIX
+        self.claim_script = self.client.register_script(_CLAIM_SCRIPT)
+
+    @property
+    def due_key(self) -> str:
+        return f"{self.key_prefix}:due"
+
+    @property
+    def jobs_key(self) -> str:
+        return f"{self.key_prefix}:jobs"
+
+    def register(self, job: typing.Dict[str, typing.Any], delay: float) -> None:
+        """
+        登记一个已提交的上游任务
+
+        Args:
+            job: 上游任务信息，必须包含 task_uuid
+            delay: 距首次轮询的时间（秒）
+        """
+        pipe = self.client.pipeline(transaction=True)
+        pipe.hset(self.jobs_key, job["task_uuid"], json.dumps(job))
+        pipe.zadd(self.due_key, {job["task_uuid"]: int((time.time() + delay) * 1000)})
+        pipe.execute()
+
+    def claim_due(self, limit: int) -> typing.List[typing.Dict[str, typing.Any]]:
+        """
+        领取已到轮询时间的上游任务
+
+        Args:
+            limit: 最多领取的数量
+
+        Returns:
+            上游任务信息列表
+        """
+        if limit <= 0:
+            return []
+        jobs = self.claim_script(
+            keys=[self.due_key, self.jobs_key],
+            args=[limit, int(settings.RESULT_POLLER_CLAIM_TTL * 1000)],
+        )
+        return [json.loads(job) for job in jobs]
+
+    def reschedule(self, job: typing.Dict[str, typing.Any], delay: float) -> None:
+        """
+        保存上游任务的最新信息并安排下次轮询
+
+        Args:
+            job: 上游任务信息
+            delay: 距下次轮询的时间（秒）
+        """
+        self.register(job, delay)
+
+    def finish(self, task_uuid: str) -> None:
+        """
+        上游任务已得到最终结果，移出登记表
+
+        Args:
+            task_uuid: 上游任务UUID
+        """
+        pipe = self.client.pipeline(transaction=True)
+        pipe.zrem(self.due_key, task_uuid)
+        pipe.hdel(self.jobs_key, task_uuid)
+        pipe.execute()
+
+    def get_status(self) -> typing.Dict[str, typing.Any]:
+        """
+        获取登记表状态
+
+        Returns:
+            未完成的上游任务数量、已到轮询时间的数量和最早的下次轮询时间
+        """
+        now_ms = int(time.time() * 1000)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zcard(self.due_key)
+        pipe.zcount(self.due_key, "-inf", now_ms)
+        pipe.zrange(self.due_key, 0, 0, withscores=True)
+        outstanding, due, first = pipe.execute()
+        return {
+            "outstanding": outstanding,
+            "due": due,
+            "next_poll_in": round((first[0][1] - now_ms) / 1000, 3) if first else None,
+        }
+
+
+# 单例模式
+_poll_registry_instance: typing.Optional[PollRegistry] = None
+
+
+def get_poll_registry() -> PollRegistry:
+    """
+    获取上游任务轮询登记表实例（单例模式）
+
+    Returns:
+        轮询登记表实例
+    """
+    global _poll_registry_instance
+    if _poll_registry_instance is None:
+        _poll_registry_instance = PollRegistry()
+    return _poll_registry_instance
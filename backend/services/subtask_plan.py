@@ -0,0 +1,390 @@
+"""
+子任务模板计划模块
+
+将任务的提示词和参数预编译为"槽位计划"，用于快速组装每个空间坐标对应的子任务内容
+"""
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Sequence, Tuple, NamedTuple, Callable
+
+from backend.models.db.subtasks import Subtask
+from backend.models.db.tasks import SettingField
+from backend.models.prompt import ConstantPrompt
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+# 可以作为变量的任务参数名称
+CONFIGURABLE_PARAMETER_NAMES: List[str] = [
+    SettingField.RATIO.value,
+    SettingField.SEED.value,
+    SettingField.USER_POLISH.value,
+    SettingField.IS_LUMINA.value,
+    SettingField.LUMINA_MODEL_NAME.value,
+    SettingField.LUMINA_CFG.value,
+    SettingField.LUMINA_STEP.value,
+]
+
+
+# 惰性物化模式下由 (任务ID, 单元格序号) 生成确定性子任务ID所用的命名空间
+CELL_SUBTASK_NAMESPACE = uuid.UUID("6f1c1f5e-5b0a-4c55-9a51-3f0b2d3c7a10")
+
+# 每个进程缓存的任务计划数量
+PLAN_CACHE_SIZE = 64
+
+
+class ActiveVariable(NamedTuple):
+    """
+    代表一个活动变量，仅包含其 ID 和可能的取值。
+    在 `active_variables_list` 中的索引即为其"维度索引"或"增序数字"。
+    """
+    variable_id: str | None     # 此变量在原始Task中的ID
+    possible_values: List[Any]  # 此变量所有可能的取值
+    # 注意：这里不包含如何应用此变量的指令。应用逻辑由槽位计划决定。
+
+
+class PlanDimension(NamedTuple):
+    """
+    计划中的一个维度
+
+    prompt_slot 与 param_name 二者只有一个有值：
+    - prompt_slot: 该维度填充的提示词位置（任务提示词列表中的索引）
+    - param_name: 该维度填充的参数名称
+    values 为该维度所有取值预先转换后的结果，提示词维度为字典（值为空的提示词为None），参数维度为原始值
+    """
+    variable_id: Optional[str]
+    prompt_slot: Optional[int]
+    param_name: Optional[str]
+    values: List[Any]
+
+
+class SubtaskSlotPlan:
+    """
+    子任务槽位计划
+
+    在任务级别只编译一次：确定每个维度对应的槽位，并预先对所有取值执行 model_dump()。
+    之后每个空间坐标只需在 O(维度数) 内通过浅拷贝列表/字典组装子任务内容，
+    不再对模板进行深拷贝，也不再线性查找变量所属的槽位。
+
+    注意：组装结果中的提示词字典在各子任务之间共享，调用方应将其视为只读。
+    """
+
+    def __init__(
+        self,
+        base_prompts: List[Optional[Dict[str, Any]]],
+        base_params: Dict[str, Any],
+        dimensions: List[PlanDimension],
+    ):
+        """
+        初始化槽位计划
+
+        Args:
+            base_prompts: 基础提示词列表，变量提示词位置及值为空的提示词为None
+            base_params: 基础参数字典（固定参数及批量大小）
+            dimensions: 维度列表，顺序与活动变量列表一致
+        """
+        self.base_prompts = base_prompts
+        self.base_params = base_params
+        self.dimensions = dimensions
+        self.prompt_dimensions: List[Tuple[int, int, List[Any]]] = [
+            (index, dim.prompt_slot, dim.values)
+            for index, dim in enumerate(dimensions) if dim.prompt_slot is not None
+        ]
+        self.param_dimensions: List[Tuple[int, str, List[Any]]] = [
+            (index, dim.param_name, dim.values)
+            for index, dim in enumerate(dimensions) if dim.param_name is not None
+        ]
+        # 没有提示词维度时，所有子任务的提示词列表相同
+        self.fixed_prompts: List[Dict[str, Any]] = [p for p in base_prompts if p is not None]
+
+    @property
+    def shape(self) -> List[int]:
+        """各维度的取值数量"""
+        return [len(dim.values) for dim in self.dimensions]
+
+    @property
+    def total_cells(self) -> int:
+        """变量空间中的单元格总数（没有变量时为1）"""
+        total = 1
+        for size in self.shape:
+            total *= size
+        return total
+
+    def decode(self, ordinal: int) -> List[int]:
+        """
+        将单元格序号按混合进制解码为空间坐标
+
+        最后一个维度变化最快，与 `itertools.product` 的遍历顺序一致，
+        因此序号 n 对应的坐标与逐个生成子任务时的第 n 个坐标相同。
+
+        Args:
+            ordinal: 单元格序号，范围 [0, total_cells)
+
+        Returns:
+            空间坐标
+
+        Raises:
+            ValueError: 序号超出范围
+        """
+        if ordinal < 0 or ordinal >= self.total_cells:
+            raise ValueError(f"单元格序号超出范围: {ordinal}")
+        coordinates = [0] * len(self.dimensions)
+        remainder = ordinal
+        for dimension_index in range(len(self.dimensions) - 1, -1, -1):
+            size = len(self.dimensions[dimension_index].values)
+            remainder, coordinates[dimension_index] = divmod(remainder, size)
+        return coordinates
+
+    def param_value(self, coordinates: Sequence[int], param_name: str) -> Any:
+        """
+        获取指定坐标下某个参数的取值（无需组装整个子任务）
+
+        Args:
+            coordinates: 空间坐标
+            param_name: 参数名称
+
+        Returns:
+            参数取值
+        """
+        for dimension_index, name, values in self.param_dimensions:
+            if name == param_name:
+                return values[coordinates[dimension_index]]
+        return self.base_params.get(param_name)
+
+    def count_cells(self, param_name: str, predicate: Callable[[Any], bool]) -> int:
+        """
+        统计某个参数取值满足条件的单元格数量
+
+        Args:
+            param_name: 参数名称
+            predicate: 判断条件
+
+        Returns:
+            满足条件的单元格数量
+        """
+        for dimension_index, name, values in self.param_dimensions:
+            if name == param_name:
+                matched = sum(1 for value in values if predicate(value))
+                return self.total_cells // len(values) * matched
+        return self.total_cells if predicate(self.base_params.get(param_name)) else 0
+
+    def build(self, coordinates: Sequence[int]) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        组装指定空间坐标的子任务提示词和参数
+
+        Args:
+            coordinates: 空间坐标，每个元素为对应维度所选取值的索引
+
+        Returns:
+            (过滤空值后的提示词列表, 参数字典)
+        """
+        if self.prompt_dimensions:
+            prompts = list(self.base_prompts)
+            for dimension_index, slot, values in self.prompt_dimensions:
+                prompts[slot] = values[coordinates[dimension_index]]
+            prompts = [p for p in prompts if p is not None]
+        else:
+            prompts = list(self.fixed_prompts)
+
+        params = dict(self.base_params)
+        for dimension_index, param_name, values in self.param_dimensions:
+            params[param_name] = values[coordinates[dimension_index]]
+
+        return prompts, params
+
+
+def _dump_prompt_if_valid(prompt: Any) -> Optional[Dict[str, Any]]:
+    """
+    将提示词转换为字典，值为空的提示词返回None（组装时会被过滤）
+
+    Args:
+        prompt: 提示词对象
+
+    Returns:
+        提示词字典或None
+    """
+    prompt_dict = prompt.model_dump()
+    value = prompt_dict.get('value')
+    if value is None or value == "":
+        return None
+    return prompt_dict
+
+
+def compile_subtask_plan(task_obj: Any, active_variables_list: Sequence[Any]) -> SubtaskSlotPlan:
+    """
+    根据任务和活动变量列表编译子任务槽位计划
+
+    Args:
+        task_obj: 任务对象
+        active_variables_list: 活动变量列表（包含 variable_id 和 possible_values）
+
+    Returns:
+        子任务槽位计划
+
+    Raises:
+        ValueError: 变量提示词的取值类型不正确，或存在未被任何维度填充的变量提示词
+    """
+    # 基础提示词：固定提示词预先转换，变量提示词位置留空
+    base_prompts: List[Optional[Dict[str, Any]]] = [None] * len(task_obj.prompts)
+    prompt_slot_by_variable: Dict[str, int] = {}
+    for i, prompt_in_task in enumerate(task_obj.prompts):
+        if prompt_in_task.is_variable:
+            # variable_id 在 prompts 中是唯一的，保留第一次出现的位置
+            prompt_slot_by_variable.setdefault(prompt_in_task.variable_id, i)
+        else:
+            base_prompts[i] = _dump_prompt_if_valid(prompt_in_task)
+
+    # 基础参数：固定参数直接取值
+    base_params: Dict[str, Any] = {}
+    param_by_variable: Dict[str, str] = {}
+    for param_name in CONFIGURABLE_PARAMETER_NAMES:
+        param_task_model = getattr(task_obj, param_name)
+        if param_task_model.is_variable:
+            param_by_variable.setdefault(param_task_model.variable_id, param_name)
+        else:
+            base_params[param_name] = param_task_model.value
+    base_params[SettingField.BATCH_SIZE.value] = task_obj.batch_size.value
+
+    dimensions: List[PlanDimension] = []
+    filled_prompt_slots = set()
+    for active_var in active_variables_list:
+        variable_id = active_var.variable_id
+        if variable_id in prompt_slot_by_variable:
+            slot = prompt_slot_by_variable[variable_id]
+            for value in active_var.possible_values:
+                if not isinstance(value, ConstantPrompt):
+                    logger.error(f"Mismatched type for prompt variable {variable_id}. Expected ConstantPrompt, got {type(value)}")
+                    raise ValueError(f"变量提示词 {variable_id} 的取值类型不正确")
+            dimensions.append(PlanDimension(
+                variable_id=variable_id,
+                prompt_slot=slot,
+                param_name=None,
+                values=[_dump_prompt_if_valid(value) for value in active_var.possible_values],
+            ))
+            filled_prompt_slots.add(slot)
+        elif variable_id in param_by_variable:
+            dimensions.append(PlanDimension(
+                variable_id=variable_id,
+                prompt_slot=None,
+                param_name=param_by_variable[variable_id],
+                values=list(active_var.possible_values),
+            ))
+        else:
+            logger.warning(f"Task {task_obj.id}: Variable ID '{variable_id}' from active_variables_list "
+                           f"was not found or applied to any part of the subtask template.")
+            # 保持维度索引不变，该维度的取值不会应用到子任务
+            dimensions.append(PlanDimension(
+                variable_id=variable_id,
+                prompt_slot=None,
+                param_name=None,
+                values=list(active_var.possible_values),
+            ))
+
+    missing_vars = [
+        prompt.variable_id for i, prompt in enumerate(task_obj.prompts)
+        if prompt.is_variable and i not in filled_prompt_slots
+    ]
+    if missing_vars:
+        logger.error(f"任务 {task_obj.id}: 部分变量提示词未被填充: {missing_vars}")
+        raise ValueError("逻辑错误：并非所有变量提示词槽都为子任务填充完毕。")
+
+    return SubtaskSlotPlan(base_prompts, base_params, dimensions)
+
+
+def collect_active_variables(task_obj: Any) -> List[ActiveVariable]:
+    """
+    按维度顺序收集任务的活动变量（先提示词变量，再可配置参数变量）
+
+    顺序与任务提交时生成 variables_map 的顺序一致。
+
+    Args:
+        task_obj: 任务对象
+
+    Returns:
+        活动变量列表
+    """
+    active_variables_list: List[ActiveVariable] = []
+    for prompt_in_task in task_obj.prompts:
+        if prompt_in_task.is_variable:
+            active_variables_list.append(ActiveVariable(prompt_in_task.variable_id, prompt_in_task.variable_values))
+    for param_name in CONFIGURABLE_PARAMETER_NAMES:
+        param_task_model = getattr(task_obj, param_name)
+        if param_task_model.is_variable:
+            active_variables_list.append(ActiveVariable(param_task_model.variable_id, param_task_model.variable_values))
+    return active_variables_list
+
+
+_plan_cache: "OrderedDict[str, SubtaskSlotPlan]" = OrderedDict()
+_plan_cache_lock = threading.Lock()
+
+
+def get_task_plan(task_obj: Any) -> SubtaskSlotPlan:
+    """
+    获取任务的槽位计划（进程内缓存）
+
+    任务提交后提示词和参数不再变化，因此每个进程对同一个任务只需编译一次。
+
+    Args:
+        task_obj: 任务对象
+
+    Returns:
+        子任务槽位计划
+    """
+    task_key = str(task_obj.id)
+    with _plan_cache_lock:
+        plan = _plan_cache.get(task_key)
+        if plan is not None:
+            _plan_cache.move_to_end(task_key)
+            return plan
+
+    plan = compile_subtask_plan(task_obj, collect_active_variables(task_obj))
+
+    with _plan_cache_lock:
+        _plan_cache[task_key] = plan
+        while len(_plan_cache) > PLAN_CACHE_SIZE:
+            _plan_cache.popitem(last=False)
+    return plan
+
+
+def cell_subtask_id(task_id: Any, ordinal: int) -> uuid.UUID:
+    """
+    生成惰性物化单元格对应的确定性子任务ID
+
+    同一单元格重复执行（重试、重复投递）时得到相同的ID，写入结果时可以按ID覆盖。
+
+    Args:
+        task_id: 任务ID
+        ordinal: 单元格序号
+
+    Returns:
+        子任务ID
+    """
+    return uuid.uuid5(CELL_SUBTASK_NAMESPACE, f"{task_id}:{ordinal}")
+
+
+def build_cell_subtask(task_obj: Any, plan: SubtaskSlotPlan, ordinal: int) -> Subtask:
+    """
+    在领取时物化单元格对应的子任务（不保存到数据库）
+
+    Args:
+        task_obj: 任务对象
+        plan: 子任务槽位计划
+        ordinal: 单元格序号
+
+    Returns:
+        未保存的子任务对象
+    """
+    coordinates = plan.decode(ordinal)
+    prompts, params = plan.build(coordinates)
+    return Subtask(
+        id=cell_subtask_id(task_obj.id, ordinal),
+        task=task_obj,
+        variable_indices=coordinates,
+        prompts=prompts,
+        started_at=datetime.now(),
+        **params
+    )
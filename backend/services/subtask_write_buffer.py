@@ -0,0 +1,308 @@
+"""
+子任务状态延迟写入模块
+
+子任务每次状态变化（处理中、已完成、失败、已取消）原本都是一次读取加一次整行保存。
+启用 SUBTASK_WRITE_BUFFER_ENABLED 后，状态、结果、错误信息和时间戳的变化先在进程内按子任务合并，
+由后台线程每隔 SUBTASK_WRITE_BUFFER_INTERVAL_MS 毫秒或积累 SUBTASK_WRITE_BUFFER_MAX_ROWS 行时
+用一条 UPDATE ... FROM (VALUES ...) 语句批量写入。进程退出前（工作进程关闭回调和atexit）会写入剩余的变化。
+随状态变化登记的发件箱事件与同一批UPDATE在一个事务中写入，写入失败时一起放回缓冲区；
+写入成功后再按子任务的最终状态更新所属任务的进度计数。
+
+延迟写入可能晚于其他进程对同一子任务的写入，因此只在行的 updated_at 不晚于缓冲区中的值时写入；
+写入失败放回缓冲区的非结束状态（如处理中）也不会覆盖期间已写入的结束状态。没有写入的行不更新进度计数。
+
+子任务消息在Actor返回后就已确认，而状态可能仍在缓冲区中：进程被强制终止（SIGKILL、OOM）时，
+最近 SUBTASK_WRITE_BUFFER_INTERVAL_MS 毫秒内的变化会丢失且消息不会重新投递，子任务停在之前的状态（通常是处理中），
+所属任务不会被判定为完成，需要重新执行这些子任务。任务协调服务的计数校正只能按数据库重建计数，不能恢复丢失的写入。
+正常退出（SIGTERM）时会先写入剩余的变化。
+"""
+import atexit
+import logging
+import os
+import threading
+import typing
+
+from backend.core.config import settings
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 子任务的结束状态
+_TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+
+# 允许延迟写入的列及其在VALUES中的类型
+_COLUMN_TYPES = {
+    "status": "varchar",
+    "error": "text",
+    "result": "text",
+    "error_retry_count": "smallint",
+    "timeout_retry_count": "smallint",
+    "updated_at": "timestamp",
+    "started_at": "timestamp",
+    "completed_at": "timestamp",
+}
+
+
+class SubtaskWriteBuffer:
+    """
+    子任务列更新的进程内缓冲区
+    """
+
+    def __init__(self, interval_ms: int, max_rows: int) -> None:
+        """
+        初始化缓冲区
+
+        Args:
+            interval_ms: 写入间隔（毫秒）
+            max_rows: 积累到多少行时立即写入
+        """
+        self.interval = interval_ms / 1000
+        self.max_rows = max_rows
+        # 子任务ID -> 待写入的列（同一子任务的多次变化按顺序合并，后写入的值覆盖先写入的值）
+        self._pending: typing.Dict[str, typing.Dict[str, typing.Any]] = {}
+        # 待写入的发件箱事件行
+        self._events: typing.List[typing.Dict[str, typing.Any]] = []
+        # 子任务ID -> 所属任务ID，用于写入后更新进度计数
+        self._task_ids: typing.Dict[str, str] = {}
+        # 写入失败后放回缓冲区的子任务ID，其中的非结束状态不覆盖已写入的结束状态
+        self._requeued: typing.Set[str] = set()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: typing.Optional[threading.Thread] = None
+        self.stats = {"enqueued": 0, "rows_written": 0, "rows_skipped": 0, "statements": 0, "errors": 0}
+
+    def _ensure_thread(self) -> None:
+        """启动后台写入线程"""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="subtask-write-buffer", daemon=True)
+            self._thread.start()
+
+    def enqueue(self, subtask_id: str, fields: typing.Dict[str, typing.Any],
+                event: typing.Optional[typing.Dict[str, typing.Any]] = None,
+                task_id: typing.Optional[str] = None) -> None:
+        """
+        登记子任务的列更新
+
+        Args:
+            subtask_id: 子任务ID
+            fields: 列名 -> 新值，列名必须在 _COLUMN_TYPES 中
+            event: 与这次更新一起写入的发件箱事件行（build_event 构建）
+            task_id: 所属任务ID，状态变化写入后更新该任务的进度计数
+        """
+        unknown = set(fields) - set(_COLUMN_TYPES)
+        if unknown:
+            raise ValueError(f"不支持延迟写入的列: {sorted(unknown)}")
+
+        with self._lock:
+            self._pending.setdefault(str(subtask_id), {}).update(fields)
+            if "status" in fields:
+                # 新登记的状态变化不受放回缓冲区的旧值限制
+                self._requeued.discard(str(subtask_id))
+            if task_id and "status" in fields:
+                self._task_ids[str(subtask_id)] = str(task_id)
+            if event is not None:
+                self._events.append(event)
+            self.stats["enqueued"] += 1
+            pending = len(self._pending)
+            self._ensure_thread()
+        if pending >= self.max_rows:
+            self._wakeup.set()
+
+    def _run(self) -> None:
+        """后台线程：按间隔或行数写入"""
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self) -> int:
+        """
+        立即写入所有待写入的变化
+
+        Returns:
+            写入的行数
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                events, self._events = self._events, []
+                task_ids, self._task_ids = self._task_ids, {}
+                requeued, self._requeued = self._requeued, set()
+            if not pending:
+                return 0
+
+            # 按列组合和是否保护结束状态分组，每组一条语句
+            groups: typing.Dict[typing.Tuple[typing.Tuple[str, ...], bool],
+                                typing.List[typing.Tuple[str, typing.Dict[str, typing.Any]]]] = {}
+            for subtask_id, fields in pending.items():
+                protect_terminal = subtask_id in requeued and fields.get("status") not in _TERMINAL_STATUSES
+                groups.setdefault((tuple(sorted(fields)), protect_terminal), []).append((subtask_id, fields))
+
+            from backend.models.db.subtasks import Subtask
+
+            try:
+                # 状态更新和发件箱事件在同一个事务中写入
+                updated: typing.Set[str] = set()
+                with Subtask._meta.database.atomic():
+                    for (columns, protect_terminal), rows in groups.items():
+                        updated |= self._write(columns, rows, protect_terminal)
+                    # 被更新的写入覆盖、没有写入的子任务不登记结束事件
+                    events = [event for event in events
+                              if "subtask_id" not in event["payload"] or event["payload"]["subtask_id"] in updated]
+                    if events:
+                        from backend.services.outbox import record_events
+                        record_events(events)
+                written = len(updated)
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"批量写入子任务状态失败（{len(pending)}行，下次重试）: {str(e)}")
+                self._requeue(list(pending.items()), events, task_ids)
+                written = 0
+            else:
+                skipped = len(pending) - written
+                if skipped:
+                    self.stats["rows_skipped"] += skipped
+                    logger.info(f"{skipped}个子任务已有更新的状态，跳过延迟写入")
+                self._record_progress({subtask_id: pending[subtask_id] for subtask_id in updated},
+                                      {subtask_id: task_id for subtask_id, task_id in task_ids.items()
+                                       if subtask_id in updated})
+
+            self.stats["rows_written"] += written
+            self._release_connection()
+            return written
+
+    def _write(self, columns: typing.Tuple[str, ...],
+               rows: typing.List[typing.Tuple[str, typing.Dict[str, typing.Any]]],
+               protect_terminal: bool = False) -> typing.Set[str]:
+        """
+        用一条 UPDATE ... FROM (VALUES ...) 语句写入同一列组合的多行
+
+        行的 updated_at 晚于要写入的值时不写入（已有其他进程写入更新的状态）。
+
+        Args:
+            columns: 列名
+            rows: (子任务ID, 列值) 列表
+            protect_terminal: 是否跳过已处于结束状态的行（放回缓冲区的非结束状态）
+
+        Returns:
+            实际写入的子任务ID
+        """
+        from backend.models.db.subtasks import Subtask
+
+        meta = Subtask._meta
+        db_columns = [meta.fields[name].column_name for name in columns]
+        placeholders = ", ".join(["%s::uuid"] + [f"%s::{_COLUMN_TYPES[name]}" for name in columns])
+        values_sql = ", ".join(f"({placeholders})" for _ in rows)
+        set_sql = ", ".join(f'"{column}" = v."{column}"' for column in db_columns)
+        alias_sql = ", ".join(["id"] + [f'"{column}"' for column in db_columns])
+
+        pk_column = meta.primary_key.column_name
+        conditions = [f's."{pk_column}" = v.id']
+        if "updated_at" in columns:
+            updated_at_column = meta.fields["updated_at"].column_name
+            conditions.append(f'(s."{updated_at_column}" IS NULL OR s."{updated_at_column}" <= v."{updated_at_column}")')
+        params: typing.List[typing.Any] = []
+        if protect_terminal:
+            status_column = meta.fields["status"].column_name
+            conditions.append(f's."{status_column}" NOT IN ({", ".join(["%s"] * len(_TERMINAL_STATUSES))})')
+
+        sql = (
+            f'UPDATE "{meta.table_name}" AS s SET {set_sql} '
+            f'FROM (VALUES {values_sql}) AS v({alias_sql}) '
+            f'WHERE {" AND ".join(conditions)} '
+            f'RETURNING s."{pk_column}"'
+        )
+        for subtask_id, fields in rows:
+            params.append(subtask_id)
+            params.extend(fields[name] for name in columns)
+        if protect_terminal:
+            params.extend(_TERMINAL_STATUSES)
+
+        cursor = meta.database.execute_sql(sql, params)
+        self.stats["statements"] += 1
+        return {str(row[0]) for row in cursor.fetchall()}
+
+    def _requeue(self, rows: typing.List[typing.Tuple[str, typing.Dict[str, typing.Any]]],
+                 events: typing.List[typing.Dict[str, typing.Any]],
+                 task_ids: typing.Dict[str, str]) -> None:
+        """写入失败的行和事件放回缓冲区，期间登记的新变化优先"""
+        with self._lock:
+            for subtask_id, fields in rows:
+                newer = self._pending.get(subtask_id, {})
+                if "status" not in newer:
+                    # 放回的状态再次写入时可能已被其他进程改为结束状态
+                    self._requeued.add(subtask_id)
+                self._pending[subtask_id] = {**fields, **newer}
+            self._events[:0] = events
+            self._task_ids = {**task_ids, **self._task_ids}
+
+    @staticmethod
+    def _record_progress(pending: typing.Dict[str, typing.Dict[str, typing.Any]],
+                         task_ids: typing.Dict[str, str]) -> None:
+        """按任务分组，用子任务合并后的最终状态更新进度计数并发布结束的子任务"""
+        if not task_ids:
+            return
+        from backend.services.task_events import publish_subtask_updates
+        from backend.services.task_progress import record_subtask_statuses
+
+        by_task: typing.Dict[str, typing.Dict[str, typing.Dict[str, typing.Any]]] = {}
+        for subtask_id, task_id in task_ids.items():
+            by_task.setdefault(task_id, {})[subtask_id] = pending[subtask_id]
+        for task_id, updates in by_task.items():
+            record_subtask_statuses(task_id, {subtask_id: fields["status"] for subtask_id, fields in updates.items()})
+            publish_subtask_updates(task_id, updates)
+
+    @staticmethod
+    def _release_connection() -> None:
+        """后台线程写入后把连接归还连接池"""
+        try:
+            from backend.db.pool import release_connection
+            release_connection()
+        except Exception as e:
+            logger.warning(f"归还数据库连接失败: {str(e)}")
+
+    def close(self) -> None:
+        """停止后台线程并写入剩余的变化"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=self.interval + 5)
+        written = self.flush()
+        if written:
+            logger.info(f"子任务状态缓冲区关闭前写入 {written} 行")
+        logger.info(f"子任务状态缓冲区统计: {self.stats}")
+
+
+# 单例模式（按进程）
+_subtask_write_buffer_instance: typing.Optional[SubtaskWriteBuffer] = None
+_subtask_write_buffer_pid: typing.Optional[int] = None
+_subtask_write_buffer_lock = threading.Lock()
+
+
+def get_subtask_write_buffer() -> SubtaskWriteBuffer:
+    """
+    获取当前进程的子任务状态缓冲区（单例模式）
+
+    Returns:
+        子任务状态缓冲区
+    """
+    global _subtask_write_buffer_instance, _subtask_write_buffer_pid
+    with _subtask_write_buffer_lock:
+        if _subtask_write_buffer_instance is None or _subtask_write_buffer_pid != os.getpid():
+            _subtask_write_buffer_instance = SubtaskWriteBuffer(
+                settings.SUBTASK_WRITE_BUFFER_INTERVAL_MS,
+                settings.SUBTASK_WRITE_BUFFER_MAX_ROWS,
+            )
+            _subtask_write_buffer_pid = os.getpid()
+            atexit.register(_subtask_write_buffer_instance.close)
+    return _subtask_write_buffer_instance
+
+
+def flush_subtask_write_buffer() -> None:
+    """
+    关闭当前进程的子任务状态缓冲区并写入剩余的变化（未创建缓冲区时不做处理）
+    """
+    if _subtask_write_buffer_instance is not None and _subtask_write_buffer_pid == os.getpid():
+        _subtask_write_buffer_instance.close()
@@ -0,0 +1,322 @@
+"""
+任务事件推送模块
+
+前端原来定时轮询任务列表、统计和进度接口，每次轮询都要查询数据库。启用 TASK_EVENTS_ENABLED 后，
+子任务和任务的状态变化写入数据库之后发布到Redis频道，API进程用一个订阅线程接收，
+通过SSE连接（GET /api/v1/test/events）推送给前端，打开再多的页面也不增加数据库查询。
+
+事件（JSON）:
+- task_status: 任务状态变化，data = {"status"}
+- task_progress: 任务进度变化，data = {"completed", "failed", "cancelled", "processed"}，
+  由监控线程或任务协调服务发布时还包含 {"total", "progress"}
+- subtasks: 子任务结束（完成、失败或取消），data = {"subtasks": [{"subtask_id", "status", "result", "error"}]}
+
+发布失败或推送连接积压时事件会丢失，前端收到 resync 事件或重新连接后重新加载一次数据。
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+import typing
+
+from backend.core.config import settings
+from backend.utils.redis_client import get_redis_client
+
+if typing.TYPE_CHECKING:
+    from backend.services.task_progress import TaskProgress
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 事件类型
+EVENT_TASK_STATUS = "task_status"
+EVENT_TASK_PROGRESS = "task_progress"
+EVENT_SUBTASKS = "subtasks"
+
+# 推送的子任务结束状态
+_FINISHED_SUBTASK_STATUSES = ("completed", "failed", "cancelled")
+
+
+def build_task_event(event_type: str, task_id: str, data: typing.Dict[str, typing.Any]) -> typing.Dict[str, typing.Any]:
+    """
+    构建任务事件
+
+    Args:
+        event_type: 事件类型
+        task_id: 任务ID
+        data: 事件数据
+
+    Returns:
+        事件
+    """
+    return {"type": event_type, "task_id": str(task_id), "data": data, "ts": round(time.time(), 3)}
+
+
+def publish_task_events(events: typing.List[typing.Dict[str, typing.Any]]) -> None:
+    """
+    发布任务事件（未启用时不做处理）
+
+    发布失败不影响状态更新，只记录警告。
+
+    Args:
+        events: build_task_event 构建的事件列表
+    """
+    if not settings.TASK_EVENTS_ENABLED or not events:
+        return
+    try:
+        client = get_redis_client()
+        if len(events) == 1:
+            client.publish(settings.TASK_EVENTS_CHANNEL, json.dumps(events[0], default=str))
+            return
+        pipe = client.pipeline(transaction=False)
+        for event in events:
+            pipe.publish(settings.TASK_EVENTS_CHANNEL, json.dumps(event, default=str))
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"发布任务事件失败（{len(events)}个）: {str(e)}")
+
+
+def publish_task_status(task_id: str, status: str) -> None:
+    """
+    发布任务状态变化
+
+    Args:
+        task_id: 任务ID
+        status: 新状态
+    """
+    publish_task_events([build_task_event(EVENT_TASK_STATUS, task_id, {"status": status})])
+
+
+def publish_task_progress(task_id: str, progress: "TaskProgress", total: typing.Optional[int] = None) -> None:
+    """
+    发布任务进度
+
+    Args:
+        task_id: 任务ID
+        progress: 子任务状态计数
+        total: 单元格总数，未知时不发布总数和百分比
+    """
+    data: typing.Dict[str, typing.Any] = {
+        "completed": progress.completed,
+        "failed": progress.failed,
+        "cancelled": progress.cancelled,
+        "processed": progress.processed,
+    }
+    if total:
+        data["total"] = total
+        data["progress"] = int((progress.processed / total) * 100)
+    publish_task_events([build_task_event(EVENT_TASK_PROGRESS, task_id, data)])
+
+
+def publish_subtask_updates(task_id: str, updates: typing.Dict[str, typing.Dict[str, typing.Any]]) -> None:
+    """
+    发布同一任务中结束的子任务（未结束的状态变化不发布）
+
+    Args:
+        task_id: 任务ID
+        updates: 子任务ID -> 写入的列值（至少包含status）
+    """
+    if not settings.TASK_EVENTS_ENABLED:
+        return
+    subtasks = [
+        {
+            "subtask_id": str(subtask_id),
+            "status": fields["status"],
+            "result": fields.get("result"),
+            "error": fields.get("error"),
+        }
+        for subtask_id, fields in updates.items()
+        if fields.get("status") in _FINISHED_SUBTASK_STATUSES
+    ]
+    if subtasks:
+        publish_task_events([build_task_event(EVENT_SUBTASKS, task_id, {"subtasks": subtasks})])
+
+
+def format_sse(event_type: str, data: str) -> str:
+    """
+    格式化一条SSE消息
+
+    Args:
+        event_type: 事件类型
+        data: 事件数据（单行JSON）
+
+    Returns:
+        SSE消息
+    """
+    return f"event: {event_type}\ndata: {data}\n\n"
+
+
+class _Subscriber:
+    """一个SSE连接的事件队列"""
+
+    def __init__(self, task_ids: typing.Optional[typing.Set[str]]) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=settings.TASK_EVENTS_QUEUE_SIZE)
+        self.task_ids = task_ids
+        self.overflowed = False
+
+    def offer(self, message: str) -> None:
+        """在连接所在的事件循环中放入消息，队列已满时标记积压并丢弃"""
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class TaskEventHub:
+    """
+    API进程内的任务事件分发
+
+    一个后台线程订阅Redis频道，把事件分发给本进程的所有SSE连接，没有连接时线程退出。
+    """
+
+    def __init__(self) -> None:
+        """初始化事件分发"""
+        self.channel = settings.TASK_EVENTS_CHANNEL
+        self._subscribers: typing.Set[_Subscriber] = set()
+        self._lock = threading.Lock()
+        self._thread: typing.Optional[threading.Thread] = None
+        self.stats = {"received": 0, "delivered": 0, "overflows": 0, "reconnects": 0}
+
+    def subscribe(self, task_ids: typing.Optional[typing.Iterable[str]] = None) -> _Subscriber:
+        """
+        登记一个连接（需要在事件循环中调用）
+
+        Args:
+            task_ids: 只接收这些任务的事件，为空时接收所有任务的事件
+
+        Returns:
+            连接的事件队列
+        """
+        subscriber = _Subscriber(set(task_ids) if task_ids else None)
+        with self._lock:
+            self._subscribers.add(subscriber)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._listen, name="task-event-hub", daemon=True)
+                self._thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber: _Subscriber) -> None:
+        """
+        移除连接
+
+        Args:
+            subscriber: subscribe 返回的事件队列
+        """
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def _listen(self) -> None:
+        """订阅线程：接收事件并分发，没有连接时退出"""
+        logger.info(f"任务事件订阅线程已启动，频道: {self.channel}")
+        while True:
+            pubsub = None
+            try:
+                pubsub = get_redis_client().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                while True:
+                    with self._lock:
+                        if not self._subscribers:
+                            self._thread = None
+                            logger.info("没有推送连接，任务事件订阅线程退出")
+                            return
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message["type"] == "message":
+                        self._dispatch(message["data"])
+            except Exception as e:
+                self.stats["reconnects"] += 1
+                logger.warning(f"任务事件订阅出错，1秒后重新订阅: {str(e)}")
+                time.sleep(1)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+
+    def _dispatch(self, raw: typing.Union[bytes, str]) -> None:
+        """把一条事件交给关注该任务的连接"""
+        data = raw.decode() if isinstance(raw, bytes) else raw
+        try:
+            event = json.loads(data)
+        except ValueError:
+            logger.warning(f"忽略无法解析的任务事件: {data[:200]}")
+            return
+        self.stats["received"] += 1
+
+        message = format_sse(event.get("type", "message"), data)
+        task_id = event.get("task_id")
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            if subscriber.task_ids is not None and task_id not in subscriber.task_ids:
+                continue
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber.offer, message)
+                self.stats["delivered"] += 1
+            except RuntimeError:
+                # 事件循环已关闭
+                self.unsubscribe(subscriber)
+
+    async def stream(self, task_ids: typing.Optional[typing.Iterable[str]] = None) -> typing.AsyncIterator[str]:
+        """
+        生成一个SSE连接的消息，连接断开时移除
+
+        先发送 ready 事件，之后转发任务事件，空闲时发送心跳注释；
+        连接积压时丢弃积压的事件并发送 resync 事件，前端收到后重新加载。
+
+        Args:
+            task_ids: 只接收这些任务的事件，为空时接收所有任务的事件
+
+        Yields:
+            SSE消息
+        """
+        subscriber = self.subscribe(task_ids)
+        try:
+            yield "retry: 3000\n" + format_sse("ready", "{}")
+            while True:
+                if subscriber.overflowed:
+                    self.stats["overflows"] += 1
+                    while not subscriber.queue.empty():
+                        subscriber.queue.get_nowait()
+                    subscriber.overflowed = False
+                    yield format_sse("resync", "{}")
+                try:
+                    message = await asyncio.wait_for(subscriber.queue.get(), timeout=settings.TASK_EVENTS_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                yield message
+        finally:
+            self.unsubscribe(subscriber)
+
+    def get_status(self) -> typing.Dict[str, typing.Any]:
+        """
+        获取分发状态
+
+        Returns:
+            本进程的连接数量和分发统计
+        """
+        with self._lock:
+            connections = len(self._subscribers)
+        return {"connections": connections, **self.stats}
+
+
+# 单例模式
+_task_event_hub_instance: typing.Optional[TaskEventHub] = None
+
+
+def get_task_event_hub() -> TaskEventHub:
+    """
+    获取任务事件分发实例（单例模式）
+
+    Returns:
+        任务事件分发实例
+    """
+    global _task_event_hub_instance
+    if _task_event_hub_instance is None:
+        _task_event_hub_instance = TaskEventHub()
+    return _task_event_hub_instance
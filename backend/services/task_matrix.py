@@ -0,0 +1,279 @@
+"""
+任务矩阵服务模块
+
+根据任务的 variables_map 和子任务列表组装矩阵数据（变量定义 + 坐标映射），供矩阵接口和基准测试使用。
+本模块只做数据组装，不访问数据库。
+"""
+import itertools
+import json
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 使用v*变量结构的特殊用户
+SPECIAL_USER_ID = "33a5e309-4569-452e-88be-7155bc87488f"
+
+
+def _variable_sort_key(var_key: str) -> int:
+    """按v0, v1, v2...的顺序排序变量键"""
+    return int(var_key[1:]) if var_key.startswith('v') and var_key[1:].isdigit() else 999
+
+
+def normalize_variables_for_frontend(variables_map: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    统一变量格式，确保前端能够正确显示
+
+    Args:
+        variables_map: 原始变量映射
+
+    Returns:
+        标准化后的变量映射
+    """
+    normalized = {}
+
+    # 按变量键排序，确保v0, v1, v2...的顺序
+    for var_key in sorted(variables_map.keys(), key=_variable_sort_key):
+        var_info = variables_map[var_key]
+
+        # 处理变量值
+        values = []
+        for i, value_item in enumerate(var_info.get("values", [])):
+            if isinstance(value_item, dict):
+                values.append({
+                    "id": value_item.get("id", str(i)),
+                    "value": str(value_item.get("value", "")),
+                    "type": value_item.get("type", "prompt")
+                })
+            else:
+                # 如果是简单值，转换为标准格式
+                values.append({
+                    "id": str(i),
+                    "value": str(value_item),
+                    "type": "prompt"
+                })
+
+        # 确保每个变量都有完整的结构
+        normalized[var_key] = {
+            "name": var_info.get("name", f"变量{var_key[1:]}"),
+            "type": "prompt",  # 默认类型
+            "values": values,
+            "values_count": len(values),
+            "tag_id": var_info.get("tag_id")
+        }
+
+    return normalized
+
+
+def calculate_total_combinations(variables_map: Dict[str, Any]) -> int:
+    """
+    计算变量的总组合数
+
+    Args:
+        variables_map: 变量映射
+
+    Returns:
+        总组合数
+    """
+    total = 1
+    for var_info in variables_map.values():
+        total *= var_info.get("values_count", 1)
+    return total
+
+
+def build_matrix_variables(task_variables_map: Dict[str, Any], user_id: Optional[str]) -> Dict[str, Any]:
+    """
+    从任务的 variables_map 解析变量定义
+
+    Args:
+        task_variables_map: 任务的 variables_map
+        user_id: 任务所属用户ID，特殊用户使用v*结构，其他用户使用dramatiq设计的数据结构
+
+    Returns:
+        变量键(v0, v1...) -> 变量名称、取值列表、取值数量和标签ID
+    """
+    variables_map = {}
+
+    if user_id == SPECIAL_USER_ID:
+        # 特殊用户：使用v*结构
+        for var_key, var_info in task_variables_map.items():
+            if not var_key.startswith('v'):
+                continue
+
+            variable_name = var_info.get("name", "")
+            variable_type = var_info.get("type", "")
+
+            # 构建变量值列表
+            values = []
+            for i, value in enumerate(var_info.get("values", [])):
+                if isinstance(value, dict):
+                    # 如果是字典，提取相关字段
+                    values.append({
+                        "id": value.get("id", str(i)),
+                        "value": str(value.get("value", "")),
+                        "type": value.get("type", variable_type)
+                    })
+                else:
+                    # 如果是简单值
+                    values.append({"id": str(i), "value": str(value), "type": variable_type})
+
+            if variable_name and variable_name.strip():
+                variables_map[var_key] = {
+                    "name": variable_name,
+                    "values": values,
+                    "values_count": len(values),
+                    "tag_id": var_info.get("id")
+                }
+        return variables_map
+
+    # 其他用户：使用dramatiq设计的数据结构
+    for dimension_index, var_info in task_variables_map.items():
+        # 如果已经是v0, v1格式，直接使用，否则构建v{index}格式
+        if isinstance(dimension_index, str) and dimension_index.startswith('v'):
+            var_key = dimension_index
+        else:
+            var_key = f"v{dimension_index}"
+
+        variable_id = var_info.get("variable_id")
+        variable_name = var_info.get("variable_name", "")
+        variable_type = var_info.get("variable_type", "")
+
+        # 构建变量值列表：提示词类型取 value 字段，参数类型直接使用简单值
+        values = [
+            {
+                "id": str(i),
+                "value": str(value.get("value", "")) if isinstance(value, dict) else str(value),
+                "type": variable_type
+            }
+            for i, value in enumerate(var_info.get("values", []))
+        ]
+
+        # 只有当变量名不为空时使用变量名；变量名为空但有值时使用默认名称
+        if variable_name and variable_name.strip():
+            name = variable_name
+        elif values:
+            name = f"变量{dimension_index}"
+        else:
+            continue
+        variables_map[var_key] = {
+            "name": name,
+            "values": values,
+            "values_count": len(values),
+            "tag_id": variable_id
+        }
+    return variables_map
+
+
+def _cell_result(subtask: Any) -> Tuple[str, str]:
+    """
+    获取单元格显示的结果：优先使用result，如果为空则使用error字段
+
+    Returns:
+        (显示值, 结果类型)，结果类型为 with_result、with_error 或 empty
+    """
+    if subtask.result is not None and subtask.result.strip():
+        return subtask.result.strip(), "with_result"
+    error = getattr(subtask, 'error', None)
+    if error is not None and error.strip():
+        # 将错误信息以特定格式传递，前端可以识别这是错误信息
+        return f"ERROR: {error.strip()}", "with_error"
+    return "", "empty"
+
+
+def build_task_matrix(task: Any, subtasks: Iterable[Any]) -> Dict[str, Any]:
+    """
+    组装任务的矩阵数据
+
+    空间坐标系构成说明：
+    1. 每个子任务通过variable_indices定义其在多维空间中的坐标位置，如 [0,0,0,1,1,2]
+    2. 坐标键为逗号分隔的索引值，如 "0,0,0,1,1,2"
+    3. 先按变量定义生成从原点开始的完整坐标矩阵（默认为空字符串），再用子任务数据覆盖
+
+    Args:
+        task: 任务对象
+        subtasks: 任务的子任务
+
+    Returns:
+        矩阵数据，包含变量定义、坐标映射和统计
+    """
+    subtasks = list(subtasks)
+
+    # 构建变量定义 - 只从 variables_map 解析
+    task_variables_map = task.variables_map
+    if isinstance(task_variables_map, str):
+        try:
+            task_variables_map = json.loads(task_variables_map)
+        except json.JSONDecodeError as e:
+            logger.error(f"解析variables_map JSON失败: {e}")
+
+    if task_variables_map:
+        user_id = str(task.user.id) if task.user else None
+        variables_map = build_matrix_variables(task_variables_map, user_id)
+    else:
+        logger.warning(f"Task {task.id} variables_map 为空或不存在")
+        variables_map = {}
+
+    normalized_variables = normalize_variables_for_frontend(variables_map)
+
+    # 首先根据变量定义生成所有可能的坐标组合（跳过没有取值的维度）
+    coordinates_by_indices: Dict[str, Any] = {}
+    dimension_ranges = [
+        range(var_info["values_count"])
+        for var_info in normalized_variables.values()
+        if var_info["values_count"] > 0
+    ]
+    if dimension_ranges:
+        coordinates_by_indices = dict.fromkeys(
+            (",".join(map(str, coordinate)) for coordinate in itertools.product(*dimension_ranges)), ""
+        )
+
+    # 然后用实际的子任务数据填充坐标映射，同时统计不同类型的结果
+    result_stats = {"with_result": 0, "with_error": 0, "empty": 0}
+    for subtask in subtasks:
+        if not subtask.variable_indices:
+            logger.warning(f"子任务 {subtask.id} 没有variable_indices，跳过坐标映射")
+            continue
+
+        result_value, value_type = _cell_result(subtask)
+        result_stats[value_type] += 1
+
+        # 对于无效索引，停止添加以保持坐标的连续性
+        coordinate_parts: List[str] = []
+        for idx in subtask.variable_indices:
+            if idx is None or idx < 0:
+                break
+            coordinate_parts.append(str(idx))
+
+        if not coordinate_parts:
+            logger.warning(f"子任务 {subtask.id} 的variable_indices无有效坐标: {subtask.variable_indices}")
+            continue
+
+        # 更新坐标映射（覆盖默认的空值），包含子任务ID和评分信息
+        coordinates_by_indices[",".join(coordinate_parts)] = {
+            "url": result_value,
+            "subtask_id": str(subtask.id),
+            "status": subtask.status,
+            "rating": getattr(subtask, 'rating', 0),
+            "evaluation": getattr(subtask, 'evaluation', []),
+            "variable_indices": subtask.variable_indices,
+            "created_at": subtask.created_at.isoformat() if subtask.created_at else None,
+            "completed_at": subtask.completed_at.isoformat() if subtask.completed_at else None
+        }
+
+    logger.info(f"坐标系构建完成，共生成 {len(coordinates_by_indices)} 个坐标映射")
+
+    return {
+        "task_id": str(task.id),
+        "task_name": task.name,
+        "created_at": task.created_at.isoformat(),
+        "variables_map": normalized_variables,
+        "coordinates_by_indices": coordinates_by_indices,
+        "summary": {
+            "total_variables": len(normalized_variables),
+            "total_combinations": calculate_total_combinations(normalized_variables),
+            "total_subtasks": len(subtasks),
+            "mapped_coordinates": len(coordinates_by_indices),
+            "result_statistics": result_stats
+        }
+    }
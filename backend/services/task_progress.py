@@ -0,0 +1,331 @@
+"""
+任务进度计数模块
+
+任务进度、完成检查和子任务统计原本都要读出任务的全部子任务行（包括提示词JSON），在Python中按状态计数。
+启用 TASK_PROGRESS_COUNTERS_ENABLED 后，子任务状态每次变化（写入数据库之后）都在Redis中按任务计数：
+一个哈希表记录每个子任务最近的状态，一个哈希表记录已完成/失败/已取消的数量，
+两者由同一个Lua脚本更新，重复上报同一状态不会重复计数，失败后重试成功时从失败数移到完成数。
+进度和完成检查只读取计数，计数缺失（如启用前已开始的任务）或长时间没有变化时按子任务的ID和状态两列重建。
+未启用时按状态分组计数（GROUP BY），同样不读取子任务行。
+"""
+import logging
+import time
+import typing
+
+from backend.core.config import settings
+from backend.models.db.subtasks import Subtask, SubtaskStatus
+from backend.services.task_events import publish_task_progress
+from backend.utils.redis_client import get_redis_client
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 计入进度的结束状态
+FINISHED_STATUSES = (SubtaskStatus.COMPLETED.value, SubtaskStatus.FAILED.value, SubtaskStatus.CANCELLED.value)
+
+# 重建时每次提交给脚本的子任务数量
+_REBUILD_CHUNK_SIZE = 1000
+
+# 记录子任务状态：状态有变化时更新子任务状态表，并把计数从旧状态移到新状态
+_RECORD_SCRIPT = """
+local counts_key = KEYS[1]
+local statuses_key = KEYS[2]
+local ttl = tonumber(ARGV[1])
+local finished = {completed = true, failed = true, cancelled = true}
+
+for i = 2, #ARGV, 2 do
+    local subtask_id = ARGV[i]
+    local status = ARGV[i + 1]
+    local previous = redis.call('HGET', statuses_key, subtask_id)
+    if previous ~= status then
+        redis.call('HSET', statuses_key, subtask_id, status)
+        if previous and finished[previous] then
+            redis.call('HINCRBY', counts_key, previous, -1)
+        end
+        if finished[status] then
+            redis.call('HINCRBY', counts_key, status, 1)
+        end
+    end
+end
+
+local time = redis.call('TIME')
+redis.call('HSET', counts_key, 'updated_at', time[1])
+redis.call('EXPIRE', counts_key, ttl)
+redis.call('EXPIRE', statuses_key, ttl)
+return redis.call('HMGET', counts_key, 'completed', 'failed', 'cancelled', 'updated_at')
+"""
+
+
+class TaskProgress(typing.NamedTuple):
+    """任务的子任务状态计数"""
+    completed: int = 0
+    failed: int = 0
+    cancelled: int = 0
+    updated_at: typing.Optional[float] = None  # 计数最近一次变化的时间（Unix时间戳），按数据库计数时为None
+
+    @property
+    def processed(self) -> int:
+        """已处理（完成、失败或取消）的子任务数量"""
+        return self.completed + self.failed + self.cancelled
+
+
+def _parse_counts(values: typing.List[typing.Any]) -> TaskProgress:
+    """把 HMGET completed failed cancelled updated_at 的结果转换为计数"""
+    completed, failed, cancelled, updated_at = values
+    return TaskProgress(
+        completed=int(completed or 0),
+        failed=int(failed or 0),
+        cancelled=int(cancelled or 0),
+        updated_at=float(updated_at) if updated_at is not None else None,
+    )
+
+
+class TaskProgressCounter:
+    """基于Redis的任务进度计数"""
+
+    def __init__(self) -> None:
+        """初始化进度计数"""
+        self.client = get_redis_client()
+        self.key_prefix = settings.TASK_PROGRESS_KEY_PREFIX
+        self.record_script = self.client.register_script(_RECORD_SCRIPT)
+
+    def _counts_key(self, task_id: str) -> str:
+        return f"{self.key_prefix}:{task_id}"
+
+    def _statuses_key(self, task_id: str) -> str:
+        return f"{self.key_prefix}:{task_id}:subtasks"
+
+    def record(self, task_id: str, statuses: typing.Dict[str, str]) -> TaskProgress:
+        """
+        记录子任务的最新状态
+
+        Args:
+            task_id: 任务ID
+            statuses: 子任务ID -> 状态
+
+        Returns:
+            记录后的计数
+        """
+        task_id = str(task_id)
+        args: typing.List[typing.Any] = [settings.TASK_PROGRESS_TTL]
+        for subtask_id, status in statuses.items():
+            args.extend((str(subtask_id), status))
+        values = self.record_script(keys=[self._counts_key(task_id), self._statuses_key(task_id)], args=args)
+        return _parse_counts(values)
+
+    def get(self, task_id: str) -> typing.Optional[TaskProgress]:
+        """
+        读取任务的计数
+
+        Args:
+            task_id: 任务ID
+
+        Returns:
+            计数，没有计数时返回None
+        """
+        return self.get_many([task_id]).get(str(task_id))
+
+    def get_many(self, task_ids: typing.List[str]) -> typing.Dict[str, TaskProgress]:
+        """
+        用一次往返读取多个任务的计数
+
+        Args:
+            task_ids: 任务ID列表
+
+        Returns:
+            任务ID -> 计数，没有计数的任务不在结果中
+        """
+        task_ids = [str(task_id) for task_id in task_ids]
+        pipe = self.client.pipeline(transaction=False)
+        for task_id in task_ids:
+            pipe.hmget(self._counts_key(task_id), "completed", "failed", "cancelled", "updated_at")
+        return {task_id: _parse_counts(values)
+                for task_id, values in zip(task_ids, pipe.execute()) if values[3] is not None}
+
+    def rebuild(self, task_id: str) -> TaskProgress:
+        """
+        按数据库中子任务的状态校正计数（只读取ID和状态两列）
+
+        与子任务状态的上报并发时，重建读取之后才写入的变化可能被较旧的状态覆盖，
+        计数再次长时间没有变化时会重新校正。
+
+        Args:
+            task_id: 任务ID
+
+        Returns:
+            校正后的计数
+        """
+        task_id = str(task_id)
+        rows = (Subtask.select(Subtask.id, Subtask.status)
+                .where((Subtask.task == task_id) & (Subtask.status != SubtaskStatus.PENDING.value))
+                .tuples())
+        progress = None
+        chunk: typing.Dict[str, str] = {}
+        for subtask_id, status in rows.iterator():
+            chunk[str(subtask_id)] = status
+            if len(chunk) >= _REBUILD_CHUNK_SIZE:
+                progress = self.record(task_id, chunk)
+                chunk = {}
+        if chunk or progress is None:
+            progress = self.record(task_id, chunk)
+        logger.info(f"任务 {task_id} 进度计数已按数据库校正: 完成={progress.completed}, "
+                    f"失败={progress.failed}, 取消={progress.cancelled}")
+        return progress
+
+    def delete(self, task_id: str) -> None:
+        """
+        删除任务的计数
+
+        Args:
+            task_id: 任务ID
+        """
+        task_id = str(task_id)
+        self.client.delete(self._counts_key(task_id), self._statuses_key(task_id))
+
+
+# 单例模式
+_task_progress_counter_instance: typing.Optional[TaskProgressCounter] = None
+
+
+def get_task_progress_counter() -> TaskProgressCounter:
+    """
+    获取任务进度计数实例（单例模式）
+
+    Returns:
+        任务进度计数实例
+    """
+    global _task_progress_counter_instance
+    if _task_progress_counter_instance is None:
+        _task_progress_counter_instance = TaskProgressCounter()
+    return _task_progress_counter_instance
+
+
+def record_subtask_statuses(task_id: str, statuses: typing.Dict[str, str]) -> None:
+    """
+    子任务状态写入数据库后更新所属任务的计数（未启用时不做处理）
+
+    计数更新失败不影响子任务状态，进度检查发现计数长时间没有变化时会按数据库校正。
+    更新后的计数作为任务进度事件发布（启用 TASK_EVENTS_ENABLED 时）。
+
+    Args:
+        task_id: 任务ID
+        statuses: 子任务ID -> 状态
+    """
+    if not settings.TASK_PROGRESS_COUNTERS_ENABLED or not statuses:
+        return
+    try:
+        progress = get_task_progress_counter().record(task_id, statuses)
+    except Exception as e:
+        logger.warning(f"更新任务 {task_id} 进度计数失败: {str(e)}")
+        return
+    publish_task_progress(task_id, progress)
+
+
+def count_subtask_statuses(task_ids: typing.List[str]) -> typing.Dict[str, TaskProgress]:
+    """
+    用一条按任务和状态分组的查询统计多个任务的子任务数量
+
+    Args:
+        task_ids: 任务ID列表
+
+    Returns:
+        任务ID -> 计数
+    """
+    from peewee import fn
+
+    task_ids = [str(task_id) for task_id in task_ids]
+    counts: typing.Dict[str, typing.Dict[str, int]] = {task_id: {} for task_id in task_ids}
+    if task_ids:
+        rows = (Subtask.select(Subtask.task, Subtask.status, fn.COUNT(Subtask.id))
+                .where(Subtask.task.in_(task_ids) & Subtask.status.in_(FINISHED_STATUSES))
+                .group_by(Subtask.task, Subtask.status)
+                .tuples())
+        for task_id, status, count in rows:
+            counts[str(task_id)][status] = count
+    return {
+        task_id: TaskProgress(
+            completed=by_status.get(SubtaskStatus.COMPLETED.value, 0),
+            failed=by_status.get(SubtaskStatus.FAILED.value, 0),
+            cancelled=by_status.get(SubtaskStatus.CANCELLED.value, 0),
+        )
+        for task_id, by_status in counts.items()
+    }
+
+
+def get_task_progress(task_id: str, rebuild_missing: bool = True) -> TaskProgress:
+    """
+    获取任务的子任务状态计数
+
+    启用计数时读取Redis计数：计数缺失时按数据库重建（rebuild_missing为False时改为分组统计，不创建计数）；
+    计数读取失败或未启用计数时在数据库中分组统计。
+
+    Args:
+        task_id: 任务ID
+        rebuild_missing: 计数缺失时是否重建
+
+    Returns:
+        计数
+    """
+    if settings.TASK_PROGRESS_COUNTERS_ENABLED:
+        try:
+            counter = get_task_progress_counter()
+            progress = counter.get(task_id)
+            if progress is not None:
+                return progress
+            if rebuild_missing:
+                return counter.rebuild(task_id)
+        except Exception as e:
+            logger.warning(f"读取任务 {task_id} 进度计数失败，改为在数据库中统计: {str(e)}")
+    return count_subtask_statuses([task_id])[str(task_id)]
+
+
+def get_tasks_progress(task_ids: typing.List[str]) -> typing.Dict[str, TaskProgress]:
+    """
+    批量获取多个任务的子任务状态计数
+
+    启用计数时用一次往返读取Redis计数，计数缺失的任务按数据库重建；
+    计数读取失败或未启用计数时用一条分组查询统计。
+
+    Args:
+        task_ids: 任务ID列表
+
+    Returns:
+        任务ID -> 计数
+    """
+    task_ids = [str(task_id) for task_id in task_ids]
+    if settings.TASK_PROGRESS_COUNTERS_ENABLED and task_ids:
+        try:
+            counter = get_task_progress_counter()
+            progress = counter.get_many(task_ids)
+            for task_id in task_ids:
+                if task_id not in progress:
+                    progress[task_id] = counter.rebuild(task_id)
+            return progress
+        except Exception as e:
+            logger.warning(f"批量读取任务进度计数失败，改为在数据库中统计: {str(e)}")
+    return count_subtask_statuses(task_ids)
+
+
+def refresh_stale_progress(task_id: str, progress: TaskProgress, total: int) -> TaskProgress:
+    """
+    未处理完的任务计数超过 TASK_PROGRESS_RESYNC_INTERVAL 秒没有变化时按数据库校正
+
+    子任务状态已写入数据库但计数更新失败（进程在两者之间退出、Redis暂时不可用）时，
+    计数会停在完成之前，校正后任务才能被判定为完成。
+
+    Args:
+        task_id: 任务ID
+        progress: 当前计数
+        total: 任务的单元格总数
+
+    Returns:
+        计数（未过期时原样返回）
+    """
+    if (progress.updated_at is None or progress.processed >= total
+            or time.time() - progress.updated_at < settings.TASK_PROGRESS_RESYNC_INTERVAL):
+        return progress
+    try:
+        return get_task_progress_counter().rebuild(task_id)
+    except Exception as e:
+        logger.warning(f"校正任务 {task_id} 进度计数失败: {str(e)}")
+        return progress
@@ -8,12 +8,17 @@ from datetime import datetime
 import logging
 
 from backend.models.db.tasks import Task, TaskStatus, MakeApiQueue
-from backend.models.db.subtasks import Subtask, SubtaskStatus
+from backend.models.db.subtasks import SubtaskStatus
 from backend.models.prompt import Prompt, ConstantPrompt
 from backend.models.task_parameter import TaskParameter
 from backend.crud.task import task_crud
 from backend.crud.subtask import subtask_crud
 from backend.utils.feishu import feishu_task_notify
+from backend.services.task_tombstones import mark_task_cancelled
+from backend.services.outbox import record_events, build_task_status_events
+from backend.services.task_progress import get_task_progress
+from backend.services.task_events import publish_task_status
+from backend.services.task_status_stats import invalidate_task_stats
 from backend.core.config import settings
 
 # 配置日志
@@ -206,16 +211,22 @@ def create_task(user_id: str, name: str, settings: Dict[str, Any]) -> Optional[T
         return None
 
 
-def update_task_status(task_id: str, status: str) -> Optional[Task]:
+def update_task_status(task_id: str, status: str, notification: Optional[Dict[str, Any]] = None,
+                       expected_status: Optional[str] = None) -> Optional[Task]:
     """
     更新任务状态
 
+    启用发件箱时，状态变化事件（包括附带的通知）与状态在同一个事务中写入，由发件箱分发器发送通知；
+    否则在状态更新后直接发送通知
+
     Args:
         task_id: 任务ID
         status: 新状态
+        notification: 状态变化后发送的飞书通知（feishu_task_notify 的参数）
+        expected_status: 只在任务仍处于该状态时更新（UPDATE ... WHERE status = ...），否则不更新也不发送通知
 
     Returns:
-        更新后的任务，如果更新失败则返回None
+        更新后的任务，如果更新失败或任务已不处于 expected_status 则返回None
     """
     try:
         task = task_crud.get(id=task_id)
@@ -232,7 +243,26 @@ def update_task_status(task_id: str, status: str) -> Optional[Task]:
         else:
             update_data = {'status': status}
 
-        updated_task = task_crud.update(db_obj=task, obj_in=update_data)
+        with Task._meta.database.atomic():
+            if expected_status is not None:
+                # 条件更新：同时检查同一任务的多个进程中只有一个能更新状态并发送通知
+                query = Task.update(**update_data).where((Task.id == task_id) & (Task.status == expected_status))
+                if not query.execute():
+                    logger.info(f"任务 {task_id} 已不是{expected_status}状态，不更新为{status}")
+                    return None
+                for field, value in update_data.items():
+                    setattr(task, field, value)
+                updated_task = task
+            else:
+                updated_task = task_crud.update(db_obj=task, obj_in=update_data)
+            if settings.OUTBOX_ENABLED:
+                record_events(build_task_status_events(task_id, status, notification))
+
+        publish_task_status(task_id, status)
+        invalidate_task_stats()
+
+        if notification and not settings.OUTBOX_ENABLED:
+            feishu_task_notify(**notification)
         return updated_task
     except Exception as e:
         logger.error(f"更新任务状态失败: {str(e)}")
@@ -245,7 +275,8 @@ def cancel_task(task_id: str) -> Tuple[bool, str]:
     """
     取消任务及其所有未完成的子任务
 
-    只允许取消处于等待中(PENDING)状态的任务，不允许取消正在执行(PROCESSING)的任务
+    可以取消等待中(PENDING)和正在执行(PROCESSING)的任务。正在执行的任务通过墓碑协作取消：
+    队列中的子任务消息被跳过，正在轮询的子任务在下一次轮询前放弃并释放工作线程
 
     Args:
         task_id: 任务ID
@@ -260,20 +291,15 @@ def cancel_task(task_id: str) -> Tuple[bool, str]:
             logger.warning(f"任务不存在: {task_id}")
             return False, "任务不存在"
 
-        # 检查任务状态
-        if task.status == TaskStatus.PROCESSING.value:
-            logger.warning(f"任务 {task_id} 正在执行中，不允许取消")
-            return False, "任务正在执行中，不允许取消"
-
         # 如果任务已经是终止状态，则不需要取消
         if task.status in [TaskStatus.COMPLETED.value, TaskStatus.FAILED.value, TaskStatus.CANCELLED.value]:
             logger.warning(f"任务 {task_id} 已经是终止状态: {task.status}，无法取消")
             return False, f"任务已经是终止状态: {task.status}，无法取消"
 
-        # 只允许取消等待中的任务
-        if task.status != TaskStatus.PENDING.value:
-            logger.warning(f"任务 {task_id} 状态为 {task.status}，不是等待中状态，无法取消")
-            return False, f"只能取消等待中的任务，当前任务状态为: {task.status}"
+        # 只允许取消等待中和执行中的任务
+        if task.status not in [TaskStatus.PENDING.value, TaskStatus.PROCESSING.value]:
+            logger.warning(f"任务 {task_id} 状态为 {task.status}，无法取消")
+            return False, f"只能取消等待中或执行中的任务，当前任务状态为: {task.status}"
 
         # 更新任务状态为已取消
         update_data = {
@@ -285,23 +311,29 @@ def cancel_task(task_id: str) -> Tuple[bool, str]:
         if not updated_task:
             logger.error(f"更新任务 {task_id} 状态为已取消失败")
             return False, "更新任务状态失败"
+        publish_task_status(task_id, TaskStatus.CANCELLED.value)
+        invalidate_task_stats()
+
+        # 写入任务墓碑，工作进程会跳过该任务尚在队列中的子任务消息，正在轮询的子任务也会据此中止
+        try:
+            mark_task_cancelled(task_id)
+        except Exception as tombstone_error:
+            logger.warning(f"写入任务 {task_id} 取消墓碑失败: {str(tombstone_error)}")
+
+        # 批量更新所有未完成的子任务状态为已取消
+        cancelled_count = subtask_crud.cancel_by_task(
+            task_id,
+            [SubtaskStatus.PENDING.value, SubtaskStatus.PROCESSING.value],
+            error="父任务已取消"
+        )
 
-        # 获取所有未完成的子任务
-        pending_subtasks = list(Subtask.select().where(
-            (Subtask.task == task_id) &
-            (Subtask.status.not_in([SubtaskStatus.COMPLETED.value, SubtaskStatus.FAILED.value, SubtaskStatus.CANCELLED.value]))
-        ))
-
-        # 更新所有未完成的子任务状态为已取消
-        cancelled_count = 0
-        for subtask in pending_subtasks:
-            updated_subtask = subtask_crud.update_status(
-                id=subtask.id,
-                status=SubtaskStatus.CANCELLED.value,
-                error="父任务已取消"
-            )
-            if updated_subtask:
-                cancelled_count += 1
+        # 等待中的任务可能在准入队列中，移出队列并唤醒后面的任务
+        if settings.ADMISSION_CONTROL_ENABLED:
+            try:
+                from backend.services.admission_controller import get_admission_controller
+                get_admission_controller().release(str(task_id))
+            except Exception as admission_error:
+                logger.warning(f"将任务 {task_id} 移出准入队列失败: {str(admission_error)}")
 
         logger.info(f"任务 {task_id} 已取消，同时取消了 {cancelled_count} 个子任务")
         return True, f"任务已取消，同时取消了 {cancelled_count} 个子任务"
@@ -330,21 +362,23 @@ def check_and_update_task_completion(task_id: str) -> bool:
             logger.warning(f"任务不存在: {task_id}")
             return False
 
-        # 获取任务的所有子任务
-        subtasks = list(Subtask.select().where(Subtask.task == task_id))
+        # 任务已处于终止状态（监控循环和发件箱分发器都可能触发检查），不重复更新和通知；
+        # 同时进行的检查由条件更新保证只有一个更新状态并发送通知
+        if task.status in [TaskStatus.COMPLETED.value, TaskStatus.FAILED.value, TaskStatus.CANCELLED.value]:
+            return False
 
-        if not subtasks:
+        # 惰性物化模式下只有产生结果或错误的单元格才有记录，两种模式的总数都以单元格总数为准
+        total_subtasks = task.total_images
+        if total_subtasks <= 0:
             logger.warning(f"任务 {task_id} 没有子任务")
             return False
 
-        # 计算子任务状态
-        total_subtasks = len(subtasks)
-        completed_subtasks = sum(1 for s in subtasks if s.status == SubtaskStatus.COMPLETED.value)
-        failed_subtasks = sum(1 for s in subtasks if s.status == SubtaskStatus.FAILED.value)
-        cancelled_subtasks = sum(1 for s in subtasks if s.status == SubtaskStatus.CANCELLED.value)
-
-        # 计算已处理的子任务数量
-        processed_subtasks = completed_subtasks + failed_subtasks + cancelled_subtasks
+        # 按子任务状态计数判断（不读取子任务行）
+        progress = get_task_progress(task_id)
+        completed_subtasks = progress.completed
+        failed_subtasks = progress.failed
+        cancelled_subtasks = progress.cancelled
+        processed_subtasks = progress.processed
 
         logger.info(f"任务 {task_id} 子任务状态: 总数={total_subtasks}, 已完成={completed_subtasks}, "
                    f"失败={failed_subtasks}, 已取消={cancelled_subtasks}")
@@ -353,14 +387,12 @@ def check_and_update_task_completion(task_id: str) -> bool:
         frontend_url = f"{settings.FRONTEND_BASE_URL}/model-testing/history/{task_id}"
 
         # 如果所有子任务都已处理完成
-        if processed_subtasks == total_subtasks:
+        if processed_subtasks >= total_subtasks:
             # 如果所有子任务都失败，则任务失败
             if failed_subtasks == total_subtasks:
                 logger.warning(f"任务 {task_id} 的所有子任务都失败，将任务标记为失败")
-                update_task_status(task_id, TaskStatus.FAILED.value)
-
-                # 发送任务失败通知
-                feishu_task_notify(
+                # 更新状态并发送任务失败通知
+                updated = update_task_status(task_id, TaskStatus.FAILED.value, notification=dict(
                     event_type='task_failed',
                     task_id=str(task_id),
                     task_name=task.name,
@@ -371,15 +403,13 @@ def check_and_update_task_completion(task_id: str) -> bool:
                     },
                     message="所有子任务均失败，请检查任务配置和服务状态",
                     frontend_url=frontend_url
-                )
-                return True
+                ), expected_status=TaskStatus.PROCESSING.value)
+                return updated is not None
             # 如果所有子任务都被取消，则任务取消
             elif cancelled_subtasks == total_subtasks:
                 logger.warning(f"任务 {task_id} 的所有子任务都被取消，将任务标记为取消")
-                update_task_status(task_id, TaskStatus.CANCELLED.value)
-
-                # 发送任务取消通知
-                feishu_task_notify(
+                # 更新状态并发送任务取消通知
+                updated = update_task_status(task_id, TaskStatus.CANCELLED.value, notification=dict(
                     event_type='task_cancelled',
                     task_id=str(task_id),
                     task_name=task.name,
@@ -389,17 +419,15 @@ def check_and_update_task_completion(task_id: str) -> bool:
                     },
                     message="所有子任务均被取消",
                     frontend_url=frontend_url
-                )
-                return True
+                ), expected_status=TaskStatus.PROCESSING.value)
+                return updated is not None
             # 如果有一些子任务成功，则任务完成
             elif completed_subtasks > 0:
                 logger.info(f"任务 {task_id} 的子任务已全部处理完成，将任务标记为完成")
-                update_task_status(task_id, TaskStatus.COMPLETED.value)
-
                 # 根据是否有失败的子任务决定发送哪种通知
                 if failed_subtasks > 0:
-                    # 发送任务部分完成通知
-                    feishu_task_notify(
+                    # 任务部分完成通知
+                    notification = dict(
                         event_type='task_partial_completed',
                         task_id=str(task_id),
                         task_name=task.name,
@@ -413,8 +441,8 @@ def check_and_update_task_completion(task_id: str) -> bool:
                         frontend_url=frontend_url
                     )
                 else:
-                    # 发送任务完全成功通知
-                    feishu_task_notify(
+                    # 任务完全成功通知
+                    notification = dict(
                         event_type='task_completed',
                         task_id=str(task_id),
                         task_name=task.name,
@@ -426,14 +454,14 @@ def check_and_update_task_completion(task_id: str) -> bool:
                         message="所有任务已成功完成",
                         frontend_url=frontend_url
                     )
-                return True
+                updated = update_task_status(task_id, TaskStatus.COMPLETED.value, notification=notification,
+                                             expected_status=TaskStatus.PROCESSING.value)
+                return updated is not None
             # 其他情况（所有子任务都是失败或取消的组合）
             else:
                 logger.warning(f"任务 {task_id} 的子任务都是失败或取消状态，将任务标记为失败")
-                update_task_status(task_id, TaskStatus.FAILED.value)
-
-                # 发送任务失败通知
-                feishu_task_notify(
+                # 更新状态并发送任务失败通知
+                updated = update_task_status(task_id, TaskStatus.FAILED.value, notification=dict(
                     event_type='task_failed',
                     task_id=str(task_id),
                     task_name=task.name,
@@ -444,8 +472,8 @@ def check_and_update_task_completion(task_id: str) -> bool:
                     },
                     message="任务执行失败，所有子任务都是失败或取消状态",
                     frontend_url=frontend_url
-                )
-                return True
+                ), expected_status=TaskStatus.PROCESSING.value)
+                return updated is not None
 
         # 更新任务进度
         task_crud.update_progress(task_id)
@@ -7,9 +7,8 @@ import logging
 from typing import Tuple
 
 from backend.crud.task import task_crud
-from backend.crud.subtask import subtask_crud
-from backend.models.db.subtasks import SubtaskStatus
-from backend.models.db.tasks import TaskStatus
+from backend.models.db.tasks import Task, TaskStatus
+from backend.services.task_progress import get_task_progress
 
 logger = logging.getLogger(__name__)
 
@@ -30,27 +29,13 @@ def update_task_subtask_stats(task_id: str) -> Tuple[bool, str]:
         if not task:
             return False, f"任务不存在: {task_id}"
 
-        # 获取该任务的所有子任务
-        subtasks = list(subtask_crud.get_by_task(task_id))
+        # 按子任务状态计数（已结束的历史任务没有Redis计数时在数据库中分组统计，不创建计数）
+        progress = get_task_progress(task_id, rebuild_missing=False)
+        completed_count = progress.completed
+        failed_count = progress.failed
 
-        if not subtasks:
-            logger.warning(f"任务 {task_id} 没有子任务")
-            return True, "任务没有子任务，无需统计"
-
-        # 统计各状态的子任务数量
-        completed_count = 0
-        failed_count = 0
-
-        for subtask in subtasks:
-            if subtask.status == SubtaskStatus.COMPLETED.value:
-                completed_count += 1
-            elif subtask.status == SubtaskStatus.FAILED.value:
-                failed_count += 1
-
-        # 更新任务的统计字段
-        task.completed_subtasks = completed_count
-        task.failed_subtasks = failed_count
-        task.save()
+        # 只更新统计列，不重写提示词等其他列
+        Task.update(completed_subtasks=completed_count, failed_subtasks=failed_count).where(Task.id == task.id).execute()
 
         logger.info(f"任务 {task_id} 子任务统计更新完成: 完成={completed_count}, 失败={failed_count}")
         return True, f"统计更新完成: 完成={completed_count}, 失败={failed_count}"
@@ -70,8 +55,6 @@ def batch_update_all_task_stats() -> Tuple[bool, str]:
     """
     try:
         # 获取所有已完成或失败的任务
-        from backend.models.db.tasks import Task
-
         tasks = list(Task.select().where(
             Task.status.in_([TaskStatus.COMPLETED.value, TaskStatus.FAILED.value])
         ))
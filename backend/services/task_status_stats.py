@@ -0,0 +1,286 @@
+"""
+任务状态统计模块
+
+任务统计接口（GET /tasks/stats）原来对同一组筛选条件执行六次 COUNT(*)（总数和每个状态各一次），
+现在用一条按状态分组的查询得到全部数量。
+
+启用 TASK_STATS_CACHE_ENABLED 后，结果按标准化的筛选条件缓存在Redis中 TASK_STATS_CACHE_TTL 秒，
+任务创建、状态变化、收藏和删除时递增缓存版本使所有缓存失效。缓存缺失时同一组筛选条件只有一个请求
+（跨API进程）执行查询，其他请求等待其结果，等待超过 TASK_STATS_COALESCE_WAIT 秒后自行查询。
+"""
+import hashlib
+import json
+import logging
+import time
+import typing
+from datetime import datetime, timedelta
+
+import redis
+
+from backend.core.config import settings
+from backend.models.db.tasks import Task, TaskStatus
+from backend.models.db.user import User
+from backend.utils.redis_client import get_redis_client
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 统计的状态（与原接口返回的键一致）
+STATS_STATUSES = (
+    TaskStatus.COMPLETED.value,
+    TaskStatus.FAILED.value,
+    TaskStatus.CANCELLED.value,
+    TaskStatus.PROCESSING.value,
+    TaskStatus.PENDING.value,
+)
+
+# 等待其他请求查询结果时的检查间隔（秒）
+_COALESCE_POLL_INTERVAL = 0.05
+
+
+class TaskStatsFilters(typing.NamedTuple):
+    """标准化的统计筛选条件"""
+    username: typing.Optional[str] = None
+    task_name: typing.Optional[str] = None
+    favorite: typing.Optional[bool] = None
+    deleted: bool = False
+    min_subtasks: typing.Optional[int] = None
+    max_subtasks: typing.Optional[int] = None
+    start_date: typing.Optional[datetime] = None
+    end_date: typing.Optional[datetime] = None  # 不包含，即结束日期的下一天0点
+
+    def cache_key(self) -> str:
+        """筛选条件的缓存键"""
+        raw = json.dumps(self._asdict(), default=str, sort_keys=True)
+        return hashlib.sha1(raw.encode()).hexdigest()[:20]
+
+
+def normalize_stats_filters(username: typing.Optional[str] = None, task_name: typing.Optional[str] = None,
+                            favorite: typing.Optional[bool] = None, deleted: typing.Optional[bool] = None,
+                            min_subtasks: typing.Optional[int] = None, max_subtasks: typing.Optional[int] = None,
+                            start_date: typing.Optional[str] = None,
+                            end_date: typing.Optional[str] = None) -> TaskStatsFilters:
+    """
+    标准化统计接口的筛选参数
+
+    空字符串视为未设置，未设置删除状态时只统计未删除的任务，无效的日期忽略。
+
+    Args:
+        username: 用户名过滤
+        task_name: 任务名搜索（部分匹配）
+        favorite: 收藏状态过滤
+        deleted: 删除状态过滤
+        min_subtasks: 最小子任务数量
+        max_subtasks: 最大子任务数量
+        start_date: 开始日期 (YYYY-MM-DD)
+        end_date: 结束日期 (YYYY-MM-DD)
+
+    Returns:
+        标准化的筛选条件
+    """
+    start_datetime = None
+    if start_date:
+        try:
+            start_datetime = datetime.strptime(start_date, "%Y-%m-%d")
+        except ValueError:
+            logger.warning(f"无效的开始日期格式: {start_date}")
+
+    end_datetime = None
+    if end_date:
+        try:
+            end_datetime = datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)
+        except ValueError:
+            logger.warning(f"无效的结束日期格式: {end_date}")
+
+    return TaskStatsFilters(
+        username=username or None,
+        task_name=task_name or None,
+        favorite=favorite,
+        deleted=bool(deleted),
+        min_subtasks=min_subtasks,
+        max_subtasks=max_subtasks,
+        start_date=start_datetime,
+        end_date=end_datetime,
+    )
+
+
+def count_tasks_by_status(filters: TaskStatsFilters) -> typing.Dict[str, int]:
+    """
+    用一条按状态分组的查询统计符合条件的任务数量
+
+    Args:
+        filters: 筛选条件
+
+    Returns:
+        总数和各状态的数量
+    """
+    from peewee import fn
+
+    query = Task.select(Task.status, fn.COUNT(Task.id)).where(Task.is_deleted == filters.deleted)
+    if filters.favorite is not None:
+        query = query.where(Task.is_favorite == filters.favorite)
+    if filters.username:
+        query = query.join(User).where(User.username == filters.username)
+    if filters.task_name:
+        query = query.where(Task.name.contains(filters.task_name))
+    if filters.min_subtasks is not None:
+        query = query.where(Task.total_images >= filters.min_subtasks)
+    if filters.max_subtasks is not None:
+        query = query.where(Task.total_images <= filters.max_subtasks)
+    if filters.start_date:
+        query = query.where(Task.created_at >= filters.start_date)
+    if filters.end_date:
+        query = query.where(Task.created_at < filters.end_date)
+
+    stats = dict.fromkeys(("total",) + STATS_STATUSES, 0)
+    for status, count in query.group_by(Task.status).tuples():
+        stats["total"] += count
+        if status in stats:
+            stats[status] = count
+    return stats
+
+
+class TaskStatsCache:
+    """基于Redis的任务统计缓存"""
+
+    def __init__(self) -> None:
+        """初始化缓存"""
+        self.client = get_redis_client()
+        self.key_prefix = settings.TASK_STATS_CACHE_KEY_PREFIX
+        self.generation_key = f"{self.key_prefix}:generation"
+
+    def _result_key(self, filters: TaskStatsFilters) -> str:
+        return f"{self.key_prefix}:result:{filters.cache_key()}"
+
+    def _lock_key(self, filters: TaskStatsFilters) -> str:
+        return f"{self.key_prefix}:lock:{filters.cache_key()}"
+
+    def peek(self, filters: TaskStatsFilters) -> typing.Tuple[typing.Optional[typing.Dict[str, int]], int]:
+        """
+        读取缓存
+
+        Args:
+            filters: 筛选条件
+
+        Returns:
+            (当前版本的缓存结果，没有时为None, 当前缓存版本)
+        """
+        pipe = self.client.pipeline(transaction=False)
+        pipe.get(self.generation_key)
+        pipe.get(self._result_key(filters))
+        generation, cached = pipe.execute()
+        generation = int(generation or 0)
+        if cached is not None:
+            entry = json.loads(cached)
+            if entry["generation"] == generation:
+                return entry["stats"], generation
+        return None, generation
+
+    def get_or_compute(self, filters: TaskStatsFilters) -> typing.Dict[str, int]:
+        """
+        读取缓存，缺失时查询并写入；同一组筛选条件同时只有一个请求查询
+
+        Args:
+            filters: 筛选条件
+
+        Returns:
+            总数和各状态的数量
+        """
+        stats, generation = self.peek(filters)
+        if stats is not None:
+            return stats
+
+        lock_key = self._lock_key(filters)
+        wait = settings.TASK_STATS_COALESCE_WAIT
+        locked = bool(self.client.set(lock_key, "1", nx=True, px=max(int(wait * 1000), 1)))
+        if not locked:
+            # 其他请求正在查询，等待其结果
+            deadline = time.monotonic() + wait
+            while time.monotonic() < deadline:
+                time.sleep(_COALESCE_POLL_INTERVAL)
+                stats, generation = self.peek(filters)
+                if stats is not None:
+                    return stats
+            logger.warning("等待任务统计结果超时，自行查询")
+
+        try:
+            # 使用查询前读取的版本：查询期间缓存失效时，写入的结果不会被当作最新结果
+            stats = count_tasks_by_status(filters)
+            entry = json.dumps({"generation": generation, "stats": stats})
+            self.client.set(self._result_key(filters), entry, px=max(int(settings.TASK_STATS_CACHE_TTL * 1000), 1))
+            return stats
+        finally:
+            if locked:
+                self.client.delete(lock_key)
+
+    def invalidate(self) -> None:
+        """使所有缓存失效"""
+        self.client.incr(self.generation_key)
+
+
+# 单例模式
+_task_stats_cache_instance: typing.Optional[TaskStatsCache] = None
+
+
+def get_task_stats_cache() -> TaskStatsCache:
+    """
+    获取任务统计缓存实例（单例模式）
+
+    Returns:
+        任务统计缓存实例
+    """
+    global _task_stats_cache_instance
+    if _task_stats_cache_instance is None:
+        _task_stats_cache_instance = TaskStatsCache()
+    return _task_stats_cache_instance
+
+
+def peek_task_status_stats(filters: TaskStatsFilters) -> typing.Optional[typing.Dict[str, int]]:
+    """
+    读取缓存的任务统计（未启用缓存或读取失败时返回None）
+
+    Args:
+        filters: 筛选条件
+
+    Returns:
+        缓存的统计结果，没有时返回None
+    """
+    if not settings.TASK_STATS_CACHE_ENABLED:
+        return None
+    try:
+        return get_task_stats_cache().peek(filters)[0]
+    except Exception as e:
+        logger.warning(f"读取任务统计缓存失败: {str(e)}")
+        return None
+
+
+def get_task_status_stats(filters: TaskStatsFilters) -> typing.Dict[str, int]:
+    """
+    获取任务统计：启用缓存时读取或合并查询，否则直接查询
+
+    Args:
+        filters: 筛选条件
+
+    Returns:
+        总数和各状态的数量
+    """
+    if settings.TASK_STATS_CACHE_ENABLED:
+        try:
+            return get_task_stats_cache().get_or_compute(filters)
+        except redis.RedisError as e:
+            logger.warning(f"任务统计缓存不可用，直接查询: {str(e)}")
+    return count_tasks_by_status(filters)
+
+
+def invalidate_task_stats() -> None:
+    """
+    任务创建、状态变化、收藏或删除后使任务统计缓存失效（未启用时不做处理）
+
+    失效失败不影响调用方，缓存最多在 TASK_STATS_CACHE_TTL 秒后过期。
+    """
+    if not settings.TASK_STATS_CACHE_ENABLED:
+        return
+    try:
+        get_task_stats_cache().invalidate()
+    except Exception as e:
+        logger.warning(f"使任务统计缓存失效失败: {str(e)}")
@@ -0,0 +1,78 @@
+"""
+任务墓碑模块
+
+取消任务时在Redis中为任务写入一个带过期时间的墓碑标记，
+Dramatiq中间件在工作进程取出消息时检查墓碑并直接跳过已取消任务的子任务消息，
+因此取消任务的开销与队列长度无关，不需要扫描和删除队列中的消息。
+"""
+import logging
+import threading
+import time
+import typing
+from collections import OrderedDict
+
+from backend.core.config import settings
+from backend.utils.redis_client import get_redis_client
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 进程内缓存：已取消的任务不会恢复，命中后一直缓存；未取消的结果只缓存很短时间
+_NEGATIVE_CACHE_SECONDS = 2.0
+_CACHE_MAX_SIZE = 10000
+
+_cancelled_cache: "OrderedDict[str, bool]" = OrderedDict()
+_negative_cache: typing.Dict[str, float] = {}
+_cache_lock = threading.Lock()
+
+
+def _tombstone_key(task_id: str) -> str:
+    """返回任务墓碑的Redis键"""
+    return f"{settings.TASK_TOMBSTONE_KEY_PREFIX}:{task_id}"
+
+
+def mark_task_cancelled(task_id: str) -> None:
+    """
+    为任务写入墓碑标记
+
+    Args:
+        task_id: 任务ID
+    """
+    task_id = str(task_id)
+    get_redis_client().set(_tombstone_key(task_id), int(time.time()), ex=settings.TASK_TOMBSTONE_TTL)
+    with _cache_lock:
+        _negative_cache.pop(task_id, None)
+    logger.info(f"任务 {task_id} 已写入取消墓碑")
+
+
+def is_task_cancelled(task_id: str) -> bool:
+    """
+    检查任务是否已写入墓碑标记（带进程内缓存）
+
+    Args:
+        task_id: 任务ID
+
+    Returns:
+        任务是否已取消
+    """
+    task_id = str(task_id)
+    now = time.monotonic()
+    with _cache_lock:
+        if task_id in _cancelled_cache:
+            return True
+        if _negative_cache.get(task_id, 0) > now:
+            return False
+
+    cancelled = bool(get_redis_client().exists(_tombstone_key(task_id)))
+
+    with _cache_lock:
+        if cancelled:
+            _cancelled_cache[task_id] = True
+            if len(_cancelled_cache) > _CACHE_MAX_SIZE:
+                _cancelled_cache.popitem(last=False)
+            _negative_cache.pop(task_id, None)
+        else:
+            if len(_negative_cache) > _CACHE_MAX_SIZE:
+                _negative_cache.clear()
+            _negative_cache[task_id] = now + _NEGATIVE_CACHE_SECONDS
+    return cancelled
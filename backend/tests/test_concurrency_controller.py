@@ -0,0 +1,108 @@
+"""
+自适应并发控制测试
+
+使用 fakeredis（需要 lupa 执行Lua脚本）代替Redis
+"""
+import asyncio
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")
+
+from backend.core.config import settings
+from backend.utils import concurrency_controller, polling_schedule
+from backend.dramatiq_app.actors import test_run_subtask
+from backend.dramatiq_app.actors.test_run_subtask import ImageClient, UpstreamTimeoutException
+
+
+@pytest.fixture
+def image_client(monkeypatch):
+    """启用自适应并发控制、使用 fakeredis 的图像生成客户端"""
+    monkeypatch.setenv("NIETA_XTOKEN", "test-token")
+    monkeypatch.setattr(settings, "ADAPTIVE_CONCURRENCY_ENABLED", True)
+    monkeypatch.setattr(settings, "ADAPTIVE_DECREASE_COOLDOWN", 0.0)
+    monkeypatch.setattr(concurrency_controller, "get_redis_client", fakeredis.FakeRedis)
+    monkeypatch.setattr(concurrency_controller, "_controller_instance", None)
+    monkeypatch.setattr(polling_schedule, "get_redis_client", fakeredis.FakeRedis)
+    monkeypatch.setattr(polling_schedule, "_polling_schedule_instance", None)
+    return ImageClient()
+
+
+def _standard_limit() -> float:
+    return concurrency_controller.get_concurrency_controller().get_status()["standard"]["limit"]
+
+
+def test_upstream_timeout_decreases_limit(image_client):
+    """上游返回TIMEOUT状态时按超时处理，降低并发上限"""
+    initial_limit = _standard_limit()
+
+    async def poll_timeout():
+        async with image_client._concurrency_slot(is_lumina=False):
+            image_client.check_task_result("task-uuid", {"task_status": "TIMEOUT"}, 1, 30)
+
+    with pytest.raises(UpstreamTimeoutException):
+        asyncio.run(poll_timeout())
+
+    assert _standard_limit() == initial_limit * settings.ADAPTIVE_DECREASE_FACTOR
+
+
+def test_upstream_failure_keeps_limit(image_client):
+    """上游返回FAILURE状态时不降低并发上限"""
+    initial_limit = _standard_limit()
+
+    async def poll_failure():
+        async with image_client._concurrency_slot(is_lumina=False):
+            image_client.check_task_result("task-uuid", {"task_status": "FAILURE"}, 1, 30)
+
+    with pytest.raises(Exception):
+        asyncio.run(poll_failure())
+
+    assert _standard_limit() == initial_limit
+
+
+def test_rate_limit_wait_and_polling_excluded_from_latency(image_client, monkeypatch):
+    """等待限流令牌和轮询间隔的时间不计入完成耗时，成功请求不会因此降低并发上限"""
+    monkeypatch.setattr(settings, "ADAPTIVE_STANDARD_LATENCY_TARGET", 0.5)
+    monkeypatch.setattr(settings, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(image_client, "polling_interval", 0.3)
+
+    class SaturatedRateLimiter:
+        async def acquire_async(self, bucket):
+            await asyncio.sleep(0.4)
+            return 0.4
+
+    statuses = iter([{"task_status": "PENDING"}, {"task_status": "SUCCESS"}])
+
+    async def call_api(api_url, payload):
+        return "task-uuid"
+
+    async def fetch_task_status(task_status_url):
+        return next(statuses)
+
+    async def extract_image_url(result):
+        return "https://example.com/image.png"
+
+    monkeypatch.setattr(test_run_subtask, "get_rate_limiter", SaturatedRateLimiter)
+    monkeypatch.setattr(image_client, "_call_api", call_api)
+    monkeypatch.setattr(image_client, "fetch_task_status", fetch_task_status)
+    monkeypatch.setattr(image_client, "extract_image_url", extract_image_url)
+
+    initial_limit = _standard_limit()
+    result = asyncio.run(image_client.generate_image(prompts=[], width=512, height=512))
+
+    assert result["success"]
+    # 令牌等待0.4秒加轮询间隔0.3秒会超过0.5秒的目标，上游完成耗时估计为两次轮询的中点（约0.15秒）
+    status = concurrency_controller.get_concurrency_controller().get_status()["standard"]
+    assert status["ewma_total_ms"] < 300
+    assert status["limit"] > initial_limit
+
+
+def test_status_history_limit_at_least_one(image_client):
+    """history_limit 小于1时只返回最近一条记录，而不是全部历史"""
+    controller = concurrency_controller.get_concurrency_controller()
+    for _ in range(3):
+        controller.release("standard", "lease", concurrency_controller.OUTCOME_TIMEOUT, 0, 0)
+
+    assert len(controller.get_status(history_limit=0)["standard"]["history"]) == 1
+
@@ -0,0 +1,48 @@
+"""
+自适应轮询计划测试
+
+使用 fakeredis 代替Redis
+"""
+import random
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from backend.core.config import settings
+from backend.utils import polling_schedule
+
+
+@pytest.fixture
+def schedule(monkeypatch):
+    """使用 fakeredis、不缓存分位数的轮询计划生成器"""
+    monkeypatch.setattr(settings, "POLLING_CACHE_TTL", 0.0)
+    monkeypatch.setattr(settings, "POLLING_MIN_SAMPLES", 20)
+    monkeypatch.setattr(settings, "POLLING_SAMPLE_SIZE", 200)
+    monkeypatch.setattr(settings, "POLLING_EXPLORATION_RATE", 0.05)
+    monkeypatch.setattr(polling_schedule, "get_redis_client", fakeredis.FakeRedis)
+    return polling_schedule.PollingSchedule()
+
+
+def _run_job(schedule, profile: str, latency: float) -> None:
+    """按轮询计划模拟轮询一个耗时为 latency 的上游任务，完成后记录"""
+    plan = schedule.plan(profile, base_interval=2.0, max_attempts=60)
+    elapsed = plan.first_delay()
+    polls = 1
+    while elapsed < latency:
+        elapsed += max(plan.next_delay(elapsed), 0.1)
+        polls += 1
+    schedule.record(plan, elapsed, polls)
+
+
+def test_first_quantile_does_not_ratchet(schedule):
+    """首次轮询推迟到学到的P10后，学到的P10仍接近真实P10，不会因样本被截断而不断推迟"""
+    # 任务耗时和是否探测使用不同的随机序列，避免两者相关
+    rng = random.Random(1)
+    random.seed(0)
+    for _ in range(4000):
+        _run_job(schedule, "standard|default|-|512x512", rng.uniform(15, 60))
+
+    first, _ = schedule._quantiles("standard|default|-|512x512")
+    # U(15, 60) 的真实P10为19.5秒
+    assert abs(first - 19.5) < 3
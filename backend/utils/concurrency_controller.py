@@ -0,0 +1,311 @@
+"""
+自适应并发控制模块
+
+基于AIMD（加性增、乘性减）的全局并发控制器：
+根据上游图像API的提交延迟、完成耗时和错误类型动态调整允许同时进行的请求数量。
+并发上限和调整历史保存在Redis中，所有工作进程共享。
+"""
+import asyncio
+import json
+import logging
+import time
+import typing
+import uuid
+
+from backend.core.config import settings
+from backend.utils.redis_client import get_redis_client
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 请求结果类型
+OUTCOME_SUCCESS = "success"      # 成功返回结果
+OUTCOME_TIMEOUT = "timeout"      # 上游TIMEOUT或轮询超时
+OUTCOME_FAILURE = "failure"      # 上游FAILURE或请求出错
+OUTCOME_CENSORED = "censored"    # 内容审核未通过（与上游健康状况无关）
+
+# 获取并发槽位：清理过期租约，未达到上限时添加新租约
+_ACQUIRE_SCRIPT = """
+local leases_key = KEYS[1]
+local state_key = KEYS[2]
+local lease_id = ARGV[1]
+local lease_ttl_ms = tonumber(ARGV[2])
+local initial_limit = tonumber(ARGV[3])
+
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+redis.call('ZREMRANGEBYSCORE', leases_key, '-inf', now)
+local limit = tonumber(redis.call('HGET', state_key, 'limit')) or initial_limit
+if redis.call('ZCARD', leases_key) < math.max(1, math.floor(limit)) then
+    redis.call('ZADD', leases_key, now + lease_ttl_ms, lease_id)
+    return 1
+end
+return 0
+"""
+
+# 释放并发槽位并根据结果调整并发上限
+_RELEASE_SCRIPT = """
+local leases_key = KEYS[1]
+local state_key = KEYS[2]
+local history_key = KEYS[3]
+local lease_id = ARGV[1]
+local outcome = ARGV[2]
+local submit_ms = tonumber(ARGV[3])
+local total_ms = tonumber(ARGV[4])
+local initial_limit = tonumber(ARGV[5])
+local min_limit = tonumber(ARGV[6])
+local max_limit = tonumber(ARGV[7])
+local decrease_factor = tonumber(ARGV[8])
+local cooldown_ms = tonumber(ARGV[9])
+local latency_target_ms = tonumber(ARGV[10])
+local history_size = tonumber(ARGV[11])
+
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+redis.call('ZREM', leases_key, lease_id)
+redis.call('HINCRBY', state_key, 'count_' .. outcome, 1)
+
+local limit = tonumber(redis.call('HGET', state_key, 'limit')) or initial_limit
+local new_limit = limit
+local action = nil
+local reason = outcome
+
+if outcome == 'success' then
+    local ewma = tonumber(redis.call('HGET', state_key, 'ewma_total_ms')) or total_ms
+    ewma = ewma * 0.8 + total_ms * 0.2
+    redis.call('HSET', state_key, 'ewma_total_ms', tostring(ewma))
+    local ewma_submit = tonumber(redis.call('HGET', state_key, 'ewma_submit_ms')) or submit_ms
+    redis.call('HSET', state_key, 'ewma_submit_ms', tostring(ewma_submit * 0.8 + submit_ms * 0.2))
+    if latency_target_ms > 0 and ewma > latency_target_ms then
+        action = 'decrease'
+        reason = 'latency'
+    else
+        new_limit = math.min(max_limit, limit + 1 / math.max(limit, 1))
+        if math.floor(new_limit) > math.floor(limit) then
+            action = 'increase'
+        end
+    end
+elseif outcome == 'timeout' then
+    action = 'decrease'
+end
+
+if action == 'decrease' then
+    local last_decrease = tonumber(redis.call('HGET', state_key, 'last_decrease_ms')) or 0
+    if now - last_decrease >= cooldown_ms then
+        new_limit = math.max(min_limit, limit * decrease_factor)
+        redis.call('HSET', state_key, 'last_decrease_ms', now)
+    else
+        action = nil
+    end
+end
+
+redis.call('HSET', state_key, 'limit', tostring(new_limit))
+
+if action then
+    redis.call('LPUSH', history_key, cjson.encode({
+        ts = now, action = action, reason = reason,
+        from = limit, to = new_limit, submit_ms = submit_ms, total_ms = total_ms
+    }))
+    redis.call('LTRIM', history_key, 0, history_size - 1)
+end
+return tostring(new_limit)
+"""
+
+
+class ConcurrencySlot:
+    """
+    一次上游请求占用的并发槽位
+
+    在 `async with` 块内记录提交耗时和结果，退出时释放槽位并反馈给控制器。
+    未显式设置结果时，正常退出视为成功，抛出异常时根据异常类型判断。
+    记录了上游完成耗时时，完成耗时只包含提交耗时和上游完成耗时，不包含轮询间隔造成的等待。
+    """
+
+    def __init__(self, controller: "AdaptiveConcurrencyController", bucket: str,
+                 timeout_exceptions: typing.Tuple[typing.Type[BaseException], ...] = (),
+                 neutral_exceptions: typing.Tuple[typing.Type[BaseException], ...] = ()):
+        self.controller = controller
+        self.bucket = bucket
+        self.timeout_exceptions = timeout_exceptions
+        self.neutral_exceptions = neutral_exceptions
+        self.lease_id = uuid.uuid4().hex
+        self.outcome: typing.Optional[str] = None
+        self.submit_ms = 0.0
+        self.completion_ms: typing.Optional[float] = None
+        self.start_time = 0.0
+
+    def record_submit(self, elapsed_seconds: float) -> None:
+        """记录提交请求的耗时"""
+        self.submit_ms = elapsed_seconds * 1000
+
+    def record_completion(self, elapsed_seconds: float) -> None:
+        """记录提交后上游完成任务的耗时（根据轮询结果估计）"""
+        self.completion_ms = elapsed_seconds * 1000
+
+    async def __aenter__(self) -> "ConcurrencySlot":
+        await self.controller.acquire(self.bucket, self.lease_id)
+        self.start_time = time.monotonic()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> bool:
+        outcome = self.outcome
+        if outcome is None:
+            if exc is None:
+                outcome = OUTCOME_SUCCESS
+            elif isinstance(exc, self.neutral_exceptions):
+                outcome = OUTCOME_CENSORED
+            elif isinstance(exc, self.timeout_exceptions):
+                outcome = OUTCOME_TIMEOUT
+            else:
+                outcome = OUTCOME_FAILURE
+        if self.completion_ms is not None:
+            total_ms = self.submit_ms + self.completion_ms
+        else:
+            total_ms = (time.monotonic() - self.start_time) * 1000
+        try:
+            await asyncio.to_thread(self.controller.release, self.bucket, self.lease_id, outcome,
+                                    self.submit_ms, total_ms)
+        except Exception as e:
+            # 释放失败时租约会自然过期，不影响请求结果
+            logger.warning(f"释放并发槽位失败: {str(e)}")
+        return False
+
+
+class AdaptiveConcurrencyController:
+    """AIMD自适应并发控制器"""
+
+    def __init__(self) -> None:
+        """初始化控制器"""
+        self.client = get_redis_client()
+        self.acquire_script = self.client.register_script(_ACQUIRE_SCRIPT)
+        self.release_script = self.client.register_script(_RELEASE_SCRIPT)
+        self.key_prefix = settings.ADAPTIVE_CONCURRENCY_KEY_PREFIX
+        # 桶名称 -> (初始上限, 最小上限, 最大上限, 延迟目标毫秒)
+        self.budgets: typing.Dict[str, typing.Tuple[float, float, float, float]] = {
+            "standard": (settings.ADAPTIVE_STANDARD_INITIAL, settings.ADAPTIVE_STANDARD_MIN,
+                         settings.ADAPTIVE_STANDARD_MAX, settings.ADAPTIVE_STANDARD_LATENCY_TARGET * 1000),
+            "lumina": (settings.ADAPTIVE_LUMINA_INITIAL, settings.ADAPTIVE_LUMINA_MIN,
+                       settings.ADAPTIVE_LUMINA_MAX, settings.ADAPTIVE_LUMINA_LATENCY_TARGET * 1000),
+        }
+
+    def _keys(self, bucket: str) -> typing.List[str]:
+        """返回桶对应的租约、状态和历史记录键"""
+        base = f"{self.key_prefix}:{bucket}"
+        return [f"{base}:leases", f"{base}:state", f"{base}:history"]
+
+    def slot(self, bucket: str,
+             timeout_exceptions: typing.Tuple[typing.Type[BaseException], ...] = (),
+             neutral_exceptions: typing.Tuple[typing.Type[BaseException], ...] = ()) -> ConcurrencySlot:
+        """
+        创建一个并发槽位上下文
+
+        Args:
+            bucket: 桶名称（standard 或 lumina）
+            timeout_exceptions: 视为超时的异常类型
+            neutral_exceptions: 与上游健康状况无关、不参与调整的异常类型
+
+        Returns:
+            并发槽位
+        """
+        return ConcurrencySlot(self, bucket, timeout_exceptions, neutral_exceptions)
+
+    async def acquire(self, bucket: str, lease_id: str) -> None:
+        """
+        等待并获取并发槽位
+
+        Args:
+            bucket: 桶名称
+            lease_id: 租约ID
+        """
+        initial_limit = self.budgets[bucket][0]
+        lease_ttl_ms = int(settings.ADAPTIVE_LEASE_TTL * 1000)
+        start_time = time.monotonic()
+        # Lua脚本是同步调用，在线程中执行，不阻塞事件循环
+        while not int(await asyncio.to_thread(self.acquire_script, keys=self._keys(bucket)[:2],
+                                              args=[lease_id, lease_ttl_ms, initial_limit])):
+            await asyncio.sleep(settings.ADAPTIVE_ACQUIRE_INTERVAL)
+        waited = time.monotonic() - start_time
+        if waited >= 1:
+            logger.info(f"获取{bucket}并发槽位等待 {waited:.2f}秒")
+
+    def release(self, bucket: str, lease_id: str, outcome: str, submit_ms: float, total_ms: float) -> float:
+        """
+        释放并发槽位并根据请求结果调整上限
+
+        Args:
+            bucket: 桶名称
+            lease_id: 租约ID
+            outcome: 请求结果
+            submit_ms: 提交请求耗时（毫秒）
+            total_ms: 从获取槽位到得到结果的总耗时（毫秒）
+
+        Returns:
+            调整后的并发上限
+        """
+        initial_limit, min_limit, max_limit, latency_target_ms = self.budgets[bucket]
+        new_limit = float(self.release_script(
+            keys=self._keys(bucket),
+            args=[
+                lease_id, outcome, int(submit_ms), int(total_ms),
+                initial_limit, min_limit, max_limit,
+                settings.ADAPTIVE_DECREASE_FACTOR, int(settings.ADAPTIVE_DECREASE_COOLDOWN * 1000),
+                int(latency_target_ms), settings.ADAPTIVE_HISTORY_SIZE,
+            ],
+        ))
+        logger.debug(f"{bucket}并发槽位已释放: 结果={outcome}, 提交耗时={submit_ms:.0f}ms, "
+                     f"总耗时={total_ms:.0f}ms, 当前上限={new_limit:.2f}")
+        return new_limit
+
+    def get_status(self, history_limit: int = 50) -> typing.Dict[str, typing.Any]:
+        """
+        获取各个桶的当前上限、进行中的请求数量和最近的调整记录
+
+        Args:
+            history_limit: 返回的历史记录条数
+
+        Returns:
+            各桶的状态
+        """
+        # lrange(0, -1) 会返回全部历史，至少返回1条
+        history_limit = max(1, history_limit)
+        now_ms = int(time.time() * 1000)
+        status: typing.Dict[str, typing.Any] = {}
+        for bucket, (initial_limit, min_limit, max_limit, latency_target_ms) in self.budgets.items():
+            leases_key, state_key, history_key = self._keys(bucket)
+            pipe = self.client.pipeline(transaction=False)
+            pipe.hgetall(state_key)
+            pipe.zcount(leases_key, now_ms, "+inf")
+            pipe.lrange(history_key, 0, history_limit - 1)
+            state, in_flight, history = pipe.execute()
+            state = {k.decode(): v.decode() for k, v in state.items()}
+            status[bucket] = {
+                "limit": float(state.get("limit", initial_limit)),
+                "in_flight": in_flight,
+                "min_limit": min_limit,
+                "max_limit": max_limit,
+                "latency_target_ms": latency_target_ms,
+                "ewma_total_ms": float(state.get("ewma_total_ms", 0)),
+                "ewma_submit_ms": float(state.get("ewma_submit_ms", 0)),
+                "counts": {k[len("count_"):]: int(v) for k, v in state.items() if k.startswith("count_")},
+                "history": [json.loads(item) for item in history],
+            }
+        return status
+
+
+# 单例模式
+_controller_instance: typing.Optional[AdaptiveConcurrencyController] = None
+
+
+def get_concurrency_controller() -> AdaptiveConcurrencyController:
+    """
+    获取自适应并发控制器实例（单例模式）
+
+    Returns:
+        自适应并发控制器实例
+    """
+    global _controller_instance
+    if _controller_instance is None:
+        _controller_instance = AdaptiveConcurrencyController()
+    return _controller_instance
@@ -4,19 +4,260 @@
 该模块提供了发送飞书通知的功能，支持两个不同的机器人：
 1. 任务状态通知机器人：用于任务发送、开始、取消、失败、结束等状态通知
 2. 错误调试机器人：用于其他错误和调试信息
+
+通知先放入进程内的有界队列，由一个后台线程通过复用连接的会话按速率限制依次发送，
+遇到Webhook限流时退避重试。队列积压时丢弃低优先级通知（任务处理中、调试信息），队列满时丢弃新通知。
+子任务完成/失败不逐条发送，而是按任务汇总为每 FEISHU_DIGEST_INTERVAL 秒一条的进度通知。
 """
 
+import atexit
 import logging
+import queue
 import threading
-import requests
+import time
 from datetime import datetime
-from typing import Optional
+from typing import Any, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
 
 from backend.core.config import settings
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
+# 通知优先级：队列积压时先丢弃低优先级通知
+PRIORITY_HIGH = "high"
+PRIORITY_LOW = "low"
+
+# 低优先级的任务状态事件
+_LOW_PRIORITY_TASK_EVENTS = {'task_processing'}
+
+# 飞书Webhook返回的限流错误码
+_RATE_LIMIT_CODES = {9499, 11232}
+
+# 每个任务的汇总通知中最多附带的错误示例数量
+_DIGEST_ERROR_SAMPLES = 3
+
+
+class FeishuDispatcher:
+    """
+    飞书通知发送器（进程内单个后台线程）
+    """
+
+    def __init__(self) -> None:
+        """初始化发送器"""
+        self.queue: "queue.Queue" = queue.Queue(maxsize=settings.FEISHU_QUEUE_SIZE)
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=2, pool_maxsize=2))
+        self.session.mount("http://", HTTPAdapter(pool_connections=2, pool_maxsize=2))
+        # 任务ID -> 汇总中的子任务结果
+        self._digests: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # Webhook URL -> 下次允许发送的时间
+        self._next_send_at: Dict[str, float] = {}
+        self.stats = {"sent": 0, "failed": 0, "dropped": 0, "rate_limited": 0, "digested": 0}
+
+    def _ensure_thread(self) -> None:
+        """启动后台发送线程"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopped.clear()
+                self._thread = threading.Thread(target=self._run, name="feishu-dispatcher", daemon=True)
+                self._thread.start()
+
+    def submit(self, webhook_url: Optional[str], text: str, priority: str = PRIORITY_HIGH) -> bool:
+        """
+        把通知放入发送队列
+
+        Args:
+            webhook_url: 机器人Webhook URL
+            text: 通知内容
+            priority: 优先级
+
+        Returns:
+            是否已放入队列
+        """
+        if not webhook_url:
+            logger.warning("飞书机器人的Webhook URL未配置，跳过通知")
+            return False
+
+        self._ensure_thread()
+        if priority == PRIORITY_LOW and \
+                self.queue.qsize() >= self.queue.maxsize * settings.FEISHU_LOW_PRIORITY_WATERMARK:
+            self._drop("队列积压，丢弃低优先级飞书通知")
+            return False
+        try:
+            self.queue.put_nowait((webhook_url, text))
+            return True
+        except queue.Full:
+            self._drop("飞书通知队列已满，丢弃通知")
+            return False
+
+    def _drop(self, reason: str) -> None:
+        """记录丢弃的通知（每100条记录一次日志）"""
+        with self._lock:
+            self.stats["dropped"] += 1
+            dropped = self.stats["dropped"]
+        if dropped % 100 == 1:
+            logger.warning(f"{reason}，累计丢弃 {dropped} 条")
+
+    def add_subtask_outcome(self, task_id: str, task_name: Optional[str], submitter: Optional[str],
+                            outcome: str, error: Optional[str] = None) -> None:
+        """
+        把子任务结果计入所属任务的汇总通知
+
+        Args:
+            task_id: 任务ID
+            task_name: 任务名称
+            submitter: 提交者
+            outcome: completed、failed 或 censored
+            error: 错误信息
+        """
+        self._ensure_thread()
+        with self._lock:
+            digest = self._digests.get(task_id)
+            if digest is None:
+                digest = self._digests[task_id] = {
+                    "task_name": task_name,
+                    "submitter": submitter,
+                    "started_at": time.monotonic(),
+                    "completed": 0,
+                    "failed": 0,
+                    "censored": 0,
+                    "errors": [],
+                }
+            digest[outcome] += 1
+            if error and outcome != "completed" and len(digest["errors"]) < _DIGEST_ERROR_SAMPLES:
+                digest["errors"].append(error)
+            self.stats["digested"] += 1
+
+    def _flush_digests(self, force: bool = False) -> None:
+        """
+        把到期的任务汇总放入发送队列
+
+        Args:
+            force: 是否忽略汇总间隔，发送所有汇总
+        """
+        now = time.monotonic()
+        with self._lock:
+            due = {task_id: digest for task_id, digest in self._digests.items()
+                   if force or now - digest["started_at"] >= settings.FEISHU_DIGEST_INTERVAL}
+            for task_id in due:
+                del self._digests[task_id]
+
+        for task_id, digest in due.items():
+            self.submit(settings.FEISHU_TASK_WEBHOOK_URL, _format_digest_message(task_id, digest, now))
+
+    def _run(self) -> None:
+        """后台线程：发送队列中的通知并定期发送任务汇总，停止后发送完剩余通知再退出"""
+        while True:
+            self._flush_digests(force=self._stopped.is_set())
+            try:
+                webhook_url, text = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                if self._stopped.is_set():
+                    return
+                continue
+            try:
+                self._send(webhook_url, text)
+            finally:
+                self.queue.task_done()
+
+    def _wait_for_slot(self, webhook_url: str) -> None:
+        """按每分钟发送上限控制同一机器人的发送间隔"""
+        min_interval = 60 / max(settings.FEISHU_RATE_PER_MINUTE, 1)
+        now = time.monotonic()
+        next_at = self._next_send_at.get(webhook_url, now)
+        if next_at > now:
+            time.sleep(next_at - now)
+        self._next_send_at[webhook_url] = max(next_at, now) + min_interval
+
+    def _send(self, webhook_url: str, text: str) -> None:
+        """
+        发送一条通知，遇到限流时退避重试
+
+        Args:
+            webhook_url: 机器人Webhook URL
+            text: 通知内容
+        """
+        content = {
+            "msg_type": "text",
+            "content": {
+                "text": text,
+            }
+        }
+        for attempt in range(settings.FEISHU_MAX_RETRIES + 1):
+            self._wait_for_slot(webhook_url)
+            retry_after = None
+            try:
+                response = self.session.post(webhook_url, json=content, timeout=10)
+                code = None
+                try:
+                    body = response.json()
+                    code = body.get("code", body.get("StatusCode"))
+                except ValueError:
+                    pass
+
+                if response.status_code == 429 or code in _RATE_LIMIT_CODES:
+                    self.stats["rate_limited"] += 1
+                    retry_after = response.headers.get("Retry-After")
+                elif response.status_code >= 500:
+                    logger.warning(f"飞书通知发送失败: {response.status_code}, {response.text}")
+                else:
+                    logger.debug(f"飞书通知发送结果: {response.status_code}, {response.text}")
+                    self.stats["sent"] += 1
+                    return
+            except requests.RequestException as e:
+                logger.warning(f"飞书通知发送失败: {str(e)}")
+
+            if attempt < settings.FEISHU_MAX_RETRIES:
+                try:
+                    delay = float(retry_after) if retry_after else 2 ** attempt
+                except ValueError:
+                    delay = 2 ** attempt
+                delay = min(delay, settings.FEISHU_MAX_BACKOFF)
+                # 退避期间同一机器人的其他通知也一起等待
+                self._next_send_at[webhook_url] = time.monotonic() + delay
+
+        self.stats["failed"] += 1
+        logger.error(f"飞书通知发送失败，已重试 {settings.FEISHU_MAX_RETRIES} 次，放弃发送")
+
+    def close(self, timeout: float = 10) -> None:
+        """
+        发送剩余的汇总和通知后停止后台线程
+
+        Args:
+            timeout: 最长等待时间（秒）
+        """
+        self._stopped.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout)
+        logger.info(f"飞书通知发送统计: {self.stats}")
+
+
+# 单例模式
+_dispatcher_instance: Optional[FeishuDispatcher] = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_feishu_dispatcher() -> FeishuDispatcher:
+    """
+    获取飞书通知发送器实例（单例模式）
+
+    Returns:
+        飞书通知发送器实例
+    """
+    global _dispatcher_instance
+    if _dispatcher_instance is None:
+        with _dispatcher_lock:
+            if _dispatcher_instance is None:
+                _dispatcher_instance = FeishuDispatcher()
+                atexit.register(_dispatcher_instance.close)
+    return _dispatcher_instance
+
 
 def feishu_task_notify(event_type: str, task_id: str = None, task_name: str = None,
                       submitter: str = None, details: dict = None, message: str = None,
@@ -33,8 +274,12 @@ def feishu_task_notify(event_type: str, task_id: str = None, task_name: str = No
         message: 额外消息
         frontend_url: 前端详细页面URL
     """
-    threading.Thread(target=_send_feishu_task_notify,
-                    args=(event_type, task_id, task_name, submitter, details, message, frontend_url)).start()
+    try:
+        text = _format_task_message(event_type, task_id, task_name, submitter, details, message, frontend_url)
+        priority = PRIORITY_LOW if event_type in _LOW_PRIORITY_TASK_EVENTS else PRIORITY_HIGH
+        get_feishu_dispatcher().submit(settings.FEISHU_TASK_WEBHOOK_URL, text, priority)
+    except Exception as e:
+        logger.error(f"发送任务状态飞书通知失败: {str(e)}")
 
 
 def feishu_debug_notify(message: str, error_type: str = "system_error", details: dict = None):
@@ -46,8 +291,42 @@ def feishu_debug_notify(message: str, error_type: str = "system_error", details:
         error_type: 错误类型
         details: 详细信息字典
     """
-    threading.Thread(target=_send_feishu_debug_notify,
-                    args=(message, error_type, details)).start()
+    try:
+        text = _format_debug_message(message, error_type, details)
+        get_feishu_dispatcher().submit(settings.FEISHU_DEBUG_WEBHOOK_URL, text, PRIORITY_LOW)
+    except Exception as e:
+        logger.error(f"发送错误调试飞书通知失败: {str(e)}")
+
+
+def feishu_subtask_notify(event_type: str, task_id: str, task_name: str = None,
+                          submitter: str = None, details: dict = None, message: str = None,
+                          error: str = None, censored: bool = False):
+    """
+    发送子任务完成/失败通知：计入所属任务的汇总通知，FEISHU_DIGEST_INTERVAL 为0时逐条发送
+
+    Args:
+        event_type: 事件类型，'task_completed' 或 'task_failed'
+        task_id: 任务ID
+        task_name: 任务名称
+        submitter: 提交者
+        details: 详细信息字典（仅逐条发送时使用）
+        message: 额外消息（仅逐条发送时使用）
+        error: 错误信息
+        censored: 是否为内容不合规
+    """
+    if settings.FEISHU_DIGEST_INTERVAL <= 0:
+        try:
+            text = _format_task_message(event_type, task_id, task_name, submitter, details, message)
+            get_feishu_dispatcher().submit(settings.FEISHU_TASK_WEBHOOK_URL, text, PRIORITY_LOW)
+        except Exception as e:
+            logger.error(f"发送任务状态飞书通知失败: {str(e)}")
+        return
+
+    if event_type == "task_completed":
+        outcome = "completed"
+    else:
+        outcome = "censored" if censored else "failed"
+    get_feishu_dispatcher().add_subtask_outcome(task_id, task_name, submitter, outcome, error)
 
 
 def feishu_notify(event_type: str, task_id: str = None, task_name: str = None,
@@ -75,11 +354,11 @@ def feishu_notify(event_type: str, task_id: str = None, task_name: str = None,
         feishu_debug_notify(message or f"{event_type} 事件", event_type, details)
 
 
-def _send_feishu_task_notify(event_type: str, task_id: str = None, task_name: str = None,
-                            submitter: str = None, details: dict = None, message: str = None,
-                            frontend_url: str = None):
+def _format_task_message(event_type: str, task_id: str = None, task_name: str = None,
+                         submitter: str = None, details: dict = None, message: str = None,
+                         frontend_url: str = None) -> str:
     """
-    实际发送任务状态飞书通知的函数
+    构建任务状态飞书通知的内容
 
     Args:
         event_type: 事件类型
@@ -89,131 +368,129 @@ def _send_feishu_task_notify(event_type: str, task_id: str = None, task_name: st
         details: 详细信息字典
         message: 额外消息
         frontend_url: 前端详细页面URL
-    """
-    try:
-        webhook_url = settings.FEISHU_TASK_WEBHOOK_URL
-        if not webhook_url:
-            logger.warning("任务状态通知机器人的Webhook URL未配置，跳过通知")
-            return
-
-        # 构建通知标题
-        title_map = {
-            'task_submitted': '🆕 任务已提交',
-            'task_processing': '⏳ 任务处理中',
-            'task_completed': '✅ 任务已完成',
-            'task_failed': '❌ 任务失败',
-            'task_partial_completed': '⚠️ 任务部分完成',
-            'task_cancelled': '🚫 任务已取消',
-            'test': '🔍 测试通知'
-        }
 
-        title = title_map.get(event_type, f'📢 {event_type}')
-
-        # 构建通知内容
-        content_lines = [title]
+    Returns:
+        通知内容
+    """
+    # 构建通知标题
+    title_map = {
+        'task_submitted': '🆕 任务已提交',
+        'task_processing': '⏳ 任务处理中',
+        'task_completed': '✅ 任务已完成',
+        'task_failed': '❌ 任务失败',
+        'task_partial_completed': '⚠️ 任务部分完成',
+        'task_cancelled': '🚫 任务已取消',
+        'test': '🔍 测试通知'
+    }
 
-        if task_id:
-            content_lines.append(f"任务ID: {task_id}")
+    title = title_map.get(event_type, f'📢 {event_type}')
 
-        if task_name:
-            content_lines.append(f"任务名称: {task_name}")
+    # 构建通知内容
+    content_lines = [title]
 
-        if submitter:
-            content_lines.append(f"提交者: {submitter}")
+    if task_id:
+        content_lines.append(f"任务ID: {task_id}")
 
-        # 添加详细信息
-        if details:
-            for key, value in details.items():
-                content_lines.append(f"{key}: {value}")
+    if task_name:
+        content_lines.append(f"任务名称: {task_name}")
 
-        # 添加前端链接
-        if frontend_url:
-            content_lines.append(f"查看详情: {frontend_url}")
+    if submitter:
+        content_lines.append(f"提交者: {submitter}")
 
-        # 添加额外消息
-        if message:
-            content_lines.append(f"\n{message}")
+    # 添加详细信息
+    if details:
+        for key, value in details.items():
+            content_lines.append(f"{key}: {value}")
 
-        # 添加时间戳
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        content_lines.append(f"\n时间: {timestamp}")
+    # 添加前端链接
+    if frontend_url:
+        content_lines.append(f"查看详情: {frontend_url}")
 
-        # 合并所有内容
-        full_content = "\n".join(content_lines)
+    # 添加额外消息
+    if message:
+        content_lines.append(f"\n{message}")
 
-        headers = {
-            'Content-Type': 'application/json',
-        }
-        content = {
-            "msg_type": "text",
-            "content": {
-                "text": full_content,
-            }
-        }
+    # 添加时间戳
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    content_lines.append(f"\n时间: {timestamp}")
 
-        response = requests.post(webhook_url, headers=headers, json=content)
-        logger.debug(f"任务状态飞书通知发送结果: {response.status_code}, {response.text}")
-    except Exception as e:
-        logger.error(f"发送任务状态飞书通知失败: {str(e)}")
+    # 合并所有内容
+    return "\n".join(content_lines)
 
 
-def _send_feishu_debug_notify(message: str, error_type: str = "system_error", details: dict = None):
+def _format_debug_message(message: str, error_type: str = "system_error", details: dict = None) -> str:
     """
-    实际发送错误调试飞书通知的函数
+    构建错误调试飞书通知的内容
 
     Args:
         message: 错误消息
         error_type: 错误类型
         details: 详细信息字典
+
+    Returns:
+        通知内容
     """
-    try:
-        webhook_url = settings.FEISHU_DEBUG_WEBHOOK_URL
-        if not webhook_url:
-            logger.warning("错误调试机器人的Webhook URL未配置，跳过通知")
-            return
-
-        # 构建通知标题
-        title_map = {
-            'system_error': '🔥 系统错误',
-            'database_error': '💾 数据库错误',
-            'api_error': '🌐 API错误',
-            'worker_error': '⚙️ 工作进程错误',
-            'debug': '🐛 调试信息',
-            'warning': '⚠️ 警告'
-        }
+    # 构建通知标题
+    title_map = {
+        'system_error': '🔥 系统错误',
+        'database_error': '💾 数据库错误',
+        'api_error': '🌐 API错误',
+        'worker_error': '⚙️ 工作进程错误',
+        'debug': '🐛 调试信息',
+        'warning': '⚠️ 警告'
+    }
 
-        title = title_map.get(error_type, f'📢 {error_type}')
+    title = title_map.get(error_type, f'📢 {error_type}')
 
-        # 构建通知内容
-        content_lines = [title]
-        content_lines.append(f"消息: {message}")
+    # 构建通知内容
+    content_lines = [title]
+    content_lines.append(f"消息: {message}")
 
-        # 添加详细信息
-        if details:
-            for key, value in details.items():
-                content_lines.append(f"{key}: {value}")
+    # 添加详细信息
+    if details:
+        for key, value in details.items():
+            content_lines.append(f"{key}: {value}")
 
-        # 添加时间戳
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        content_lines.append(f"\n时间: {timestamp}")
+    # 添加时间戳
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    content_lines.append(f"\n时间: {timestamp}")
 
-        # 合并所有内容
-        full_content = "\n".join(content_lines)
+    # 合并所有内容
+    return "\n".join(content_lines)
 
-        headers = {
-            'Content-Type': 'application/json',
-        }
-        content = {
-            "msg_type": "text",
-            "content": {
-                "text": full_content,
-            }
-        }
 
-        response = requests.post(webhook_url, headers=headers, json=content)
-        logger.debug(f"错误调试飞书通知发送结果: {response.status_code}, {response.text}")
-    except Exception as e:
-        logger.error(f"发送错误调试飞书通知失败: {str(e)}")
+def _format_digest_message(task_id: str, digest: Dict[str, Any], now: float) -> str:
+    """
+    构建任务的子任务进度汇总通知内容
+
+    Args:
+        task_id: 任务ID
+        digest: 汇总中的子任务结果
+        now: 当前时间（time.monotonic()）
+
+    Returns:
+        通知内容
+    """
+    content_lines = ['📊 子任务进度汇总', f"任务ID: {task_id}"]
+    if digest["task_name"]:
+        content_lines.append(f"任务名称: {digest['task_name']}")
+    if digest["submitter"]:
+        content_lines.append(f"提交者: {digest['submitter']}")
+
+    seconds = max(int(now - digest["started_at"]), 1)
+    failed = digest["failed"] + digest["censored"]
+    summary = f"最近{seconds}秒: 完成 {digest['completed']} 个，失败 {failed} 个"
+    if digest["censored"]:
+        summary += f"（其中内容不合规 {digest['censored']} 个）"
+    content_lines.append(summary)
+
+    if digest["errors"]:
+        content_lines.append("\n错误示例:")
+        content_lines.extend(f"- {error}" for error in digest["errors"])
+
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    content_lines.append(f"\n时间: {timestamp}")
+    return "\n".join(content_lines)
 
 
 # 保持向后兼容的函数
@@ -0,0 +1,194 @@
+"""
+共享HTTP客户端模块
+
+为上游图像API调用提供进程内复用的 httpx.AsyncClient（连接池、keep-alive、可选HTTP/2），
+避免每次提交和轮询都重新建立TCP和TLS连接。
+
+httpx.AsyncClient 的连接池绑定在创建它的事件循环上，而Dramatiq每个工作线程各自持有一个事件循环，
+因此按事件循环分别创建客户端：同一工作线程处理的所有消息共享同一个连接池。
+"""
+import asyncio
+import logging
+import threading
+import typing
+import weakref
+
+import httpx
+
+from backend.core.config import settings
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+class ConnectionStats:
+    """连接复用统计（进程内所有共享客户端合计）"""
+
+    def __init__(self) -> None:
+        """初始化统计"""
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+        self.tls_handshakes = 0
+        self.http2_requests = 0
+        self.clients_created = 0
+
+    def incr(self, field: str, amount: int = 1) -> int:
+        """
+        增加统计项
+
+        Args:
+            field: 统计项名称
+            amount: 增加量
+
+        Returns:
+            增加后的值
+        """
+        with self._lock:
+            value = getattr(self, field) + amount
+            setattr(self, field, value)
+            return value
+
+    def snapshot(self) -> typing.Dict[str, typing.Any]:
+        """
+        获取统计快照
+
+        Returns:
+            请求数、新建连接数、TLS握手次数、复用连接的请求数和复用率
+        """
+        with self._lock:
+            reused = max(self.requests - self.new_connections, 0)
+            return {
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "tls_handshakes": self.tls_handshakes,
+                "reused_requests": reused,
+                "reuse_ratio": round(reused / self.requests, 4) if self.requests else 0.0,
+                "http2_requests": self.http2_requests,
+                "clients_created": self.clients_created,
+                "open_clients": len(_clients),
+            }
+
+
+_stats = ConnectionStats()
+
+# 每个事件循环一个客户端，事件循环被回收后对应条目自动移除
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+_clients_lock = threading.Lock()
+
+
+def _http2_available() -> bool:
+    """HTTP/2 需要可选依赖 h2（pip install 'httpx[http2]'）"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+async def _trace(event_name: str, info: typing.Dict[str, typing.Any]) -> None:
+    """httpcore 连接事件回调：统计新建连接和TLS握手"""
+    if event_name == "connection.connect_tcp.complete":
+        _stats.incr("new_connections")
+    elif event_name == "connection.start_tls.complete":
+        _stats.incr("tls_handshakes")
+
+
+async def _on_request(request: httpx.Request) -> None:
+    """请求事件钩子：挂载连接事件回调并计数"""
+    request.extensions["trace"] = _trace
+    requests = _stats.incr("requests")
+    interval = settings.HTTP_CLIENT_STATS_LOG_INTERVAL
+    if interval > 0 and requests % interval == 0:
+        logger.info(f"共享HTTP客户端连接复用统计: {_stats.snapshot()}")
+
+
+async def _on_response(response: httpx.Response) -> None:
+    """响应事件钩子：统计HTTP/2请求"""
+    if response.http_version == "HTTP/2":
+        _stats.incr("http2_requests")
+
+
+def _create_client() -> httpx.AsyncClient:
+    """
+    按配置创建共享客户端
+
+    Returns:
+        httpx.AsyncClient 实例
+    """
+    http2 = settings.HTTP_CLIENT_HTTP2
+    if http2 and not _http2_available():
+        logger.warning("已启用HTTP_CLIENT_HTTP2但未安装h2，回退到HTTP/1.1")
+        http2 = False
+
+    limits = httpx.Limits(
+        max_connections=settings.HTTP_CLIENT_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_CLIENT_MAX_KEEPALIVE,
+        keepalive_expiry=settings.HTTP_CLIENT_KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(settings.HTTP_CLIENT_TIMEOUT, connect=settings.HTTP_CLIENT_CONNECT_TIMEOUT)
+    _stats.incr("clients_created")
+    logger.info(f"创建共享HTTP客户端: http2={http2}, limits={limits}")
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=limits,
+        timeout=timeout,
+        event_hooks={"request": [_on_request], "response": [_on_response]},
+    )
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    获取当前事件循环的共享HTTP客户端（每个事件循环一个实例）
+
+    必须在协程中调用；请求级的超时可通过 `timeout=` 参数单独指定。
+
+    Returns:
+        httpx.AsyncClient 实例
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        with _clients_lock:
+            client = _clients.get(loop)
+            if client is None or client.is_closed:
+                client = _create_client()
+                _clients[loop] = client
+    return client
+
+
+async def aclose_http_client() -> None:
+    """关闭当前事件循环的共享HTTP客户端"""
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        client = _clients.pop(loop, None)
+    if client is not None and not client.is_closed:
+        await client.aclose()
+        logger.info(f"已关闭共享HTTP客户端，连接复用统计: {_stats.snapshot()}")
+
+
+def close_http_client_for_loop(loop: asyncio.AbstractEventLoop) -> None:
+    """
+    在事件循环未运行时关闭其共享HTTP客户端（用于工作线程退出时）
+
+    Args:
+        loop: 事件循环
+    """
+    with _clients_lock:
+        client = _clients.pop(loop, None)
+    if client is None or client.is_closed or loop.is_closed() or loop.is_running():
+        return
+    try:
+        loop.run_until_complete(client.aclose())
+    except Exception as e:
+        logger.warning(f"关闭共享HTTP客户端失败: {str(e)}")
+
+
+def get_http_client_stats() -> typing.Dict[str, typing.Any]:
+    """
+    获取连接复用统计
+
+    Returns:
+        统计快照
+    """
+    return _stats.snapshot()
@@ -0,0 +1,99 @@
+"""
+基于Redis的领导者选举模块
+
+多个实例竞争同一个带过期时间的租约键，持有者定期续期，其他实例在租约过期后才能取得。
+持有者进程退出时主动释放租约，崩溃时由其他实例在租约过期后接替。
+租约只保证同一时刻通常只有一个持有者：持有者停顿超过租约有效期时可能短暂出现两个持有者，
+由租约保护的操作需要可以重复执行。
+"""
+import logging
+import os
+import typing
+import uuid
+
+from backend.core.config import settings
+from backend.utils.redis_client import get_redis_client
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 取得或续期租约：租约空闲或已由自己持有时写入并刷新有效期
+_ACQUIRE_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if current == false or current == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+    return 1
+end
+return 0
+"""
+
+# 释放租约：只删除自己持有的租约
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class LeaderLease:
+    """
+    Redis租约
+    """
+
+    def __init__(self, key: str, ttl: float, identity: typing.Optional[str] = None) -> None:
+        """
+        初始化租约
+
+        Args:
+            key: 租约的Redis键
+            ttl: 租约有效期（秒），需要明显长于续期间隔
+            identity: 持有者标识，默认为 容器ID:进程ID:随机后缀
+        """
+        self.client = get_redis_client()
+        self.key = key
+        self.ttl_ms = int(ttl * 1000)
+        self.identity = identity or f"{settings.CONTAINER_UUID}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.acquire_script = self.client.register_script(_ACQUIRE_SCRIPT)
+        self.release_script = self.client.register_script(_RELEASE_SCRIPT)
+        self.is_leader = False
+
+    def acquire(self) -> bool:
+        """
+        取得或续期租约
+
+        Returns:
+            当前是否持有租约
+        """
+        try:
+            held = bool(self.acquire_script(keys=[self.key], args=[self.identity, self.ttl_ms]))
+        except Exception as e:
+            # 无法确认时按未持有处理，避免与其他实例同时执行
+            logger.warning(f"续期租约 {self.key} 失败: {str(e)}")
+            held = False
+
+        if held != self.is_leader:
+            logger.info(f"{'取得' if held else '失去'}租约 {self.key}（{self.identity}）")
+        self.is_leader = held
+        return held
+
+    def release(self) -> None:
+        """释放自己持有的租约"""
+        if not self.is_leader:
+            return
+        try:
+            self.release_script(keys=[self.key], args=[self.identity])
+            logger.info(f"已释放租约 {self.key}（{self.identity}）")
+        except Exception as e:
+            logger.warning(f"释放租约 {self.key} 失败: {str(e)}")
+        self.is_leader = False
+
+    def holder(self) -> typing.Optional[str]:
+        """
+        获取当前持有者
+
+        Returns:
+            持有者标识，租约空闲时返回None
+        """
+        value = self.client.get(self.key)
+        return value.decode() if isinstance(value, bytes) else value
@@ -0,0 +1,317 @@
+"""
+自适应轮询计划模块
+
+按 (API端点, 模型, 步数, 分辨率) 统计上游任务的完成耗时分布（样本保存在Redis中，所有进程共享），
+首次轮询推迟到完成耗时的低分位数（默认P10），之后按固定间隔轮询，
+超过高分位数（默认P90）后按已等待时间逐步拉长轮询间隔。
+总等待时间预算与固定间隔轮询相同（最大轮询次数 × 轮询间隔）。
+
+按耗时分布推迟首次轮询的任务，其样本在首次轮询处被截断（首次轮询前完成的任务只能记为首次轮询的时间，
+不记录又只留下慢于首次轮询的任务），用来计算低分位数会使首次轮询时间不断推迟。
+因此低分位数只由从头按固定间隔轮询的任务（样本不足时的任务和按 POLLING_EXPLORATION_RATE 比例保留的探测任务）
+的样本计算，高分位数使用所有未被截断的样本。
+"""
+import logging
+import random
+import threading
+import time
+import typing
+
+from backend.core.config import settings
+from backend.utils.redis_client import get_redis_client
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+class PollPlan:
+    """
+    单个上游任务的轮询计划
+    """
+
+    def __init__(self, profile: str, base_interval: float, budget: float, probe: bool,
+                 quantiles: typing.Optional[typing.Tuple[float, float]]) -> None:
+        """
+        初始化轮询计划
+
+        Args:
+            profile: 耗时分布分组
+            base_interval: 固定轮询间隔（秒）
+            budget: 总等待时间预算（秒）
+            probe: 是否为探测任务（从头按固定间隔轮询）
+            quantiles: (首次轮询分位数, 开始退避分位数) 对应的耗时（秒），样本不足时为None
+        """
+        self.profile = profile
+        self.base_interval = base_interval
+        self.budget = budget
+        self.probe = probe
+        self.quantiles = quantiles
+        self.last_poll_elapsed: typing.Optional[float] = None
+
+    @property
+    def adaptive(self) -> bool:
+        """是否按耗时分布调整轮询时间"""
+        return not self.probe and self.quantiles is not None
+
+    def first_delay(self) -> float:
+        """
+        首次轮询前的等待时间
+
+        Returns:
+            等待时间（秒）
+        """
+        if not self.adaptive:
+            return self.base_interval
+        return min(max(self.base_interval, self.quantiles[0]), self.budget)
+
+    def next_delay(self, elapsed: float) -> float:
+        """
+        距下次轮询的等待时间
+
+        Args:
+            elapsed: 从提交到本次轮询的时间（秒）
+
+        Returns:
+            等待时间（秒），不超过剩余预算
+        """
+        self.last_poll_elapsed = elapsed
+        delay = self.base_interval
+        if self.adaptive and elapsed > self.quantiles[1]:
+            # 超过高分位数后，轮询间隔随超出的时间线性增长
+            delay = min(settings.POLLING_MAX_INTERVAL,
+                        self.base_interval + (elapsed - self.quantiles[1]) * (settings.POLLING_BACKOFF_FACTOR - 1))
+        return max(min(delay, self.budget - elapsed), 0.0)
+
+    def sample(self, elapsed: float) -> float:
+        """
+        根据成功时的轮询时间估计完成耗时：取上一次轮询和本次轮询的中点
+
+        Args:
+            elapsed: 得到成功结果时距提交的时间（秒）
+
+        Returns:
+            估计的完成耗时（秒）
+        """
+        if self.last_poll_elapsed is None:
+            return elapsed
+        return (self.last_poll_elapsed + elapsed) / 2
+
+    def to_dict(self) -> typing.Dict[str, typing.Any]:
+        """转换为可以随上游任务登记的字典"""
+        return {
+            "profile": self.profile,
+            "base_interval": self.base_interval,
+            "budget": self.budget,
+            "probe": self.probe,
+            "last_poll_elapsed": self.last_poll_elapsed,
+        }
+
+
+class PollingSchedule:
+    """基于完成耗时分布的轮询计划生成器"""
+
+    def __init__(self) -> None:
+        """初始化轮询计划生成器"""
+        self.client = get_redis_client()
+        self.key_prefix = settings.POLLING_SCHEDULE_KEY_PREFIX
+        # 分组 -> (读取时间, 分位数)，避免每个任务都读取Redis
+        self._cache: typing.Dict[str, typing.Tuple[float, typing.Optional[typing.Tuple[float, float]]]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def profile_key(is_lumina: bool, model: typing.Optional[str], steps: typing.Optional[int],
+                    width: int, height: int) -> str:
+        """
+        生成耗时分布分组
+
+        Args:
+            is_lumina: 是否使用Lumina端点
+            model: 模型名称
+            steps: 步数
+            width: 图像宽度
+            height: 图像高度
+
+        Returns:
+            分组名称
+        """
+        endpoint = "lumina" if is_lumina else "standard"
+        return f"{endpoint}|{model or 'default'}|{steps or '-'}|{width}x{height}"
+
+    def _samples_key(self, profile: str) -> str:
+        return f"{self.key_prefix}:samples:{profile}"
+
+    def _unbiased_samples_key(self, profile: str) -> str:
+        return f"{self.key_prefix}:unbiased:{profile}"
+
+    @property
+    def stats_key(self) -> str:
+        return f"{self.key_prefix}:stats"
+
+    def _quantiles(self, profile: str) -> typing.Optional[typing.Tuple[float, float]]:
+        """
+        获取分组的首次轮询分位数和开始退避分位数（进程内缓存 POLLING_CACHE_TTL 秒）
+
+        Args:
+            profile: 分组名称
+
+        Returns:
+            (首次轮询分位数耗时, 开始退避分位数耗时)，样本不足时为None
+        """
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(profile)
+            if cached and now - cached[0] < settings.POLLING_CACHE_TTL:
+                return cached[1]
+
+        pipe = self.client.pipeline(transaction=False)
+        pipe.lrange(self._unbiased_samples_key(profile), 0, -1)
+        pipe.lrange(self._samples_key(profile), 0, -1)
+        unbiased, samples = [sorted(float(v) for v in values) for values in pipe.execute()]
+        quantiles = None
+        if len(unbiased) >= settings.POLLING_MIN_SAMPLES and len(samples) >= settings.POLLING_MIN_SAMPLES:
+            quantiles = (
+                quantile(unbiased, settings.POLLING_FIRST_QUANTILE),
+                quantile(samples, settings.POLLING_TAIL_QUANTILE),
+            )
+
+        with self._lock:
+            self._cache[profile] = (now, quantiles)
+        return quantiles
+
+    def plan(self, profile: str, base_interval: float, max_attempts: int) -> PollPlan:
+        """
+        为上游任务生成轮询计划
+
+        Args:
+            profile: 分组名称
+            base_interval: 固定轮询间隔（秒）
+            max_attempts: 固定间隔轮询时的最大轮询次数，与轮询间隔相乘作为总等待时间预算
+
+        Returns:
+            轮询计划
+        """
+        probe = random.random() < settings.POLLING_EXPLORATION_RATE
+        try:
+            quantiles = self._quantiles(profile)
+        except Exception as e:
+            logger.warning(f"读取轮询耗时分布失败，使用固定间隔轮询: {str(e)}")
+            quantiles = None
+        return PollPlan(profile, base_interval, base_interval * max_attempts, probe, quantiles)
+
+    def restore(self, data: typing.Dict[str, typing.Any]) -> PollPlan:
+        """
+        从登记的字典恢复轮询计划（结果轮询服务使用）
+
+        Args:
+            data: PollPlan.to_dict() 的结果
+
+        Returns:
+            轮询计划
+        """
+        try:
+            quantiles = self._quantiles(data["profile"])
+        except Exception as e:
+            logger.warning(f"读取轮询耗时分布失败，使用固定间隔轮询: {str(e)}")
+            quantiles = None
+        plan = PollPlan(data["profile"], data["base_interval"], data["budget"], data["probe"], quantiles)
+        plan.last_poll_elapsed = data.get("last_poll_elapsed")
+        return plan
+
+    def record(self, plan: PollPlan, elapsed: float, polls: int) -> None:
+        """
+        记录一次成功的上游任务：完成耗时样本和轮询次数
+
+        按耗时分布推迟首次轮询的任务在首次轮询时就已完成时，完成耗时被截断为首次轮询的时间，只记录轮询次数；
+        从头按固定间隔轮询的任务的样本没有被截断，另外记录一份用于计算首次轮询分位数。
+
+        Args:
+            plan: 轮询计划
+            elapsed: 得到成功结果时距提交的时间（秒）
+            polls: 本任务的轮询次数
+        """
+        censored = plan.adaptive and plan.last_poll_elapsed is None
+        try:
+            key = self._samples_key(plan.profile)
+            pipe = self.client.pipeline(transaction=False)
+            if censored:
+                pipe.hincrby(self.stats_key, "censored_samples", 1)
+            else:
+                sample = round(plan.sample(elapsed), 3)
+                keys = [key] if plan.adaptive else [key, self._unbiased_samples_key(plan.profile)]
+                for sample_key in keys:
+                    pipe.lpush(sample_key, sample)
+                    pipe.ltrim(sample_key, 0, settings.POLLING_SAMPLE_SIZE - 1)
+                    pipe.expire(sample_key, 7 * 24 * 3600)
+            pipe.hincrby(self.stats_key, "jobs", 1)
+            pipe.hincrby(self.stats_key, "polls", polls)
+            pipe.hincrby(self.stats_key, "adaptive_jobs" if plan.adaptive else "fixed_jobs", 1)
+            pipe.hincrby(self.stats_key, "adaptive_polls" if plan.adaptive else "fixed_polls", polls)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"记录轮询耗时样本失败: {str(e)}")
+
+    def get_status(self) -> typing.Dict[str, typing.Any]:
+        """
+        获取各分组的耗时分布和轮询次数统计
+
+        Returns:
+            分组样本数和分位数、每个任务的平均轮询次数
+        """
+        profiles = {}
+        prefix = self._samples_key("")
+        for key in self.client.scan_iter(match=f"{prefix}*", count=100):
+            key = key.decode()
+            samples = sorted(float(v) for v in self.client.lrange(key, 0, -1))
+            if not samples:
+                continue
+            profile = key[len(prefix):]
+            profiles[profile] = {
+                "samples": len(samples),
+                "unbiased_samples": self.client.llen(self._unbiased_samples_key(profile)),
+                "p10": quantile(samples, 0.1),
+                "p50": quantile(samples, 0.5),
+                "p90": quantile(samples, 0.9),
+                "p99": quantile(samples, 0.99),
+            }
+
+        stats = {k.decode(): int(v) for k, v in self.client.hgetall(self.stats_key).items()}
+        for kind in ("adaptive", "fixed"):
+            jobs = stats.get(f"{kind}_jobs", 0)
+            stats[f"{kind}_polls_per_job"] = round(stats.get(f"{kind}_polls", 0) / jobs, 2) if jobs else None
+        return {"profiles": profiles, "stats": stats}
+
+
+def quantile(sorted_samples: typing.List[float], q: float) -> float:
+    """
+    计算已排序样本的分位数（线性插值）
+
+    Args:
+        sorted_samples: 升序排列的样本
+        q: 分位数（0~1）
+
+    Returns:
+        分位数对应的值
+    """
+    if not sorted_samples:
+        return 0.0
+    position = (len(sorted_samples) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_samples) - 1)
+    return sorted_samples[lower] + (sorted_samples[upper] - sorted_samples[lower]) * (position - lower)
+
+
+# 单例模式
+_polling_schedule_instance: typing.Optional[PollingSchedule] = None
+
+
+def get_polling_schedule() -> PollingSchedule:
+    """
+    获取轮询计划生成器实例（单例模式）
+
+    Returns:
+        轮询计划生成器实例
+    """
+    global _polling_schedule_instance
+    if _polling_schedule_instance is None:
+        _polling_schedule_instance = PollingSchedule()
+    return _polling_schedule_instance
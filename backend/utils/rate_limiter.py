@@ -0,0 +1,128 @@
+"""
+分布式限流模块
+
+基于Redis的全局令牌桶，所有工作进程共享同一个桶，
+标准API和Lumina API使用各自独立的预算
+"""
+import asyncio
+import logging
+import time
+import typing
+
+from backend.core.config import settings
+from backend.utils.redis_client import get_redis_client
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 令牌桶名称
+BUCKET_STANDARD = "standard"
+BUCKET_LUMINA = "lumina"
+
+# 令牌桶Lua脚本：按Redis服务器时间补充令牌，令牌足够时扣除并返回0，否则返回需要等待的毫秒数
+_TOKEN_BUCKET_SCRIPT = """
+local key = KEYS[1]
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+local state = redis.call('HMGET', key, 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate / 1000)
+
+local wait_ms = 0
+if tokens >= requested then
+    tokens = tokens - requested
+else
+    wait_ms = math.ceil((requested - tokens) * 1000 / rate)
+end
+
+redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', key, math.ceil(capacity * 1000 / rate) + 60000)
+return wait_ms
+"""
+
+
+class RateLimitTimeoutError(Exception):
+    """等待令牌超时"""
+    pass
+
+
+class TokenBucketRateLimiter:
+    """Redis全局令牌桶限流器"""
+
+    def __init__(self) -> None:
+        """初始化限流器"""
+        self.client = get_redis_client()
+        self.script = self.client.register_script(_TOKEN_BUCKET_SCRIPT)
+        self.key_prefix = settings.RATE_LIMIT_KEY_PREFIX
+        # 桶名称 -> (每秒补充的令牌数, 桶容量)
+        self.budgets: typing.Dict[str, typing.Tuple[float, float]] = {
+            BUCKET_STANDARD: (settings.RATE_LIMIT_STANDARD_RATE, settings.RATE_LIMIT_STANDARD_BURST),
+            BUCKET_LUMINA: (settings.RATE_LIMIT_LUMINA_RATE, settings.RATE_LIMIT_LUMINA_BURST),
+        }
+
+    def try_acquire(self, bucket: str, tokens: float = 1) -> int:
+        """
+        尝试获取令牌（不等待）
+
+        Args:
+            bucket: 桶名称
+            tokens: 需要的令牌数
+
+        Returns:
+            0表示获取成功，否则为还需等待的毫秒数
+        """
+        rate, capacity = self.budgets[bucket]
+        return int(self.script(keys=[f"{self.key_prefix}:{bucket}"], args=[rate, capacity, tokens]))
+
+    async def acquire_async(self, bucket: str, tokens: float = 1, timeout: typing.Optional[float] = None) -> float:
+        """
+        获取令牌，令牌不足时异步等待
+
+        Args:
+            bucket: 桶名称
+            tokens: 需要的令牌数
+            timeout: 最长等待时间（秒），默认使用 RATE_LIMIT_MAX_WAIT 配置
+
+        Returns:
+            实际等待的秒数
+
+        Raises:
+            RateLimitTimeoutError: 超过最长等待时间仍未获取到令牌
+        """
+        timeout = settings.RATE_LIMIT_MAX_WAIT if timeout is None else timeout
+        start_time = time.monotonic()
+        while True:
+            # Redis往返在线程中执行，不阻塞事件循环中的其他协程
+            wait_ms = await asyncio.to_thread(self.try_acquire, bucket, tokens)
+            waited = time.monotonic() - start_time
+            if wait_ms == 0:
+                if waited > 1:
+                    logger.debug(f"获取 {bucket} 令牌等待了 {waited:.2f}秒")
+                return waited
+            if waited + wait_ms / 1000 > timeout:
+                raise RateLimitTimeoutError(f"等待 {bucket} 限流令牌超时（已等待 {waited:.2f}秒）")
+            await asyncio.sleep(wait_ms / 1000)
+
+
+# 单例模式
+_rate_limiter_instance: typing.Optional[TokenBucketRateLimiter] = None
+
+
+def get_rate_limiter() -> TokenBucketRateLimiter:
+    """
+    获取限流器实例（单例模式）
+
+    Returns:
+        限流器实例
+    """
+    global _rate_limiter_instance
+    if _rate_limiter_instance is None:
+        _rate_limiter_instance = TokenBucketRateLimiter()
+    return _rate_limiter_instance
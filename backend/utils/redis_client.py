@@ -0,0 +1,37 @@
+"""
+Redis客户端模块
+
+提供进程内共享的Redis客户端，供限流、并发控制等跨进程协调功能使用
+"""
+import logging
+import threading
+import typing
+
+import redis
+
+from backend.core.config import settings
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 单例模式
+_redis_client_instance: typing.Optional[redis.Redis] = None
+_redis_client_lock = threading.Lock()
+
+
+def get_redis_client() -> redis.Redis:
+    """
+    获取Redis客户端实例（单例模式）
+
+    使用与Dramatiq broker相同的Redis（BROKER_REDIS_URL），客户端内部自带连接池，可在线程间共享。
+
+    Returns:
+        Redis客户端实例
+    """
+    global _redis_client_instance
+    if _redis_client_instance is None:
+        with _redis_client_lock:
+            if _redis_client_instance is None:
+                logger.info("初始化共享Redis客户端")
+                _redis_client_instance = redis.Redis.from_url(settings.BROKER_REDIS_URL)
+    return _redis_client_instance
@@ -15,6 +15,7 @@ import {
 } from "@heroui/react";
 import { Icon } from "@iconify/react";
 import { getTasks } from "@/utils/apiClient";
+import { applyTaskProgressEvent, useCoalescedCallback, useTaskEvents } from "@/utils/taskEvents";
 import { TaskListItem, APIResponse } from "@/types/task";
 import { TaskStatusChip } from "@/components/task/task-status-chip";
 import { CustomProgress } from "@/components/ui/custom-progress";
@@ -92,12 +93,32 @@ export default function QueuePage() {
     loadQueueTasks(true);
   };
 
-  // 初始加载和定时刷新
+  // 进度事件直接更新队列中的任务；状态变化时重新加载（多个任务同时变化时合并为一次）
+  const reloadQueueTasks = useCoalescedCallback(() => loadQueueTasks(true));
+  const eventsConnected = useTaskEvents((event) => {
+    if (event.type === "task_progress") {
+      const data = event.data;
+      setQueueTasks((prev) =>
+        prev.map((task) => (task.id === event.task_id ? applyTaskProgressEvent(task, data) : task))
+      );
+    } else if (event.type === "task_status") {
+      reloadQueueTasks();
+    }
+  }, reloadQueueTasks);
+
+  // 初始加载
   useEffect(() => {
     loadQueueTasks();
+  }, []);
+
+  // 推送不可用时定时刷新
+  useEffect(() => {
+    if (eventsConnected) {
+      return;
+    }
     const interval = setInterval(() => loadQueueTasks(true), 15000); // 改为15秒
     return () => clearInterval(interval);
-  }, []);
+  }, [eventsConnected]);
 
   const getStatusIcon = (status: string) => {
     switch (status) {
@@ -4,6 +4,7 @@ import React, { useState, useEffect } from "react";
 import { Card, CardBody, Chip, Spinner } from "@heroui/react";
 import { Icon } from "@iconify/react";
 import { getRunningTasks } from "@/utils/apiClient";
+import { useCoalescedCallback, useTaskEvents } from "@/utils/taskEvents";
 import { RunningTasksResponse, APIResponse } from "@/types/task";
 
 interface RunningTasksOverviewProps {
@@ -30,15 +31,26 @@ export const RunningTasksOverview: React.FC<RunningTasksOverviewProps> = ({
         }
     };
 
-    // 初始加载和定时刷新
+    // 任务状态变化时重新加载（多个任务同时变化时合并为一次）
+    const reloadRunningTasks = useCoalescedCallback(loadRunningTasks);
+    const eventsConnected = useTaskEvents((event) => {
+        if (event.type === "task_status") {
+            reloadRunningTasks();
+        }
+    }, reloadRunningTasks);
+
+    // 初始加载
     useEffect(() => {
         loadRunningTasks();
+    }, []);
 
-        if (refreshInterval > 0) {
+    // 推送不可用时定时刷新
+    useEffect(() => {
+        if (refreshInterval > 0 && !eventsConnected) {
             const interval = setInterval(loadRunningTasks, refreshInterval);
             return () => clearInterval(interval);
         }
-    }, [refreshInterval]);
+    }, [refreshInterval, eventsConnected]);
 
     // 格式化时间
     const formatTime = (timeStr: string) => {
@@ -29,6 +29,7 @@ import { Icon } from "@iconify/react";
 import { TaskStatusChip } from "@/components/task/task-status-chip";
 import { TaskProgressBar } from "@/components/task/task-progress-bar";
 import { getTasks, cancelTask, getTask } from "@/utils/apiClient";
+import { applyTaskProgressEvent, useCoalescedCallback, useTaskEvents } from "@/utils/taskEvents";
 import { TaskListItem, TaskDetailResponse, APIResponse } from "@/types/task";
 
 interface TaskListProps {
@@ -102,15 +103,31 @@ export const TaskList: React.FC<TaskListProps> = ({
         }
     };
 
-    // 初始加载和定时刷新
+    // 进度事件直接更新列表中的任务；状态变化可能改变筛选结果，重新加载（多个任务同时变化时合并为一次）
+    const reloadTasks = useCoalescedCallback(loadTasks);
+    const eventsConnected = useTaskEvents((event) => {
+        if (event.type === "task_progress") {
+            const data = event.data;
+            setTasks((prev) =>
+                prev.map((task) => (task.id === event.task_id ? applyTaskProgressEvent(task, data) : task))
+            );
+        } else if (event.type === "task_status") {
+            reloadTasks();
+        }
+    }, reloadTasks);
+
+    // 初始加载
     useEffect(() => {
         loadTasks();
+    }, [page, statusFilter, usernameFilter, taskNameFilter, showRunningOnly]);
 
-        if (refreshInterval > 0) {
+    // 推送不可用时定时刷新
+    useEffect(() => {
+        if (refreshInterval > 0 && !eventsConnected) {
             const interval = setInterval(loadTasks, refreshInterval);
             return () => clearInterval(interval);
         }
-    }, [page, statusFilter, usernameFilter, taskNameFilter, showRunningOnly]);
+    }, [page, statusFilter, usernameFilter, taskNameFilter, showRunningOnly, eventsConnected]);
 
     const columns = [
         { key: "name", label: "任务名称" },
@@ -168,7 +185,7 @@ export const TaskList: React.FC<TaskListProps> = ({
                                 <Icon icon="solar:eye-linear" className="w-4 h-4" />
                             </Button>
                         </Tooltip>
-                        {(task.status === "pending" || task.status === "running") && (
+                        {(task.status === "pending" || task.status === "running" || task.status === "processing") && (
                             <Tooltip content="取消任务">
                                 <Button
                                     isIconOnly
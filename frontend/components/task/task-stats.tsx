@@ -3,7 +3,8 @@
 import React, { useState, useEffect } from "react";
 import { Card, CardBody, Spinner } from "@heroui/react";
 import { Icon } from "@iconify/react";
-import { getTasks } from "@/utils/apiClient";
+import { getTasksStats } from "@/utils/apiClient";
+import { useCoalescedCallback, useTaskEvents } from "@/utils/taskEvents";
 import { APIResponse } from "@/types/task";
 
 interface TaskStatsProps {
@@ -28,23 +29,19 @@ export const TaskStats: React.FC<TaskStatsProps> = ({
     // 加载任务统计
     const loadStats = async () => {
         try {
-            // 并行获取各种状态的任务数量
-            const [totalRes, pendingRes, runningRes, completedRes, failedRes, cancelledRes] = await Promise.all([
-                getTasks(1, 1, undefined, undefined, undefined),
-                getTasks(1, 1, "pending", undefined, undefined),
-                getTasks(1, 1, "running", undefined, undefined),
-                getTasks(1, 1, "completed", undefined, undefined),
-                getTasks(1, 1, "failed", undefined, undefined),
-                getTasks(1, 1, "cancelled", undefined, undefined)
-            ]);
+            // 一次请求获取各种状态的任务数量
+            const response: APIResponse<Record<string, number>> = await getTasksStats();
+            if (response.code !== 200) {
+                throw new Error(response.message);
+            }
 
             const newStats: TaskStats = {
-                total: totalRes.data.total,
-                pending: pendingRes.data.total,
-                running: runningRes.data.total,
-                completed: completedRes.data.total,
-                failed: failedRes.data.total,
-                cancelled: cancelledRes.data.total
+                total: response.data.total,
+                pending: response.data.pending,
+                running: response.data.processing,
+                completed: response.data.completed,
+                failed: response.data.failed,
+                cancelled: response.data.cancelled
             };
 
             setStats(newStats);
@@ -55,15 +52,26 @@ export const TaskStats: React.FC<TaskStatsProps> = ({
         }
     };
 
-    // 初始加载和定时刷新
+    // 任务状态变化时重新统计（多个任务同时变化时合并为一次）
+    const reloadStats = useCoalescedCallback(loadStats, 2000);
+    const eventsConnected = useTaskEvents((event) => {
+        if (event.type === "task_status") {
+            reloadStats();
+        }
+    }, reloadStats);
+
+    // 初始加载
     useEffect(() => {
         loadStats();
+    }, []);
 
-        if (refreshInterval > 0) {
+    // 推送不可用时定时刷新
+    useEffect(() => {
+        if (refreshInterval > 0 && !eventsConnected) {
             const interval = setInterval(loadStats, refreshInterval);
             return () => clearInterval(interval);
         }
-    }, [refreshInterval]);
+    }, [refreshInterval, eventsConnected]);
 
     if (loading) {
         return (
@@ -211,4 +211,42 @@ export interface TableRowData {
 export interface DimensionFilter {
     dimension: string; // 维度标识 (例如 "v2")
     valueIndex: number | null; // 在该维度上固定的值索引
-}
\ No newline at end of file
+}
+/**
+ * 任务事件推送 - 任务状态变化
+ */
+export interface TaskStatusEventData {
+    status: string;
+}
+
+/**
+ * 任务事件推送 - 任务进度（total和progress只在监控线程或任务协调服务发布时存在）
+ */
+export interface TaskProgressEventData {
+    completed: number;
+    failed: number;
+    cancelled: number;
+    processed: number;
+    total?: number;
+    progress?: number;
+}
+
+/**
+ * 任务事件推送 - 结束的子任务
+ */
+export interface SubtasksEventData {
+    subtasks: {
+        subtask_id: string;
+        status: string;
+        result?: string | null;
+        error?: string | null;
+    }[];
+}
+
+/**
+ * 任务事件推送 - 事件
+ */
+export type TaskEvent =
+    | { type: "task_status"; task_id: string; data: TaskStatusEventData; ts: number }
+    | { type: "task_progress"; task_id: string; data: TaskProgressEventData; ts: number }
+    | { type: "subtasks"; task_id: string; data: SubtasksEventData; ts: number };
@@ -0,0 +1,178 @@
+"use client";
+
+/**
+ * 任务事件推送
+ *
+ * 订阅后端的SSE事件流（GET /api/v1/test/events），任务状态、进度和子任务结束时由后端推送，
+ * 代替定时轮询。同一页面的所有组件共用一个连接；后端未启用推送（TASK_EVENTS_ENABLED）
+ * 或连接断开期间 useTaskEvents 返回 false，组件按原来的间隔继续轮询。
+ */
+
+import { useCallback, useEffect, useRef, useState } from "react";
+import { getApiUrl } from "./apiClient";
+import { TaskEvent, TaskProgressEventData } from "@/types/task";
+
+// 转发给组件的事件类型
+const TASK_EVENT_TYPES: TaskEvent["type"][] = ["task_status", "task_progress", "subtasks"];
+
+interface TaskEventListener {
+  onEvent: (event: TaskEvent) => void;
+  onResync: () => void;
+  onConnectionChange: (connected: boolean) => void;
+}
+
+// 页面内共用的连接
+let sharedSource: EventSource | null = null;
+let sharedConnected = false;
+const listeners = new Set<TaskEventListener>();
+
+const setSharedConnected = (connected: boolean) => {
+  sharedConnected = connected;
+  listeners.forEach((listener) => listener.onConnectionChange(connected));
+};
+
+const openSharedSource = (): EventSource => {
+  const source = new EventSource(getApiUrl("api/v1/test/events"));
+  let wasConnected = false;
+
+  source.addEventListener("ready", () => {
+    setSharedConnected(true);
+    // 重新连接后补上断开期间错过的变化
+    if (wasConnected) {
+      listeners.forEach((listener) => listener.onResync());
+    }
+    wasConnected = true;
+  });
+
+  // 后端连接积压丢弃了事件，需要重新加载
+  source.addEventListener("resync", () => {
+    listeners.forEach((listener) => listener.onResync());
+  });
+
+  TASK_EVENT_TYPES.forEach((type) => {
+    source.addEventListener(type, (message) => {
+      let event: TaskEvent;
+      try {
+        event = JSON.parse((message as MessageEvent).data);
+      } catch (error) {
+        console.error("解析任务事件失败:", error);
+        return;
+      }
+      listeners.forEach((listener) => listener.onEvent(event));
+    });
+  });
+
+  // 网络断开时浏览器会自动重连；后端未启用推送（503）时连接直接关闭，组件回退到轮询
+  source.onerror = () => setSharedConnected(false);
+
+  return source;
+};
+
+const subscribeTaskEvents = (listener: TaskEventListener) => {
+  listeners.add(listener);
+  if (!sharedSource) {
+    sharedSource = openSharedSource();
+  }
+  listener.onConnectionChange(sharedConnected);
+
+  return () => {
+    listeners.delete(listener);
+    if (listeners.size === 0 && sharedSource) {
+      sharedSource.close();
+      sharedSource = null;
+      sharedConnected = false;
+    }
+  };
+};
+
+/**
+ * 订阅任务事件
+ * @param onEvent 收到任务事件时调用
+ * @param onResync 重新连接或事件积压后调用，用于重新加载数据
+ * @returns 推送连接是否可用，不可用时组件应继续轮询
+ */
+export const useTaskEvents = (
+  onEvent: (event: TaskEvent) => void,
+  onResync?: () => void
+): boolean => {
+  const [connected, setConnected] = useState(false);
+  const onEventRef = useRef(onEvent);
+  const onResyncRef = useRef(onResync);
+
+  // 始终调用最新的回调，不因回调变化重新订阅
+  onEventRef.current = onEvent;
+  onResyncRef.current = onResync;
+
+  useEffect(() => {
+    if (typeof EventSource === "undefined") {
+      return;
+    }
+    return subscribeTaskEvents({
+      onEvent: (event) => onEventRef.current(event),
+      onResync: () => onResyncRef.current?.(),
+      onConnectionChange: setConnected,
+    });
+  }, []);
+
+  return connected;
+};
+
+/**
+ * 合并短时间内的多次调用：第一次调用后等待 delay 毫秒执行一次
+ * 用于多个任务同时变化状态时只重新加载一次
+ * @param callback 要执行的函数
+ * @param delay 等待时间（毫秒）
+ * @returns 合并后的函数
+ */
+export const useCoalescedCallback = (callback: () => void, delay = 1000) => {
+  const callbackRef = useRef(callback);
+  const timerRef = useRef<ReturnType<typeof setTimeout> | null>(null);
+
+  callbackRef.current = callback;
+
+  useEffect(() => {
+    return () => {
+      if (timerRef.current) {
+        clearTimeout(timerRef.current);
+      }
+    };
+  }, []);
+
+  return useCallback(() => {
+    if (timerRef.current) {
+      return;
+    }
+    timerRef.current = setTimeout(() => {
+      timerRef.current = null;
+      callbackRef.current();
+    }, delay);
+  }, [delay]);
+};
+
+/**
+ * 把进度事件应用到任务列表项
+ * @param task 任务列表项
+ * @param data 进度事件数据
+ * @returns 更新后的任务列表项
+ */
+export const applyTaskProgressEvent = <
+  T extends {
+    total_images: number;
+    processed_images: number;
+    completed_images: number;
+    failed_images: number;
+    progress: number;
+  }
+>(
+  task: T,
+  data: TaskProgressEventData
+): T => {
+  const total = data.total ?? task.total_images;
+  return {
+    ...task,
+    processed_images: data.processed,
+    completed_images: data.completed,
+    failed_images: data.failed,
+    progress: data.progress ?? (total > 0 ? Math.floor((data.processed / total) * 100) : task.progress),
+  };
+};
@@ -29,6 +29,8 @@ except ImportError as e:
     print("请运行: pip install -r migration_requirements.txt")
     sys.exit(1)
 
+from backend.db.bulk_load import bulk_load_rows, insert_rows, COLUMN_JSON, COLUMN_ARRAY
+
 # 加载环境变量
 load_dotenv()
 
@@ -75,6 +77,20 @@ DEFAULT_TEST_USER = {
 }
 
 
+# 子任务表的列顺序及需要特殊编码的列
+SUBTASK_COLUMNS = [
+    'id', 'task_id', 'status', 'variable_indices', 'prompts', 'ratio', 'seed', 'use_polish',
+    'batch_size', 'is_lumina', 'lumina_model_name', 'lumina_cfg', 'lumina_step',
+    'timeout_retry_count', 'error_retry_count', 'error', 'created_at', 'updated_at',
+    'started_at', 'completed_at', 'result', 'rating', 'evaluation'
+]
+SUBTASK_COLUMN_TYPES = {
+    'variable_indices': COLUMN_ARRAY,
+    'prompts': COLUMN_JSON,
+    'evaluation': COLUMN_ARRAY,
+}
+
+
 class MigrationLogger:
     """迁移日志管理器"""
 
@@ -391,8 +407,8 @@ class MongoToPgMigratorV2:
             cursor.execute("SELECT 1 FROM nietest_tasks WHERE id = %s", (task_id,))
             return cursor.fetchone() is not None
 
-    def migrate_subtask(self, mongo_subtask: Dict) -> bool:
-        """迁移单个子任务，返回是否成功"""
+    def build_subtask_row(self, mongo_subtask: Dict) -> Optional[tuple]:
+        """将单个子任务转换为待写入的行，已存在、缺少或找不到父任务时返回None"""
         subtask_id = mongo_subtask.get('id', 'unknown')
 
         try:
@@ -400,19 +416,19 @@ class MongoToPgMigratorV2:
             if self.check_existing_subtask(subtask_id):
                 self.stats['subtasks_skipped'] += 1
                 self.logger.info(f"跳过已存在的子任务: {subtask_id}")
-                return True
+                return None
 
             # 检查父任务是否存在
             parent_task_id = mongo_subtask.get('parent_task_id')
             if not parent_task_id:
                 self.stats['subtasks_failed'] += 1
                 self.logger.warning(f"子任务 {subtask_id} 缺少parent_task_id，跳过")
-                return False
+                return None
 
             if not self.check_parent_task_exists(parent_task_id):
                 self.stats['subtasks_orphaned'] += 1
                 self.logger.warning(f"子任务 {subtask_id} 的父任务 {parent_task_id} 不存在，跳过")
-                return False
+                return None
 
             # 转换variable_indices格式
             variable_indices = mongo_subtask.get('variable_indices', [])
@@ -439,50 +455,60 @@ class MongoToPgMigratorV2:
             elif not isinstance(updated_at, datetime):
                 updated_at = datetime.now()
 
-            # 插入子任务到PostgreSQL
-            with self.pg_conn.cursor() as cursor:
-                cursor.execute("""
-                    INSERT INTO nietest_subtasks (
-                        id, task_id, status, variable_indices, prompts, ratio, seed, use_polish,
-                        batch_size, is_lumina, lumina_model_name, lumina_cfg, lumina_step,
-                        timeout_retry_count, error_retry_count, error, created_at, updated_at,
-                        started_at, completed_at, result, rating, evaluation
-                    ) VALUES (
-                        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-                    )
-                """, (
-                    subtask_id,
-                    mongo_subtask['parent_task_id'],
-                    mongo_subtask.get('status', 'pending'),
-                    pg_variable_indices,
-                    json.dumps(prompts),
-                    mongo_subtask.get('ratio', '1:1'),
-                    mongo_subtask.get('seed'),
-                    mongo_subtask.get('use_polish', False),
-                    1,  # batch_size
-                    False,  # is_lumina
-                    None,  # lumina_model_name
-                    None,  # lumina_cfg
-                    None,  # lumina_step
-                    mongo_subtask.get('retry_count', 0),
-                    0,  # error_retry_count
-                    mongo_subtask.get('error'),
-                    created_at,
-                    updated_at,
-                    None,  # started_at
-                    updated_at if mongo_subtask.get('status') == 'completed' else None,
-                    result_url,
-                    0,  # rating
-                    []  # evaluation
-                ))
-
-            self.stats['subtasks_migrated'] += 1
-            return True
+            return (
+                subtask_id,
+                mongo_subtask['parent_task_id'],
+                mongo_subtask.get('status', 'pending'),
+                pg_variable_indices,
+                prompts,
+                mongo_subtask.get('ratio', '1:1'),
+                mongo_subtask.get('seed'),
+                mongo_subtask.get('use_polish', False),
+                1,  # batch_size
+                False,  # is_lumina
+                None,  # lumina_model_name
+                None,  # lumina_cfg
+                None,  # lumina_step
+                mongo_subtask.get('retry_count', 0),
+                0,  # error_retry_count
+                mongo_subtask.get('error'),
+                created_at,
+                updated_at,
+                None,  # started_at
+                updated_at if mongo_subtask.get('status') == 'completed' else None,
+                result_url,
+                0,  # rating
+                []  # evaluation
+            )
 
         except Exception as e:
             self.stats['subtasks_failed'] += 1
-            self.logger.error(f"迁移子任务失败 {subtask_id}: {e}")
-            return False
+            self.logger.error(f"转换子任务失败 {subtask_id}: {e}")
+            return None
+
+    def flush_subtask_rows(self, rows: List[tuple]):
+        """
+        批量写入一批子任务行
+
+        优先使用COPY一次写入整批；整批失败时逐行INSERT，以便定位并跳过有问题的行
+        """
+        if not rows:
+            return
+
+        try:
+            bulk_load_rows(self.pg_conn, 'nietest_subtasks', SUBTASK_COLUMNS, rows, SUBTASK_COLUMN_TYPES)
+            self.stats['subtasks_migrated'] += len(rows)
+            return
+        except Exception as e:
+            self.logger.warning(f"批量写入 {len(rows)} 个子任务失败，改为逐行写入: {e}")
+
+        for row in rows:
+            try:
+                insert_rows(self.pg_conn, 'nietest_subtasks', SUBTASK_COLUMNS, [row], SUBTASK_COLUMN_TYPES)
+                self.stats['subtasks_migrated'] += 1
+            except Exception as e:
+                self.stats['subtasks_failed'] += 1
+                self.logger.error(f"迁移子任务失败 {row[0]}: {e}")
 
     def migrate_all_data(self, dry_run: bool = False):
         """迁移所有数据"""
@@ -524,12 +550,19 @@ class MongoToPgMigratorV2:
             self.logger.info("开始迁移子任务数据...")
             subtasks_cursor = dramatiq_collection.find({})
 
+            pending_rows = []
             for subtask in subtasks_cursor:
-                self.migrate_subtask(subtask)
+                row = self.build_subtask_row(subtask)
+                if row is not None:
+                    pending_rows.append(row)
 
-                # 每处理一定数量后输出进度
-                if (self.stats['subtasks_migrated'] + self.stats['subtasks_skipped'] + self.stats['subtasks_failed']) % 50 == 0:
-                    self.logger.info(f"子任务进度: {self.stats['subtasks_migrated'] + self.stats['subtasks_skipped'] + self.stats['subtasks_failed']}/{self.stats['subtasks_total']}")
+                # 每积累一批后批量写入并输出进度
+                if len(pending_rows) >= self.batch_size:
+                    self.flush_subtask_rows(pending_rows)
+                    pending_rows = []
+                    self.logger.info(f"子任务进度: {self.stats['subtasks_migrated'] + self.stats['subtasks_skipped'] + self.stats['subtasks_failed'] + self.stats['subtasks_orphaned']}/{self.stats['subtasks_total']}")
+
+            self.flush_subtask_rows(pending_rows)
 
             # 输出最终统计
             self.print_final_stats()